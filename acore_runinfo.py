@@ -1,15 +1,14 @@
-import os
 import copy
-from hashlib import md5
+from typing import Optional
 from PySide2 import QtWidgets
 from jh_resource import ACoreRunInfo, CommonOSRunInfo
 from jh_resource import ResourceGuestCell
 from forms.ui_acore_runinfo import Ui_ACoreRunInfoWidget
-from generator import GuestCellGenerator
 from commonos_runinfo import OSRunInfoWidget
 from common_widget import set_lineedit_status
 from utils import from_human_num, to_human_addr
 from rpc_server.rpc_client import RPCClient
+from rpc_job import RPCJob
 
 
 class ACoreRunInfoWidget(OSRunInfoWidget):
@@ -140,12 +139,12 @@ class ACoreRunInfoWidget(OSRunInfoWidget):
         if changed:
             self.value_changed.emit()
 
-    def run(self, cell: ResourceGuestCell) -> bool:
+    def run(self, cell: ResourceGuestCell) -> Optional[RPCJob]:
         client = RPCClient.get_instance()
         if cell is None:
-            return False
+            return None
         if not client.is_connected():
-            return False
+            return None
 
         cellname = cell.name()
         os_runinfo: ACoreRunInfo = self.runinfo()
@@ -155,97 +154,5 @@ class ACoreRunInfoWidget(OSRunInfoWidget):
         if cell.reset_addr() != os_runinfo.msl.addr:
             cell.set_reset_addr(os_runinfo.msl.addr)
 
-        images = list()
-        images.extend((
-            {
-                'name': "MSL",
-                "enable": True,
-                "addr": os_runinfo.msl.addr,
-                "file": self.abspath(cell, os_runinfo.msl.filename)
-            },
-            {
-                'name': "OS",
-                "enable": True,
-                "addr": os_runinfo.os.addr,
-                "file": self.abspath(cell, os_runinfo.os.filename)
-            },
-            {
-                'name': "APP",
-                "enable": os_runinfo.app.enable,
-                "addr": os_runinfo.app.addr,
-                "file": self.abspath(cell, os_runinfo.app.filename)
-            },
-        ))
-
-        for image in images:
-            if not image['enable']:
-                continue
-            if image['addr'] is None:
-                self.logger.error(f"image ({image['name']}) invalid.")
-                return
-            if not os.path.exists(image['file']):
-                self.logger.error(f"image ({image['name']}) not found: {image['file']}")
-                return
-
-        # 生成当前guest cell的配置
-        self.logger.info(f"generate cell({cellname}) config")
-        guest_cell_bin = GuestCellGenerator.gen_config_bin(cell)
-        if guest_cell_bin is None:
-            self.logger.error(f"generate cell config failed")
-            return
-
-        # 创建之前先查询列表，有无此cell,若有就destroy
-        cell_exist = False
-        result = client.list_cell()
-        if result is None or not result.result:
-            self.logger.error("get cell list failed")
-            return
-        for _cell in result.result:
-            if _cell['name'] == cellname:
-                cell_exist = True
-                break
-        if cell_exist:
-            self.logger.info(f"cell exist, destroy cell({cellname}) firstly.")
-            if not client.destroy_cell(cellname):
-                self.logger.debug(f"destroy cell({cellname}) failed")
-                return
-
-        #  创建guest cell
-        self.logger.info(f'create cell({cellname})')
-        result = client.create_cell(guest_cell_bin)
-        if not result.status:
-            self.logger.error(f"create guest cell failed {result.message}")
-            return
-
-        for image in images:
-            if not image['enable']:
-                continue
-            name = image['name']
-            addr = image['addr']
-            file = image['file']
-
-            self.logger.info(f"load firmware {name} for cell({cellname}) @{hex(addr)}")
-            try:
-                with open(file, 'rb') as f:
-                    fw_bin = f.read()
-            except:
-                self.logger.error(f"read {file} failed.")
-                return
-
-            self.logger.info(f"md5: {md5(fw_bin).hexdigest()}")
-            result = client.load_cell(cellname, addr, fw_bin )
-            if result is None or not result.status:
-                self.logger.error(f"load failed")
-                return
-
-        if not self.load_resource_table(cell):
-            self.logger.error("load resource table failed.")
-            return
-
-        self.logger.info(f"start cell({cellname})")
-        result = client.start_cell(cellname)
-        if result is None or not result.status:
-            self.logger.error(f"start cell({cellname}) failed")
-            return
-
-        self.logger.info(f"run cell{cellname} success.")
\ No newline at end of file
+        # 验证镜像, 生成配置和资源表, 读取镜像和部署在后台任务中完成
+        return self.deploy(cell, os_runinfo)
@@ -0,0 +1,355 @@
+"""
+自动保存模块。
+
+编辑中的资源定时保存到日志文件(journal)，程序崩溃后下次启动时可以恢复。
+- 资源修改时增加修改计数，定时检查，计数变化后才保存
+- 界面线程中生成快照(to_dict并复制字典和列表)，资源对象不是线程安全的
+- 后台线程中转换为JSON并原子写入，不阻塞界面
+- 用户保存文件或正常退出后删除日志文件
+- 日志文件记录写入的进程ID，进程仍在运行时(同时打开了多个程序)不恢复也不删除
+
+日志文件保存在 ~/.resource_tool_autosave/<id>.journal，格式(JSON):
+    {
+        'magic': 'jhr-journal',
+        'version': JOURNAL_VERSION,
+        'filename': 资源文件名，未保存过时为None,
+        'name': 资源名称,
+        'time': 保存时间,
+        'pid': 进程ID,
+        'value': 资源字典,
+    }
+
+主要类:
+- Journal: 日志文件中的资源
+- AutosaveService: 自动保存服务，全局唯一
+
+示例:
+    autosave = AutosaveService.get_instance()
+    autosave.start()
+    for journal in autosave.journals():
+        rsc = autosave.recover(journal)
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import pathlib
+import logging
+import threading
+import weakref
+import collections
+from typing import Optional, List, Dict
+
+from PySide2 import QtCore
+
+from jh_resource import ResourceSignals, ResourceMgr, ResourceBase, Resource
+from utils import write_file_atomic
+
+
+JOURNAL_MAGIC = "jhr-journal"
+JOURNAL_VERSION = 1
+JOURNAL_SUFFIX = ".journal"
+
+
+def journal_dir() -> str:
+    return os.path.join(pathlib.Path.home(), ".resource_tool_autosave")
+
+
+def pid_alive(pid: int) -> bool:
+    """ 进程是否在运行 """
+    if pid <= 0:
+        return False
+    if sys.platform == 'win32':
+        # Windows上os.kill(pid, 0)会结束进程
+        import ctypes
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return True
+            return code.value == STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def snapshot(value):
+    """ 复制字典和列表, to_dict的结果中有资源内部的列表, 不能在其他线程中使用 """
+    if isinstance(value, dict):
+        return {k: snapshot(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [snapshot(v) for v in value]
+    return value
+
+
+class Journal(object):
+    """
+    日志文件中的资源。
+    
+    Attributes:
+        path: 日志文件
+        filename: 资源文件名，未保存过时为None
+        name: 资源名称
+        time: 保存时间
+        pid: 写入日志文件的进程ID
+        value: 资源字典
+    """
+    def __init__(self, path: str, filename: Optional[str], name: str, time: float, pid: int, value: dict):
+        self.path = path
+        self.filename = filename
+        self.name = name
+        self.time = time
+        self.pid = pid
+        self.value = value
+
+    def is_orphaned(self) -> bool:
+        """ 写入日志文件的进程已退出 """
+        # 进程ID被本进程重用时也是上次运行留下的, 本进程的日志文件不会出现在journals()中
+        return self.pid == os.getpid() or not pid_alive(self.pid)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['Journal']:
+        try:
+            with open(path, "rb") as f:
+                journal = json.loads(f.read().decode('utf-8'))
+        except Exception:
+            return None
+        if not isinstance(journal, dict):
+            return None
+        if journal.get('magic') != JOURNAL_MAGIC or journal.get('version') != JOURNAL_VERSION:
+            return None
+        value = journal.get('value')
+        filename = journal.get('filename')
+        pid = journal.get('pid')
+        if not isinstance(value, dict) or not isinstance(filename, (str, type(None))):
+            return None
+        if not isinstance(pid, int):
+            pid = 0
+        return cls(path, filename, str(journal.get('name', "")), float(journal.get('time', 0)), pid, value)
+
+
+class AutosaveService(QtCore.QObject):
+    """
+    自动保存服务。
+    
+    只在界面线程中使用。写入和删除日志文件的请求按文件合并，
+    由一个后台线程依次执行，同一个文件只写入最新的快照。
+    
+    信号:
+        written: 日志文件写入结束 (日志文件, 是否成功)，在界面线程中处理
+    """
+    logger = logging.getLogger("Autosave")
+    written = QtCore.Signal(str, bool)
+
+    # 自动保存间隔(毫秒)
+    INTERVAL = 30*1000
+
+    _instance = None
+
+    @classmethod
+    def get_instance(cls) -> 'AutosaveService':
+        if cls._instance is None:
+            cls._instance = AutosaveService()
+        return cls._instance
+
+    def __init__(self, path: Optional[str] = None):
+        super().__init__()
+        self._path = journal_dir() if path is None else path
+
+        # 资源的修改计数和已保存的修改计数
+        self._generation: Dict[Resource, int] = weakref.WeakKeyDictionary()
+        self._saved: Dict[Resource, int] = weakref.WeakKeyDictionary()
+        # 资源对应的日志文件
+        self._journals: Dict[Resource, str] = weakref.WeakKeyDictionary()
+
+        # 待执行的请求 {日志文件: 写入的数据, None表示删除}
+        self._pending: Dict[str, Optional[dict]] = collections.OrderedDict()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(self.INTERVAL)
+        self._timer.timeout.connect(self.autosave)
+        self.written.connect(self._on_written)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._writer, name="autosave", daemon=True)
+        self._thread.start()
+        ResourceSignals.modified.connect(self._on_rsc_modified)
+        self._timer.start()
+
+    def stop(self, discard: bool = True, timeout: float = 5.0):
+        """
+        停止自动保存，等待未完成的请求。
+        
+        Args:
+            discard: 是否删除本次运行的日志文件，正常退出时删除
+            timeout: 等待后台线程的时间(秒)
+        """
+        self._timer.stop()
+        ResourceSignals.modified.disconnect(self._on_rsc_modified)
+        if discard:
+            for path in list(self._journals.values()):
+                self._submit(path, None)
+            self._journals.clear()
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def autosave(self):
+        """ 保存修改计数变化了的资源 """
+        rsc_mgr = ResourceMgr.get_instance()
+        for i in range(len(rsc_mgr)):
+            rsc = rsc_mgr[i]
+            generation = self._generation.get(rsc, 0)
+            if generation == self._saved.get(rsc, 0):
+                continue
+            value = rsc.to_dict()
+            if value is None:
+                self.logger.error(f"autosave {rsc.name()}: resource to dict failed")
+                continue
+            path = self._journals.get(rsc)
+            if path is None:
+                path = os.path.join(self._path, uuid.uuid4().hex + JOURNAL_SUFFIX)
+                self._journals[rsc] = path
+            self._saved[rsc] = generation
+            self._submit(path, {
+                'magic': JOURNAL_MAGIC,
+                'version': JOURNAL_VERSION,
+                'filename': rsc.filename(),
+                'name': rsc.name(),
+                'time': time.time(),
+                'pid': os.getpid(),
+                'value': snapshot(value),
+            })
+
+    def mark_saved(self, rsc: Resource):
+        """ 资源已保存到文件, 删除日志文件, 再次修改后才自动保存 """
+        self._saved[rsc] = self._generation.get(rsc, 0)
+        path = self._journals.pop(rsc, None)
+        if path is not None:
+            self._submit(path, None)
+
+    def journals(self) -> List[Journal]:
+        """ 已退出的程序留下的日志文件, 按保存时间排序, 其他正在运行的程序的日志文件不包括在内 """
+        try:
+            names = os.listdir(self._path)
+        except OSError:
+            return list()
+        adopted = set(self._journals.values())
+        journals = list()
+        for name in names:
+            path = os.path.join(self._path, name)
+            if not name.endswith(JOURNAL_SUFFIX) or path in adopted:
+                continue
+            journal = Journal.load(path)
+            if journal is None:
+                self.logger.warning(f"invalid journal {path}")
+                continue
+            if not journal.is_orphaned():
+                continue
+            journals.append(journal)
+        journals.sort(key=lambda x: x.time)
+        return journals
+
+    def recover(self, journal: Journal) -> Optional[Resource]:
+        """
+        从日志文件恢复资源。
+        
+        恢复的资源标记为已修改，日志文件继续用于该资源的自动保存，
+        用户保存文件后删除。
+        
+        Returns:
+            Resource: 恢复失败时返回None
+        """
+        rsc = ResourceMgr.get_instance().load(journal.value)
+        if rsc is None:
+            return None
+        if journal.filename is not None:
+            rsc.set_filename(journal.filename)
+        self._journals[rsc] = journal.path
+        rsc.set_modified()
+        # 立即以本进程的ID重写日志文件, 其他程序不会再恢复它
+        self.autosave()
+        return rsc
+
+    def discard(self, journal: Journal):
+        """ 删除不恢复的日志文件 """
+        self._submit(journal.path, None)
+
+    def _submit(self, path: str, journal: Optional[dict]):
+        if self._thread is None:
+            self._execute(path, journal)
+            return
+        with self._cond:
+            self._pending.pop(path, None)
+            self._pending[path] = journal
+            self._cond.notify()
+
+    def _writer(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                path, journal = self._pending.popitem(last=False)
+            self._execute(path, journal)
+
+    def _execute(self, path: str, journal: Optional[dict]):
+        if journal is None:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return
+
+        try:
+            os.makedirs(self._path, exist_ok=True)
+            data = json.dumps(journal, ensure_ascii=False).encode('utf-8')
+            write_file_atomic(path, data)
+        except Exception as e:
+            self.logger.error(f"write journal {path} failed: {e}")
+            self.written.emit(path, False)
+            return
+        self.written.emit(path, True)
+
+    def _on_written(self, path: str, ok: bool):
+        if ok:
+            return
+        # 写入失败, 下次定时再写入
+        for rsc, journal_path in list(self._journals.items()):
+            if journal_path == path:
+                self._saved.pop(rsc, None)
+
+    def _on_rsc_modified(self, sender, **kwargs):
+        if not isinstance(sender, ResourceBase):
+            return
+        rsc = sender.ancestor(Resource)
+        if rsc is None:
+            return
+        self._generation[rsc] = self._generation.get(rsc, 0) + 1
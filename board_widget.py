@@ -6,7 +6,7 @@ from forms.ui_device_widget import Ui_DeviceWidget
 from jh_resource import ResourceBoard, ResourceCPU
 from jh_resource import PlatformMgr, ResourceSignals
 from flowlayout import FlowLayout
-from common_widget import SelectButton, clean_layout
+from common_widget import SelectButton, KeyedLayout
 from cpu_edit_widget import CPUEditWidget
 from mem_edit_widget import MemEditWidget
 import utils
@@ -49,6 +49,7 @@ class BoardWidget(QtWidgets.QWidget):
         # 核心数据对象及布局管理器
         self._board: Optional[ResourceBoard] = None
         self._device_layout = FlowLayout(self._ui.frame_devices_items)  # 流式布局管理设备选择按钮
+        self._devices = KeyedLayout(self._device_layout, lambda name: SelectButton(name, self))
         self._cpu_editor = CPUEditWidget(self)  # CPU配置编辑部件
         self._ui.frame_cpus_content.layout().addWidget(self._cpu_editor)
 
@@ -73,17 +74,16 @@ class BoardWidget(QtWidgets.QWidget):
         """
         刷新界面显示以匹配当前开发板数据。
         
-        包括清空旧数据、更新基础信息、填充设备列表、同步CPU和内存配置。
+        包括更新基础信息、同步设备列表、CPU和内存配置，已有的设备按钮会被复用。
         """
         board = self._board
-        # 初始化界面状态
-        self._ui.label_model.setText("")
-        self._ui.label_vendor.setText("")
-        clean_layout(self._device_layout)   # 清空设备列表布局
-        self._cpu_editor.set_cpu_count(0)
-        self._board_mem_editor.set_regions(list())
-
         if board is None:
+            # 清空界面状态
+            self._ui.label_model.setText("")
+            self._ui.label_vendor.setText("")
+            self._devices.clear()
+            self._cpu_editor.set_cpu_count(0)
+            self._board_mem_editor.set_regions(list())
             return
 
         # 更新基础信息
@@ -93,14 +93,12 @@ class BoardWidget(QtWidgets.QWidget):
         # 获取父级CPU资源
         cpu: ResourceCPU = board.parent().cpu()
 
-        # 构建设备选择按钮列表
+        # 同步设备选择按钮列表
         dev_names = sorted(map(lambda x: x.name(), cpu.devices()))
-        for dev in dev_names:
-            w = SelectButton(dev, self)
-            self._device_layout.addWidget(w)
+        self._devices.sync(dev_names)
+        for dev, w in self._devices.items():
             # 标记已选中的设备
-            if dev in board.devices:
-                w.setChecked(True)
+            w.setChecked(dev in board.devices)
 
         # 同步CPU配置
         self._cpu_editor.set_cpu_count( cpu.cpu_count() )
@@ -0,0 +1,544 @@
+"""
+多单元格启动编排模块。
+
+本模块用于一次启动资源中的全部客户单元格，包括:
+- 在调用线程中生成各单元格的配置、资源表和设备树
+- 并发读取各单元格的镜像
+- 并行上传ACore和通用系统单元格(创建并加载, 暂不启动)
+- 按依赖顺序启动单元格，依赖启动失败的单元格被跳过
+
+依赖关系保存在单元格运行信息的depends中，也可以在调用时覆盖，
+例如通信对端需要先于使用它的单元格启动。
+
+主要类:
+- CellBootPlan: 单个客户单元格的启动计划
+- BootOrchestrator: 启动编排器
+
+命令行:
+    python3 boot_orchestrator.py boot demos/D2000.jhr --addr tcp://127.0.0.1:4240 --enable
+"""
+
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Callable
+import gevent
+import gevent.pool
+import click
+from jh_resource import Resource, ResourceGuestCell, ResourceGuestCellList
+from jh_resource import LinuxRunInfo, ACoreRunInfo, CommonOSRunInfo
+from jh_resource import ResourceMgr, PlatformMgr
+from rpc_server.rpc_client import RPCClient
+from rpc_server.api import RPCApi
+from cell_deploy import DeployError, deploy_source, linux_source, root_source
+from cell_deploy import read_image, read_linux, deploy_plan, run_linux, enable_hypervisor
+
+
+logger = logging.getLogger("BootOrchestrator")
+
+
+def order_levels(depends: Dict[str, List[str]]) -> Optional[List[List[str]]]:
+    """
+    按依赖关系分层, 每层只依赖之前的层, 层内保持depends中的顺序。
+
+    Args:
+        depends: {单元格名称: [依赖的单元格名称]}
+
+    Returns:
+        list: [[单元格名称 ...] ...]，依赖的单元格不存在或存在循环依赖时返回None
+    """
+    for name, deps in depends.items():
+        for dep in deps:
+            if dep not in depends:
+                logger.error(f"cell {name} depends on unknown cell {dep}")
+                return None
+            if dep == name:
+                logger.error(f"cell {name} depends on itself")
+                return None
+
+    levels = list()
+    done = set()
+    pending = list(depends.keys())
+    while pending:
+        level = [name for name in pending if all(dep in done for dep in depends[name])]
+        if not level:
+            logger.error(f"circular dependency between cells: {', '.join(pending)}")
+            return None
+        levels.append(level)
+        done.update(level)
+        pending = [name for name in pending if name not in done]
+    return levels
+
+
+class CellBootPlan(object):
+    """
+    单个客户单元格的启动计划。
+
+    ACore和通用系统单元格使用deploy_cell上传配置和镜像，
+    Linux单元格由jailhouse cell linux一次完成创建、加载和启动，只能在启动时上传。
+
+    Attributes:
+        name: 单元格名称
+        kind: DEPLOY或LINUX
+        depends: 依赖的单元格名称
+        source: 在调用线程中生成的部署源，见cell_deploy
+        images: DEPLOY时为读取的镜像[{name, addr, data} ...]
+        linux: LINUX时为读取的镜像{kernel, dtb, ramdisk, bootargs}
+        error: 生成或读取失败的原因，成功时为None
+    """
+    DEPLOY = 'deploy'
+    LINUX = 'linux'
+
+    def __init__(self, name: str, kind: str, depends: List[str]):
+        self.name = name
+        self.kind = kind
+        self.depends = depends
+        self.source: Optional[dict] = None
+        self.images: List[dict] = list()
+        self.linux: Optional[dict] = None
+        self.error: Optional[str] = None
+
+    @property
+    def config(self) -> Optional[bytes]:
+        return self.source['config'] if self.source is not None else None
+
+    def deploy_plan(self, start: bool) -> dict:
+        return deploy_plan(self.source, self.images, start)
+
+
+class BootOrchestrator(object):
+    """
+    启动编排器。
+
+    boot()按以下步骤启动资源中的全部客户单元格:
+    1. prepare(): 在调用线程中设置入口地址，生成各单元格的配置、资源表和根单元格配置
+    2. 在线程池中并发读取各单元格的镜像, 工作线程只访问部署源中的数据
+    3. 可选地启动根单元格
+    4. 每个单元格使用独立的连接并行上传(deploy_cell, 不启动)
+    5. 按依赖分层依次启动, 依赖失败的单元格跳过
+
+    资源对象不是线程安全的，在后台线程中启动时，先在界面线程中调用prepare()，
+    之后的boot()不再访问资源。
+
+    单元格的状态: prepared, uploaded, running, failed, skipped
+    """
+    PREPARED = 'prepared'
+    UPLOADED = 'uploaded'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    SKIPPED = 'skipped'
+
+    # 上传连接的超时时间(秒), deploy_cell一次发送全部镜像, 需要足够上传大的镜像
+    UPLOAD_TIMEOUT = 300
+
+    def __init__(self, rsc: Resource, client: RPCClient,
+                 depends: Optional[Dict[str, List[str]]] = None,
+                 max_workers: int = 4, max_parallel: int = 4,
+                 upload_timeout: int = UPLOAD_TIMEOUT):
+        """
+        Args:
+            rsc: 资源对象
+            client: 已连接的RPC客户端，上传时按其地址为每个单元格建立新的连接
+            depends: 覆盖运行信息中的依赖关系, {单元格名称: [依赖的单元格名称]}
+            max_workers: 读取镜像的线程数
+            max_parallel: 并行上传的单元格数
+            upload_timeout: 上传连接的超时时间(秒)
+        """
+        self._rsc = rsc
+        self._client = client
+        self._depends_override = depends or dict()
+        self._max_workers = max(1, max_workers)
+        self._max_parallel = max(1, max_parallel)
+        self._upload_timeout = upload_timeout
+        self._states: Dict[str, str] = dict()
+        self._messages: Dict[str, str] = dict()
+        self._listener: Optional[Callable[[str, str], None]] = None
+        self._cancel_check: Optional[Callable[[], bool]] = None
+        # prepare()的结果
+        self._levels: Optional[List[List[str]]] = None
+        self._plans: Optional[Dict[str, CellBootPlan]] = None
+        self._root: Optional[dict] = None
+
+    def set_listener(self, listener: Optional[Callable[[str, str], None]]):
+        """ 设置单元格状态变化的回调 listener(单元格名称, 状态), 在执行boot()的线程中调用 """
+        self._listener = listener
+
+    def set_cancel_check(self, cancel_check: Optional[Callable[[], bool]]):
+        """ 设置取消检查函数, 返回True时不再上传和启动其余的单元格 """
+        self._cancel_check = cancel_check
+
+    def is_canceled(self) -> bool:
+        return self._cancel_check is not None and self._cancel_check()
+
+    def cells(self) -> List[ResourceGuestCell]:
+        guestcells: ResourceGuestCellList = self._rsc.find(ResourceGuestCellList)
+        return [guestcells.cell_at(i) for i in range(guestcells.cell_count())]
+
+    def depends(self) -> Dict[str, List[str]]:
+        """ 各单元格的依赖, 调用时指定的依赖优先 """
+        value = dict()
+        for cell in self.cells():
+            name = cell.name()
+            if name in self._depends_override:
+                value[name] = list(self._depends_override[name])
+            else:
+                value[name] = cell.runinfo().depends()
+        return value
+
+    def order(self) -> Optional[List[List[str]]]:
+        """
+        按依赖关系分层, 每层只依赖之前的层。
+
+        Returns:
+            list: [[单元格名称 ...] ...]，依赖的单元格不存在或存在循环依赖时返回None
+        """
+        # 保持资源中的单元格顺序
+        return order_levels(self.depends())
+
+    def state(self, name: str) -> Optional[str]:
+        return self._states.get(name)
+
+    def states(self) -> Dict[str, str]:
+        return dict(self._states)
+
+    def message(self, name: str) -> str:
+        return self._messages.get(name, "")
+
+    def _set_state(self, name: str, state: str, msg: str = ""):
+        self._states[name] = state
+        self._messages[name] = msg
+        if state in (self.FAILED, self.SKIPPED):
+            logger.error(f"cell({name}) {state} {msg}")
+        else:
+            logger.info(f"cell({name}) {state}")
+        if self._listener is not None:
+            self._listener(name, state)
+
+    def _skip_canceled(self, plans: Dict[str, CellBootPlan]):
+        """ 取消后跳过未启动的单元格, 已上传的单元格不再保留 """
+        for name, plan in plans.items():
+            state = self._states.get(name)
+            if state in (self.RUNNING, self.FAILED, self.SKIPPED):
+                continue
+            if state == self.UPLOADED:
+                self._client.destroy_cell(name)
+            self._set_state(name, self.SKIPPED, "canceled")
+
+    def set_reset_addrs(self):
+        """
+        设置所有单元格的入口地址。
+
+        由prepare()调用, 之后的boot()不会再修改资源。
+        """
+        for cell in self.cells():
+            self._set_reset_addr(cell)
+
+    @staticmethod
+    def _set_reset_addr(cell: ResourceGuestCell):
+        """ 根据系统类型设置入口地址, 会修改资源, 只在调用线程中执行 """
+        os_runinfo = cell.runinfo().os_runinfo()
+        if isinstance(os_runinfo, ACoreRunInfo):
+            # 天脉系统的入口地址为MSL的加载地址
+            addr = os_runinfo.msl.addr
+        elif isinstance(os_runinfo, LinuxRunInfo):
+            # linux系统的入口地址固定为0
+            addr = 0
+        elif isinstance(os_runinfo, CommonOSRunInfo):
+            addr = os_runinfo.reset_addr()
+        else:
+            return
+        if cell.reset_addr() != addr:
+            cell.set_reset_addr(addr)
+
+    @classmethod
+    def prepare_cell(cls, cell: ResourceGuestCell, depends: List[str]) -> CellBootPlan:
+        """
+        生成单个单元格的部署源, 访问资源, 只在调用线程中执行。
+        """
+        os_runinfo = cell.runinfo().os_runinfo()
+        kind = CellBootPlan.LINUX if isinstance(os_runinfo, LinuxRunInfo) else CellBootPlan.DEPLOY
+        plan = CellBootPlan(cell.name(), kind, depends)
+        try:
+            if kind == CellBootPlan.LINUX:
+                plan.source = linux_source(cell, os_runinfo)
+            else:
+                plan.source = deploy_source(cell, os_runinfo)
+        except DeployError as e:
+            plan.error = str(e)
+        except Exception as e:
+            plan.error = f"prepare except {e}"
+        return plan
+
+    def prepare(self, enable: bool = False) -> bool:
+        """
+        设置入口地址，生成各单元格的部署源和根单元格配置，结果由下一次boot()使用。
+
+        访问和修改资源, 只在调用线程(界面线程)中执行, 生成失败的单元格在boot()中标记为失败。
+
+        Args:
+            enable: 是否生成根单元格配置
+
+        Returns:
+            bool: 依赖关系错误或根单元格配置生成失败时返回False
+        """
+        self._levels = self.order()
+        if self._levels is None:
+            return False
+
+        self._root = None
+        if enable:
+            try:
+                self._root = root_source(self._rsc)
+            except DeployError as e:
+                logger.error(f"{e}")
+                return False
+
+        # 入口地址写入资源会发出修改信号
+        self.set_reset_addrs()
+        depends = self.depends()
+        start = time.monotonic()
+        plans = [self.prepare_cell(cell, depends[cell.name()]) for cell in self.cells()]
+        logger.info(f"prepare {len(plans)} cells in {time.monotonic()-start:.2f}s")
+        self._plans = {plan.name: plan for plan in plans}
+        return True
+
+    def plans(self) -> Dict[str, CellBootPlan]:
+        """ prepare()生成的启动计划 """
+        return dict(self._plans or dict())
+
+    @staticmethod
+    def read_source(kind: str, source: dict):
+        """
+        读取部署源中的文件, 不访问资源, 在工作线程中执行。
+
+        Returns:
+            DEPLOY时为[{name, addr, data} ...]，LINUX时为{kernel, dtb, ramdisk, bootargs}
+
+        Raises:
+            DeployError: 读取失败
+        """
+        if kind == CellBootPlan.LINUX:
+            return read_linux(source)
+        return [read_image(image) for image in source['images']]
+
+    def read(self, plans: Dict[str, CellBootPlan]):
+        """
+        在线程池中并发读取各单元格的镜像, 线程池只得到部署源, 结果在调用线程中写入启动计划。
+        """
+        targets = [plan for plan in plans.values() if plan.error is None]
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            futures = [executor.submit(self.read_source, plan.kind, plan.source) for plan in targets]
+            for plan, future in zip(targets, futures):
+                try:
+                    value = future.result()
+                except DeployError as e:
+                    plan.error = str(e)
+                    continue
+                except Exception as e:
+                    plan.error = f"read except {e}"
+                    continue
+                if plan.kind == CellBootPlan.LINUX:
+                    plan.linux = value
+                else:
+                    plan.images = value
+        logger.info(f"read {len(targets)} cells in {time.monotonic()-start:.2f}s")
+
+        for plan in plans.values():
+            if plan.error is not None:
+                self._set_state(plan.name, self.FAILED, plan.error)
+            else:
+                self._set_state(plan.name, self.PREPARED)
+
+    def _upload(self, plan: CellBootPlan) -> RPCApi.Result:
+        # RPCClient的调用互斥, 每个单元格使用单独的连接才能并行
+        client = RPCClient()
+        if not client.connect(self._client.addr(), timeout=self._upload_timeout):
+            return RPCApi.Result.error(f"connect {self._client.addr()} failed")
+        try:
+            result = client.deploy_cell(plan.deploy_plan(False))
+        finally:
+            client.close()
+        if result is None:
+            return RPCApi.Result.error("no result")
+        return result
+
+    def upload(self, plans: Dict[str, CellBootPlan]):
+        """
+        并行上传ACore和通用系统单元格, 上传后单元格已创建并加载镜像, 处于未启动状态。
+        """
+        targets = [plan for plan in plans.values()
+                   if plan.kind == CellBootPlan.DEPLOY and self._states.get(plan.name) == self.PREPARED]
+        if not targets:
+            return
+
+        start = time.monotonic()
+        pool = gevent.pool.Pool(self._max_parallel)
+        jobs = [pool.spawn(self._upload, plan) for plan in targets]
+        gevent.joinall(jobs)
+        logger.info(f"upload {len(targets)} cells in {time.monotonic()-start:.2f}s")
+
+        for plan, job in zip(targets, jobs):
+            if not job.successful():
+                self._set_state(plan.name, self.FAILED, f"upload except {job.exception}")
+            elif not job.value.status:
+                self._set_state(plan.name, self.FAILED, job.value.message)
+            else:
+                self._set_state(plan.name, self.UPLOADED)
+
+    def start(self, plans: Dict[str, CellBootPlan], levels: List[List[str]]):
+        """
+        按依赖分层启动单元格, 依赖没有启动的单元格跳过。
+        """
+        for level in levels:
+            for name in level:
+                if self.is_canceled():
+                    self._skip_canceled(plans)
+                    return
+                plan = plans[name]
+                if self._states.get(name) in (self.FAILED, self.SKIPPED):
+                    continue
+                failed = [dep for dep in plan.depends if self._states.get(dep) != self.RUNNING]
+                if failed:
+                    if plan.kind == CellBootPlan.DEPLOY:
+                        # 已上传的单元格不再保留
+                        self._client.destroy_cell(name)
+                    self._set_state(name, self.SKIPPED, f"depends on {', '.join(failed)}")
+                    continue
+
+                if plan.kind == CellBootPlan.LINUX:
+                    result = run_linux(self._client, name, plan.config, plan.linux)
+                else:
+                    result = self._client.start_cell(name)
+                if result is None or not result.status:
+                    msg = result.message if result is not None else "no result"
+                    self._set_state(name, self.FAILED, msg)
+                else:
+                    self._set_state(name, self.RUNNING)
+
+    def boot(self, enable: bool = False, client: Optional[RPCClient] = None) -> bool:
+        """
+        启动全部客户单元格。
+
+        没有调用prepare()时先在当前线程中调用; 已调用时只使用其结果, 不访问资源。
+
+        Args:
+            enable: 是否先启动根单元格
+            client: 执行RPC调用的连接, 默认为构造时的连接, 在工作线程中执行时使用该线程的连接
+
+        Returns:
+            bool: 所有单元格是否都启动成功
+        """
+        if client is not None:
+            self._client = client
+        self._states.clear()
+        self._messages.clear()
+        if not self._client.is_connected():
+            logger.error("unconnected")
+            return False
+
+        if self._plans is None and not self.prepare(enable):
+            return False
+        if enable and self._root is None:
+            logger.error("root cell not prepared")
+            return False
+        # 每次prepare()的结果只使用一次
+        levels, plans, root = self._levels, self._plans, self._root
+        self._levels, self._plans, self._root = None, None, None
+        logger.info("boot order: " + " -> ".join(f"[{', '.join(level)}]" for level in levels))
+
+        self.read(plans)
+        if enable and not enable_hypervisor(self._client, root):
+            return False
+        if not self.is_canceled():
+            self.upload(plans)
+        self.start(plans, levels)
+
+        ok = all(state == self.RUNNING for state in self._states.values())
+        logger.info(f"boot {'success' if ok else 'failed'}: "
+                    + ", ".join(f"{name}={state}" for name, state in self._states.items()))
+        return ok
+
+
+def parse_depends(text: str) -> Dict[str, List[str]]:
+    """
+    解析命令行中的依赖关系。
+
+    格式: "cell1:cell2,cell3;cell4:cell1"，表示cell1依赖cell2和cell3，cell4依赖cell1。
+    冒号后为空表示没有依赖。
+    """
+    depends = dict()
+    for item in text.split(';'):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, deps = item.partition(':')
+        depends[name.strip()] = [dep.strip() for dep in deps.split(',') if dep.strip()]
+    return depends
+
+
+@click.group()
+def cli():
+    """多单元格启动编排命令行接口。"""
+    pass
+
+
+def _open_resource(jhr: str) -> Optional[Resource]:
+    PlatformMgr.get_instance().load("platform")
+    rsc = ResourceMgr.get_instance().open(jhr)
+    if rsc is None:
+        logging.error(f"open {jhr} failed.")
+    return rsc
+
+
+@cli.command("order")
+@click.argument("jhr")
+@click.option("--depends", type=str, default='', help="覆盖依赖关系, 例如 'app:comm;comm:'")
+def cmd_order(jhr, depends):
+    """
+    显示单元格的启动顺序。
+    """
+    rsc = _open_resource(jhr)
+    if rsc is None:
+        return False
+    orchestrator = BootOrchestrator(rsc, RPCClient(), parse_depends(depends))
+    levels = orchestrator.order()
+    if levels is None:
+        return False
+    for idx, level in enumerate(levels):
+        print(f"{idx}: {' '.join(level)}")
+    return True
+
+
+@cli.command("boot")
+@click.argument("jhr")
+@click.option("--addr", type=str, default='tcp://127.0.0.1:4240', help="RPC服务器地址")
+@click.option("--enable/--no-enable", default=False, help="是否先启动根单元格")
+@click.option("--depends", type=str, default='', help="覆盖依赖关系, 例如 'app:comm;comm:'")
+@click.option("--jobs", type=int, default=4, help="并发生成和上传的单元格数")
+def cmd_boot(jhr, addr, enable, depends, jobs):
+    """
+    启动资源文件中的全部客户单元格。
+    """
+    rsc = _open_resource(jhr)
+    if rsc is None:
+        return False
+
+    client = RPCClient()
+    if not client.connect(addr, timeout=10):
+        logging.error(f"connect {addr} failed.")
+        return False
+
+    orchestrator = BootOrchestrator(rsc, client, parse_depends(depends), jobs, jobs)
+    ok = orchestrator.boot(enable)
+    for name, state in orchestrator.states().items():
+        print(f"{name:<32} {state:<10} {orchestrator.message(name)}")
+    client.close()
+    if not ok:
+        raise SystemExit(1)
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cli()
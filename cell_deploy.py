@@ -0,0 +1,396 @@
+"""
+单元格部署模块。
+
+界面和启动编排(boot_orchestrator)共用的单元格部署步骤。资源对象不是线程安全的，
+部署分为两步:
+- 在界面线程中从资源生成单元格配置、资源表和设备树，复制镜像路径、地址等运行信息，
+  结果只包含bytes和普通值
+- 在工作线程中读取镜像文件、追加ramdisk并调用RPC，不再访问资源
+
+部署源(source)的格式:
+    ACore和通用系统(deploy_source):
+    {
+        'name': 单元格名称,
+        'config': 单元格配置二进制,
+        'images': [{name, addr, file} ...]，只包含启用的镜像，file为绝对路径,
+        'rsc_table': {name, addr, data}，没有资源表时为None,
+    }
+    Linux(linux_source):
+    {
+        'name': 单元格名称,
+        'config': 单元格配置二进制,
+        'kernel': 内核文件,
+        'devicetree': 设备树文件，为None时使用dtb,
+        'dtb': 生成的设备树二进制,
+        'ramdisk': ramdisk文件，没有时为None,
+        'overlay': [追加到ramdisk的文件 ...],
+        'bootargs': 启动参数,
+    }
+    根单元格(root_source):
+    {
+        'config': 根单元格配置二进制,
+        'jhr': 资源的JSON，用于启动UART服务器，生成失败时为None,
+    }
+
+主要函数:
+- deploy_source, linux_source, root_source: 在界面线程中生成部署源
+- read_image, read_linux: 在工作线程中读取文件
+- deploy_plan: deploy_cell请求的参数
+- run_linux, enable_hypervisor: 在工作线程中执行的RPC操作
+"""
+
+import os
+import json
+import logging
+from hashlib import md5
+from typing import Optional, List, Callable
+from jh_resource import ResourceBase, Resource, ResourceGuestCell, MemRegionList
+from jh_resource import OSRunInfoBase, LinuxRunInfo, ACoreRunInfo, CommonOSRunInfo
+from generator import RootCellGenerator, GuestCellGenerator
+from rpc_server.api import RPCApi
+from utils import CpioUtil
+
+
+logger = logging.getLogger("CellDeploy")
+
+
+class DeployError(Exception):
+    """ 生成部署源或读取镜像失败 """
+    pass
+
+
+def cell_abspath(rsc_any: ResourceBase, path: str) -> str:
+    """
+    获取单元格中文件的绝对路径，相对路径相对于资源文件所在目录。
+    """
+    if os.path.isabs(path):
+        return path
+    rsc: Resource = rsc_any.ancestor(Resource)
+    if rsc is None:
+        return ""
+    return rsc.abs_path(path)
+
+
+def read_file(filename: str) -> bytes:
+    """
+    读取镜像文件。
+
+    Raises:
+        DeployError: 读取失败
+    """
+    try:
+        with open(filename, "rb") as f:
+            return f.read()
+    except OSError as e:
+        raise DeployError(f"read {filename} failed: {e.strerror or e}")
+
+
+def resource_table_image(cell: ResourceGuestCell) -> Optional[dict]:
+    """
+    生成资源表镜像。
+
+    Args:
+        cell: 客户单元格对象
+
+    Returns:
+        dict: {name, addr, data}，没有资源表时data为None，生成失败时返回None
+    """
+    rsc_table_mmap = cell.system_mem_resource_table()
+    if rsc_table_mmap is None:
+        return {'name': "resource table", 'addr': 0, 'data': None}
+
+    logger.info(f"resource table 0x{rsc_table_mmap.virt():x}@{rsc_table_mmap.size()}")
+    rsc_table_bin = GuestCellGenerator.gen_resource_table_bin(cell)
+    if rsc_table_bin is None:
+        logger.error(f'generate resource table dtb failed.')
+        return None
+
+    logger.info(f"resource table size: {len(rsc_table_bin)} sum: {sum(rsc_table_bin)}")
+    if len(rsc_table_bin) > rsc_table_mmap.size():
+        logger.error(f'resource table size {rsc_table_mmap.size()}, need {len(rsc_table_bin)}')
+        return None
+    return {'name': "resource table", 'addr': rsc_table_mmap.virt(), 'data': rsc_table_bin}
+
+
+def image_list(cell: ResourceGuestCell, os_runinfo: OSRunInfoBase) -> Optional[List[dict]]:
+    """
+    单元格启用的镜像。
+
+    Args:
+        cell: 客户单元格对象，用于转换相对路径
+        os_runinfo: 运行信息，可以是界面中编辑的副本
+
+    Returns:
+        list: [{name, addr, file} ...]，不是ACore或通用系统时返回None
+    """
+    images = list()
+    if isinstance(os_runinfo, ACoreRunInfo):
+        for name, image, enable in (("MSL", os_runinfo.msl, True),
+                                    ("OS", os_runinfo.os, True),
+                                    ("APP", os_runinfo.app, os_runinfo.app.enable)):
+            if enable:
+                images.append({'name': name, 'addr': image.addr, 'file': cell_abspath(cell, image.filename)})
+    elif isinstance(os_runinfo, CommonOSRunInfo):
+        for image in os_runinfo.images():
+            if image.enable:
+                images.append({'name': image.name, 'addr': image.addr, 'file': cell_abspath(cell, image.filename)})
+    else:
+        return None
+    return images
+
+
+def check_images(images: List[dict]):
+    """
+    检查镜像的加载地址和文件，镜像之间不能重叠。
+
+    Raises:
+        DeployError: 地址无效、文件不存在或镜像重叠
+    """
+    regions = MemRegionList()
+    for image in images:
+        if image['addr'] is None:
+            raise DeployError(f"image ({image['name']}) invalid.")
+        if not os.path.isfile(image['file']):
+            raise DeployError(f"image ({image['name']}) not found: {image['file']}")
+        size = os.path.getsize(image['file'])
+        if regions.is_overlap(image['addr'], size):
+            raise DeployError(f"image ({image['name']}) overlap")
+        regions.add(image['addr'], size)
+
+
+def deploy_source(cell: ResourceGuestCell, os_runinfo: OSRunInfoBase) -> dict:
+    """
+    生成ACore和通用系统单元格的部署源，在界面线程中执行。
+
+    Raises:
+        DeployError: 镜像配置错误，生成配置或资源表失败
+    """
+    images = image_list(cell, os_runinfo)
+    if images is None:
+        raise DeployError(f"unknown os runinfo {type(os_runinfo)}")
+    check_images(images)
+
+    config = GuestCellGenerator.gen_config_bin(cell)
+    if config is None:
+        raise DeployError("generate cell config failed.")
+
+    rsc_table = resource_table_image(cell)
+    if rsc_table is None:
+        raise DeployError("generate resource table failed.")
+
+    return {
+        'name': cell.name(),
+        'config': config,
+        'images': images,
+        'rsc_table': rsc_table if rsc_table['data'] is not None else None,
+    }
+
+
+def read_image(image: dict) -> dict:
+    """
+    读取镜像，在工作线程中执行。
+
+    Args:
+        image: {name, addr, file}
+
+    Returns:
+        dict: {name, addr, data}
+
+    Raises:
+        DeployError: 读取失败
+    """
+    data = read_file(image['file'])
+    logger.info(f"image {image['name']} @{hex(image['addr'])} md5: {md5(data).hexdigest()}")
+    return {'name': image['name'], 'addr': image['addr'], 'data': data}
+
+
+def deploy_plan(source: dict, images: List[dict], start: bool = True, replace: bool = True) -> dict:
+    """
+    deploy_cell请求的参数，资源表在镜像之后加载。
+
+    Args:
+        source: deploy_source生成的部署源
+        images: read_image读取的镜像
+    """
+    images = list(images)
+    if source['rsc_table'] is not None:
+        images.append(source['rsc_table'])
+    return {
+        'name': source['name'],
+        'config': source['config'],
+        'images': images,
+        'start': start,
+        'replace': replace,
+    }
+
+
+def linux_source(cell: ResourceGuestCell, os_runinfo: LinuxRunInfo) -> dict:
+    """
+    生成Linux单元格的部署源，在界面线程中执行。
+
+    没有指定设备树文件时根据资源生成设备树。
+
+    Raises:
+        DeployError: 生成配置或设备树失败，ramdisk不存在
+    """
+    dtb = None
+    devicetree = None
+    if len(os_runinfo.devicetree) > 0:
+        devicetree = cell_abspath(cell, os_runinfo.devicetree)
+    else:
+        dtb = GuestCellGenerator.gen_guestlinux_dtb(cell)
+        if dtb is None:
+            raise DeployError("generate dtb failed.")
+
+    ramdisk = None
+    if len(os_runinfo.ramdisk) > 0:
+        ramdisk = cell_abspath(cell, os_runinfo.ramdisk)
+        if not os.path.exists(ramdisk):
+            raise DeployError(f"ramdisk {os_runinfo.ramdisk} not exist.")
+
+    config = GuestCellGenerator.gen_config_bin(cell)
+    if config is None:
+        raise DeployError("generate cell config failed.")
+
+    return {
+        'name': cell.name(),
+        'config': config,
+        'kernel': cell_abspath(cell, os_runinfo.kernel),
+        'devicetree': devicetree,
+        'dtb': dtb,
+        'ramdisk': ramdisk,
+        'overlay': list(os_runinfo.ramdisk_overlay),
+        'bootargs': os_runinfo.bootargs,
+    }
+
+
+def read_linux(source: dict) -> dict:
+    """
+    读取内核、设备树和ramdisk，向ramdisk追加文件，在工作线程中执行。
+
+    Returns:
+        dict: {kernel, dtb, ramdisk, bootargs}，没有ramdisk时ramdisk为None
+
+    Raises:
+        DeployError: 读取失败
+    """
+    kernel = read_file(source['kernel'])
+    dtb = source['dtb']
+    if source['devicetree'] is not None:
+        dtb = read_file(source['devicetree'])
+
+    ramdisk = None
+    if source['ramdisk'] is not None:
+        cpio = CpioUtil(source['ramdisk'])
+        for filename in source['overlay']:
+            logger.info(f"append {filename} to ramdisk")
+            if not cpio.append_file(os.path.basename(filename), filename):
+                raise DeployError(f"append {filename} to ramdisk failed.")
+        ramdisk = cpio.get_bytes()
+        if ramdisk is None:
+            raise DeployError("append file to ramdisk failed.")
+
+    return {
+        'kernel': kernel,
+        'dtb': dtb,
+        'ramdisk': ramdisk,
+        'bootargs': source['bootargs'],
+    }
+
+
+def run_linux(client: RPCApi, name: str, config: bytes, linux: dict) -> RPCApi.Result:
+    """
+    销毁已存在的同名单元格，创建、加载并启动Linux单元格。
+
+    Args:
+        client: 已连接的RPC客户端
+        name: 单元格名称
+        config: 单元格配置二进制
+        linux: read_linux读取的镜像
+    """
+    result = client.list_cell()
+    if result is None or not result.status:
+        return RPCApi.Result.error("get cell list failed.")
+    if any(cell['name'] == name for cell in result.result):
+        client.destroy_cell(name)
+    result = client.run_linux(config, linux['kernel'], linux['dtb'], linux['ramdisk'], linux['bootargs'])
+    if result is None:
+        return RPCApi.Result.error("no result")
+    return result
+
+
+def root_source(rsc: Resource) -> dict:
+    """
+    生成根单元格的部署源，在界面线程中执行。
+
+    Raises:
+        DeployError: 生成根单元格配置失败
+    """
+    config = RootCellGenerator.gen_config_bin(rsc)
+    if config is None:
+        raise DeployError("generate root cell config failed.")
+
+    jhr = None
+    jhr_obj = rsc.to_dict()
+    if jhr_obj is not None:
+        jhr = json.dumps(jhr_obj)
+    else:
+        logger.warning(f"generate jhr json failed.")
+    return {'config': config, 'jhr': jhr}
+
+
+def enable_hypervisor(client: RPCApi, root: dict, start_uart: bool = True,
+                      step: Optional[Callable[[int, int, str], None]] = None) -> bool:
+    """
+    启动虚拟机监控器，在工作线程中执行。
+
+    已启动时先关闭，再启用Jailhouse，可选地启动UART服务器。
+
+    Args:
+        client: 已连接的RPC客户端
+        root: root_source生成的部署源
+        start_uart: 是否启动UART服务器
+        step: 每个步骤开始前调用 step(步骤, 步骤数, 说明)，可以抛出异常中止
+
+    Returns:
+        bool: 根单元格是否启动成功
+    """
+    steps = 3 if start_uart else 2
+
+    # 每次创建前先销毁
+    if step is not None:
+        step(0, steps, "disable")
+    result = client.list_cell()
+    if result is None or not result.status:
+        logger.error("get root cell list failed")
+        return False
+    for cell in result.result:
+        if cell['id'] == 0:
+            logger.info(f"jailhouse disable")
+            result = client.jailhouse_disable()
+            if result is None or not result.status:
+                logger.error("disable failed")
+                return False
+            break
+
+    if step is not None:
+        step(1, steps, "enable")
+    logger.info(f"jailhouse enable")
+    result = client.jailhouse_enable(root['config'])
+    if result is None or not result.status:
+        logger.error("jailhouse_enable failed")
+        if result is not None:
+            logger.error(f"{result.message}")
+        return False
+    logger.info("jailhouse root cell enable success")
+
+    if not start_uart or root['jhr'] is None:
+        return True
+    if step is not None:
+        step(2, steps, "start uart server")
+    result = client.start_uart_server(root['jhr'])
+    if not result:
+        logger.warning(f"start uart server failed, {result.message if result is not None else ''}")
+    else:
+        logger.info("start uart server succes.")
+    return True
@@ -3,15 +3,21 @@
 
 本模块提供了一些常用的界面组件和工具函数，包括：
 - 布局清理功能
+- 按键值同步布局中的组件, 复用已有组件
 - 输入框状态设置
 - 可选择按钮组件
+- 后台任务进度显示
 
 主要组件:
 - clean_layout: 清理布局中的所有组件
+- KeyedLayout: 按键值同步布局中的组件
+- sync_list_widget: 同步列表控件的文本
 - set_lineedit_status: 设置输入框的状态和提示
 - SelectButton: 可选择的按钮组件
+- JobProgressWidget: 显示后台任务的进度, 可以取消任务
 """
 
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
 from PySide2 import QtWidgets, QtGui, QtCore
 
 def clean_layout(layout):
@@ -33,6 +39,108 @@ def clean_layout(layout):
             widget.setParent(None)
             widget.deleteLater()
 
+class KeyedLayout(object):
+    """
+    按键值同步布局中的组件。
+    
+    每个键对应一个组件，sync()时保留键相同的组件，只创建新增的、删除多余的，
+    顺序变化时重新排列，避免每次刷新都重新创建所有组件。
+    
+    示例:
+        self._devices = KeyedLayout(layout, lambda name: SelectButton(name))
+        self._devices.sync(names)
+        for name, w in self._devices.items():
+            w.setChecked(name in selected)
+    """
+    def __init__(self, layout: QtWidgets.QLayout, create: Callable[[Hashable], QtWidgets.QWidget]):
+        """
+        Args:
+            layout: 管理的布局，布局中只应包含本对象创建的组件
+            create: 根据键创建组件的函数
+        """
+        self._layout = layout
+        self._create = create
+        self._widgets: Dict[Hashable, QtWidgets.QWidget] = dict()
+        self._keys: List[Hashable] = list()
+
+    def sync(self, keys: Iterable[Hashable]) -> bool:
+        """
+        同步组件。
+        
+        Args:
+            keys: 新的键列表，顺序为组件的显示顺序
+        
+        Returns:
+            bool: 组件是否有增加、删除或顺序变化
+        """
+        keys = list(dict.fromkeys(keys))
+        if keys == self._keys:
+            return False
+
+        new_keys = set(keys)
+        for key in self._keys:
+            if key not in new_keys:
+                widget = self._widgets.pop(key)
+                self._layout.removeWidget(widget)
+                widget.setParent(None)
+                widget.deleteLater()
+        kept = [key for key in self._keys if key in new_keys]
+
+        for key in keys:
+            if key not in self._widgets:
+                self._widgets[key] = self._create(key)
+
+        # 保留的组件顺序不变时只需在末尾添加新组件, 否则重新排列
+        if kept == keys[:len(kept)]:
+            for key in keys[len(kept):]:
+                self._layout.addWidget(self._widgets[key])
+        else:
+            for key in kept:
+                self._layout.removeWidget(self._widgets[key])
+            for key in keys:
+                self._layout.addWidget(self._widgets[key])
+
+        self._keys = keys
+        return True
+
+    def widget(self, key: Hashable) -> Optional[QtWidgets.QWidget]:
+        return self._widgets.get(key)
+
+    def keys(self) -> List[Hashable]:
+        return list(self._keys)
+
+    def items(self) -> List[tuple]:
+        return [(key, self._widgets[key]) for key in self._keys]
+
+    def clear(self):
+        self.sync(list())
+
+
+def sync_list_widget(listwidget: QtWidgets.QListWidget, texts: List[str]) -> bool:
+    """
+    同步列表控件的文本，复用已有的列表项，只修改变化的文本。
+    
+    Args:
+        listwidget: 列表控件
+        texts: 新的文本列表
+    
+    Returns:
+        bool: 列表是否有变化
+    """
+    changed = False
+    for row, text in enumerate(texts):
+        item = listwidget.item(row)
+        if item is None:
+            listwidget.addItem(text)
+            changed = True
+        elif item.text() != text:
+            item.setText(text)
+            changed = True
+    while listwidget.count() > len(texts):
+        listwidget.takeItem(listwidget.count()-1)
+        changed = True
+    return changed
+
 def set_lineedit_status(lineedit: QtWidgets.QLineEdit, ok: bool):
     """
     设置输入框的状态和提示信息。
@@ -75,3 +183,104 @@ class SelectButton(QtWidgets.QPushButton):
         super().__init__(name, parent)
         self.setCheckable(True)
 
+
+class JobProgressWidget(QtWidgets.QWidget):
+    """
+    后台任务进度组件。
+    
+    显示最近提交的任务的名称和进度，可以取消正在执行的任务，
+    没有任务时隐藏，任务出错时显示错误原因直到提交下一个任务。
+    """
+    def __init__(self, parent=None):
+        """
+        Args:
+            parent: 父窗口部件，默认为None
+        """
+        super().__init__(parent)
+        self._jobs = list()
+        self._failed = False
+
+        self._label = QtWidgets.QLabel(self)
+        self._progress = QtWidgets.QProgressBar(self)
+        self._progress.setTextVisible(False)
+        self._progress.setMaximumWidth(120)
+        self._btn_cancel = QtWidgets.QPushButton("取消", self)
+        self._btn_cancel.clicked.connect(self.cancel)
+
+        layout = QtWidgets.QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self._label)
+        layout.addWidget(self._progress)
+        layout.addWidget(self._btn_cancel)
+        self.hide()
+
+    def track(self, job):
+        """
+        显示任务的进度。
+        
+        Args:
+            job: 后台任务(RPCJob)，为None时不处理
+        """
+        if job is None:
+            return
+        self._jobs.append(job)
+        self._failed = False
+        self._label.setText(job.name())
+        # 没有报告进度前显示为忙碌状态
+        self._progress.setRange(0, 0)
+        self._progress.show()
+        self._btn_cancel.setEnabled(True)
+        self._btn_cancel.show()
+        self.show()
+
+        job.signals.progress.connect(lambda value, maximum, text: self._on_progress(job, value, maximum, text))
+        job.signals.result.connect(lambda value: self._on_result(job, value))
+        job.signals.error.connect(lambda msg: self._on_error(job, msg))
+        job.signals.canceled.connect(lambda: self._on_canceled(job))
+        job.signals.finished.connect(lambda: self._on_finished(job))
+
+    def cancel(self):
+        """ 取消正在执行的任务, 任务在下一个步骤之前结束 """
+        for job in self._jobs:
+            job.cancel()
+        self._btn_cancel.setEnabled(False)
+        self._label.setText("正在取消...")
+
+    def _is_latest(self, job) -> bool:
+        return len(self._jobs) > 0 and self._jobs[-1] is job
+
+    def _on_progress(self, job, value: int, maximum: int, text: str):
+        if not self._is_latest(job) or job.is_canceled():
+            return
+        self._progress.setRange(0, maximum)
+        self._progress.setValue(value)
+        if text:
+            self._label.setText(f"{job.name()}: {text}")
+
+    def _on_result(self, job, value):
+        # 任务函数返回False表示失败, 原因已写入日志
+        if value is False:
+            self._on_error(job, "详见日志")
+
+    def _on_error(self, job, msg: str):
+        if not self._is_latest(job):
+            return
+        self._failed = True
+        self._label.setText(f"{job.name()} 失败: {msg}")
+
+    def _on_canceled(self, job):
+        if not self._is_latest(job):
+            return
+        self._label.setText(f"{job.name()} 已取消")
+
+    def _on_finished(self, job):
+        if job in self._jobs:
+            self._jobs.remove(job)
+        if self._jobs:
+            return
+        if self._failed:
+            # 保留错误原因
+            self._progress.hide()
+            self._btn_cancel.hide()
+            return
+        self.hide()
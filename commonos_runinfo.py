@@ -13,22 +13,21 @@
 - CommonOSRunInfoWidget: 通用操作系统运行信息界面
 """
 
-import os
 import copy
 import logging
-from typing import List
-from hashlib import md5
+from typing import List, Optional
 from PySide2 import QtWidgets, QtCore
-from jh_resource import ResourceGuestCell, ResourceBase, Resource
+from jh_resource import ResourceGuestCell, ResourceBase
 from jh_resource import ImageInfo
 from jh_resource import OSRunInfoBase, CommonOSRunInfo
-from jh_resource import MemRegionList, MemRegion
-from generator import GuestCellGenerator
 from forms.ui_image_info import Ui_ImageInfoWidget
 from forms.ui_common_runinfo import Ui_CommonRunInfoWidget
 from common_widget import clean_layout
 from utils import from_human_num, to_human_addr
 from rpc_server.rpc_client import RPCClient
+from cell_deploy import DeployError, cell_abspath, resource_table_image
+from cell_deploy import deploy_source, read_image, deploy_plan
+from rpc_job import JobManager, RPCJob
 
 
 class ImageInfoWidget(QtWidgets.QWidget):
@@ -195,6 +194,72 @@ class OSRunInfoWidget(QtWidgets.QWidget):
         """
         return copy.deepcopy(self._runinfo)
 
+    def resource_table_image(self, cell: ResourceGuestCell) -> Optional[dict]:
+        """
+        生成资源表镜像。
+        
+        Args:
+            cell: 客户单元格对象
+            
+        Returns:
+            dict: {name, addr, data}，没有资源表时data为None，生成失败时返回None
+        """
+        return resource_table_image(cell)
+
+    def deploy(self, cell: ResourceGuestCell, os_runinfo: OSRunInfoBase) -> Optional[RPCJob]:
+        """
+        提交部署并启动单元格的后台任务。
+        
+        在界面线程中检查镜像，生成单元格配置和资源表，资源对象不是线程安全的；
+        后台任务只读取镜像文件，通过一次deploy_cell请求在服务端完成
+        销毁旧单元格、创建、加载和启动，失败时由服务端回滚。
+        
+        Args:
+            cell: 客户单元格对象
+            os_runinfo: 运行信息
+            
+        Returns:
+            RPCJob: 后台任务，检查或生成失败、未连接时返回None
+        """
+        self.logger.info(f"generate cell({cell.name()}) config")
+        try:
+            source = deploy_source(cell, os_runinfo)
+        except DeployError as e:
+            self.logger.error(f"deploy cell({cell.name()}) failed: {e}")
+            return None
+        return JobManager.get_instance().submit(f"deploy {cell.name()}", self._deploy_job, source)
+
+    def _deploy_job(self, job: RPCJob, client: RPCClient, source: dict) -> bool:
+        """
+        部署任务，在工作线程中执行，只访问部署源中的数据。
+        """
+        cellname = source['name']
+        steps = len(source['images']) + 1
+
+        images = list()
+        for idx, image in enumerate(source['images']):
+            job.check_canceled()
+            job.progress(idx, steps, f"read {image['name']}")
+            self.logger.info(f"load firmware {image['name']} for cell({cellname}) @{hex(image['addr'])}")
+            try:
+                images.append(read_image(image))
+            except DeployError as e:
+                self.logger.error(f"{e}")
+                return False
+
+        job.check_canceled()
+        job.progress(steps-1, steps, "deploy")
+        self.logger.info(f"deploy cell({cellname})")
+        result = client.deploy_cell(deploy_plan(source, images))
+        if result is None or not result.status:
+            msg = result.message if result is not None else ""
+            self.logger.error(f"deploy cell({cellname}) failed {msg}")
+            return False
+        self.logger.info(f"deploy cell({cellname}): {' -> '.join(result.result)}")
+        job.progress(steps, steps, "done")
+        self.logger.info(f"run cell{cellname} success.")
+        return True
+
     def load_resource_table(self, cell: ResourceGuestCell) -> bool:
         """
         加载资源表。
@@ -209,24 +274,16 @@ class OSRunInfoWidget(QtWidgets.QWidget):
         """
         client = RPCClient.get_instance()
         cellname = cell.name()
-        rsc_table_mmap = cell.system_mem_resource_table()
-
-        if rsc_table_mmap is not None:
-            self.logger.info(f"load resource table 0x{rsc_table_mmap.virt():x}@{rsc_table_mmap.size()}")
-            rsc_table_bin = GuestCellGenerator.gen_resource_table_bin(cell)
-            if rsc_table_bin is None:
-                self.logger.error(f'generate resource table dtb failed.')
-                return False
-
-            self.logger.info(f"resource table size: {len(rsc_table_bin)} sum: {sum(rsc_table_bin)}")
-            if len(rsc_table_bin) > rsc_table_mmap.size():
-                self.logger.error(f'resource table size {rsc_table_mmap.size()}, need {len(rsc_table_bin)}')
-                return False
-            result = client.load_cell(cellname, rsc_table_mmap.virt(), rsc_table_bin )
-            if result is None or not result.status:
-                self.logger.error(f"load failed")
-                return False
+        rsc_table = self.resource_table_image(cell)
+        if rsc_table is None:
+            return False
+        if rsc_table['data'] is None:
             return True
+
+        result = client.load_cell(cellname, rsc_table['addr'], rsc_table['data'])
+        if result is None or not result.status:
+            self.logger.error(f"load failed")
+            return False
         return True
 
     def abspath(self, rsc_any: ResourceBase, path) -> str:
@@ -242,12 +299,7 @@ class OSRunInfoWidget(QtWidgets.QWidget):
         Returns:
             str: 文件的绝对路径
         """
-        if os.path.isabs(path):
-            return path
-        rsc: Resource = rsc_any.ancestor(Resource)
-        if rsc is None:
-            return ""
-        return rsc.abs_path(path)
+        return cell_abspath(rsc_any, path)
 
     def reset(self):
         """
@@ -268,19 +320,20 @@ class OSRunInfoWidget(QtWidgets.QWidget):
         """
         pass
 
-    def run(self, cell: ResourceGuestCell) -> bool:
+    def run(self, cell: ResourceGuestCell) -> Optional[RPCJob]:
         """
         运行系统。
         
-        子类需要实现此方法。
+        子类需要实现此方法，在界面线程中检查配置并从资源生成部署数据，
+        读取文件和RPC调用在后台任务中执行。
         
         Args:
             cell: 要运行的客户单元格
             
         Returns:
-            bool: 运行是否成功
+            RPCJob: 后台任务，检查失败时返回None
         """
-        return False
+        return None
 
 
 class CommonOSRunInfoWidget(OSRunInfoWidget):
@@ -406,31 +459,27 @@ class CommonOSRunInfoWidget(OSRunInfoWidget):
         self._runinfo.set_reset_addr(value)
         self.value_changed.emit()
 
-    def run(self, cell: ResourceGuestCell) -> bool:
+    def run(self, cell: ResourceGuestCell) -> Optional[RPCJob]:
         """
         运行通用操作系统。
         
         执行以下步骤：
         1. 检查运行环境
-        2. 验证镜像配置
-        3. 生成并加载客户单元格配置
-        4. 加载系统镜像
-        5. 加载资源表
-        6. 启动系统
+        2. 验证镜像配置，生成客户单元格配置和资源表
+        3. 在后台任务中读取镜像，通过deploy_cell一次完成创建、加载镜像和资源表、启动
         
         Args:
             cell: 要运行的客户单元格
             
         Returns:
-            bool: 运行是否成功
+            RPCJob: 后台任务，检查失败时返回None
         """
         client = RPCClient.get_instance()
         if cell is None:
-            return False
+            return None
         if not client.is_connected():
-            return False
+            return None
 
-        regions = MemRegionList()
         cellname = cell.name()
         os_runinfo: CommonOSRunInfo = self.runinfo()
         self.logger.info(f"start run cell {cellname}")
@@ -438,91 +487,9 @@ class CommonOSRunInfoWidget(OSRunInfoWidget):
         reset_addr = from_human_num(self._ui.lineedit_reset_addr.text())
         if reset_addr is None:
             self.logger.error(f"invalid entry addr {self._ui.lineedit_reset_addr.text()}")
-            return False
+            return None
         self.logger.info(f"set reset addr {hex(reset_addr)}")
         cell.set_reset_addr(reset_addr)
 
-        # 验证镜像配置
-        for image in os_runinfo.images():
-            if not image.enable:
-                continue
-
-            if image.addr is None:
-                self.logger.error(f"image ({image.name}) invalid.")
-                return
-            if not os.path.isfile(self.abspath(cell, image.filename)):
-                self.logger.error(f"image ({image.name}) not found: {image.filename}")
-                return
-
-            size = os.path.getsize(self.abspath(cell, image.filename))
-            if regions.is_overlap(image.addr, size):
-                self.logger.error(f"image ({image.name}) overlap")
-                return
-            regions.add(image.addr, size)
-
-        # 生成客户单元格配置
-        self.logger.info(f"generate cell({cellname}) config")
-        guest_cell_bin = GuestCellGenerator.gen_config_bin(cell)
-        if guest_cell_bin is None:
-            self.logger.error(f"generate cell config failed")
-            return
-
-        # 检查并清理已存在的单元格
-        cell_exist = False
-        result = client.list_cell()
-        if result is None or not result.result:
-            self.logger.error("get cell list failed")
-            return
-        for _cell in result.result:
-            if _cell['name'] == cellname:
-                cell_exist = True
-                break
-        if cell_exist:
-            self.logger.info(f"cell exist, destroy cell({cellname}) firstly.")
-            if not client.destroy_cell(cellname):
-                self.logger.debug(f"destroy cell({cellname}) failed")
-                return
-
-        # 创建新的客户单元格
-        self.logger.info(f'create cell({cellname})')
-        result = client.create_cell(guest_cell_bin)
-        if not result.status:
-            self.logger.error(f"create guest cell failed {result.message}")
-            return
-
-        # 加载系统镜像
-        for image in os_runinfo.images():
-            if not image.enable:
-                continue
-            name = image.name
-            addr = image.addr
-            file = self.abspath(cell, image.filename)
-
-            self.logger.info(f"load firmware {name} for cell({cellname}) @{hex(addr)}")
-            try:
-                with open(file, 'rb') as f:
-                    fw_bin = f.read()
-            except:
-                self.logger.error(f"read {file} failed.")
-                return
-
-            self.logger.info(f"md5: {md5(fw_bin).hexdigest()}")
-            result = client.load_cell(cellname, addr, fw_bin )
-            if result is None or not result.status:
-                self.logger.error(f"load failed")
-                return
-
-        # 加载资源表
-        if not self.load_resource_table(cell):
-            self.logger.error("load resource table failed.")
-            return
-
-        # 启动系统
-        self.logger.info(f"start cell({cellname})")
-        result = client.start_cell(cellname)
-        if result is None or not result.status:
-            self.logger.error(f"start cell({cellname}) failed")
-            return
-
-        self.logger.info(f"run cell{cellname} success.")
-        return True
+        # 验证镜像, 生成配置和资源表, 读取镜像和部署在后台任务中完成
+        return self.deploy(cell, os_runinfo)
@@ -15,7 +15,7 @@ from PySide2 import QtWidgets, QtCore
 from typing import Set, List
 from forms.ui_cpu_edit_widget import Ui_CPUEditWidget
 from flowlayout import FlowLayout
-from common_widget import SelectButton, clean_layout
+from common_widget import SelectButton, KeyedLayout
 
 
 class CPUEditWidget(QtWidgets.QWidget):
@@ -48,6 +48,7 @@ class CPUEditWidget(QtWidgets.QWidget):
         self._ui.setupUi(self)
         self._ui.frame_ops.hide()
         self._layout = FlowLayout(self._ui.frame_cpus)
+        self._buttons = KeyedLayout(self._layout, self._create_item)
 
         self._editable = True
         self._items: List[SelectButton] = list()
@@ -63,14 +64,16 @@ class CPUEditWidget(QtWidgets.QWidget):
             count: CPU核心数量
         """
         self._cpu_count = count
-        clean_layout(self._layout)
-        self._items.clear()
+        # 数量不变时保留已有的按钮
+        self._buttons.sync(range(count))
+        self._items = [item for _, item in self._buttons.items()]
+        for item in self._items:
+            item.setEnabled(self._editable)
 
-        for i in range(count):
-            item = SelectButton(str(i), self._ui.frame_cpus)
-            self._layout.addWidget(item)
-            item.clicked.connect(self._on_item_changed)
-            self._items.append(item)
+    def _create_item(self, index: int) -> SelectButton:
+        item = SelectButton(str(index), self._ui.frame_cpus)
+        item.clicked.connect(self._on_item_changed)
+        return item
 
     def set_editable(self, editable: bool):
         """
@@ -81,6 +84,7 @@ class CPUEditWidget(QtWidgets.QWidget):
         Args:
             editable: 是否允许编辑
         """
+        self._editable = editable
         for item in self._items:
             item.setEnabled(editable)
 
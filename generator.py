@@ -17,14 +17,11 @@ Jailhouse配置生成器模块。
 import logging
 from typing import TypedDict, List, Optional
 import ctypes
-from mako.template import Template
-from mako import exceptions
 from jh_resource import Resource, ResourceGuestCell, ResourceCPU, ResourceGuestCellList, ResourcePCIDeviceList, ResourceRootCell
 from jh_resource import ResourceComm, ARMArch
 from jh_resource import ResourceMgr, PlatformMgr
 from utils import get_template_path
 import click
-import fdt
 import cellconfig
 from cellconfig import Revision14
 
@@ -372,6 +369,9 @@ class RootCellGenerator(object):
     def gen_config_source(cls, rsc: Resource) -> Optional[str]:
         kwargs = cls.gen_kwargs(rsc)
 
+        # mako在生成源码时才导入, 减少启动时间
+        from mako.template import Template
+        from mako import exceptions
         mako_txt = open(get_template_path("root_cell.mako"), "rt", encoding='utf-8').read()
         try:
             txt = Template(mako_txt).render(**kwargs)
@@ -798,6 +798,8 @@ class GuestCellGenerator(object):
         if kwargs is None:
             return None
 
+        from mako.template import Template
+        from mako import exceptions
         try:
             mako_txt = open(get_template_path("guest_cell.mako"), "rt", encoding='utf-8').read()
             txt = Template(mako_txt).render(**kwargs)
@@ -964,6 +966,7 @@ class GuestCellGenerator(object):
         kwargs = cls.gen_kwargs(guestcell)
         if kwargs is None:
             return None
+        from mako.template import Template
         from mako import exceptions
         try:
             mako_txt = open(get_template_path(fname), "rt", encoding='utf-8').read()
@@ -976,6 +979,7 @@ class GuestCellGenerator(object):
 
     @classmethod
     def dts_to_dtb(cls, dts):
+        import fdt
         x = fdt.parse_dts(dts)
         return x.to_dtb(version=17)
 
@@ -991,6 +995,7 @@ class GuestCellGenerator(object):
         kwargs = cls.gen_kwargs(guestcell)
         if kwargs is None:
             return None
+        from mako.template import Template
         from mako import exceptions
         try:
             mako_txt = open(get_template_path("resource_table.dts.mako"), "rt", encoding='utf-8').read()
@@ -7,7 +7,7 @@ from jh_resource import ResourceSignals
 from mem_edit_widget import MemEditWidget
 from utils import from_human_num, to_human_addr
 from flowlayout import FlowLayout
-from common_widget import clean_layout, set_lineedit_status, SelectButton
+from common_widget import KeyedLayout, sync_list_widget, set_lineedit_status, SelectButton
 from forms.ui_guestcell_widget import Ui_GuestCellWidget
 from forms.ui_guestcells_widget import Ui_GuestCellsWidget
 from tip_widget import TipMgr
@@ -48,6 +48,7 @@ class GuestCellsWidget(QtWidgets.QWidget):
         self._ui.setupUi(self)
 
         self._guestcells: Optional[ResourceGuestCellList] = None
+        self._current_cell: Optional[ResourceGuestCell] = None
         self._guestcell_widget = GuestCellWidget(self)
         self._ui.frame_guestcell_content.layout().addWidget(self._guestcell_widget)
 
@@ -63,6 +64,7 @@ class GuestCellsWidget(QtWidgets.QWidget):
             return
 
         self._guestcells = guestcells
+        self._current_cell = None
         self._update_guestcells()
         self._ui.frame_guestcell_content.hide()
 
@@ -80,36 +82,34 @@ class GuestCellsWidget(QtWidgets.QWidget):
             return
 
         guestcells = self._guestcells
+        cells = [guestcells.cell_at(i) for i in range(guestcells.cell_count())]
 
-        current_name = ""
-        if self._ui.listwidget_guestcells.currentRow() >= 0:
-            current_name = self._ui.listwidget_guestcells.currentItem().text()
-
-        self._ui.label_guestcell_name.clear()
-        self._ui.btn_remove_cell.setEnabled(False)
-        self._ui.frame_guestcell_content.hide()
-
+        # 只修改变化的列表项, 当前单元格仍存在时保持选中和显示的内容
         self._ui.listwidget_guestcells.blockSignals(True)
-        self._ui.listwidget_guestcells.clear()
-        for i in range(guestcells.cell_count()):
-            guestcell = guestcells.cell_at(i)
-            name = guestcell.name()
-            item = QtWidgets.QListWidgetItem(name, self._ui.listwidget_guestcells)
-            self._ui.listwidget_guestcells.addItem(item)
+        sync_list_widget(self._ui.listwidget_guestcells, [cell.name() for cell in cells])
+        row = -1
+        for i, cell in enumerate(cells):
+            if cell is self._current_cell:
+                row = i
+                break
+        self._ui.listwidget_guestcells.setCurrentRow(row)
         self._ui.listwidget_guestcells.blockSignals(False)
 
         height = self._ui.listwidget_guestcells.sizeHintForRow(0)*self._ui.listwidget_guestcells.count()
         self._ui.listwidget_guestcells.setFixedHeight(height+10)
 
-        for i in range(guestcells.cell_count()):
-            if current_name == guestcells.cell_at(i).name():
-                self._ui.listwidget_guestcells.setCurrentRow(i)
+        if row < 0:
+            self._current_cell = None
+            self._ui.label_guestcell_name.clear()
+            self._ui.btn_remove_cell.setEnabled(False)
+            self._ui.frame_guestcell_content.hide()
 
     def _on_guestcell_selected(self, row):
         if self._guestcells is None:
             return
         guestcell = self._guestcells.cell_at(row)
         if guestcell is not None:
+            self._current_cell = guestcell
             self._guestcell_widget.set_guestcell(guestcell)
             self._ui.label_guestcell_name.setText(guestcell.name())
             self._ui.btn_remove_cell.setEnabled(True)
@@ -147,7 +147,6 @@ class GuestCellsWidget(QtWidgets.QWidget):
                                            QtWidgets.QMessageBox.Yes|QtWidgets.QMessageBox.No, QtWidgets.QMessageBox.No)
         if x == QtWidgets.QMessageBox.Yes:
             self._guestcells.remove_cell(guestcell)
-            self._ui.listwidget_guestcells.clear()
             self._update_guestcells()
 
 
@@ -170,9 +169,13 @@ class GuestCellWidget(QtWidgets.QWidget):
 
         self._devices_layout = FlowLayout()
         self._ui.frame_devices.setLayout(self._devices_layout)
+        self._devices = KeyedLayout(self._devices_layout,
+                                    lambda name: self._create_select_button(name, self._on_device_changed))
 
         self._pci_devices_layout = FlowLayout()
         self._ui.frame_pci_devices.setLayout(self._pci_devices_layout)
+        self._pci_devices = KeyedLayout(self._pci_devices_layout,
+                                        lambda name: self._create_select_button(name, self._on_pci_device_changed))
 
         self._mmaps_widget = MemEditWidget(self)
         self._ui.frame_memmaps.layout().addWidget(self._mmaps_widget)
@@ -260,19 +263,20 @@ class GuestCellWidget(QtWidgets.QWidget):
         self.set_guestcell(self._guestcell)
         return super().showEvent(event)
 
+    @staticmethod
+    def _create_select_button(name: str, on_clicked) -> SelectButton:
+        w = SelectButton(name)
+        w.setCheckable(True)
+        w.clicked.connect(on_clicked)
+        return w
+
     def _update_devices(self, guestcell: ResourceGuestCell):
         cpu: ResourceCPU = guestcell.find(ResourceCPU)
-        clean_layout(self._devices_layout)
+        self._devices.sync(dev.name() for dev in cpu.devices())
 
         devices = guestcell.devices()
-        for dev in cpu.devices():
-            name = dev.name()
-            w = SelectButton(name)
-            w.setCheckable(True)
-            if name in devices:
-                w.setChecked(True)
-            w.clicked.connect(self._on_device_changed)
-            self._devices_layout.addWidget(w)
+        for name, w in self._devices.items():
+            w.setChecked(name in devices)
 
     def _on_console_changed(self, index):
         if self._guestcell is None:
@@ -288,10 +292,9 @@ class GuestCellWidget(QtWidgets.QWidget):
         if self._guestcell is None:
             return
         devices = list()
-        for i in range(self._devices_layout.count()):
-            w: QtWidgets.QPushButton = self._devices_layout.itemAt(i).widget()
+        for name, w in self._devices.items():
             if w.isChecked():
-                devices.append(w.text())
+                devices.append(name)
         self._guestcell.set_devices(devices)
 
     def _on_reset_addr_changed(self):
@@ -307,29 +310,25 @@ class GuestCellWidget(QtWidgets.QWidget):
 
     def _update_pci_devices(self, guestcell: ResourceGuestCell):
         pci_devices: ResourcePCIDeviceList = guestcell.find(ResourcePCIDeviceList)
-        clean_layout(self._pci_devices_layout)
-
-        devices = guestcell.pci_deivces()
+        names = list()
         for idx in range(pci_devices.device_count()):
             dev = pci_devices.device_at(idx)
             if dev is None:
                 break
-            name = dev.path()
-            w = SelectButton(name)
-            w.setCheckable(True)
-            if name in devices:
-                w.setChecked(True)
-            w.clicked.connect(self._on_pci_device_changed)
-            self._pci_devices_layout.addWidget(w)
+            names.append(dev.path())
+        self._pci_devices.sync(names)
+
+        devices = guestcell.pci_deivces()
+        for name, w in self._pci_devices.items():
+            w.setChecked(name in devices)
 
     def _on_pci_device_changed(self):
         if self._guestcell is None:
             return
         devices = list()
-        for i in range(self._pci_devices_layout.count()):
-            w: QtWidgets.QPushButton = self._pci_devices_layout.itemAt(i).widget()
+        for name, w in self._pci_devices.items():
             if w.isChecked():
-                devices.append(w.text())
+                devices.append(name)
         self._guestcell.set_pci_devices(devices)
 
     def _on_sysmem_changed(self):
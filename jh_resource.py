@@ -1,7 +1,8 @@
 from inspect import isclass, isfunction
+from types import FunctionType
 import json
 import os
-from typing import Callable, Optional, List, Set, Any, Union
+from typing import Callable, Optional, List, Set, Any, Union, Tuple
 import logging
 import toml
 import blinker
@@ -15,6 +16,8 @@ import itertools
 import copy
 import enum
 import base64
+import jhr_cache
+from utils import write_file_atomic
 
 # 资源结构
 # Resource
@@ -95,6 +98,9 @@ class DictHelper(object):
                 return False
             setattr(obj, name, value)
             return True
+        # 编译加载函数时使用
+        _setattr.attr_name = name
+        _setattr.convert = None
         return _setattr
 
     @classmethod
@@ -134,6 +140,30 @@ class DictHelper(object):
             return Ok(size)
         return _getattr
 
+    @classmethod
+    def parse_size(cls, value) -> Optional[int]:
+        """
+        解析大小, 支持整数和"4KB"/"2MB"/"1GB"格式, 无效时返回None
+        """
+        if isinstance(value, str):
+            try:
+                if value.endswith('GB'):
+                    value = int(value[0:-2])*cls.GB
+                elif value.endswith('MB'):
+                    value = int(value[0:-2])*cls.MB
+                elif value.endswith('KB'):
+                    value = int(value[0:-2])*cls.KB
+                else:
+                    cls.logger.error("invalid size value")
+                    return None
+            except:
+                cls.logger.error("invalid size value")
+                return None
+        if not isinstance(value, int):
+            cls.logger.error("type error")
+            return None
+        return value
+
     @classmethod
     def size_set(cls, name: str):
         def _setattr(obj, value) -> bool:
@@ -143,79 +173,159 @@ class DictHelper(object):
             if isfunction(getattr(obj, name)):
                 cls.logger.error(f"attr {name} in object {obj} is function")
                 return False
-            if isinstance(value, str):
-                try:
-                    if value.endswith('GB'):
-                        value = int(value[0:-2])*cls.GB
-                    elif value.endswith('MB'):
-                        value = int(value[0:-2])*cls.MB
-                    elif value.endswith('KB'):
-                        value = int(value[0:-2])*cls.KB
-                    else:
-                        cls.logger.error("invalid size value")
-                        return False
-                except:
-                    cls.logger.error("invalid size value")
-                    return False
-            if not isinstance(value, int):
-                cls.logger.error("type error")
+            value = cls.parse_size(value)
+            if value is None:
                 return False
             setattr(obj, name, value)
             return True
+        # 编译加载函数时使用
+        _setattr.attr_name = name
+        _setattr.convert = cls.parse_size
         return _setattr
 
     @classmethod
     def size_getset(cls, name: str):
         return DictHelper.size_get(name), DictHelper.size_set(name)
 
+    # 编译后的加载函数 {id(items): (items, loader)}, 保存items避免id被复用
+    _loaders = dict()
+
     @classmethod
     def from_dict(cls, items: List[Item], obj: object, value: dict) -> bool:
         """
         从字典加载数据
         """
-        for item in items:
-            keys = item.keys
-            if isinstance(keys, str):
-                keys = keys.split('.')
-
-            if not isinstance(keys, (list, tuple)):
-                cls.logger.error("items error {keys}")
-                return False
+        entry = cls._loaders.get(id(items))
+        if entry is None or entry[0] is not items:
+            entry = (items, cls.compile(items))
+            cls._loaders[id(items)] = entry
+        return entry[1](obj, value)
 
-            v = value
-            for key in keys:
-                if not isinstance(v, dict):
-                    cls.logger.error(f"[{key}] not a dict")
-                    traceback.print_stack()
-                    return False
-                v = v.get(key)
+    @classmethod
+    def compile(cls, items: List[Item]) -> Callable[[object, dict], bool]:
+        """
+        将items编译为加载函数 loader(obj, value) -> bool
 
-            if v is None and not item.require:
-                cls.logger.debug(f"{keys} not found, ignore")
+        键路径拆分、枚举名称表和类型检查在编译时完成。单层键的项生成直接的
+        字典查找和属性赋值代码, 其他情况和出错时调用逐项的处理函数,
+        结果和日志与逐项解释items相同。
+        """
+        ns = {'isinstance': isinstance, 'getattr': getattr, 'FunctionType': FunctionType}
+        lines = ["def _loader(obj, value):"]
+        if items:
+            lines += [
+                "    if not isinstance(value, dict):",
+                "        return S0(obj, value)",
+                "    d = getattr(obj, '__dict__', None)",
+            ]
+        for i, item in enumerate(items):
+            step, convert, key = cls._compile_item(item)
+            ns[f'S{i}'] = step
+            if key is None:
+                lines += [
+                    f"    if not S{i}(obj, value):",
+                    f"        return False",
+                ]
                 continue
 
-            if isclass(item.types) and issubclass(item.types, enum.Enum):
-                # 字符串转枚举值
-                enum_type = item.types
-                enum_value = None
-                for name in enum_type.__members__:
-                    if v.upper() == name.upper():
-                        enum_value = enum_type.__members__[name]
-                        break
+            ns[f'K{i}'] = key
+            ns[f'T{i}'] = item.types
+            ns[f'C{i}'] = convert
+            ns[f'SET{i}'] = item.set
+            lines += [
+                f"    v = value.get(K{i})",
+                f"    if v is None or not isinstance(v, T{i}):",
+                f"        if not C{i}(obj, v, value):",
+                f"            return False",
+            ]
+            # common_set/size_set的属性在__dict__中时直接赋值, 否则由设置函数报告错误
+            name = getattr(item.set, 'attr_name', None)
+            if name is not None:
+                ns[f'N{i}'] = name
+                ns[f'CV{i}'] = item.set.convert
+                lines.append(f"    elif d is not None and N{i} in d and not isinstance(d[N{i}], FunctionType):")
+                if item.set.convert is not None:
+                    lines += [
+                        f"        v = CV{i}(v)",
+                        f"        if v is None:",
+                        f"            return False",
+                    ]
+                lines.append(f"        d[N{i}] = v")
+            lines += [
+                f"    elif not SET{i}(obj, v):",
+                f"        return False",
+            ]
+        lines.append("    return True")
+
+        exec(compile('\n'.join(lines), "<DictHelper.compile>", "exec"), ns)
+        return ns['_loader']
+
+    @classmethod
+    def _compile_item(cls, item: Item) -> Tuple[Callable[[object, dict], bool], Optional[Callable], Optional[str]]:
+        """
+        编译单个项。
+
+        Returns:
+            (step, convert, key): step(obj, value)完整处理该项; convert(obj, v, value)处理
+            已取出的值; key为单层非枚举项的键, 可以生成直接查找的代码, 否则为None
+        """
+        keys = item.keys
+        if isinstance(keys, str):
+            keys = keys.split('.')
+
+        if not isinstance(keys, (list, tuple)):
+            def _error(obj, value) -> bool:
+                cls.logger.error("items error {keys}")
+                return False
+            return _error, None, None
+
+        shown_keys = keys
+        keys = tuple(keys)
+        types = item.types
+        _set = item.set
+        require = item.require
+        logger = cls.logger
+
+        # 字符串转枚举值, 名称不区分大小写, 同名时使用第一个
+        enum_type = None
+        enum_values = dict()
+        if isclass(types) and issubclass(types, enum.Enum):
+            enum_type = types
+            for name, member in types.__members__.items():
+                enum_values.setdefault(name.upper(), member)
+
+        def _convert(obj: object, v, value: dict) -> bool:
+            if v is None and not require:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"{shown_keys} not found, ignore")
+                return True
+
+            if enum_type is not None:
+                enum_value = enum_values.get(v.upper())
                 if enum_value is None:
-                    cls.logger.error(f'unknown enum value {v} for type {enum_type}')
+                    logger.error(f'unknown enum value {v} for type {enum_type}')
                     return False
                 v = enum_value
 
-            if not isinstance(v, item.types):
-                cls.logger.error(f'[{item.keys}]({v}) type error expect {item.types} but {type(v)}: {value}')
+            if not isinstance(v, types):
+                logger.error(f'[{item.keys}]({v}) type error expect {types} but {type(v)}: {value}')
                 return False
 
-            ret = item.set(obj, v)
-            if not ret:
-                return ret
+            return _set(obj, v)
 
-        return True
+        def _step(obj: object, value: dict) -> bool:
+            v = value
+            for key in keys:
+                if not isinstance(v, dict):
+                    logger.error(f"[{key}] not a dict")
+                    traceback.print_stack()
+                    return False
+                v = v.get(key)
+            return _convert(obj, v, value)
+
+        if len(keys) == 1 and enum_type is None:
+            return _step, _convert, keys[0]
+        return _step, _convert, None
 
     @classmethod
     def to_dict(cls, items, obj) -> Optional[dict]:
@@ -1362,6 +1472,8 @@ class ResourceRunInfo(ResourceBase):
         super().__init__(parent)
 
         self._os_runinfo: OSRunInfoBase = CommonOSRunInfo()
+        # 启动时依赖的其他单元格名称, 全部启动时先启动依赖的单元格
+        self._depends: List[str] = list()
 
     def label(self) -> str:
         return "runinfo"
@@ -1369,6 +1481,19 @@ class ResourceRunInfo(ResourceBase):
     def os_runinfo(self) -> Optional[OSRunInfoBase]:
         return self._os_runinfo
 
+    def depends(self) -> List[str]:
+        return list(self._depends)
+
+    @ResourceBase.modified
+    def set_depends(self, depends: List[str]) -> bool:
+        if not isinstance(depends, (list, tuple)):
+            return False
+        for name in depends:
+            if not ResourceGuestCell.check_name(name):
+                return False
+        self._depends = list(dict.fromkeys(depends))
+        return True
+
     @ResourceBase.modified
     def set_os_runinfo(self, runinfo: OSRunInfoBase) -> bool:
         if not isinstance(runinfo, OSRunInfoBase):
@@ -1380,6 +1505,10 @@ class ResourceRunInfo(ResourceBase):
         if not isinstance(value, dict):
             return False
 
+        depends = value.get('depends')
+        if isinstance(depends, list):
+            self._depends = [name for name in depends if isinstance(name, str)]
+
         os_type = value.get('os_type')
         os_runinfo = value.get('os_runinfo')
         if os_type is None or os_runinfo is None:
@@ -1397,6 +1526,8 @@ class ResourceRunInfo(ResourceBase):
         if self._os_runinfo is not None:
             value['os_type'] = self._os_runinfo.name()
             value['os_runinfo'] = self._os_runinfo.to_dict()
+        if self._depends:
+            value['depends'] = list(self._depends)
         return value
 
 
@@ -1851,12 +1982,14 @@ class ResourcePCIDevice(ResourceBase):
         if not isinstance(caps, list):
             self.logger.error("caps not fount.")
             return False
+        new_caps = list()
         for cap in caps:
             pcicap = self.PCICap()
             if not pcicap.from_dict(cap):
                 self.logger.error("failed.")
                 return False
-            self._caps.append(pcicap)
+            new_caps.append(pcicap)
+        self._caps = new_caps
 
         self._bars.clear()
         new_bars = list()
@@ -1919,6 +2052,9 @@ class ResourcePCIDeviceList(ResourceBase):
     def __init__(self, parent):
         super().__init__(parent)
         self._devices: List[ResourcePCIDevice] = list()
+        # 服务端PCI清单的id和generation, 用于增量更新, 不保存到文件
+        self._inventory_id = ""
+        self._generation = 0
 
     @ResourceBase.modified
     def add_device(self, value: dict) -> Optional[ResourcePCIDevice]:
@@ -1936,12 +2072,27 @@ class ResourcePCIDeviceList(ResourceBase):
 
     @ResourceBase.modified
     def remove_device(self, path) -> bool:
-        for dev in self._devices:
+        for index, dev in enumerate(self._devices):
             if dev.path() == path:
                 self._devices.remove(dev)
+                self._children.remove(dev)
+                ResourceSignals.remove.send(self, devices=[dev], count=1, index=index)
                 return True
         return False
 
+    @ResourceBase.modified
+    def update_device(self, value: dict) -> Optional[ResourcePCIDevice]:
+        """按path更新已有设备, 设备不存在时返回None
+        """
+        dev = self.find_device(value.get("path"))
+        if dev is None:
+            return None
+        if not dev.from_dict(value):
+            self.logger.error("invalid dict value")
+            return None
+        dev.set_modified()
+        return dev
+
     @ResourceBase.modified
     def remove_all_device(self) -> None:
         for dev in self._devices:
@@ -1949,6 +2100,8 @@ class ResourcePCIDeviceList(ResourceBase):
         # TODO 对device做一次复制，使不被释放
         devices = list(self._devices)
         self._devices.clear()
+        self._inventory_id = ""
+        self._generation = 0
         ResourceSignals.remove.send(self, devices=devices, count=len(devices))
 
     def find_device(self, path) -> Optional[ResourcePCIDevice]:
@@ -1960,6 +2113,63 @@ class ResourcePCIDeviceList(ResourceBase):
     def device_count(self):
         return len(self._devices)
 
+    def inventory(self) -> Tuple[str, int]:
+        """服务端PCI清单的(id, generation), 未同步过时为("", 0)
+        """
+        return (self._inventory_id, self._generation)
+
+    def apply_inventory(self, value: dict) -> Optional[Tuple[List[str], List[str], List[str]]]:
+        """应用服务端pci_devices_since返回的变化
+        Returns:
+            (添加的path, 修改的path, 删除的path), 数据格式错误时返回None
+        """
+        if not isinstance(value, dict):
+            return None
+        full = value.get('full', True)
+        updates = list(value.get('added', list())) + list(value.get('changed', list()))
+
+        added = list()
+        changed = list()
+        removed = list()
+        paths = set()
+        for pci in updates:
+            # 过滤桥设备
+            if not isinstance(pci, dict):
+                continue
+            if pci.get('type') == 'bridge':
+                continue
+            path = pci.get('path')
+            paths.add(path)
+
+            dev = self.find_device(path)
+            if dev is None:
+                if self.add_device(pci) is None:
+                    self.logger.error(f"add device failed {path}.")
+                    continue
+                added.append(path)
+                continue
+
+            new_dev = ResourcePCIDevice(self)
+            if not new_dev.from_dict(pci):
+                self.logger.error(f"invalid device {path}.")
+                continue
+            if new_dev.to_dict() == dev.to_dict():
+                continue
+            if self.update_device(pci) is not None:
+                changed.append(path)
+
+        if full:
+            removed_paths = [dev.path() for dev in self._devices if dev.path() not in paths]
+        else:
+            removed_paths = value.get('removed', list())
+        for path in removed_paths:
+            if self.remove_device(path):
+                removed.append(path)
+
+        self._inventory_id = value.get('id', "")
+        self._generation = value.get('generation', 0)
+        return (added, changed, removed)
+
     def device_at(self, index: int) -> Optional[ResourcePCIDevice]:
         if index >= 0 and index < len(self._devices):
             return self._devices[index]
@@ -2187,8 +2397,22 @@ class Resource(ResourceBase):
 
 
 class PlatformMgr(object):
+    """
+    平台资源管理。
+
+    index.toml中的cpu和开发板在第一次使用时才加载(find_cpu/find_board)。
+    平台目录编译后的目录(id、文件和名称)保存在index.toml.cache中，
+    目录中的文件修改时间和大小都不变时直接使用，启动时不需要解析每个toml文件。
+    """
     logger = logging.getLogger("platform")
 
+    # 平台目录缓存, 保存在平台目录中
+    CATALOGUE_CACHE = "index.toml.cache"
+    CATALOGUE_VERSION = 1
+
+    # 是否使用平台目录缓存
+    use_cache = True
+
     class CPU():
         def __init__(self):
             self.id = ''
@@ -2196,8 +2420,35 @@ class PlatformMgr(object):
 
             self.name = ''
             self.path = ''
-            self.value = None
-            self.guestos_dts = None
+            self.dts_path = None
+            self._value = None
+            self._guestos_dts = None
+            self._loaded = False
+
+        @property
+        def value(self) -> Optional[dict]:
+            self.materialize()
+            return self._value
+
+        @property
+        def guestos_dts(self) -> Optional[bytes]:
+            if self._guestos_dts is None and self.dts_path is not None:
+                try:
+                    with open(self.dts_path, "rb") as f:
+                        self._guestos_dts = base64.b64encode(f.read())
+                except OSError as e:
+                    PlatformMgr.logger.error(f"load guest os dts {self.dts_path} failed {e}")
+            return self._guestos_dts
+
+        def materialize(self) -> bool:
+            """ 加载并检查cpu文件, 只加载一次 """
+            if not self._loaded:
+                self._loaded = True
+                PlatformMgr.logger.info(f"load cpu {self.file}")
+                loaded = PlatformMgr.load_value(self.path, ResourceCPU)
+                if loaded is not None:
+                    self._value, self.name = loaded
+            return self._value is not None
 
         def from_dict(self, value) -> bool:
             return DictHelper.from_dict(self.items, self, value)
@@ -2214,8 +2465,24 @@ class PlatformMgr(object):
 
             self.name = ''
             self.path = ''
-            self.value = None
             self.cpu = None
+            self._value = None
+            self._loaded = False
+
+        @property
+        def value(self) -> Optional[dict]:
+            self.materialize()
+            return self._value
+
+        def materialize(self) -> bool:
+            """ 加载并检查开发板文件, 只加载一次 """
+            if not self._loaded:
+                self._loaded = True
+                PlatformMgr.logger.info(f"load board {self.file}")
+                loaded = PlatformMgr.load_value(self.path, ResourceBoard)
+                if loaded is not None:
+                    self._value, self.name = loaded
+            return self._value is not None
 
         def from_dict(self, value) -> bool:
             return DictHelper.from_dict(self.items, self, value)
@@ -2247,12 +2514,55 @@ class PlatformMgr(object):
             cls.logger.error(f"load toml {filename} failed {e}")
             return None
 
+    @classmethod
+    def load_value(cls, filename: str, rsc_type) -> Optional[Tuple[dict, str]]:
+        """
+        加载cpu或开发板文件, 检查能否使用ResourceCPU/ResourceBoard加载
+
+        Returns:
+            (value, name): 文件内容和名称, 失败返回None
+        """
+        value = cls.load_toml(filename)
+        if not isinstance(value, dict):
+            cls.logger.error(f"{filename} not a dict")
+            return None
+
+        rsc = rsc_type(None)
+        if not rsc.from_dict(value):
+            cls.logger.error(f"{filename} from dict failed.")
+            return None
+        return value, rsc.name()
+
     def load(self, plt_path: str) -> bool:
         """
         加载平台资源文件
-        :param index_toml: index.toml
+        :param plt_path: 平台目录, 包含index.toml
         :return:
         """
+        cache_file = os.path.join(plt_path, self.CATALOGUE_CACHE)
+        catalogue = self._read_catalogue(plt_path, cache_file) if self.use_cache else None
+        if catalogue is not None:
+            self.logger.debug(f"load platform catalogue from {cache_file}")
+            cpus, boards = catalogue
+        else:
+            index = self._parse_index(plt_path)
+            if index is None:
+                return False
+            cpus, boards = index
+
+            # 没有缓存时加载全部文件, 得到名称并检查
+            cpus = [cpu for cpu in cpus if cpu.materialize()]
+            boards = [board for board in boards if self._link_cpu(board, cpus) and board.materialize()]
+            if self.use_cache:
+                self._write_catalogue(plt_path, cache_file, cpus, boards)
+
+        self._path = plt_path
+        self._cpus = cpus
+        self._boards = boards
+        return True
+
+    def _parse_index(self, plt_path: str) -> Optional[Tuple[List[CPU], List[Board]]]:
+        """ 解析index.toml, 不加载cpu和开发板文件 """
         index_toml = os.path.join(plt_path, "index.toml")
 
         try:
@@ -2260,11 +2570,11 @@ class PlatformMgr(object):
         except Exception as e:
             self.logger.error(f"parse platform index file failed, {index_toml}")
             self.logger.error(str(e))
-            return False
+            return None
 
         if not isinstance(index, dict):
             self.logger.error("invalid index, not a dict.")
-            return False
+            return None
 
         cpus: List[self.CPU] = list()
         boards: List[self.Board] = list()
@@ -2272,11 +2582,10 @@ class PlatformMgr(object):
         index_cpus = index.get('cpus')
         if not isinstance(index_cpus, dict):
             self.logger.error("cpus not a dict")
-            return False
+            return None
 
         for cpu_id in index_cpus:
             filename = index_cpus[cpu_id]['file']
-            self.logger.info(f"load cpu {filename}")
             guestos_dts = index_cpus[cpu_id].get('guestos-dts')
             if not isinstance(cpu_id, str) or not isinstance(filename, str):
                 self.logger.error("cpu_id or file is not a string")
@@ -2284,34 +2593,22 @@ class PlatformMgr(object):
 
             cpu = self.CPU()
             cpu.id = cpu_id
+            cpu.file = filename
             cpu.path = os.path.join(plt_path, filename)
             if not os.path.exists(cpu.path):
                 self.logger.error(f"cpu toml {cpu.path} not exist.")
                 continue
 
-            cpu.value = self.load_toml(cpu.path)
-            if not isinstance(cpu.value, dict):
-                self.logger.error(f"cpu toml not a dict")
-                continue
-
             if guestos_dts is not None:
                 dts_path = os.path.join(plt_path, guestos_dts)
                 if os.path.exists(dts_path):
-                    with open(dts_path, "rt") as f:
-                        cpu.guestos_dts = base64.b64encode(f.read())
-
-            # 检查能否使用ResourceCPU加载
-            rsc_cpu = ResourceCPU(None)
-            if not rsc_cpu.from_dict(cpu.value):
-                self.logger.error("cpu from dict failed.")
-                continue
-            cpu.name = rsc_cpu.name()
+                    cpu.dts_path = dts_path
             cpus.append(cpu)
 
         index_boards = index.get("boards")
         if not isinstance(index_boards, dict):
             self.logger.error("boards not a dict")
-            return False
+            return None
 
         for board_id in index_boards:
             board_value = index_boards[board_id]
@@ -2319,45 +2616,108 @@ class PlatformMgr(object):
             if not board.from_dict(board_value):
                 self.logger.error("board from dict failed.")
                 continue
-
+            board.id = board_id
             board.path = os.path.join(plt_path, board.file)
-            board.value = self.load_toml(board.path)
-            if not isinstance(board.value, dict):
-                self.logger.error("board toml is not dict")
-                continue
+            boards.append(board)
 
-            # 检查是否能使用ResourceBoard加载
-            rsc_board = ResourceBoard(None)
-            if not rsc_board.from_dict(board.value):
-                self.logger.error("board form dict failed.")
-                continue
+        return cpus, boards
 
-            for cpu in cpus:
-                if cpu.id == board.cpu_id:
-                    board.cpu = cpu
-                    break
-            if board.cpu is None:
-                self.logger.error(f'{board.path} cpu not found.')
-                continue
+    def _link_cpu(self, board: Board, cpus: List[CPU]) -> bool:
+        for cpu in cpus:
+            if cpu.id == board.cpu_id:
+                board.cpu = cpu
+                return True
+        self.logger.error(f'{board.path} cpu not found.')
+        return False
 
-            board.name = rsc_board.name()
-            board.id = board_id
-            boards.append(board)
+    @staticmethod
+    def _stamp(path: str) -> Optional[List[int]]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return [st.st_mtime_ns, st.st_size]
 
-        self._path = plt_path
-        self._cpus = cpus
-        self._boards = boards
-        return True
+    def _read_catalogue(self, plt_path: str, cache_file: str) -> Optional[Tuple[List[CPU], List[Board]]]:
+        """ 读取平台目录缓存, 目录中任何文件变化时返回None """
+        try:
+            with open(cache_file, "rb") as f:
+                catalogue = json.loads(f.read().decode('utf-8'))
+            if catalogue['version'] != self.CATALOGUE_VERSION:
+                return None
+            for file, stamp in catalogue['stamps'].items():
+                if self._stamp(os.path.join(plt_path, file)) != stamp:
+                    return None
+
+            cpus: List[self.CPU] = list()
+            for item in catalogue['cpus']:
+                cpu = self.CPU()
+                cpu.id, cpu.file, cpu.name = item['id'], item['file'], item['name']
+                cpu.path = os.path.join(plt_path, cpu.file)
+                if item['dts'] is not None:
+                    cpu.dts_path = os.path.join(plt_path, item['dts'])
+                cpus.append(cpu)
+
+            boards: List[self.Board] = list()
+            for item in catalogue['boards']:
+                board = self.Board()
+                board.id, board.file, board.name = item['id'], item['file'], item['name']
+                board.cpu_id = item['cpu']
+                board.path = os.path.join(plt_path, board.file)
+                if not self._link_cpu(board, cpus):
+                    return None
+                boards.append(board)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            self.logger.debug(f"invalid platform catalogue {cache_file}: {e}")
+            return None
+        return cpus, boards
+
+    def _write_catalogue(self, plt_path: str, cache_file: str, cpus: List[CPU], boards: List[Board]):
+        files = ["index.toml"]
+        cpu_items = list()
+        for cpu in cpus:
+            dts = None
+            if cpu.dts_path is not None:
+                dts = os.path.relpath(cpu.dts_path, plt_path)
+                files.append(dts)
+            files.append(cpu.file)
+            cpu_items.append({'id': cpu.id, 'file': cpu.file, 'name': cpu.name, 'dts': dts})
+        board_items = list()
+        for board in boards:
+            files.append(board.file)
+            board_items.append({'id': board.id, 'file': board.file, 'name': board.name, 'cpu': board.cpu_id})
+
+        stamps = dict()
+        for file in files:
+            stamp = self._stamp(os.path.join(plt_path, file))
+            if stamp is None:
+                return
+            stamps[file] = stamp
+
+        catalogue = {
+            'version': self.CATALOGUE_VERSION,
+            'stamps': stamps,
+            'cpus': cpu_items,
+            'boards': board_items,
+        }
+        try:
+            write_file_atomic(cache_file, json.dumps(catalogue, ensure_ascii=False).encode('utf-8'))
+        except OSError as e:
+            self.logger.debug(f"write platform catalogue {cache_file} failed: {e}")
 
     def find_board(self, name: str) -> Optional[Board]:
         for board in self._boards:
             if board.name == name or board.id == name:
+                if not board.materialize() or not board.cpu.materialize():
+                    return None
                 return board
         return None
 
     def find_cpu(self, name: str) -> Optional[CPU]:
         for cpu in self._cpus:
             if cpu.name == name or cpu.id == name:
+                if not cpu.materialize():
+                    return None
                 return cpu
         return None
 
@@ -2365,7 +2725,7 @@ class PlatformMgr(object):
         return list(map(lambda x: x.name, self._boards))
 
     def cpu_names(self) -> List[str]:
-        return list(map(lambda x: x.name, self._cpu))
+        return list(map(lambda x: x.name, self._cpus))
 
 
 class ResourceMgr(object):
@@ -2373,6 +2733,9 @@ class ResourceMgr(object):
 
     instance = None
 
+    # 是否使用.jhr的二进制缓存(<文件名>.cache), 见jhr_cache
+    use_cache = True
+
     def __init__(self):
         super().__init__()
         self._resources: List[Resource] = list()
@@ -2420,8 +2783,7 @@ class ResourceMgr(object):
     def open(self, filename) -> Optional[Resource]:
         value = None
         try:
-            with open(filename, "rt", encoding='utf8') as f:
-                value = json.load(f)
+            value = jhr_cache.read_jhr(filename, self.use_cache)
         except Exception as e:
             self.logger.error(f"open {filename} failed: {e}")
             return None
@@ -2431,6 +2793,12 @@ class ResourceMgr(object):
             rsc.set_filename(filename)
         return rsc
 
+    @classmethod
+    def dumps(cls, value: dict) -> bytes:
+        """ 资源字典转换为.jhr文件内容, 换行与文本模式写入时相同 """
+        json_str = json.dumps(value, indent=4, ensure_ascii=False)
+        return json_str.replace('\n', os.linesep).encode('utf-8')
+
     @classmethod
     def save(cls, rsc: Resource, filename: str) -> bool:
         value = rsc.to_dict()
@@ -2438,14 +2806,15 @@ class ResourceMgr(object):
             cls.logger.error("resource to dict failed")
             return False
 
-        json_str = json.dumps(value, indent=4, ensure_ascii=False)
-
+        # 先写临时文件再替换, 写入时崩溃不会损坏原文件
         try:
-            with open(filename, "wt", encoding='utf-8') as f:
-                f.write(json_str)
-        except:
-            cls.logger.error("save file failed.")
+            write_file_atomic(filename, cls.dumps(value))
+        except Exception as e:
+            cls.logger.error(f"save file failed: {e}")
+            return False
 
+        if cls.use_cache:
+            jhr_cache.write_cache(filename, value)
         return True
 
     def remove(self, rsc: Resource):
@@ -2506,6 +2875,35 @@ def test():
         return False
     return True
 
+@cli.command("cache-check")
+@click.argument("jhrs", nargs=-1, required=True)
+def cache_check(jhrs):
+    """
+    检查.jhr文件与二进制缓存的往返转换, 不写入缓存文件
+    """
+    if not jhr_cache.available():
+        logging.error("msgpack not installed")
+        exit(1)
+
+    failed = False
+    for jhr in jhrs:
+        value = jhr_cache.read_jhr(jhr, use_cache=False)
+        _, cached = jhr_cache.unpack(jhr_cache.pack(value, "check"))
+        ok = cached == value
+
+        rsc = Resource("check", ResourceMgr.get_instance())
+        ok = ok and rsc.from_dict(cached)
+        rsc_value = rsc.to_dict() if ok else None
+        ok = ok and rsc_value is not None
+        if ok:
+            # 资源转换后的字典, JSON和缓存两种格式都应能还原
+            again = jhr_cache.unpack(jhr_cache.pack(rsc_value, "check"))[1]
+            ok = again == rsc_value and json.loads(json.dumps(rsc_value)) == again
+        print(f"{jhr}: {'ok' if ok else 'FAILED'}")
+        failed = failed or not ok
+    if failed:
+        exit(1)
+
 @cli.group()
 @click.argument("jhr")
 @click.pass_context
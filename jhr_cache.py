@@ -0,0 +1,177 @@
+"""
+.jhr 二进制缓存模块。
+
+.jhr 文件使用JSON格式，便于阅读和比较差异。大的资源文件解析较慢，
+本模块在JSON文件旁保存msgpack格式的缓存文件(<文件名>.cache)，
+打开时如果缓存比JSON新并且内容哈希一致，则直接读取缓存。
+
+缓存文件格式(msgpack):
+    {
+        'magic': 'jhr-cache',
+        'version': CACHE_VERSION,
+        'sha256': JSON文件内容的sha256,
+        'value': 资源字典,
+    }
+
+JSON始终是权威格式，缓存缺失、过期、损坏或没有安装msgpack时都使用JSON，
+缓存写入失败不影响保存。
+
+主要函数:
+- read_jhr: 读取.jhr文件，优先使用缓存
+- write_cache: 保存JSON后更新缓存
+- pack/unpack: 缓存格式的编码和解码
+"""
+
+import os
+import json
+import hashlib
+import logging
+from typing import Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+logger = logging.getLogger("JHRCache")
+
+CACHE_MAGIC = "jhr-cache"
+CACHE_VERSION = 1
+CACHE_SUFFIX = ".cache"
+
+
+def available() -> bool:
+    return msgpack is not None
+
+
+def cache_path(filename: str) -> str:
+    return filename + CACHE_SUFFIX
+
+
+def pack(value: dict, digest: str) -> bytes:
+    return msgpack.packb({
+        'magic': CACHE_MAGIC,
+        'version': CACHE_VERSION,
+        'sha256': digest,
+        'value': value,
+    }, use_bin_type=True)
+
+
+def unpack(data: bytes) -> Optional[Tuple[str, dict]]:
+    """
+    解码缓存。
+
+    Returns:
+        (sha256, value): 格式或版本不匹配时返回None
+    """
+    try:
+        cache = msgpack.unpackb(data, raw=False)
+    except Exception as e:
+        logger.debug(f"invalid cache: {e}")
+        return None
+    if not isinstance(cache, dict):
+        return None
+    if cache.get('magic') != CACHE_MAGIC or cache.get('version') != CACHE_VERSION:
+        return None
+    digest = cache.get('sha256')
+    value = cache.get('value')
+    if not isinstance(digest, str) or not isinstance(value, dict):
+        return None
+    return digest, value
+
+
+def _read_cache(filename: str, digest: str) -> Optional[dict]:
+    """ 读取比JSON新并且哈希一致的缓存 """
+    path = cache_path(filename)
+    try:
+        if os.stat(path).st_mtime_ns < os.stat(filename).st_mtime_ns:
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    cache = unpack(data)
+    if cache is None or cache[0] != digest:
+        return None
+    return cache[1]
+
+
+def _write_cache(filename: str, value: dict, digest: str) -> bool:
+    path = cache_path(filename)
+    tmp = path + ".tmp"
+    try:
+        data = pack(value, digest)
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except Exception as e:
+        logger.debug(f"write cache {path} failed: {e}")
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def read_jhr(filename: str, use_cache: bool = True) -> dict:
+    """
+    读取.jhr文件。
+
+    缓存有效时使用缓存，否则解析JSON并更新缓存。
+
+    Args:
+        filename: .jhr文件
+        use_cache: 是否使用缓存
+
+    Returns:
+        dict: 资源字典
+
+    Raises:
+        OSError, ValueError: 读取或解析JSON失败
+    """
+    with open(filename, "rb") as f:
+        data = f.read()
+
+    if not use_cache or not available():
+        return json.loads(data.decode('utf-8'))
+
+    digest = hashlib.sha256(data).hexdigest()
+    value = _read_cache(filename, digest)
+    if value is not None:
+        logger.debug(f"load {filename} from cache")
+        return value
+
+    value = json.loads(data.decode('utf-8'))
+    _write_cache(filename, value, digest)
+    return value
+
+
+def write_cache(filename: str, value: dict) -> bool:
+    """
+    保存JSON文件后更新缓存，哈希按写入磁盘的JSON内容计算。
+
+    Args:
+        filename: 已保存的.jhr文件
+        value: 写入JSON的资源字典
+
+    Returns:
+        bool: 是否写入缓存
+    """
+    if not available():
+        return False
+    try:
+        with open(filename, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return False
+    return _write_cache(filename, value, digest)
+
+
+def remove_cache(filename: str):
+    try:
+        os.remove(cache_path(filename))
+    except OSError:
+        pass
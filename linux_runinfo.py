@@ -5,11 +5,11 @@ from PySide2 import QtWidgets, QtCore
 from jh_resource import OSRunInfoBase, LinuxRunInfo
 from jh_resource import ResourceGuestCell
 from jh_resource import ResourceGuestCell, ResourceCPU
-from generator import GuestCellGenerator
 from forms.ui_linux_runinfo import Ui_LinuxRunInfoWidget
 from commonos_runinfo import OSRunInfoWidget
 from rpc_server.rpc_client import RPCClient
-from utils import CpioUtil
+from rpc_job import JobManager, RPCJob
+from cell_deploy import DeployError, linux_source, read_linux, run_linux
 
 class LinuxRunInfoWidget(OSRunInfoWidget):
     def __init__(self, parent=None):
@@ -169,92 +169,47 @@ class LinuxRunInfoWidget(OSRunInfoWidget):
         self._runinfo.bootargs = bootargs
         self.value_changed.emit()
 
-    def run(self, cell: ResourceGuestCell) -> bool:
+    def run(self, cell: ResourceGuestCell) -> Optional[RPCJob]:
         client = RPCClient.get_instance()
         if cell is None:
-            return False
+            return None
         if not client.is_connected():
-            return False
-
-        cellname = cell.name()
-        cpuname = cell.find(ResourceCPU).name()
-        os_runinfo: LinuxRunInfo = self._runinfo
+            return None
 
         # linux系统的入口地址固定为0
         if cell.reset_addr() != 0:
             cell.set_reset_addr(0)
 
-        def read_file(filename) -> Optional[bytes]:
-            try:
-                with open(filename, "rb") as f:
-                    return f.read()
-            except:
-                self.logger.error(f"read {filename} failed.")
-                return None
-
-        self.logger.info("read kernel")
-        kernel = read_file(self.abspath(cell, os_runinfo.kernel))
-        if kernel is None:
-            self.logger.error("read kernel failed.")
-            return False
-
-        self.logger.info("read devicetree")
-        devicetree = None
-        if len(os_runinfo.devicetree) > 0:
-            devicetree = read_file(self.abspath(cell, os_runinfo.devicetree))
-            if devicetree is None:
-                self.logger.error("read devicetree failed.")
-                return False
-        else:
-            devicetree = GuestCellGenerator.gen_guestlinux_dtb(cell)
-            if devicetree is None:
-                self.logger.error("generate dtb failed.")
-                return False
-
-        ramdisk = None
-        if len(os_runinfo.ramdisk) > 0:
-            if not os.path.exists(self.abspath(cell, os_runinfo.ramdisk)):
-                self.logger.error(f"ramdisk {os_runinfo.ramdisk} not exist.")
-                return False
-
-            cpio = CpioUtil(self.abspath(cell, os_runinfo.ramdisk))
-            for filename in os_runinfo.ramdisk_overlay:
-                self.logger.info(f"append {filename} to ramdisk")
-                try:
-                    with open(filename, "rb") as f:
-                        data = f.read()
-                except:
-                    self.logger.error(f"read {filename} failed")
-                    return False
-
-                if not cpio.append(os.path.basename(filename), data):
-                    self.logger.error("append file to cpio failed.")
-                    return False
-            ramdisk = cpio.get_bytes()
-
+        # 在界面线程中生成配置和设备树, 读取镜像、上传并启动在后台任务中完成
+        os_runinfo: LinuxRunInfo = self.runinfo()
         self.logger.info("generate cell config.")
-        cell_config = GuestCellGenerator.gen_config_bin(cell)
-        if cell_config is None:
-            self.logger.error("generate cell config failed.")
+        try:
+            source = linux_source(cell, os_runinfo)
+        except DeployError as e:
+            self.logger.error(f"run linux {cell.name()} failed: {e}")
+            return None
+        return JobManager.get_instance().submit(f"run linux {cell.name()}", self._run_job, source)
+
+    def _run_job(self, job: RPCJob, client: RPCClient, source: dict) -> bool:
+        """ 运行linux的后台任务, 只访问部署源中的数据 """
+        steps = 2
+
+        job.progress(0, steps, "read images")
+        self.logger.info("read kernel, devicetree and ramdisk")
+        try:
+            linux = read_linux(source)
+        except DeployError as e:
+            self.logger.error(f"{e}")
             return False
 
-        cell_exist = False
-        result = client.list_cell()
-        if not result:
-            self.logger.error("get cell list failed.")
-            return False
-        for _cell in result.result:
-            if _cell['name'] == cellname:
-                cell_exist = True
-                break
-
-        if cell_exist:
-            client.destroy_cell(cellname)
-
+        job.check_canceled()
+        job.progress(1, steps, "run linux")
         self.logger.info("run linux.")
-        result = client.run_linux(cell_config, kernel, devicetree, ramdisk, os_runinfo.bootargs)
+        result = run_linux(client, source['name'], source['config'], linux)
         if not result:
             self.logger.error(f"run linux failed {result.message}.")
             return False
 
+        job.progress(steps, steps, "done")
         self.logger.info("run linux done.")
+        return True
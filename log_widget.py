@@ -1,5 +1,8 @@
 import time
 import logging
+import threading
+import collections
+from typing import List, Tuple
 from PySide2 import QtWidgets, QtCore, QtGui
 
 from forms.ui_log import Ui_LogWidget
@@ -16,8 +19,55 @@ class LogHandler(logging.Handler):
             self._callback(record)
 
 
+class LogBuffer(object):
+    """
+    日志缓冲区，可以在任意线程中写入。
+
+    写入的日志先放入待显示队列，界面定时批量取出；保留最近max_lines行，
+    超出的日志丢弃并计数。
+    """
+    def __init__(self, max_lines: int):
+        self._lock = threading.Lock()
+        self._pending = collections.deque(maxlen=max_lines)
+        self._lines = collections.deque(maxlen=max_lines)
+        self._dropped = 0
+
+    def push(self, line: Tuple[int, str, str]) -> bool:
+        """ 写入一行, 返回写入前待显示队列是否为空 """
+        with self._lock:
+            was_empty = len(self._pending) == 0
+            if len(self._pending) == self._pending.maxlen:
+                self._dropped += 1
+            self._pending.append(line)
+            return was_empty
+
+    def take(self) -> Tuple[List[Tuple[int, str, str]], int]:
+        """ 取出待显示的日志和丢弃的行数, 同时保存到保留的日志中 """
+        with self._lock:
+            lines = list(self._pending)
+            dropped = self._dropped
+            self._pending.clear()
+            self._dropped = 0
+        self._lines.extend(lines)
+        return lines, dropped
+
+    def lines(self) -> List[Tuple[int, str, str]]:
+        return list(self._lines)
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            self._dropped = 0
+        self._lines.clear()
+
+
 class LogWidget(QtWidgets.QWidget):
-    sig_new_log = QtCore.Signal(object)
+    sig_new_log = QtCore.Signal()
+
+    # 保留的日志行数
+    MAX_LINES = 5000
+    # 刷新间隔(毫秒), 大约一帧
+    FLUSH_INTERVAL = 16
 
     colors = {
         logging.DEBUG: QtGui.QColor(116, 185, 255),
@@ -32,6 +82,15 @@ class LogWidget(QtWidgets.QWidget):
         self._ui = Ui_LogWidget()
         self._ui.setupUi(self)
         self._ui.combobox_level.setView(QtWidgets.QListView())
+        self._ui.textbrowser.document().setMaximumBlockCount(self.MAX_LINES)
+
+        self._buffer = LogBuffer(self.MAX_LINES)
+        # 隐藏时只缓存不显示, 再次显示时从保留的日志重新生成
+        self._stale = False
+        self._flush_timer = QtCore.QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(self.FLUSH_INTERVAL)
+        self._flush_timer.timeout.connect(self._on_flush)
 
         self._handler = LogHandler(
             lambda record: self.new_log(record)
@@ -52,7 +111,7 @@ class LogWidget(QtWidgets.QWidget):
         self._ui.combobox_level.currentIndexChanged.connect(self._on_loglevel_changed)
         self._ui.btn_clean.clicked.connect(self._on_log_clean)
 
-        self.sig_new_log.connect(self._on_log)
+        self.sig_new_log.connect(self._on_new_log)
 
     def set_loglevel(self, level):
         self._handler.setLevel(level)
@@ -61,34 +120,77 @@ class LogWidget(QtWidgets.QWidget):
         return self._handler.level
 
     def log_clean(self):
+        self._buffer.clear()
         self._ui.textbrowser.clear()
 
     def new_log(self, record: logging.LogRecord):
-        self.sig_new_log.emit(record)
-
-    def _on_log(self, record: logging.LogRecord):
+        """ 日志处理函数, 可以在任意线程中调用, 每批日志只发出一次信号 """
         if record.name == "zerorpc.gevent_zmq":
             return
 
         sec = time.strftime(f"%H:%M:%S", time.gmtime(record.created))
         msec = f'{int(record.msecs):03d}'
-        timestamp = f"  {sec}.{msec}"
-        color = self.colors.get(record.levelno, QtCore.Qt.white)
-        self._ui.textbrowser.setTextColor(color)
-        self._ui.textbrowser.insertPlainText(record.levelname.ljust(8))
-        self._ui.textbrowser.insertPlainText(timestamp)
-        self._ui.textbrowser.insertPlainText("  " + record.name)
-
+        prefix = f"{record.levelname.ljust(8)}  {sec}.{msec}  {record.name}"
         if record.levelno >= logging.ERROR:
-            self._ui.textbrowser.insertPlainText(f"  {record.funcName}:{record.lineno}")
+            prefix += f"  {record.funcName}:{record.lineno}"
+        try:
+            msg = record.getMessage()
+        except Exception:
+            msg = str(record.msg)
+
+        if self._buffer.push((record.levelno, prefix, msg)):
+            self.sig_new_log.emit()
+
+    def showEvent(self, event: QtGui.QShowEvent) -> None:
+        if self._stale:
+            self._render_all()
+        return super().showEvent(event)
+
+    def _on_new_log(self):
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def _on_flush(self):
+        lines, dropped = self._buffer.take()
+        if not self.isVisible():
+            self._stale = True
+            return
+        if self._stale:
+            self._render_all()
+            return
+        self._render(lines, dropped)
 
-        self._ui.textbrowser.insertPlainText(": ")
-        self._ui.textbrowser.setTextColor(QtCore.Qt.white)
-        self._ui.textbrowser.insertPlainText(record.msg)
-        self._ui.textbrowser.insertPlainText('\n')
-        self._ui.textbrowser.moveCursor(self._ui.textbrowser.textCursor().End)
+    def _render_all(self):
+        self._stale = False
+        self._ui.textbrowser.clear()
+        self._render(self._buffer.lines(), 0)
 
-        QtWidgets.QApplication.instance().processEvents()
+    def _render(self, lines: List[Tuple[int, str, str]], dropped: int):
+        if not lines and not dropped:
+            return
+        textbrowser = self._ui.textbrowser
+        scrollbar = textbrowser.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum()
+
+        cursor = QtGui.QTextCursor(textbrowser.document())
+        cursor.movePosition(QtGui.QTextCursor.End)
+        prefix_format = QtGui.QTextCharFormat()
+        msg_format = QtGui.QTextCharFormat()
+        msg_format.setForeground(QtGui.QColor(QtCore.Qt.white))
+
+        # 一批日志在一个编辑块中插入, 只触发一次布局
+        cursor.beginEditBlock()
+        if dropped:
+            prefix_format.setForeground(QtGui.QColor(QtCore.Qt.yellow))
+            cursor.insertText(f"... {dropped} lines dropped\n", prefix_format)
+        for levelno, prefix, msg in lines:
+            prefix_format.setForeground(QtGui.QColor(self.colors.get(levelno, QtCore.Qt.white)))
+            cursor.insertText(prefix + ": ", prefix_format)
+            cursor.insertText(msg + '\n', msg_format)
+        cursor.endEditBlock()
+
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
 
     def _on_loglevel_changed(self):
         name = self._ui.combobox_level.currentText()
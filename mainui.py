@@ -11,7 +11,8 @@ import logging
 import io
 import time
 import json
-from typing import Optional
+import importlib
+from typing import Optional, Callable, Dict
 
 from PySide2 import QtWidgets, QtCore, QtGui
 from assets import qr_resource
@@ -29,24 +30,9 @@ from jh_resource import ResourcePCIDevice, ResourcePCIDeviceList
 
 from frameless_window import FramelessWindow
 from log_widget import LogWidget
-from resource_tree_widget import ResourceTreeWidget
-from create_widget import CreateDialog
-from hw_platform_widget import HwPlatformWidget
-from cpu_widget import CPUWidget
-from board_widget import BoardWidget
-from vm_config_widget import VMConfigWidget
-from export_widget import ExportDialog
-from rootcell_widget import RootCellWidget
-from ivshmem_widget import IVShMemWidget
-from jailhouse_widget import JailhouseWidget
-from pci_device_widget import PCIDeviceWidget, PCIDeviceListWidget
-from guestcell_widget import GuestCellWidget, GuestCellsWidget
-from vm_manage_widget import VMManageWidget
-
-from remote_widget import RemoteWidget
-from except_widget import ExceptDialog
 from tip_widget import TipWidget
 from check_widget import CheckWidget
+from autosave import AutosaveService
 
 from version import VERSION, BUILD_TIME
 
@@ -103,6 +89,15 @@ class MainUI(QtWidgets.QMainWindow):
         设置界面布局，创建和添加各个子部件，连接信号和槽。
         """
         super().__init__()
+        from resource_tree_widget import ResourceTreeWidget
+        from remote_widget import RemoteWidget
+        from cpu_widget import CPUWidget
+        from board_widget import BoardWidget
+        from rootcell_widget import RootCellWidget
+        from ivshmem_widget import IVShMemWidget
+        from jailhouse_widget import JailhouseWidget
+        from pci_device_widget import PCIDeviceWidget, PCIDeviceListWidget
+        from guestcell_widget import GuestCellWidget, GuestCellsWidget
 
         self._ui = Ui_MainWindow()
         self._ui.setupUi(self)
@@ -187,6 +182,7 @@ class MainUI(QtWidgets.QMainWindow):
         
         打开创建对话框，用于创建新的资源。
         """
+        from create_widget import CreateDialog
         x = CreateDialog()
         x.exec_()
         self._resource_tree.expand_all()
@@ -225,12 +221,14 @@ class MainUI(QtWidgets.QMainWindow):
             if len(filename) == 0:
                 return
 
-        if ResourceMgr.save(rsc, filename):
-            self.logger.info(f"save resource to {filename}")
-        else:
+        if not ResourceMgr.save(rsc, filename):
             self.logger.error("save failed.")
+            return
+        self.logger.info(f"save resource to {filename}")
 
         rsc.set_prop(PROP_FILENAME, filename)
+        rsc.set_filename(filename)
+        AutosaveService.get_instance().mark_saved(rsc)
 
     def _on_save(self):
         """
@@ -270,6 +268,7 @@ class MainUI(QtWidgets.QMainWindow):
         
         显示导出对话框，将资源导出为其他格式。
         """
+        from export_widget import ExportDialog
         x = ExportDialog()
         x.exec_()
 
@@ -378,6 +377,7 @@ class HomePageWidget(QtWidgets.QWidget):
         
         打开创建对话框，用于创建新的资源。
         """
+        from create_widget import CreateDialog
         x = CreateDialog()
         x.exec_()
 
@@ -399,6 +399,89 @@ class HomePageWidget(QtWidgets.QWidget):
         ResourceMgr.get_instance().set_current(rsc)
 
 
+class PageRegistry(object):
+    """
+    页面注册表。
+    
+    页面在第一次显示时才导入模块并创建，导入页面模块时才加载QtCharts、
+    mako等较重的库，减少程序启动时间。
+    
+    Attributes:
+        _stacked_widget: 页面所在的QStackedWidget。
+        _pages: 已注册的页面，{名称: (模块名, 类名, 设置资源的函数)}。
+        _widgets: 已创建的页面部件。
+        _resource: 当前资源，页面创建时设置。
+    """
+    logger = logging.getLogger('PageRegistry')
+
+    def __init__(self, stacked_widget: QtWidgets.QStackedWidget):
+        """
+        初始化页面注册表。
+        
+        Args:
+            stacked_widget: 页面所在的QStackedWidget。
+        """
+        self._stacked_widget = stacked_widget
+        self._pages: Dict[str, tuple] = dict()
+        self._widgets: Dict[str, QtWidgets.QWidget] = dict()
+        self._resource: Optional[Resource] = None
+
+    def register(self, name: str, module: str, cls: str, set_resource: Callable):
+        """
+        注册页面。
+        
+        Args:
+            name: 页面名称。
+            module: 页面所在的模块名。
+            cls: 页面类名。
+            set_resource: 设置资源的函数，参数为(页面部件, 资源或None)。
+        """
+        self._pages[name] = (module, cls, set_resource)
+
+    def is_created(self, name: str) -> bool:
+        """
+        页面是否已创建。
+        """
+        return name in self._widgets
+
+    def page(self, name: str) -> Optional[QtWidgets.QWidget]:
+        """
+        获取页面，第一次获取时导入模块并创建页面。
+        
+        Args:
+            name: 页面名称。
+            
+        Returns:
+            页面部件，页面未注册时返回None。
+        """
+        widget = self._widgets.get(name)
+        if widget is not None:
+            return widget
+        if name not in self._pages:
+            return None
+
+        module, cls, set_resource = self._pages[name]
+        start = time.perf_counter()
+        widget = getattr(importlib.import_module(module), cls)(self._stacked_widget)
+        self._stacked_widget.addWidget(widget)
+        self._widgets[name] = widget
+        if self._resource is not None:
+            set_resource(widget, self._resource)
+        self.logger.debug(f"create page {name} in {(time.perf_counter()-start)*1000:.1f}ms")
+        return widget
+
+    def set_resource(self, rsc: Optional[Resource]):
+        """
+        设置资源，只更新已创建的页面，未创建的页面在创建时设置。
+        
+        Args:
+            rsc: 资源对象，None表示清空。
+        """
+        self._resource = rsc
+        for name, widget in self._widgets.items():
+            self._pages[name][2](widget, rsc)
+
+
 class MainPageWidget(QtWidgets.QWidget):
     """
     主页面部件。
@@ -408,9 +491,7 @@ class MainPageWidget(QtWidgets.QWidget):
     Attributes:
         _ui: 用户界面对象。
         _blank_page: 空白页面。
-        _hw_plt_page: 硬件平台配置页面。
-        _vm_config_page: 虚拟机配置页面。
-        _vm_manage_page: 虚拟机管理页面。
+        _pages: 页面注册表，包含硬件平台配置、虚拟机配置和虚拟机管理页面。
         signal_close: 关闭信号。
         logger: 日志记录器。
     """
@@ -429,16 +510,17 @@ class MainPageWidget(QtWidgets.QWidget):
         self._ui.setupUi(self)
 
         self._blank_page = QtWidgets.QWidget(self._ui.stacked_widget)
-        self._hw_plt_page = HwPlatformWidget(self._ui.stacked_widget)
-        self._vm_config_page = VMConfigWidget(self._ui.stacked_widget)
-        self._vm_manage_page = VMManageWidget(self._ui.stacked_widget)
-
         self._ui.stacked_widget.addWidget(self._blank_page)
-        self._ui.stacked_widget.addWidget(self._hw_plt_page)
-        self._ui.stacked_widget.addWidget(self._vm_config_page)
-        self._ui.stacked_widget.addWidget(self._vm_manage_page)
         self._ui.stacked_widget.setCurrentWidget(self._blank_page)
 
+        self._pages = PageRegistry(self._ui.stacked_widget)
+        self._pages.register('hw_platform', 'hw_platform_widget', 'HwPlatformWidget',
+                             lambda w, rsc: w.set_platform(rsc.platform() if rsc else None))
+        self._pages.register('vm_config', 'vm_config_widget', 'VMConfigWidget',
+                             lambda w, rsc: w.set_vm_config(rsc.jailhouse() if rsc else None))
+        self._pages.register('vm_manage', 'vm_manage_widget', 'VMManageWidget',
+                             lambda w, rsc: w.set_resource(rsc))
+
         self._ui.btn_save.clicked.connect(self._on_save)
         self._ui.btn_export.clicked.connect(self._on_export)
         self._ui.btn_save_and_exit.clicked.connect(self._on_save_and_exit)
@@ -457,16 +539,12 @@ class MainPageWidget(QtWidgets.QWidget):
         """
         self._ui.label_name.clear()
         self._ui.label_state.clear()
-        self._hw_plt_page.set_platform(None)
-        self._vm_config_page.set_vm_config(None)
-        self._vm_manage_page.set_resource(None)
+        self._pages.set_resource(None)
 
         if rsc is None:
             return
         self._ui.label_name.setText(rsc.name())
-        self._hw_plt_page.set_platform(rsc.platform())
-        self._vm_config_page.set_vm_config(rsc.jailhouse())
-        self._vm_manage_page.set_resource(rsc)
+        self._pages.set_resource(rsc)
         if rsc.is_modified():
             self._ui.label_state.setText("已修改")
 
@@ -500,12 +578,14 @@ class MainPageWidget(QtWidgets.QWidget):
             if len(filename) == 0:
                 return
 
-        if ResourceMgr.save(rsc, filename):
-            self.logger.info(f"save resource to {filename}")
-        else:
+        if not ResourceMgr.save(rsc, filename):
             self.logger.error("save failed.")
+            return
+        self.logger.info(f"save resource to {filename}")
 
         rsc.set_prop(PROP_FILENAME, filename)
+        rsc.set_filename(filename)
+        AutosaveService.get_instance().mark_saved(rsc)
         self._ui.label_state.clear()
 
     def _on_save(self):
@@ -525,6 +605,7 @@ class MainPageWidget(QtWidgets.QWidget):
         
         显示导出对话框，将资源导出为其他格式。
         """
+        from export_widget import ExportDialog
         x = ExportDialog()
         x.exec_()
 
@@ -550,11 +631,11 @@ class MainPageWidget(QtWidgets.QWidget):
             return
 
         if self._ui.btn_hw_platform.isChecked():
-            self._ui.stacked_widget.setCurrentWidget(self._hw_plt_page)
+            self._ui.stacked_widget.setCurrentWidget(self._pages.page('hw_platform'))
         if self._ui.btn_vm_config.isChecked():
-            self._ui.stacked_widget.setCurrentWidget(self._vm_config_page)
+            self._ui.stacked_widget.setCurrentWidget(self._pages.page('vm_config'))
         if self._ui.btn_vm_manage.isChecked():
-            self._ui.stacked_widget.setCurrentWidget(self._vm_manage_page)
+            self._ui.stacked_widget.setCurrentWidget(self._pages.page('vm_manage'))
 
 
 class MainWindow(QtWidgets.QWidget):
@@ -571,7 +652,13 @@ class MainWindow(QtWidgets.QWidget):
         _tip_widget: 提示信息部件。
         _check_widget: 检查信息部件。
         _tools_spliter: 工具区域分割器。
+        _autosave: 自动保存服务。
     """
+    logger = logging.getLogger('MainWindow')
+
+    # 退出时等待后台任务结束的时间(毫秒)
+    JOB_WAIT_TIMEOUT = 5000
+
     def __init__(self, parent=None) -> None:
         """
         初始化主窗口。
@@ -581,6 +668,7 @@ class MainWindow(QtWidgets.QWidget):
         """
         super().__init__(parent)
         self.setWindowFlag(QtCore.Qt.FramelessWindowHint, True)
+        self._autosave = AutosaveService.get_instance()
 
         self._ui = Ui_NewMainWindow()
         self._ui.setupUi(self)
@@ -621,6 +709,37 @@ class MainWindow(QtWidgets.QWidget):
         self._ui.btn_tip.setChecked(True)
         self._on_status_btn()
 
+    def recover_autosave(self):
+        """
+        恢复自动保存的资源。
+        
+        上次程序异常退出时留下了自动保存的日志文件，提示用户是否恢复，
+        不恢复时删除日志文件。
+        """
+        journals = self._autosave.journals()
+        if len(journals) == 0:
+            return
+
+        lines = list()
+        for journal in journals:
+            t = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(journal.time))
+            lines.append(f"{journal.name}  {journal.filename or '未保存'}  {t}")
+        text = "上次程序异常退出, 以下资源有未保存的修改, 是否恢复\n" + '\n'.join(lines)
+        btns = QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No
+        result = QtWidgets.QMessageBox.question(self, "恢复", text, btns)
+
+        for journal in journals:
+            if result != QtWidgets.QMessageBox.Yes:
+                self._autosave.discard(journal)
+                continue
+            rsc = self._autosave.recover(journal)
+            if rsc is None:
+                self.logger.error(f"recover {journal.path} failed")
+                continue
+            if journal.filename is not None:
+                rsc.set_prop(PROP_FILENAME, journal.filename)
+            ResourceMgr.get_instance().set_current(rsc)
+
     def showEvent(self, event: QtGui.QShowEvent) -> None:
         """
         处理窗口显示事件。
@@ -668,6 +787,25 @@ class MainWindow(QtWidgets.QWidget):
         """
         QtWidgets.QApplication.instance().quit()
 
+    def shutdown(self):
+        """
+        程序退出前取消并等待后台任务。
+        
+        任务在下一个步骤之前结束，避免任务结束后访问已销毁的界面。
+        正在执行的RPC调用不能中断，最多等待JOB_WAIT_TIMEOUT。
+        """
+        # 后台任务模块在打开提交任务的页面时才导入, 没有导入时不会有任务
+        rpc_job = sys.modules.get('rpc_job')
+        if rpc_job is None:
+            return
+        jobs = rpc_job.JobManager.get_instance()
+        if not jobs.is_busy():
+            return
+        self.logger.info(f"cancel {len(jobs.jobs())} jobs")
+        jobs.cancel_all()
+        if not jobs.wait(self.JOB_WAIT_TIMEOUT):
+            self.logger.warning("background jobs are still running")
+
     def _on_minimize(self):
         """
         处理最小化按钮点击事件。
@@ -730,6 +868,33 @@ class MainWindow(QtWidgets.QWidget):
         self._main_page.set_resource(None)
 
 
+class FirstPaintFilter(QtCore.QObject):
+    """
+    首次绘制事件过滤器。
+    
+    窗口第一次绘制时输出标记并调用回调，用于测量启动时间，见startup_bench.py。
+    """
+    MARKER = "startup: first paint"
+
+    def __init__(self, widget: QtWidgets.QWidget, callback: Callable):
+        """
+        Args:
+            widget: 要监视的窗口。
+            callback: 首次绘制后调用的函数。
+        """
+        super().__init__(widget)
+        self._callback = callback
+        self._painted = False
+        widget.installEventFilter(self)
+
+    def eventFilter(self, obj, event) -> bool:
+        if not self._painted and event.type() == QtCore.QEvent.Paint:
+            self._painted = True
+            print(self.MARKER, flush=True)
+            QtCore.QTimer.singleShot(0, self._callback)
+        return False
+
+
 def load_stylesheet(name: str) -> Optional[str]:
     """
     加载样式表。
@@ -819,9 +984,22 @@ if __name__ == '__main__':
         s = io.StringIO()
         traceback.print_exception(etype, value, tb, file=s)
 
+        from except_widget import ExceptDialog
         x = ExceptDialog()
         x.set_text(s.getvalue())
         x.exec_()
 
     sys.excepthook = on_exception
+
+    # 正常退出时删除自动保存的日志文件
+    autosave = AutosaveService.get_instance()
+    app.aboutToQuit.connect(mainui.shutdown)
+    app.aboutToQuit.connect(autosave.stop)
+    autosave.start()
+
+    # 主窗口第一次绘制后立即退出, 用于测量启动时间, 见startup_bench.py
+    if '--startup-only' in sys.argv:
+        first_paint = FirstPaintFilter(window, app.quit)
+    else:
+        QtCore.QTimer.singleShot(0, mainui.recover_autosave)
     app.exec_()
@@ -1,320 +1,373 @@
+import bisect
 import itertools
 import logging
 import enum
-from typing import Optional, List, Union
+from typing import Optional, List, Union, Dict, Set, Tuple
 from PySide2 import QtWidgets, QtGui, QtCore
-from forms.ui_mem_region_item import Ui_MemRegionItem
-from forms.ui_mem_map_item import Ui_MemMapItem
 from forms.ui_mem_edit_widget import Ui_MemEditWidget
 import utils
-from common_widget import clean_layout, set_lineedit_status
+from common_widget import set_lineedit_status
 from jh_resource import MemMap, MemRegion, MemRegionList
 
 logger = logging.getLogger("MemRegion")
 
 
-class MemReginItem(QtWidgets.QWidget): ...
-class MemEditWidget(QtWidgets.QWidget): ...
-
-
-class MemRegionItem(QtWidgets.QWidget):
+class IntervalIndex(object):
     """
-    内存区域项部件。
+    区间索引。
     
-    用于显示和编辑单个内存区域(MemRegion)的界面组件，提供地址和大小的编辑功能。
-    
-    Attributes:
-        _on_remove: 删除当前项的回调函数。
-        _on_changed: 当值改变时的回调函数。
-        _region: 当前内存区域对象。
-        _ui: 用户界面对象。
+    区间按起始地址排序保存，查询与[start, end)重叠的区间时，
+    只需要检查起始地址在(start-最大长度, end)内的区间。
     """
-    def __init__(self, on_remove, on_changed, region: Optional[MemRegion]=None, parent=None):
-        """
-        初始化内存区域项部件。
-        
-        Args:
-            on_remove: 删除当前项的回调函数。
-            on_changed: 当值改变时的回调函数。
-            region: 内存区域对象，如果为None则创建空白区域。
-            parent: 父窗口部件，默认为None。
-        """
-        super().__init__(parent)
-
-        self._on_remove = on_remove
-        self._on_changed = on_changed
-        self._region = MemRegion()
-
-        self._ui = Ui_MemRegionItem()
-        self._ui.setupUi(self)
-
-        if region is None:
-            region = MemRegion()
-        self.set_value(region)
-
-        self._ui.lineedit_addr.setText(utils.to_human_addr(region.addr()))
-        self._ui.lineedit_size.setText(utils.to_human_size(region.size()))
-
-        self._ui.btn_remove.clicked.connect(self._on_btn_remove)
-        self._ui.lineedit_addr.textChanged.connect(self._on_value_changed)
-        self._ui.lineedit_size.textChanged.connect(self._on_value_changed)
-        self._ui.lineedit_addr.editingFinished.connect(self._on_edit_finished)
-        self._ui.lineedit_size.editingFinished.connect(self._on_edit_finished)
-
-    def set_value(self, region: MemRegion):
-        """
-        设置内存区域的值。
-        
-        Args:
-            region: 要设置的内存区域对象。
-        """
-        self._region = region
-        self._ui.lineedit_addr.setText(utils.to_human_addr(region.addr()))
-        self._ui.lineedit_size.setText(utils.to_human_size(region.size()))
-
-    def value(self) -> Optional[MemRegion]:
-        """
-        获取当前内存区域的值。
-        
-        Returns:
-            当前编辑的内存区域对象，如果输入无效则返回None。
-        """
-        addr_txt = self._ui.lineedit_addr.text()
-        size_txt = self._ui.lineedit_size.text()
-
-        addr = utils.from_human_num(addr_txt)
-        if addr is None:
-            logger.error(f"invalid addr {addr_txt}.")
-            return None
-        size = utils.from_human_num(size_txt)
-        if size is None:
-            logger.error(f"invalid size {size_txt}")
-            return None
-
-        return MemRegion(addr, size)
-
-    def _on_btn_remove(self):
-        """
-        处理删除按钮点击事件。
-        
-        调用删除回调函数，将自身作为参数传递。
-        """
-        self._on_remove(self)
-
-    def _on_value_changed(self, text):
-        """
-        处理输入值变化事件。
-        
-        验证输入的文本是否为有效的数值，并更新输入框的状态。
-        
-        Args:
-            text: 输入的文本。
-        """
-        w: QtWidgets.QLineEdit = self.sender()
-        value = utils.from_human_num(text)
-        set_lineedit_status( w, value is not None)
-
-    def _on_edit_finished(self):
-        """
-        处理编辑完成事件。
-        
-        当用户完成编辑时，验证输入值并更新内存区域对象。
-        如果输入无效，则恢复为原始值。
-        """
-        w: QtWidgets.QLineEdit = self.sender()
-        value = utils.from_human_num(w.text())
-        # 如果值无效,修改为默认值
-        if w is self._ui.lineedit_addr:
-            if value is None:
-                self._ui.lineedit_addr.setText(utils.to_human_addr(self._region.addr()))
-            else:
-                self._ui.lineedit_addr.setText(utils.to_human_addr(value))
-                if self._region.addr() != value:
-                    self._region.set_addr(value)
-                    self._on_changed(self)
-        if w is self._ui.lineedit_size:
-            if value is None:
-                self._ui.lineedit_size.setText(utils.to_human_size(self._region.size()))
-            else:
-                self._ui.lineedit_size.setText(utils.to_human_size(value))
-                if self._region.size() != value:
-                    self._region.set_size(value)
-                    self._on_changed(self)
-
-class MemMapItem(QtWidgets.QWidget):
+    def __init__(self):
+        self._starts: List[Tuple[int, int]] = list()
+        self._ends: Dict[int, int] = dict()
+        self._max_size = 0
+
+    def clear(self):
+        self._starts.clear()
+        self._ends.clear()
+        self._max_size = 0
+
+    def add(self, key: int, start: int, size: int):
+        bisect.insort(self._starts, (start, key))
+        self._ends[key] = start + size
+        # 最大长度只增加, 删除区间后仍是上限, 查询结果不受影响
+        self._max_size = max(self._max_size, size)
+
+    def remove(self, key: int, start: int):
+        i = bisect.bisect_left(self._starts, (start, key))
+        if i < len(self._starts) and self._starts[i] == (start, key):
+            del self._starts[i]
+        self._ends.pop(key, None)
+
+    def overlaps(self, start: int, size: int) -> Set[int]:
+        """ 与[start, start+size)重叠的区间 """
+        end = start + size
+        lo = bisect.bisect_right(self._starts, (start - self._max_size, float('inf')))
+        hi = bisect.bisect_left(self._starts, (end, -1))
+        keys = set()
+        for s, key in self._starts[lo:hi]:
+            if self._ends[key] > start:
+                keys.add(key)
+        return keys
+
+
+class MemTableModel(QtCore.QAbstractTableModel):
     """
-    内存映射项部件。
+    内存区域/内存映射表格模型。
     
-    用于显示和编辑单个内存映射(MemMap)的界面组件，提供物理地址、虚拟地址、大小和类型的编辑功能。
+    每行保存一个MemRegion或MemMap的副本，修改一行时只检查这一行与其他行是否重叠。
+    内存映射的物理地址和虚拟地址分别检查。
     
-    Attributes:
-        _on_remove: 删除当前项的回调函数。
-        _on_changed: 当值改变时的回调函数。
-        _mmap: 当前内存映射对象。
-        _ui: 用户界面对象。
+    信号:
+        signal_changed: 数据被修改
     """
-    def __init__(self, on_remove, on_changed, mmap: Optional[MemMap]=None, parent=None):
-        """
-        初始化内存映射项部件。
-        
-        Args:
-            on_remove: 删除当前项的回调函数。
-            on_changed: 当值改变时的回调函数。
-            mmap: 内存映射对象，如果为None则创建空白映射。
-            parent: 父窗口部件，默认为None。
-        """
-        super().__init__(parent)
-        self._on_remove = on_remove
-        self._on_changed = on_changed
-        self._mmap = MemMap(0, 0, 0)
+    signal_changed = QtCore.Signal()
 
-        self._ui = Ui_MemMapItem()
-        self._ui.setupUi(self)
-        self._ui.combobox_type.addItems(MemMap.Type.names())
-
-        if mmap is None:
-            mmap = MemMap(0, 0, 0)
-        self.set_value(mmap)
-
-        self._ui.btn_remove.clicked.connect(self._on_btn_remove)
-        self._ui.lineedit_phys.textChanged.connect(self._on_value_changed)
-        self._ui.lineedit_virt.textChanged.connect(self._on_value_changed)
-        self._ui.lineedit_size.textChanged.connect(self._on_value_changed)
-        self._ui.lineedit_phys.editingFinished.connect(self._on_edit_finished)
-        self._ui.lineedit_virt.editingFinished.connect(self._on_edit_finished)
-        self._ui.lineedit_size.editingFinished.connect(self._on_edit_finished)
-        self._ui.lineedit_comment.editingFinished.connect(self._on_comment_edit_finished)
-        self._ui.combobox_type.currentIndexChanged.connect(self._on_type_changed)
-
-    def set_value(self, mmap: MemMap):
-        """
-        设置内存映射的值。
-        
-        Args:
-            mmap: 要设置的内存映射对象。
-        """
-        self._mmap = mmap
-        self._ui.lineedit_phys.setText(utils.to_human_addr(mmap.phys()))
-        self._ui.lineedit_virt.setText(utils.to_human_addr(mmap.virt()))
-        self._ui.lineedit_size.setText(utils.to_human_size(mmap.size()))
-        self._ui.lineedit_comment.setText(mmap.comment())
-        self._ui.combobox_type.setCurrentText(mmap.type().value)
-
-    def value(self) -> Optional[MemMap]:
-        """
-        获取当前内存映射的值。
-        
-        Returns:
-            当前编辑的内存映射对象，如果输入无效则返回None。
-        """
-        phys_txt = self._ui.lineedit_phys.text()
-        virt_txt = self._ui.lineedit_virt.text()
-        size_txt = self._ui.lineedit_size.text()
+    REGION_COLUMNS = ["地址", "大小", ""]
+    MMAP_COLUMNS = ["物理地址", "虚拟地址", "大小", "类型", "注释", ""]
 
-        phys = utils.from_human_num(phys_txt)
-        if phys is None:
-            logger.error(f"invalid phys {phys_txt}.")
-            return None
-        virt = utils.from_human_num(virt_txt)
-        if virt is None:
-            logger.error(f"invalid virt {virt_txt}.")
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._is_mmap = False
+        self._keys: List[int] = list()
+        self._values: Dict[int, Union[MemRegion, MemMap]] = dict()
+        self._key_counter = itertools.count()
+        self._indexes: List[IntervalIndex] = list()
+        # 大小为0的行, 以及与其他行重叠的行
+        self._empty: Set[int] = set()
+        self._conflicts: Dict[int, Set[int]] = dict()
+        self._total = 0
+
+    def set_values(self, values: Union[List[MemRegion], List[MemMap]], is_mmap: bool):
+        self.beginResetModel()
+        self._is_mmap = is_mmap
+        self._keys.clear()
+        self._values.clear()
+        self._empty.clear()
+        self._conflicts.clear()
+        self._total = 0
+        self._indexes = [IntervalIndex() for _ in range(2 if is_mmap else 1)]
+        for value in values:
+            key = next(self._key_counter)
+            self._keys.append(key)
+            self._values[key] = self._copy(value)
+            self._attach(key)
+        self.endResetModel()
+
+    def values(self) -> Union[List[MemRegion], List[MemMap]]:
+        return [self._copy(self._values[key]) for key in self._keys]
+
+    def is_mmap(self) -> bool:
+        return self._is_mmap
+
+    def total(self) -> int:
+        return self._total
+
+    def is_valid(self) -> bool:
+        return not self._empty and not self._conflicts
+
+    def first_conflict(self) -> Optional[Tuple[int, int]]:
+        """ 第一对重叠的行 """
+        for row, key in enumerate(self._keys):
+            others = self._conflicts.get(key)
+            if others:
+                return row, min(self._keys.index(k) for k in others)
+        return None
+
+    def append(self, value: Union[MemRegion, MemMap]):
+        row = len(self._keys)
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        key = next(self._key_counter)
+        self._keys.append(key)
+        self._values[key] = self._copy(value)
+        self._attach(key)
+        self.endInsertRows()
+
+    def remove(self, row: int):
+        if row < 0 or row >= len(self._keys):
+            return
+        key = self._keys[row]
+        others = self._detach(key)
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        del self._keys[row]
+        del self._values[key]
+        self.endRemoveRows()
+        self._rows_changed(others)
+        self.signal_changed.emit()
+
+    def rowCount(self, parent=QtCore.QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self._keys)
+
+    def columnCount(self, parent=QtCore.QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self.MMAP_COLUMNS if self._is_mmap else self.REGION_COLUMNS)
+
+    def remove_column(self) -> int:
+        return self.columnCount() - 1
+
+    def type_column(self) -> int:
+        return 3 if self._is_mmap else -1
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
             return None
-        size = utils.from_human_num(size_txt)
-        if size is None:
-            logger.error(f"invalid size {size_txt}")
+        if orientation == QtCore.Qt.Horizontal:
+            columns = self.MMAP_COLUMNS if self._is_mmap else self.REGION_COLUMNS
+            return columns[section] if section < len(columns) else None
+        return str(section)
+
+    def flags(self, index: QtCore.QModelIndex):
+        if not index.isValid():
+            return QtCore.Qt.NoItemFlags
+        flags = QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+        if index.column() != self.remove_column():
+            flags |= QtCore.Qt.ItemIsEditable
+        return flags
+
+    def data(self, index: QtCore.QModelIndex, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._keys):
             return None
-        comment = self._ui.lineedit_comment.text().strip()
-
-        _type = MemMap.Type.from_name(self._ui.combobox_type.currentText())
-        if _type is None:
-            _type = MemMap.Type.NORMAL
-
-        return MemMap(phys, virt, size, _type, comment)
-
-    def _on_btn_remove(self):
-        """
-        处理删除按钮点击事件。
-        
-        调用删除回调函数，将自身作为参数传递。
-        """
-        self._on_remove(self)
-
-    def _on_value_changed(self, text):
-        """
-        处理输入值变化事件。
-        
-        验证输入的文本是否为有效的数值，并更新输入框的状态。
-        
-        Args:
-            text: 输入的文本。
-        """
-        w: QtWidgets.QLineEdit = self.sender()
-        value = utils.from_human_num(text)
-        set_lineedit_status(w, value is not None)
+        key = self._keys[index.row()]
+        column = index.column()
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            if column == self.remove_column():
+                return "删除" if role == QtCore.Qt.DisplayRole else None
+            return self._text(self._values[key], column)
+        if role == QtCore.Qt.ForegroundRole:
+            if column != self.remove_column() and (key in self._empty or key in self._conflicts):
+                return QtGui.QBrush(QtCore.Qt.red)
+        if role == QtCore.Qt.ToolTipRole:
+            if key in self._empty:
+                return "大小为0"
+            others = self._conflicts.get(key)
+            if others:
+                rows = sorted(self._keys.index(k) for k in others)
+                return "与索引" + ",".join(map(str, rows)) + "重叠"
+        return None
+
+    def setData(self, index: QtCore.QModelIndex, value, role=QtCore.Qt.EditRole) -> bool:
+        if not index.isValid() or role != QtCore.Qt.EditRole:
+            return False
+        key = self._keys[index.row()]
+        new_value = self._edit(self._values[key], index.column(), value)
+        # 输入无效时保持原来的值
+        if new_value is None:
+            return False
+        if self._fields(new_value) == self._fields(self._values[key]):
+            return True
+
+        others = self._detach(key)
+        self._values[key] = new_value
+        others |= self._attach(key)
+        self._rows_changed(others | {key})
+        self.signal_changed.emit()
+        return True
 
-    def _on_edit_finished(self):
-        """
-        处理编辑完成事件。
-        
-        当用户完成编辑时，验证输入值并更新内存映射对象。
-        如果输入无效，则恢复为原始值。
-        """
-        w: QtWidgets.QLineEdit = self.sender()
-        value = utils.from_human_num(w.text())
-        # 如果输入有误, 使用默认值
-        if w is self._ui.lineedit_phys:
-            if value is None:
-                w.setText(utils.to_human_addr(self._mmap.phys()))
-            else:
-                w.setText(utils.to_human_addr(value))
-                self._on_changed(self)
-        if w is self._ui.lineedit_virt:
-            if value is None:
-                w.setText(utils.to_human_addr(self._mmap.virt()))
+    @staticmethod
+    def _copy(value: Union[MemRegion, MemMap]) -> Union[MemRegion, MemMap]:
+        if isinstance(value, MemMap):
+            return MemMap(value.phys(), value.virt(), value.size(), value.type(), value.comment())
+        return MemRegion(value.addr(), value.size())
+
+    @staticmethod
+    def _fields(value: Union[MemRegion, MemMap]) -> tuple:
+        if isinstance(value, MemMap):
+            return (value.phys(), value.virt(), value.size(), value.type(), value.comment())
+        return (value.addr(), value.size())
+
+    def _intervals(self, value: Union[MemRegion, MemMap]) -> List[int]:
+        if isinstance(value, MemMap):
+            return [value.phys(), value.virt()]
+        return [value.addr()]
+
+    def _attach(self, key: int) -> Set[int]:
+        """ 将一行加入索引, 返回与它重叠的行 """
+        value = self._values[key]
+        self._total += value.size()
+        if value.size() == 0:
+            self._empty.add(key)
+            return set()
+        others = set()
+        for index, start in zip(self._indexes, self._intervals(value)):
+            others |= index.overlaps(start, value.size())
+            index.add(key, start, value.size())
+        others.discard(key)
+        if others:
+            self._conflicts[key] = set(others)
+            for other in others:
+                self._conflicts.setdefault(other, set()).add(key)
+        return others
+
+    def _detach(self, key: int) -> Set[int]:
+        """ 将一行移出索引, 返回原来与它重叠的行 """
+        value = self._values[key]
+        self._total -= value.size()
+        self._empty.discard(key)
+        for index, start in zip(self._indexes, self._intervals(value)):
+            index.remove(key, start)
+        others = self._conflicts.pop(key, set())
+        for other in others:
+            conflicts = self._conflicts.get(other)
+            if conflicts is not None:
+                conflicts.discard(key)
+                if not conflicts:
+                    del self._conflicts[other]
+        return others
+
+    def _rows_changed(self, keys: Set[int]):
+        last = self.columnCount() - 1
+        for key in keys:
+            if key not in self._values:
+                continue
+            row = self._keys.index(key)
+            self.dataChanged.emit(self.index(row, 0), self.index(row, last))
+
+    def _text(self, value: Union[MemRegion, MemMap], column: int) -> str:
+        if isinstance(value, MemMap):
+            texts = [
+                lambda: utils.to_human_addr(value.phys()),
+                lambda: utils.to_human_addr(value.virt()),
+                lambda: utils.to_human_size(value.size()),
+                lambda: value.type().value,
+                lambda: value.comment(),
+            ]
+        else:
+            texts = [
+                lambda: utils.to_human_addr(value.addr()),
+                lambda: utils.to_human_size(value.size()),
+            ]
+        return texts[column]() if column < len(texts) else ""
+
+    def _edit(self, value: Union[MemRegion, MemMap], column: int, text) -> Optional[Union[MemRegion, MemMap]]:
+        """ 修改一列, 返回新的值, 输入无效时返回None """
+        text = str(text).strip()
+        if isinstance(value, MemMap):
+            phys, virt, size = value.phys(), value.virt(), value.size()
+            _type, comment = value.type(), value.comment()
+            if column == 3:
+                _type = MemMap.Type.from_name(text)
+                if _type is None:
+                    return None
+            elif column == 4:
+                comment = text
             else:
-                w.setText(utils.to_human_addr(value))
-                self._on_changed(self)
-        if w is self._ui.lineedit_size:
-            if value is None:
-                w.setText(utils.to_human_size(self._mmap.size()))
-            else:
-                w.setText(utils.to_human_size(value))
-                self._on_changed(self)
+                num = utils.from_human_num(text)
+                if num is None:
+                    return None
+                if column == 0:
+                    phys = num
+                elif column == 1:
+                    virt = num
+                elif column == 2:
+                    size = num
+            return MemMap(phys, virt, size, _type, comment)
+
+        num = utils.from_human_num(text)
+        if num is None:
+            return None
+        if column == 0:
+            return MemRegion(num, value.size())
+        if column == 1:
+            return MemRegion(value.addr(), num)
+        return None
 
-    def _on_comment_edit_finished(self):
-        """
-        处理注释编辑完成事件。
-        
-        当用户完成注释编辑时，通知值已改变。
-        """
-        self._on_changed(self)
 
-    def _on_type_changed(self, index):
-        """
-        处理类型改变事件。
-        
-        当用户选择不同的内存映射类型时，通知值已改变。
-        
-        Args:
-            index: 下拉列表的索引。
-        """
-        name = self._ui.combobox_type.currentText()
-        self._on_changed(self)
+class MemItemDelegate(QtWidgets.QStyledItemDelegate):
+    """
+    内存表格的编辑代理。
+    
+    类型列使用下拉框，注释列使用普通输入框，其他列输入时检查是否为有效的数值。
+    """
+    def createEditor(self, parent, option, index: QtCore.QModelIndex):
+        model: MemTableModel = index.model()
+        if index.column() == model.type_column():
+            combobox = QtWidgets.QComboBox(parent)
+            combobox.addItems(MemMap.Type.names())
+            return combobox
+        lineedit = QtWidgets.QLineEdit(parent)
+        if not (model.is_mmap() and index.column() == 4):
+            lineedit.textChanged.connect(
+                lambda text: set_lineedit_status(lineedit, utils.from_human_num(text) is not None)
+            )
+        return lineedit
+
+    def setEditorData(self, editor, index: QtCore.QModelIndex):
+        text = index.data(QtCore.Qt.EditRole)
+        if isinstance(editor, QtWidgets.QComboBox):
+            editor.setCurrentText(text)
+        else:
+            editor.setText(text)
+
+    def setModelData(self, editor, model: MemTableModel, index: QtCore.QModelIndex):
+        if isinstance(editor, QtWidgets.QComboBox):
+            model.setData(index, editor.currentText())
+        else:
+            model.setData(index, editor.text())
+
 
 class MemEditWidget(QtWidgets.QWidget):
     """
     内存编辑部件。
     
     用于编辑内存区域列表或内存映射列表的界面组件，提供添加、删除和编辑功能。
+    使用表格视图，只绘制可见的行，修改时只检查修改的行。
     
     Attributes:
         signal_changed: 当内容改变时发出的信号。
         _ui: 用户界面对象。
-        _items: 内存项列表。
+        _model: 表格模型。
         _mode: 编辑模式，可以是内存区域模式或内存映射模式。
     """
     signal_changed = QtCore.Signal()
 
+    # 表格最多显示的行数, 超出时滚动
+    MAX_VISIBLE_ROWS = 12
+
     class Mode(enum.Enum):
         """
         编辑模式枚举。
@@ -343,10 +396,27 @@ class MemEditWidget(QtWidgets.QWidget):
         self._ui.label_total.setText("总大小: 0")
         self._ui.label_msg.setText("")
 
-        self._items = list()
         self._mode = self.Mode.UNKNOWN
+        self._model = MemTableModel(self)
+
+        self._view = QtWidgets.QTableView(self._ui.frame_regions)
+        self._view.setModel(self._model)
+        self._view.setItemDelegate(MemItemDelegate(self._view))
+        self._view.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
+        self._view.setEditTriggers(QtWidgets.QAbstractItemView.AllEditTriggers)
+        self._view.setVerticalScrollMode(QtWidgets.QAbstractItemView.ScrollPerPixel)
+        self._view.setSizePolicy(QtWidgets.QSizePolicy.Preferred, QtWidgets.QSizePolicy.Fixed)
+        # 固定行高, 视图不需要逐行计算高度
+        self._view.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+        self._view.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
+        self._ui.frame_regions.layout().addWidget(self._view)
 
         self._ui.btn_add.clicked.connect(self._on_add)
+        self._view.clicked.connect(self._on_clicked)
+        self._model.signal_changed.connect(self._on_model_changed)
+        self._model.modelReset.connect(self._update_height)
+        self._model.rowsInserted.connect(self._update_height)
+        self._model.rowsRemoved.connect(self._update_height)
 
     def set_regions(self, regions: List[MemRegion]):
         """
@@ -357,10 +427,9 @@ class MemEditWidget(QtWidgets.QWidget):
         Args:
             regions: 内存区域对象列表。
         """
-        self._clear()
         self._mode = self.Mode.MEM_REGION
-        for region in regions:
-            self._add(region)
+        self._model.set_values(regions, False)
+        self._update_columns()
         self._update(False)
 
     def set_mmaps(self, mmaps: List[MemMap]):
@@ -372,10 +441,9 @@ class MemEditWidget(QtWidgets.QWidget):
         Args:
             mmaps: 内存映射对象列表。
         """
-        self._clear()
         self._mode = self.Mode.MEM_MAP
-        for mmap in mmaps:
-            self._add(mmap)
+        self._model.set_values(mmaps, True)
+        self._update_columns()
         self._update(False)
 
     def get_value(self) -> Union[List[MemMap], List[MemRegion]]:
@@ -384,104 +452,58 @@ class MemEditWidget(QtWidgets.QWidget):
         
         Returns:
             根据当前模式返回内存区域列表或内存映射列表。
-            如果有任何项的值无效，则返回空列表。
         """
-        values = list()
-        for item in self._items:
-            value = item.value()
-            if value is None:
-                return list()
-            values.append(value)
-        return values
-
-    def _clear(self):
+        return self._model.values()
+
+    def _update_columns(self):
         """
-        清空当前所有项。
-        
-        清除项列表并清理布局。
+        设置删除列的宽度。
         """
-        self._items.clear()
-        clean_layout(self._ui.frame_regions.layout())
+        header = self._view.horizontalHeader()
+        column = self._model.remove_column()
+        header.setSectionResizeMode(column, QtWidgets.QHeaderView.ResizeToContents)
 
-    def _add(self, m: Union[MemRegion, MemMap]) -> bool:
+    def _update_height(self):
         """
-        添加一个内存项。
-        
-        根据当前模式添加内存区域或内存映射项。
-        
-        Args:
-            m: 要添加的内存区域或内存映射对象。
-            
-        Returns:
-            bool: 添加是否成功。
+        根据行数调整表格高度，超过MAX_VISIBLE_ROWS行时滚动。
         """
-        if self._mode is self.Mode.MEM_REGION:
-            if not isinstance(m, MemRegion):
-                return False
-            item = MemRegionItem(self._on_item_remove, self._on_item_changed, m, self)
-            self._items.append(item)
-            self._ui.frame_regions.layout().addWidget(item)
-        elif self._mode is self.Mode.MEM_MAP:
-            if not isinstance(m, MemMap):
-                return False
-            item = MemMapItem(self._on_item_remove, self._on_item_changed, m, self)
-            self._items.append(item)
-            self._ui.frame_regions.layout().addWidget(item)
-        return True
+        rows = min(self._model.rowCount(), self.MAX_VISIBLE_ROWS)
+        height = self._view.horizontalHeader().height() + 2*self._view.frameWidth()
+        height += rows * self._view.verticalHeader().defaultSectionSize()
+        self._view.setFixedHeight(height)
 
     def _check(self) -> bool:
         """
         检查输入是否有效。
         
-        验证所有项的大小不为0，并检查是否有重叠区域。
+        所有项的大小不为0，并且没有重叠区域。
         
         Returns:
             bool: 输入是否有效。
         """
-        # 所有item大小不为0
-        for item in self._items:
-            v = item.value()
-            if v is None or v.size()==0:
-                return False
-
-        # 检查是否重叠
         self._ui.label_msg.clear()
-        for index_pair in itertools.combinations(range(len(self._items)), 2):
-            i1 = index_pair[0]
-            i2 = index_pair[1]
-            m1 = self._items[i1].value()
-            m2 = self._items[i2].value()
-            if m1.is_overlap(m2):
-                self._ui.label_msg.setText(f"索引{i1}和{i2}重叠")
-                return False
-
-        return True
+        if self._model.is_valid():
+            return True
+        conflict = self._model.first_conflict()
+        if conflict is not None:
+            self._ui.label_msg.setText(f"索引{conflict[0]}和{conflict[1]}重叠")
+        return False
 
     def _update(self, emit=True):
         """
         更新显示。
         
-        计算总大小并更新显示。
+        显示总大小。
         
         Args:
             emit: 是否发出changed信号，默认为True。
         """
-        total = 0
         self._ui.label_total.clear()
 
         if not self._check():
             return
 
-        if self._mode is self.Mode.MEM_REGION:
-            for item in self._items:
-                if item.value():
-                    total = total + item.value().size()
-        elif self._mode is self.Mode.MEM_MAP:
-            for item in self._items:
-                if item.value():
-                    total = total + item.value().size()
-
-        txt = f'总大小 {utils.to_human_size(total)}'
+        txt = f'总大小 {utils.to_human_size(self._model.total())}'
         self._ui.label_total.setText(txt)
         if emit:
             self.signal_changed.emit()
@@ -499,37 +521,31 @@ class MemEditWidget(QtWidgets.QWidget):
             return False
 
         if self._mode == self.Mode.MEM_REGION:
-            self._add(MemRegion(0,0))
+            self._model.append(MemRegion(0,0))
         elif self._mode is self.Mode.MEM_MAP:
-            self._add(MemMap(0,0,0))
+            self._model.append(MemMap(0,0,0))
+        else:
+            return False
+        row = self._model.rowCount() - 1
+        self._view.scrollToBottom()
+        self._view.edit(self._model.index(row, 0))
         return True
 
-    def _on_item_remove(self, item: MemReginItem):
+    def _on_clicked(self, index: QtCore.QModelIndex):
         """
-        处理项删除事件。
-        
-        从列表和布局中移除指定的项，并更新显示。
+        处理表格点击事件，点击删除列时删除所在的行。
         
         Args:
-            item: 要删除的项。
+            index: 点击的单元格。
         """
-        if item in self._items:
-            self._ui.frame_regions.layout().removeWidget(item)
-            self._items.remove(item)
-        item.deleteLater()
-        self._update()
+        if index.column() == self._model.remove_column():
+            self._model.remove(index.row())
 
-    def _on_item_changed(self, item: MemReginItem):
+    def _on_model_changed(self):
         """
-        处理项内容改变事件。
-        
-        当项的内容改变时更新显示。
-        
-        Args:
-            item: 内容已改变的项。
+        处理表格内容改变事件。
         """
-        if item in self._items:
-            self._update()
+        self._update()
 
 
 if __name__ == "__main__":
@@ -1,10 +1,11 @@
 import logging
-from typing import Optional
+from typing import Optional, Dict, List
 from PySide2 import QtWidgets, QtCore
 from jh_resource import ResourcePCIDevice, ResourcePCIDeviceList
 from common_widget import clean_layout
 from rpc_server.rpc_client import RPCClient
-from rpc_server.pci_device import PCICapID, PCIExtCapID
+from rpc_job import JobManager, RPCJob
+from rpc_server.pci_device import PCICapID, PCIExtCapID, PCISnapshot
 from forms.ui_pci_device_widget import Ui_PCIDeviceWidget
 from forms.ui_pci_devices_widget import Ui_PCIDevicesWidget
 from forms.ui_pci_device_item import Ui_PCIDeviceItemWidget
@@ -12,6 +13,51 @@ from forms.ui_pci_cap_widget import Ui_PCICapWidget
 from forms.ui_pci_bar_widget import Ui_PCIBarWidget
 
 
+def load_pci_snapshot(pcidevs: ResourcePCIDeviceList, filename: str) -> Optional[tuple]:
+    """
+    从PCI设备快照文件导入设备列表。
+    
+    Args:
+        pcidevs: PCI设备列表资源对象。
+        filename: 快照文件路径。
+        
+    Returns:
+        tuple: (添加的path, 修改的path, 删除的path)，失败时返回None。
+    """
+    devices = PCISnapshot.load(filename)
+    if devices is None:
+        return None
+    value = {
+        'full': True,
+        'added': [dev.to_dict() for dev in devices],
+    }
+    return pcidevs.apply_inventory(value)
+
+
+def fetch_pci_inventory(job: RPCJob, client: RPCClient, inventory_id: str, generation: int) -> Optional[dict]:
+    """
+    获取PCI设备列表的变化，在后台任务中执行。
+    
+    Args:
+        job: 后台任务。
+        client: 工作线程的RPC连接。
+        inventory_id: 当前设备列表的标识。
+        generation: 当前设备列表的版本。
+        
+    Returns:
+        dict: 设备列表变化，失败时返回None。
+    """
+    logger = logging.getLogger("PCIDeviceListWidget")
+    result = client.pci_devices_since(inventory_id, generation)
+    if result is None:
+        logger.error("get pci device failed.")
+        return None
+    if not result.status:
+        logger.error(f"get pci device failed. {result.message}")
+        return None
+    return result.result
+
+
 class PCICapWidget(QtWidgets.QWidget):
     """
     PCI设备能力显示部件。
@@ -172,6 +218,15 @@ class PCIDeviceItemWidget(QtWidgets.QWidget):
         self._ui = Ui_PCIDeviceItemWidget()
         self._ui.setupUi(self)
 
+        self.set_device(rsc)
+
+    def set_device(self, rsc: ResourcePCIDevice):
+        """
+        更新显示的PCI设备信息。
+        
+        Args:
+            rsc: PCI设备资源对象。
+        """
         self._ui.label_name.setText(rsc.name())
         self._ui.label_path.setText(rsc.path())
 
@@ -200,9 +255,11 @@ class PCIDeviceListWidget(QtWidgets.QWidget):
         self._ui = Ui_PCIDevicesWidget()
         self._ui.setupUi(self)
         self._ui.btn_update.clicked.connect(self._on_update)
+        self._ui.btn_load_snapshot.clicked.connect(self._on_load_snapshot)
         self._item_layout = QtWidgets.QVBoxLayout(self._ui.frame_items)
 
         self._pcidevs: Optional[ResourcePCIDeviceList] = None
+        self._items: Dict[str, PCIDeviceItemWidget] = dict()
 
         client: RPCClient = RPCClient.get_instance()
         self._ui.btn_update.setEnabled(client.is_connected())
@@ -226,6 +283,7 @@ class PCIDeviceListWidget(QtWidgets.QWidget):
         """
         # 清空
         clean_layout(self._item_layout)
+        self._items.clear()
         if self._pcidevs is None:
             return
 
@@ -233,6 +291,36 @@ class PCIDeviceListWidget(QtWidgets.QWidget):
             pci_dev = self._pcidevs.device_at(i)
             item_widget = PCIDeviceItemWidget(pci_dev)
             self._item_layout.addWidget(item_widget)
+            self._items[pci_dev.path()] = item_widget
+
+    def _patch(self, added: List[str], changed: List[str], removed: List[str]):
+        """
+        按设备变化增量更新界面，只处理添加、修改和删除的设备。
+        
+        Args:
+            added: 添加的设备路径。
+            changed: 修改的设备路径。
+            removed: 删除的设备路径。
+        """
+        for path in removed:
+            item_widget = self._items.pop(path, None)
+            if item_widget is not None:
+                self._item_layout.removeWidget(item_widget)
+                item_widget.deleteLater()
+
+        for path in changed:
+            item_widget = self._items.get(path)
+            pci_dev = self._pcidevs.find_device(path)
+            if item_widget is not None and pci_dev is not None:
+                item_widget.set_device(pci_dev)
+
+        for path in added:
+            pci_dev = self._pcidevs.find_device(path)
+            if pci_dev is None:
+                continue
+            item_widget = PCIDeviceItemWidget(pci_dev)
+            self._item_layout.insertWidget(pci_dev.my_index(), item_widget)
+            self._items[path] = item_widget
 
     def _on_rpc_client_state_changed(self, sender):
         """
@@ -262,34 +350,50 @@ class PCIDeviceListWidget(QtWidgets.QWidget):
         if self._pcidevs is None:
             return
 
-        # 清空
-        clean_layout(self._item_layout)
+        # 设备列表在后台任务中获取, 在界面线程中更新资源
+        pcidevs = self._pcidevs
+        inventory_id, generation = pcidevs.inventory()
+        job = JobManager.get_instance().submit("update pci devices", fetch_pci_inventory, inventory_id, generation)
+        if job is None:
+            return
+        self._ui.btn_update.setEnabled(False)
+        job.signals.result.connect(lambda value: self._on_inventory(pcidevs, value))
+        job.signals.finished.connect(lambda: self._ui.btn_update.setEnabled(RPCClient.get_instance().is_connected()))
 
-        result = client.pci_devices()
-        if result is None:
-            self.logger.error("get pci device failed.")
+    def _on_inventory(self, pcidevs: ResourcePCIDeviceList, value: Optional[dict]):
+        """
+        处理后台任务获取的PCI设备列表。
+        
+        Args:
+            pcidevs: 提交任务时的PCI设备列表资源对象。
+            value: 设备列表变化，获取失败时为None。
+        """
+        if value is None or pcidevs is not self._pcidevs:
             return
-        if not result.status:
-            self.logger.error(f"get pci device failed. {result.message}")
+        changes = pcidevs.apply_inventory(value)
+        if changes is None:
+            self.logger.error("invalid pci device inventory.")
             return
-        pci_devices = result.result
+        self._patch(*changes)
 
-        self._pcidevs.remove_all_device()
-
-        for pci in pci_devices:
-            # 过滤桥设备
-            if not isinstance(pci, dict):
-                continue
-            dev_type: str = pci.get('type')
-            if dev_type == 'bridge':
-                continue
+    def _on_load_snapshot(self):
+        """
+        处理从快照导入按钮点击事件。
+        
+        从PCI设备快照文件导入设备列表，不需要连接远程主机。
+        """
+        if self._pcidevs is None:
+            return
 
-            pci_dev = self._pcidevs.add_device(pci)
-            if pci_dev is None:
-                self.logger.error(f"add device failed {pci_dev}.")
-                continue
+        filename = QtWidgets.QFileDialog.getOpenFileName(self, "打开PCI设备快照", "", "snapshot(*.tar.gz *.tgz);; data(*.*);;")[0]
+        if not filename:
+            return
 
-        self._update()
+        changes = load_pci_snapshot(self._pcidevs, filename)
+        if changes is None:
+            self.logger.error(f"load pci snapshot {filename} failed.")
+            return
+        self._patch(*changes)
 
 class PCIDevicesWidget(QtWidgets.QWidget):
     """
@@ -315,6 +419,7 @@ class PCIDevicesWidget(QtWidgets.QWidget):
         self._ui = Ui_PCIDevicesWidget()
         self._ui.setupUi(self)
         self._ui.btn_update.clicked.connect(self._on_update)
+        self._ui.btn_load_snapshot.clicked.connect(self._on_load_snapshot)
 
         self._pcidevs: Optional[ResourcePCIDeviceList] = None
 
@@ -351,16 +456,85 @@ class PCIDevicesWidget(QtWidgets.QWidget):
             return
         for i in range(self._pcidevs.device_count()):
             pci_dev = self._pcidevs.device_at(i)
-            txt = f'{pci_dev.name()}\n{pci_dev.path()}'
-            item = QtWidgets.QListWidgetItem(txt)
+            item = QtWidgets.QListWidgetItem(self._item_text(pci_dev))
             self._ui.listwidget_pci_devices.addItem(item)
 
-        fixed_height = self._ui.listwidget_pci_devices.sizeHintForRow(0) * self._ui.listwidget_pci_devices.count()
-        self._ui.listwidget_pci_devices.setFixedHeight(fixed_height+5)
+        self._update_list_height()
         if self._pcidevs.device_count() > 0:
             self._ui.listwidget_pci_devices.setCurrentRow(0)
             self._update_pci_device_info(self._pcidevs.device_at(0))
 
+    @staticmethod
+    def _item_text(pci_dev: ResourcePCIDevice) -> str:
+        return f'{pci_dev.name()}\n{pci_dev.path()}'
+
+    def _update_list_height(self):
+        fixed_height = self._ui.listwidget_pci_devices.sizeHintForRow(0) * self._ui.listwidget_pci_devices.count()
+        self._ui.listwidget_pci_devices.setFixedHeight(fixed_height+5)
+
+    def _find_row(self, path: str) -> int:
+        """
+        查找设备在列表中的行号，列表项文本的第二行为设备路径。
+        
+        Args:
+            path: 设备路径。
+            
+        Returns:
+            int: 行号，不存在时返回-1。
+        """
+        listwidget = self._ui.listwidget_pci_devices
+        for row in range(listwidget.count()):
+            if listwidget.item(row).text().split('\n')[-1] == path:
+                return row
+        return -1
+
+    def _patch(self, added: List[str], changed: List[str], removed: List[str]):
+        """
+        按设备变化增量更新列表，只处理添加、修改和删除的设备。
+        
+        Args:
+            added: 添加的设备路径。
+            changed: 修改的设备路径。
+            removed: 删除的设备路径。
+        """
+        if not (added or changed or removed):
+            return
+
+        listwidget = self._ui.listwidget_pci_devices
+        current_row = listwidget.currentRow()
+        current_item = listwidget.item(current_row) if current_row >= 0 else None
+        current_path = current_item.text().split('\n')[-1] if current_item is not None else None
+
+        listwidget.blockSignals(True)
+        for path in removed:
+            row = self._find_row(path)
+            if row >= 0:
+                listwidget.takeItem(row)
+
+        for path in changed:
+            row = self._find_row(path)
+            pci_dev = self._pcidevs.find_device(path)
+            if row >= 0 and pci_dev is not None:
+                listwidget.item(row).setText(self._item_text(pci_dev))
+
+        for path in added:
+            pci_dev = self._pcidevs.find_device(path)
+            if pci_dev is None:
+                continue
+            listwidget.insertItem(pci_dev.my_index(), QtWidgets.QListWidgetItem(self._item_text(pci_dev)))
+        listwidget.blockSignals(False)
+
+        self._update_list_height()
+
+        # 保持当前选中的设备, 选中设备被删除时选中第一个
+        row = self._find_row(current_path) if current_path is not None else -1
+        if row < 0 and listwidget.count() > 0:
+            row = 0
+        listwidget.setCurrentRow(row)
+        if current_path is None or row < 0 or current_path in changed \
+                or listwidget.item(row).text().split('\n')[-1] != current_path:
+            self._update_pci_device_info(self._pcidevs.device_at(row))
+
     def _update_pci_device_info(self, pci_dev: ResourcePCIDevice):
         """
         更新PCI设备详细信息显示。
@@ -459,28 +633,47 @@ class PCIDevicesWidget(QtWidgets.QWidget):
         if self._pcidevs is None:
             return
 
-        result = client.pci_devices()
-        if result is None:
-            self.logger.error("get pci device failed.")
+        # 设备列表在后台任务中获取, 在界面线程中更新资源
+        pcidevs = self._pcidevs
+        inventory_id, generation = pcidevs.inventory()
+        job = JobManager.get_instance().submit("update pci devices", fetch_pci_inventory, inventory_id, generation)
+        if job is None:
             return
-        if not result.status:
-            self.logger.error(f"get pci device failed. {result.message}")
-            return
-        pci_devices = result.result
+        self._ui.btn_update.setEnabled(False)
+        job.signals.result.connect(lambda value: self._on_inventory(pcidevs, value))
+        job.signals.finished.connect(lambda: self._ui.btn_update.setEnabled(RPCClient.get_instance().is_connected()))
 
-        self._pcidevs.remove_all_device()
+    def _on_inventory(self, pcidevs: ResourcePCIDeviceList, value: Optional[dict]):
+        """
+        处理后台任务获取的PCI设备列表。
+        
+        Args:
+            pcidevs: 提交任务时的PCI设备列表资源对象。
+            value: 设备列表变化，获取失败时为None。
+        """
+        if value is None or pcidevs is not self._pcidevs:
+            return
+        changes = pcidevs.apply_inventory(value)
+        if changes is None:
+            self.logger.error("invalid pci device inventory.")
+            return
+        self._patch(*changes)
 
-        for pci in pci_devices:
-            # 过滤桥设备
-            if not isinstance(pci, dict):
-                continue
-            dev_type: str = pci.get('type')
-            if dev_type == 'bridge':
-                continue
+    def _on_load_snapshot(self):
+        """
+        处理从快照导入按钮点击事件。
+        
+        从PCI设备快照文件导入设备列表，不需要连接远程主机。
+        """
+        if self._pcidevs is None:
+            return
 
-            pci_dev = self._pcidevs.add_device(pci)
-            if pci_dev is None:
-                self.logger.error(f"add device failed {pci_dev}.")
-                continue
+        filename = QtWidgets.QFileDialog.getOpenFileName(self, "打开PCI设备快照", "", "snapshot(*.tar.gz *.tgz);; data(*.*);;")[0]
+        if not filename:
+            return
 
-        self._update()
+        changes = load_pci_snapshot(self._pcidevs, filename)
+        if changes is None:
+            self.logger.error(f"load pci snapshot {filename} failed.")
+            return
+        self._patch(*changes)
@@ -1,6 +1,6 @@
 import os
 import logging
-from hashlib import md5
+from typing import Optional
 
 from PySide2 import QtWidgets, QtCore
 from forms.ui_remote_widget import Ui_RemoteWidget
@@ -8,11 +8,30 @@ from forms.ui_acoreOs_source_config import Ui_Form_acoreOS
 from forms.ui_root_cell_config import Ui_Form_root
 
 from rpc_server.rpc_client import RPCClient
-from generator import RootCellGenerator, GuestCellGenerator
+from rpc_job import JobManager, RPCJob
+from common_widget import JobProgressWidget
+from generator import GuestCellGenerator
+from cell_deploy import DeployError, read_image, root_source, enable_hypervisor
 from jh_resource import Resource, ResourceGuestCellList, ResourceGuestCell
 from jh_resource import ResourceMgr, ResourceSignals
 from utils import from_human_num, Profile
 
+def wait_job(button: QtWidgets.QAbstractButton, progress: JobProgressWidget, job: Optional[RPCJob]):
+    """
+    显示后台任务的进度，任务结束前禁用按钮。
+    
+    Args:
+        button: 任务执行期间禁用的按钮。
+        progress: 显示任务进度的组件。
+        job: 后台任务，为None时不处理。
+    """
+    if job is None:
+        return
+    progress.track(job)
+    button.setEnabled(False)
+    job.signals.finished.connect(lambda: button.setEnabled(True))
+
+
 class RemoteACoreWidget(QtWidgets.QWidget):
     # 配置文件项目，用于保存ACore相关设置
     profile_msl_run_addr = Profile.Item('acore_msl_run_addr', 0)
@@ -39,6 +58,8 @@ class RemoteACoreWidget(QtWidgets.QWidget):
         super().__init__(parent)
         self._ui = Ui_Form_acoreOS()
         self._ui.setupUi(self)
+        self._progress = JobProgressWidget(self)
+        self._ui.pushButton_start.parentWidget().layout().insertWidget(0, self._progress)
 
         self._client: RPCClient = RPCClient.get_instance()
 
@@ -196,64 +217,93 @@ class RemoteACoreWidget(QtWidgets.QWidget):
                 self.logger.error(f"[{name}] invalid addr or filename")
                 return
 
-        # 生成当前guest cell的配置
+        # 生成当前guest cell的配置, 资源对象不是线程安全的, 在界面线程中生成
         self.logger.info(f"generate cell({cellname}) config")
         guest_cell_bin = GuestCellGenerator.gen_config_bin(cell)
         if guest_cell_bin is None:
             self.logger.error(f"generate cell config failed")
             return
 
+        # 加载固件和启动单元格在后台任务中完成
+        job = JobManager.get_instance().submit(f"start cell {cellname}", self._start_job,
+                                               cellname, guest_cell_bin, firmwares)
+        wait_job(self._ui.pushButton_start, self._progress, job)
+
+    def _start_job(self, job: RPCJob, client: RPCClient, cellname: str, guest_cell_bin: bytes,
+                   firmwares: dict) -> bool:
+        """
+        启动客户单元格的后台任务。
+        
+        Args:
+            job: 后台任务。
+            client: 工作线程的RPC连接。
+            cellname: 客户单元格名称。
+            guest_cell_bin: 在界面线程中生成的单元格配置。
+            firmwares: 固件配置。
+            
+        Returns:
+            bool: 是否启动成功。
+        """
+        enabled = [name for name, fw in firmwares.items() if fw['enable']]
+        # 销毁, 创建, 加载各固件, 启动
+        steps = 3 + len(enabled)
+
         # 创建之前先查询列表，有无此cell,若有就销毁
         cell_exist = False
-        result = self._client.list_cell()
+        result = client.list_cell()
         if result is None or not result.result:
             self.logger.error("get cell list failed")
-            return
+            return False
         self.logger.debug("jailhouse cll list: " + str(result.result))
         for cell in result.result:
             if cell['name'] == cellname:
                 cell_exist = True
                 break
+        job.check_canceled()
+        job.progress(0, steps, "destroy cell")
         if cell_exist:
             self.logger.info(f"destroy cell({cellname})")
-            if not self._client.destroy_cell(cellname):
+            if not client.destroy_cell(cellname):
                 self.logger.debug(f"destroy cell({cellname}) failed")
-                return
+                return False
 
         # 创建guest cell
+        job.check_canceled()
+        job.progress(1, steps, "create cell")
         self.logger.info(f'create cell({cellname})')
-        result = self._client.create_cell(guest_cell_bin)
+        result = client.create_cell(guest_cell_bin)
         if not result.status:
             self.logger.error(f"create guest cell failed {result.message}")
-            return
+            return False
 
         # 加载每个固件
-        for name, fw in firmwares.items():
-            if not fw['enable']:
-                continue
-
+        for idx, name in enumerate(enabled):
+            fw = firmwares[name]
+            job.check_canceled()
+            job.progress(2+idx, steps, f"load {name}")
             self.logger.info(f"load firmware {name} for cell({cellname}) @{hex(fw['addr'])}")
             try:
-                with open(fw['file'], 'rb') as f:
-                    fw_bin = f.read()
-            except:
-                self.logger.error(f"read {fw['file']} failed.")
-                return
+                image = read_image({'name': name, 'addr': fw['addr'], 'file': fw['file']})
+            except DeployError as e:
+                self.logger.error(f"{e}")
+                return False
 
-            self.logger.info(f"md5: {md5(fw_bin).hexdigest()}")
-            result = self._client.load_cell(cellname, fw['addr'], fw_bin )
+            result = client.load_cell(cellname, fw['addr'], image['data'])
             if result is None or not result.status:
                 self.logger.error(f"load failed")
-                return
+                return False
 
         # 启动单元格
+        job.check_canceled()
+        job.progress(steps-1, steps, "start cell")
         self.logger.info(f"start cell({cellname})")
-        result = self._client.start_cell(cellname)
+        result = client.start_cell(cellname)
         if result is None or not result.status:
             self.logger.error(f"start cell({cellname}) failed")
-            return
+            return False
 
         self.logger.info(f"run cell{cellname} success.")
+        return True
 
     def _on_guest_cell_stop_connect(self):
         """
@@ -265,24 +315,30 @@ class RemoteACoreWidget(QtWidgets.QWidget):
         # 停止客户单元格
         # 获取当前的comboBox选中的值
         current_text = self._ui.comboBox_cell_name.currentText()
+        job = JobManager.get_instance().submit(f"destroy cell {current_text}", self._stop_job, current_text)
+        wait_job(self._ui.pushButton_stop, self._progress, job)
+
+    def _stop_job(self, job: RPCJob, client: RPCClient, current_text: str) -> bool:
+        """ 销毁客户单元格的后台任务 """
         # 查询列表
-        result = self._client.list_cell()
+        result = client.list_cell()
         if result is None:
             self.logger.debug("get guest cell list failed")
-            return
+            return False
         if not result.status:
             self.logger.debug("get guest cell list failed")
-            return
+            return False
         # 查找guest cell
         for cell in result.result:
             if cell['name'] == current_text:
                 self.logger.debug(f"destroy {current_text}...")
-                if not self._client.destroy_cell(current_text):
+                if not client.destroy_cell(current_text):
                     self.logger.debug(f"destroy {current_text} failed")
-                    return
+                    return False
         # 销毁
-        self._client.destroy_cell(current_text)
+        client.destroy_cell(current_text)
         self.logger.debug(f"destroy {current_text} success")
+        return True
 
     def _on_current_rsc_changed(self, sender, **kwargs):
         """
@@ -337,6 +393,8 @@ class RemoteRootWidget(QtWidgets.QWidget):
         super().__init__(parent)
         self._ui = Ui_Form_root()
         self._ui.setupUi(self)
+        self._progress = JobProgressWidget(self)
+        self._ui.pushButton_start.parentWidget().layout().insertWidget(0, self._progress)
 
         self._client: RPCClient = RPCClient.get_instance()
 
@@ -358,33 +416,22 @@ class RemoteRootWidget(QtWidgets.QWidget):
             self.logger.error("ResourceMgr failed")
             return
 
-        # 生成配置
-        root_cell_bin = RootCellGenerator.gen_config_bin(rsc)
-        if root_cell_bin is None:
-            self.logger.error("root_cell_bin is None")
+        # 在界面线程中生成配置
+        try:
+            root = root_source(rsc)
+        except DeployError as e:
+            self.logger.error(f"{e}")
             return
 
-        # 每次创建前先销毁
-        result = self._client.list_cell()
-        if result is None or not result.status:
-            self.logger.error("get root cell list failed")
-            return
-        for cell in result.result:
-            if cell['id'] == 0:
-                self.logger.debug(f"jailhouse disable")
-                result = self._client.jailhouse_disable()
-                if not result.status:
-                    self.logger.debug("disable failed")
-                    return
-                break
+        job = JobManager.get_instance().submit("enable root cell", self._start_job, root)
+        wait_job(self._ui.pushButton_start, self._progress, job)
 
-        # 创建root cell
-        result = self._client.jailhouse_enable(root_cell_bin)
-        if not result.status:
-            self.logger.error("jailhouse_enable failed")
-            self.logger.error(f"{result.message}")
-            return
-        self.logger.info("jailhouse root cell enable success")
+    def _start_job(self, job: RPCJob, client: RPCClient, root: dict) -> bool:
+        """ 启动根单元格的后台任务, 每次创建前先销毁 """
+        def step(value: int, maximum: int, text: str):
+            job.check_canceled()
+            job.progress(value, maximum, text)
+        return enable_hypervisor(client, root, start_uart=False, step=step)
 
     def _on_root_cell_destory_connect(self):
         """
@@ -394,16 +441,22 @@ class RemoteRootWidget(QtWidgets.QWidget):
         此过程包括获取单元格列表和禁用Jailhouse。
         """
         # 销毁根单元格
+        job = JobManager.get_instance().submit("disable root cell", self._destroy_job)
+        wait_job(self._ui.pushButton_stop, self._progress, job)
+
+    def _destroy_job(self, job: RPCJob, client: RPCClient) -> bool:
+        """ 销毁根单元格的后台任务 """
         # 先获取列表
-        result = self._client.list_cell()
+        result = client.list_cell()
         if not result.status or result is None:
             self.logger.error("get root cell list failed")
-            return
-        result = self._client.jailhouse_disable()
+            return False
+        result = client.jailhouse_disable()
         if not result.status:
             self.logger.error("get root cell list failed")
-            return
+            return False
         self.logger.debug("root cell disable success")
+        return True
 
 class RemoteWidget(QtWidgets.QWidget):
     # 远程控制主界面
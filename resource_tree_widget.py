@@ -125,9 +125,10 @@ class ResourceTreeModel(QtCore.QAbstractItemModel):
             # 删除PCI设备（清空？）
             pci_devs: ResourcePCIDeviceList = sender
             count = kwargs['count']
+            index = kwargs.get('index', 0)
             self.beginRemoveRows(
                 self._create_index(pci_devs.my_index(), pci_devs),
-                0, count-1
+                index, index+count-1
             )
             self.endRemoveRows()
         if isinstance(sender, ResourceGuestCellList):
@@ -0,0 +1,224 @@
+"""
+后台任务模块。
+
+RPC调用会阻塞到服务端返回，上传镜像、启动单元格时界面会卡住。
+本模块提供在QThreadPool中执行RPC操作的任务框架:
+- 每个工作线程使用单独的RPCClient连接，zerorpc连接不能跨线程使用
+- 任务通过信号报告进度、结果、错误和取消，信号在界面线程中处理
+- 任务在步骤之间检查取消标志
+
+主要类:
+- RPCJob: 后台任务
+- JobManager: 任务管理器，全局唯一
+
+示例:
+    job = JobManager.get_instance().submit("start cell", self._start_job, cellname)
+    job.signals.finished.connect(self._on_job_finished)
+
+    def _start_job(self, job: RPCJob, client: RPCClient, cellname):
+        job.progress(0, 1, "start")
+        return client.start_cell(cellname)
+"""
+
+import logging
+import threading
+import traceback
+from typing import Optional, Callable, List
+
+from PySide2 import QtCore
+from rpc_server.rpc_client import RPCClient
+
+
+class JobCanceled(Exception):
+    """ 任务被取消 """
+    pass
+
+
+class JobSignals(QtCore.QObject):
+    """
+    任务信号，对象在界面线程中创建，工作线程发出的信号在界面线程中处理。
+
+    信号:
+        started: 任务开始执行
+        progress: 进度 (当前值, 最大值, 说明)
+        result: 任务函数的返回值
+        error: 任务出错的原因
+        canceled: 任务被取消
+        finished: 任务结束，在result/error/canceled之后总会发出
+    """
+    started = QtCore.Signal()
+    progress = QtCore.Signal(int, int, str)
+    result = QtCore.Signal(object)
+    error = QtCore.Signal(str)
+    canceled = QtCore.Signal()
+    finished = QtCore.Signal()
+
+
+class RPCJob(QtCore.QRunnable):
+    """
+    后台任务。
+
+    任务函数的形式为 fn(job, client, *args)，client为工作线程的RPC连接，
+    返回值通过result信号发出。长时间的任务应调用progress()报告进度，
+    并在步骤之间调用check_canceled()。
+    """
+    logger = logging.getLogger("RPCJob")
+
+    def __init__(self, manager: 'JobManager', name: str, fn: Callable, args: tuple, addr: Optional[str]):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.signals = JobSignals()
+        self._manager = manager
+        self._name = name
+        self._fn = fn
+        self._args = args
+        self._addr = addr
+        self._canceled = threading.Event()
+        self._running = False
+        self._done = False
+
+    def name(self) -> str:
+        return self._name
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def is_done(self) -> bool:
+        return self._done
+
+    def cancel(self):
+        """ 请求取消任务, 正在执行的RPC调用不会被中断 """
+        self._canceled.set()
+
+    def is_canceled(self) -> bool:
+        return self._canceled.is_set()
+
+    def check_canceled(self):
+        """ 任务已取消时抛出JobCanceled, 在任务函数的步骤之间调用 """
+        if self._canceled.is_set():
+            raise JobCanceled()
+
+    def progress(self, value: int, maximum: int = 0, text: str = ""):
+        self.signals.progress.emit(value, maximum, text)
+
+    def run(self):
+        self._running = True
+        try:
+            self.check_canceled()
+            self.signals.started.emit()
+            client = None
+            if self._addr is not None:
+                client = self._manager.thread_client(self._addr)
+                if client is None:
+                    raise RuntimeError(f"connect {self._addr} failed")
+            value = self._fn(self, client, *self._args)
+            self.check_canceled()
+            self.signals.result.emit(value)
+        except JobCanceled:
+            self.logger.info(f"job {self._name} canceled")
+            self.signals.canceled.emit()
+        except Exception as e:
+            traceback.print_exc()
+            self.logger.error(f"job {self._name} failed: {e}")
+            self.signals.error.emit(str(e))
+        finally:
+            self._running = False
+            self._done = True
+            self.signals.finished.emit()
+
+
+class JobManager(QtCore.QObject):
+    """
+    任务管理器。
+
+    工作线程保持运行，每个线程的RPC连接在第一次使用时建立，
+    连接地址与界面的RPCClient相同。
+
+    信号:
+        busy_changed: 是否有未结束的任务
+    """
+    logger = logging.getLogger("JobManager")
+    busy_changed = QtCore.Signal(bool)
+
+    # 工作线程连接的超时时间(秒)，需要足够上传大的镜像
+    RPC_TIMEOUT = 300
+
+    _instance = None
+
+    @classmethod
+    def get_instance(cls) -> 'JobManager':
+        if cls._instance is None:
+            cls._instance = JobManager()
+        return cls._instance
+
+    def __init__(self, max_threads: int = 2):
+        super().__init__()
+        self._pool = QtCore.QThreadPool()
+        self._pool.setMaxThreadCount(max_threads)
+        # 线程退出时连接无法正确关闭, 工作线程一直保持
+        self._pool.setExpiryTimeout(-1)
+        self._jobs: List[RPCJob] = list()
+        self._local = threading.local()
+
+    def thread_client(self, addr: str) -> Optional[RPCClient]:
+        """ 当前工作线程的RPC连接, 地址变化或断开时重新连接 """
+        client: Optional[RPCClient] = getattr(self._local, 'client', None)
+        if client is not None and (not client.is_connected() or client.addr() != addr):
+            client.close()
+            client = None
+        if client is None:
+            client = RPCClient()
+            if not client.connect(addr, timeout=self.RPC_TIMEOUT):
+                return None
+            self._local.client = client
+        return client
+
+    def submit(self, name: str, fn: Callable, *args, rpc: bool = True) -> Optional[RPCJob]:
+        """
+        提交任务。
+
+        Args:
+            name: 任务名称, 用于日志
+            fn: 任务函数 fn(job, client, *args)
+            args: 任务函数的参数
+            rpc: 是否需要RPC连接, 为False时client参数为None
+
+        Returns:
+            RPCJob: 需要RPC连接但界面未连接时返回None
+        """
+        addr = None
+        if rpc:
+            main_client = RPCClient.get_instance()
+            if not main_client.is_connected():
+                self.logger.error(f"{name}: unconnected")
+                return None
+            addr = main_client.addr()
+
+        job = RPCJob(self, name, fn, args, addr)
+        job.signals.finished.connect(lambda: self._on_job_finished(job))
+        was_busy = self.is_busy()
+        self._jobs.append(job)
+        self._pool.start(job)
+        if not was_busy:
+            self.busy_changed.emit(True)
+        return job
+
+    def is_busy(self) -> bool:
+        return len(self._jobs) > 0
+
+    def jobs(self) -> List[RPCJob]:
+        return list(self._jobs)
+
+    def cancel_all(self):
+        for job in self._jobs:
+            job.cancel()
+
+    def wait(self, msecs: int = -1) -> bool:
+        """ 等待所有任务结束, 用于退出程序前 """
+        return self._pool.waitForDone(msecs)
+
+    def _on_job_finished(self, job: RPCJob):
+        if job in self._jobs:
+            self._jobs.remove(job)
+        if not self._jobs:
+            self.busy_changed.emit(False)
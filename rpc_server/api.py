@@ -2,6 +2,48 @@ from typing import Any
 import abc
 from unittest import result
 
+
+# dict_diff结果中记录被删除键的列表, 值为None的键正常传递
+DIFF_DELETED = '__deleted__'
+
+
+def dict_diff(old: dict, new: dict) -> dict:
+    """ 计算两个状态字典的差异
+    只保留发生变化的键, 子字典递归比较, 删除的键记录在DIFF_DELETED列表中.
+    """
+    diff = dict()
+    for key, value in new.items():
+        if key not in old:
+            diff[key] = value
+            continue
+        old_value = old[key]
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            sub = dict_diff(old_value, value)
+            if sub:
+                diff[key] = sub
+        elif value != old_value:
+            diff[key] = value
+    deleted = [key for key in old if key not in new]
+    if deleted:
+        diff[DIFF_DELETED] = deleted
+    return diff
+
+
+def dict_patch(base: dict, diff: dict) -> dict:
+    """ 将dict_diff的结果应用到base, 返回新的字典, 不修改base
+    """
+    result = dict(base)
+    for key in diff.get(DIFF_DELETED, ()):
+        result.pop(key, None)
+    for key, value in diff.items():
+        if key == DIFF_DELETED:
+            continue
+        if isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = dict_patch(result[key], value)
+        else:
+            result[key] = value
+    return result
+
 class RPCApi(metaclass=abc.ABCMeta):
     class Result(object):
         def __init__(self, status: bool = False, msg: str = "", result: Any = None):
@@ -54,6 +96,26 @@ class RPCApi(metaclass=abc.ABCMeta):
         """
         return None
 
+    @abc.abstractmethod
+    def pci_devices_since(self, inventory_id: str, generation: int) -> dict:
+        """ 获取PCI列表的增量变化
+        Args:
+            inventory_id (str): 上次获取到的清单id, 首次获取传空字符串
+            generation (int): 上次获取到的generation, 首次获取传0
+        Returns:
+            {id, generation, full, added, changed, removed}
+            id或generation不匹配时full为True, added为完整的设备列表
+        """
+        return None
+
+    @abc.abstractmethod
+    def pci_snapshot(self) -> dict:
+        """ 导出PCI设备快照
+        Returns:
+            bytes: tar.gz格式的快照, 用于离线配置
+        """
+        return None
+
     @abc.abstractmethod
     def compile_cell(self, source: str) -> dict:
         """ 编译cell
@@ -119,6 +181,22 @@ class RPCApi(metaclass=abc.ABCMeta):
         """
         return None
 
+    @abc.abstractmethod
+    def deploy_cell(self, plan: dict) -> dict:
+        """ 在服务端一次完成cell的销毁/创建/加载/启动, 失败时销毁新创建的cell
+        Args:
+            plan (dict): {
+                name:    cell名称, 必须与config中的名称一致,
+                config:  cell配置二进制,
+                images:  [ {name:<name>, addr:<addr>, data:<data>} ... ],
+                start:   加载后是否启动, 默认True,
+                replace: 存在同名cell时是否先销毁, 默认True,
+            }
+        Returns:
+            result为执行的步骤列表
+        """
+        return None
+
     @abc.abstractmethod
     def get_status(self) -> dict:
         """获取状态
@@ -126,10 +204,11 @@ class RPCApi(metaclass=abc.ABCMeta):
             {
                 timestamp: time.time()
                 rootcell: {
-                    meminfo = psutils.virtual_memory(),
-                    cputimes = psutil.cpu_times(),
-                    cpuload = psutil.cpu_percent(),
                     cpucount: <count>,
+                    cpuload: 与上次采样之间的总负载(百分比),
+                    cpus: [每个CPU的负载(百分比)],
+                    cputimes: {user, system, idle} 累计时间(秒),
+                    meminfo: {total, available, free} 字节,
                 }
                 guestcells: {
                     'name': {'id', 'name', 'status'} ... ],
@@ -138,6 +217,38 @@ class RPCApi(metaclass=abc.ABCMeta):
         """
         return None
 
+    @abc.abstractmethod
+    def get_status_history(self, start: float, end: float, max_points: int) -> dict:
+        """获取状态历史
+        Args:
+            start (float): 开始时间, time.time()
+            end (float): 结束时间, 小于等于0表示最新
+            max_points (int): 最多返回的点数, 超过时降采样, 0表示不降采样
+        Returns:
+            {
+                timestamp: [...],
+                cpuload: [...],
+                cpus: [[cpu0 ...], [cpu1 ...] ...],
+                mem_total: [...],
+                mem_available: [...],
+                cells: {name: [status|None ...]},
+            }
+        """
+        return None
+
+    @abc.abstractmethod
+    def stream_status(self):
+        """订阅状态推送
+        服务端按固定周期采样, 第一条消息为完整状态, 之后只推送变化部分.
+        Yields:
+            {
+                seq: 序号
+                full: 是否为完整状态
+                status: get_status的结果或dict_diff差异
+            }
+        """
+        return None
+
     @abc.abstractmethod
     def get_guest_status(self, idx) -> dict:
         """
@@ -150,6 +261,14 @@ class RPCApi(metaclass=abc.ABCMeta):
         """
         return None
 
+    @abc.abstractmethod
+    def get_guests_status(self) -> dict:
+        """ 一次获取所有guest的状态
+        Returns:
+            [get_guest_status的结果 ...], 列表索引为guest编号
+        """
+        return None
+
 
     @abc.abstractmethod
     def run_linux(self, cell: bytes, kernel: bytes, dtb: bytes, ramdisk: bytes, bootargs: str) -> dict:
@@ -1,61 +1,188 @@
 import ctypes
 import os
+import time
+import logging
+from typing import Optional, List
+
+
+class GuestStatus(ctypes.LittleEndianStructure):
+    """
+    typedef struct ivsm_p2p_guest_status{
+        int32_t  online;    /* 是否在线 */
+        uint64_t mem_total; /* 总内存 单位字节 */
+        uint64_t mem_used;  /* 已使用内存 单位字节 */
+        int32_t  cpu_load;  /* CPU负载 */
+    }ivsm_p2p_guestos_status_t;
+    """
+    _pack_ = 8
+    _fields_ = [
+        ("online", ctypes.c_int32),
+        ("mem_total", ctypes.c_int64),
+        ("mem_used", ctypes.c_int64),
+        ("cpu_load", ctypes.c_int32)
+    ]
+
+    def to_dict(self):
+        return {
+            "online": self.online,
+            "mem_total": self.mem_total,
+            "mem_used": self.mem_used,
+            "cpu_load": self.cpu_load
+        }
+    def __repr__(self) -> str:
+        return f"online: {self.online} mem: {self.mem_used}/{self.mem_total} cpu: {self.cpu_load}"
+
+
+class IvsmP2PLibrary(object):
+    """ libjhtool.so
+
+    int ivsm_p2p_init(void);
+    int ivsm_p2p_guestos_status( int target, ivsm_p2p_guestos_status_t *status );
+    int ivsm_p2p_guestos_status_all( ivsm_p2p_guestos_status_t *status, int count );
+
+    ivsm_p2p_guestos_status_all为批量接口, 一次填充count个guest的状态, 返回填充的个数.
+    旧版本的库没有该接口, 此时逐个调用ivsm_p2p_guestos_status, 查询失败的guest状态清零.
+    """
+    logger = logging.getLogger("IvsmP2PLibrary")
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'libjhtool.so')
+        self._path = path
+        self._so = None
+        self._has_all = False
+
+    def init(self) -> bool:
+        try:
+            so = ctypes.CDLL(self._path)
+        except OSError as e:
+            self.logger.error(f"load {self._path} failed: {e}")
+            return False
+
+        so.ivsm_p2p_guestos_status.argtypes = (ctypes.c_int, ctypes.POINTER(GuestStatus))
+        so.ivsm_p2p_guestos_status.restype = ctypes.c_int
+        try:
+            so.ivsm_p2p_guestos_status_all.argtypes = (ctypes.POINTER(GuestStatus), ctypes.c_int)
+            so.ivsm_p2p_guestos_status_all.restype = ctypes.c_int
+            self._has_all = True
+        except AttributeError:
+            self.logger.info("ivsm_p2p_guestos_status_all not found, query guests one by one")
+            self._has_all = False
+
+        if so.ivsm_p2p_init() < 0:
+            self.logger.error("ivsm_p2p_init failed.")
+            return False
+        self._so = so
+        return True
+
+    def guestos_status(self, target: int, status: GuestStatus) -> int:
+        return self._so.ivsm_p2p_guestos_status(target, status)
+
+    def guestos_status_all(self, status: ctypes.Array, count: int) -> int:
+        if self._has_all:
+            return self._so.ivsm_p2p_guestos_status_all(status, count)
+        # 列表索引为target, 只返回到最后一个应答的guest, 中间未应答的guest清零(不在线)
+        answered = 0
+        for target in range(count):
+            if self._so.ivsm_p2p_guestos_status(target, status[target]) < 0:
+                ctypes.memset(ctypes.addressof(status[target]), 0, ctypes.sizeof(GuestStatus))
+            else:
+                answered = target + 1
+        return answered
+
+
+class FakeIvsmP2PLibrary(object):
+    """ 模拟的共享内存后端, 用于测试
+
+    共享内存中为GuestStatus数组, 每个guest写自己的位置,
+    批量查询时一次复制整个数组, 与真实共享内存的布局一致.
+    """
+    def __init__(self, count: int = 8):
+        self.count = count
+        self.shm = (GuestStatus * count)()
+        self.calls = 0
+
+    def init(self) -> bool:
+        return True
+
+    def set_guest(self, target: int, online: bool, mem_total: int = 0, mem_used: int = 0, cpu_load: int = 0):
+        """ 模拟guest写入共享内存 """
+        status = self.shm[target]
+        status.online = int(online)
+        status.mem_total = mem_total
+        status.mem_used = mem_used
+        status.cpu_load = cpu_load
+
+    def guestos_status(self, target: int, status: GuestStatus) -> int:
+        self.calls += 1
+        if target < 0 or target >= self.count:
+            return -1
+        ctypes.pointer(status)[0] = self.shm[target]
+        return 0
+
+    def guestos_status_all(self, status: ctypes.Array, count: int) -> int:
+        self.calls += 1
+        count = min(count, self.count)
+        ctypes.memmove(status, self.shm, ctypes.sizeof(GuestStatus) * count)
+        return count
+
 
 class IvsmP2P():
-    so = None
-
-    class GuestStatus(ctypes.LittleEndianStructure):
-        _pack_ = 8
-        _fields_ = [
-            ("online", ctypes.c_int32),
-            ("mem_total", ctypes.c_int64),
-            ("mem_used", ctypes.c_int64),
-            ("cpu_load", ctypes.c_int32)
-        ]
-
-        def to_dict(self):
-            return {
-                "online": self.online,
-                "mem_total": self.mem_total,
-                "mem_used": self.mem_used,
-                "cpu_load": self.cpu_load
-            }
-        def __repr__(self) -> str:
-            return f"online: {self.online} mem: {self.mem_used}/{self.mem_total} cpu: {self.cpu_load}"
+    """ 通过ivshmem查询guest os状态
 
-    @classmethod
-    def init(cls):
-        if cls.so is None:
-            self_path = os.path.realpath(__file__)
-            so_path = os.path.join(os.path.dirname(self_path), 'libjhtool.so')
-            print(so_path, __file__)
-            cls.so = ctypes.CDLL(so_path)
+    库只初始化一次, 所有guest的状态通过一次批量调用获取并缓存,
+    cache_time内的重复查询直接返回缓存, 多个客户端高频查询时不会重复访问共享内存.
+    """
+    logger = logging.getLogger("IvsmP2P")
 
-            cls.so.ivsm_p2p_guestos_status.argtypes = (ctypes.c_int, ctypes.POINTER(cls.GuestStatus) )
-            cls.so.ivsm_p2p_guestos_status.restype = ctypes.c_int
+    GuestStatus = GuestStatus
 
-            cls.so.ivsm_p2p_init()
+    lib = None
+    max_guests = 8
+    cache_time = 0.05
+
+    _status = (GuestStatus * max_guests)()
+    _status_count = 0
+    _status_time = 0.0
 
     @classmethod
-    def guestos_status(cls, target):
-        """
-        typedef struct ivsm_p2p_guest_status{
-            int32_t  online;    /* 是否在线 */
-            uint64_t mem_total; /* 总内存 单位字节 */
-            uint64_t mem_used;  /* 已使用内存 单位字节 */
-            int32_t  cpu_load;  /* CPU负载 */
-        }ivsm_p2p_guestos_status_t;
-        int ivsm_p2p_guestos_status( int target, ivsm_p2p_guestos_status_t *status );
-        """
-        if cls.so is None:
-            print("so is None")
+    def init(cls, lib=None) -> bool:
+        if cls.lib is not None:
+            return True
+        if lib is None:
+            lib = IvsmP2PLibrary()
+        if not lib.init():
+            return False
+        cls.lib = lib
+        return True
+
+    @classmethod
+    def is_initialized(cls) -> bool:
+        return cls.lib is not None
+
+    @classmethod
+    def all_guestos_status(cls) -> Optional[List[GuestStatus]]:
+        """ 所有guest的状态, 列表索引为target """
+        if cls.lib is None:
             return None
-        print("guestos status")
-        cls.so.ivsm_p2p_init()
 
-        status = cls.GuestStatus()
-        a = cls.so.ivsm_p2p_guestos_status(target, status)
-        return status
+        now = time.monotonic()
+        if now - cls._status_time > cls.cache_time:
+            count = cls.lib.guestos_status_all(cls._status, cls.max_guests)
+            if count < 0:
+                cls.logger.error("query guest os status failed.")
+                return None
+            cls._status_count = count
+            cls._status_time = now
+
+        return [GuestStatus.from_buffer_copy(cls._status[i]) for i in range(cls._status_count)]
+
+    @classmethod
+    def guestos_status(cls, target) -> Optional[GuestStatus]:
+        status = cls.all_guestos_status()
+        if status is None or target < 0 or target >= len(status):
+            return None
+        return status[target]
 
 
 if __name__ == '__main__':
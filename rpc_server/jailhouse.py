@@ -3,19 +3,60 @@ import logging
 import platform
 import subprocess
 import tempfile
-from typing import Union, Optional
+from typing import Union, Optional, Dict, List, Tuple
 from api import RPCApi
+from jailhouse_driver import JailhouseDriver, cell_config_name
 import shlex
 
 
 class TempFile(object):
-    def __init__(self) -> None:
+    """ 临时文件
+
+    默认使用memfd_create创建内存文件, 通过/proc/<pid>/fd/<fd>路径传给jailhouse等命令,
+    数据不落盘; 系统不支持memfd时退回到临时目录中的文件.
+    在with语句中使用时, 退出时立即释放.
+    """
+    def __init__(self, memory: bool = True) -> None:
         self._temp_files = list()
+        self._memfds = list()
+        self._memory = memory and hasattr(os, 'memfd_create')
 
     def __del__(self):
         self.clean()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.clean()
+
+    def _save_memfd(self, name: str, data: Optional[Union[str,bytes]]) -> Optional[str]:
+        try:
+            fd = os.memfd_create(name)
+        except OSError:
+            self._memory = False
+            return None
+
+        if isinstance(data, str):
+            data = data.encode()
+        try:
+            view = memoryview(data or b'')
+            while len(view) > 0:
+                view = view[os.write(fd, view):]
+        except OSError:
+            os.close(fd)
+            logging.error(f"write memfd failed {name}.")
+            return None
+
+        self._memfds.append(fd)
+        return f"/proc/{os.getpid()}/fd/{fd}"
+
     def save(self, prefix: str, suffix: str, data: Optional[Union[str,bytes]] = None) -> Optional[str]:
+        if self._memory:
+            temp = self._save_memfd(prefix+suffix, data)
+            if temp is not None:
+                return temp
+
         temp = tempfile.mktemp(suffix, prefix)
         try:
             if isinstance(data, str):
@@ -32,8 +73,12 @@ class TempFile(object):
         return temp
 
     def clean(self):
+        for fd in self._memfds:
+            os.close(fd)
+        self._memfds.clear()
         for fn in self._temp_files:
-            os.unlink(fn)
+            if os.path.exists(fn):
+                os.unlink(fn)
         self._temp_files.clear()
 
 
@@ -63,10 +108,19 @@ class Jailhouse(object):
     jh_exe = os.path.join(jailhouse_bin, "jailhouse")
     jh_ko  = os.path.join(jailhouse_bin, "jailhouse.ko")
     jh_dev = '/dev/jailhouse'
+    jh_sysfs = '/sys/devices/jailhouse'
+    jh_sysfs_cells = os.path.join(jh_sysfs, 'cells')
     linux_loader = os.path.join(jailhouse_bin, "linux-loader.bin")
 
     tmep_files = list()
 
+    # cell名称到id的缓存, 创建/销毁cell时失效
+    _cell_ids: Dict[str, int] = dict()
+
+    # ioctl后端, 设备不可用时使用jailhouse命令
+    use_driver = True
+    _driver: Optional[JailhouseDriver] = None
+
     def __init__(self) -> None:
         pass
 
@@ -89,23 +143,53 @@ class Jailhouse(object):
         else:
             return RPCApi.Result(False, msg=out+'\n'+err)
 
+    @classmethod
+    def _read_sysfs(cls, path: str) -> Optional[str]:
+        try:
+            with open(path, 'rt') as f:
+                return f.read().strip()
+        except:
+            return None
+
+    @classmethod
+    def set_driver(cls, driver: Optional[JailhouseDriver]):
+        if cls._driver is not None:
+            cls._driver.close()
+        cls._driver = driver
+
+    @classmethod
+    def driver(cls) -> Optional[JailhouseDriver]:
+        """ 获取可用的ioctl后端, 设备无法打开时返回None """
+        if not cls.use_driver:
+            return None
+        if cls._driver is None:
+            cls._driver = JailhouseDriver()
+        if not cls._driver.open():
+            return None
+        return cls._driver
+
+    @classmethod
+    def _invalidate_cells(cls):
+        cls._cell_ids.clear()
+
     @classmethod
     def find_cell_id(cls, name: str) -> Optional[int]:
+        # 缓存命中时通过sysfs确认id仍然对应该名称
+        cell_id = cls._cell_ids.get(name)
+        if cell_id is not None:
+            if cls._read_sysfs(os.path.join(cls.jh_sysfs_cells, str(cell_id), 'name')) == name:
+                return cell_id
+
         celllist = cls.list_cell()
         if not celllist:
             return None
         celllist = celllist.result
 
-        for cell in celllist:
-            if cell['id'] == 0:
-                continue
-            if cell['name'] == name:
-                return cell['id']
-        return None
+        cls._cell_ids = {cell['name']: cell['id'] for cell in celllist if cell['id'] != 0}
+        return cls._cell_ids.get(name)
 
     @classmethod
     def enable(cls, rootcell: bytes) -> RPCApi.Result:
-        tf = TempFile()
         if not os.path.exists(cls.jh_dev):
             # 加载驱动
             logging.info("install jailhouse ko")
@@ -113,13 +197,15 @@ class Jailhouse(object):
             if not r:
                 return RPCApi.Result(False, msg="insmod failed")
 
-        # 保存rootcell到文件
-        temp_fn = tf.save("rootcell", ".cell", rootcell)
-        if temp_fn is None:
-            return RPCApi.Result(False, msg="save temp file failed.")
+        with TempFile() as tf:
+            # 保存rootcell到文件
+            temp_fn = tf.save("rootcell", ".cell", rootcell)
+            if temp_fn is None:
+                return RPCApi.Result(False, msg="save temp file failed.")
 
-        cmd = f'{cls.jh_exe} enable {temp_fn}'
-        r = cls.run_command(cmd)
+            cmd = f'{cls.jh_exe} enable {temp_fn}'
+            cls._invalidate_cells()
+            r = cls.run_command(cmd)
         if not r:
             return RPCApi.Result(False, msg='jailhouse enable faild.')
 
@@ -131,12 +217,49 @@ class Jailhouse(object):
             return RPCApi.Result(True)
 
         cmd = f'{cls.jh_exe} disable'
+        cls._invalidate_cells()
         if not cls.run_command(cmd):
             return RPCApi.Result(False, "disable failed.")
         return RPCApi.Result(True)
 
+    @classmethod
+    def _list_cell_sysfs(cls) -> List[dict]:
+        cells = list()
+        if not os.path.isdir(cls.jh_sysfs_cells):
+            return cells
+
+        for entry in os.listdir(cls.jh_sysfs_cells):
+            if not entry.isdigit():
+                continue
+            path = os.path.join(cls.jh_sysfs_cells, entry)
+            name = cls._read_sysfs(os.path.join(path, 'name'))
+            if name is None:
+                # cell在读取过程中被销毁
+                continue
+            cpus = cls._read_sysfs(os.path.join(path, 'cpus_assigned_list'))
+            if cpus is None:
+                cpus = cls._read_sysfs(os.path.join(path, 'cpus_assigned'))
+            cells.append({
+                'id': int(entry),
+                'name': name,
+                'status': cls._read_sysfs(os.path.join(path, 'state')) or '',
+                'cpus': cpus or ''
+            })
+        cells.sort(key=lambda x: x['id'])
+        return cells
+
     @classmethod
     def list_cell(cls) -> RPCApi.Result:
+        driver = cls.driver()
+        if driver is not None:
+            cells = driver.list_cell()
+            if cells is not None:
+                return RPCApi.Result(True, result=cells)
+
+        # 驱动已加载时直接读取sysfs, 不需要启动jailhouse进程
+        if os.path.isdir(cls.jh_sysfs):
+            return RPCApi.Result(True, result=cls._list_cell_sysfs())
+
         cmd = f"{cls.jh_exe} cell list"
         r = cls.run_command(cmd)
         if not r:
@@ -159,13 +282,19 @@ class Jailhouse(object):
 
     @classmethod
     def create_cell(cls, cell: bytes) -> RPCApi.Result:
-        tf = TempFile()
-        temp_fn = tf.save("create_cell", ".cell", cell)
-        if temp_fn is None:
-            return RPCApi.Result(False, msg="save temp file failed")
-
-        cmd = f"{cls.jh_exe} cell create {temp_fn}"
-        r = cls.run_command(cmd)
+        driver = cls.driver()
+        if driver is not None:
+            cls._invalidate_cells()
+            return driver.create_cell(cell)
+
+        with TempFile() as tf:
+            temp_fn = tf.save("create_cell", ".cell", cell)
+            if temp_fn is None:
+                return RPCApi.Result(False, msg="save temp file failed")
+
+            cmd = f"{cls.jh_exe} cell create {temp_fn}"
+            cls._invalidate_cells()
+            r = cls.run_command(cmd)
         if not r:
             return r
 
@@ -173,11 +302,17 @@ class Jailhouse(object):
 
     @classmethod
     def destroy_cell(cls, name: str) -> RPCApi.Result:
+        driver = cls.driver()
+        if driver is not None:
+            cls._invalidate_cells()
+            return driver.destroy_cell(name)
+
         cell_id = cls.find_cell_id(name)
         if cell_id is None:
             return RPCApi.Result(False, msg=f"cell {name} not found")
 
         cmd = f"{cls.jh_exe} cell destroy {cell_id}"
+        cls._invalidate_cells()
         r = cls.run_command(cmd)
         if not r:
             return r
@@ -186,24 +321,100 @@ class Jailhouse(object):
 
     @classmethod
     def load_cell(cls, name, addr, data) -> RPCApi.Result:
-        tf = TempFile()
+        return cls.load_cell_images(name, [(addr, data)])
+
+    @classmethod
+    def load_cell_images(cls, name, images: List[Tuple[int, bytes]]) -> RPCApi.Result:
+        """ 一次加载多个镜像
+        Args:
+            images: [(加载地址, 数据) ...]
+        """
+        driver = cls.driver()
+        if driver is not None:
+            return driver.load_cell(name, images)
+
         cell_id = cls.find_cell_id(name)
         if cell_id is None:
             return RPCApi.Result(False, msg=f"cell {name} not found")
 
-        temp_fn = tf.save("load", ".bin", data)
-        if temp_fn is None:
-            return RPCApi.Result(False, msg="save temp file failed.")
+        with TempFile() as tf:
+            args = list()
+            for addr, data in images:
+                temp_fn = tf.save("load", ".bin", data)
+                if temp_fn is None:
+                    return RPCApi.Result(False, msg="save temp file failed.")
+                args.append(f"{temp_fn} -a {hex(addr)}")
 
-        cmd = f"{cls.jh_exe} cell load {cell_id} {temp_fn} -a {hex(addr)}"
-        r = cls.run_command(cmd)
+            cmd = f"{cls.jh_exe} cell load {cell_id} {' '.join(args)}"
+            r = cls.run_command(cmd)
         if not r:
             return r
 
         return RPCApi.Result(True)
 
+    @classmethod
+    def deploy_cell(cls, name: str, config: bytes, images: List[Tuple[int, bytes]],
+                    start: bool = True, replace: bool = True) -> RPCApi.Result:
+        """ 创建, 加载并启动cell, 任一步骤失败时销毁新创建的cell
+        Args:
+            name: cell名称, 与config中的名称不一致时不创建cell, 返回错误
+            images: [(加载地址, 数据) ...], 按顺序一次加载
+            start: 加载后是否启动
+            replace: 已存在同名cell时先销毁, 为False时返回错误
+        Returns:
+            result为执行的步骤列表
+        """
+        steps = list()
+
+        def failed(step: str, r: RPCApi.Result, rollback: bool) -> RPCApi.Result:
+            msg = f"deploy cell {name} failed at {step}: {r.message}"
+            logging.error(msg)
+            if rollback:
+                logging.info(f"rollback, destroy cell {name}")
+                rr = cls.destroy_cell(name)
+                steps.append("rollback" if rr else "rollback failed")
+            return RPCApi.Result(False, msg=msg, result=steps)
+
+        # 后续步骤按name操作, 名称不一致时创建的cell无法加载和回滚
+        config_name = cell_config_name(config)
+        if config_name is None:
+            return failed("check", RPCApi.Result(False, msg="invalid cell config"), False)
+        if config_name != name:
+            return failed("check", RPCApi.Result(False, msg=f"cell config is for {config_name}"), False)
+
+        if cls.find_cell_id(name) is not None:
+            if not replace:
+                return RPCApi.Result(False, msg=f"cell {name} exists", result=steps)
+            r = cls.destroy_cell(name)
+            if not r:
+                return failed("destroy", r, False)
+            steps.append("destroy")
+
+        r = cls.create_cell(config)
+        if not r:
+            return failed("create", r, False)
+        steps.append("create")
+
+        if images:
+            r = cls.load_cell_images(name, images)
+            if not r:
+                return failed("load", r, True)
+            steps.append("load")
+
+        if start:
+            r = cls.start_cell(name)
+            if not r:
+                return failed("start", r, True)
+            steps.append("start")
+
+        return RPCApi.Result(True, result=steps)
+
     @classmethod
     def start_cell(cls, name) -> RPCApi.Result:
+        driver = cls.driver()
+        if driver is not None:
+            return driver.start_cell(name)
+
         cell_id = cls.find_cell_id(name)
         if cell_id is None:
             return RPCApi.Result(False, msg=f"cell {name} not found")
@@ -217,6 +428,10 @@ class Jailhouse(object):
 
     @classmethod
     def stop_cell(cls, name) -> RPCApi.Result:
+        driver = cls.driver()
+        if driver is not None:
+            return driver.shutdown_cell(name)
+
         cell_id = cls.find_cell_id(name)
         if cell_id is None:
             return RPCApi.Result(False, msg=f"cell {name} not found")
@@ -235,6 +450,7 @@ class Jailhouse(object):
         else:
             cmd = f'{cls.jh_exe} cell linux -d {dtb_fn} -i {ramdisk_fn} {cell_fn} {kernel_fn} -c "{bootargs}"'
 
+        cls._invalidate_cells()
         return cls.run_command(cmd)
 
 
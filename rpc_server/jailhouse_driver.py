@@ -0,0 +1,286 @@
+"""
+jailhouse驱动ioctl接口, 参考jailhouse源码 include/jailhouse/jailhouse.h (driver/jailhouse.h)
+
+struct jailhouse_cell_create {
+    __u64 config_address;
+    __u32 config_size;
+    __u32 padding;
+};
+
+struct jailhouse_preload_image {
+    __u64 source_address;
+    __u64 size;
+    __u64 target_address;
+    __u64 padding;
+};
+
+struct jailhouse_cell_id {
+    __s32 id;
+    __u32 padding;
+    char name[JAILHOUSE_CELL_ID_NAMELEN + 1];
+};
+
+struct jailhouse_cell_load {
+    struct jailhouse_cell_id cell_id;
+    __u32 num_preload_images;
+    __u32 padding;
+    struct jailhouse_preload_image image[];
+};
+"""
+
+import os
+import fcntl
+import ctypes
+import logging
+from typing import Optional, List, Tuple, Dict
+from api import RPCApi
+
+JAILHOUSE_CELL_ID_NAMELEN = 31
+JAILHOUSE_CELL_ID_UNUSED = -1
+
+# jailhouse_cell_desc中name的偏移, 前面是 signature[6] 和 revision(u16)
+CELL_DESC_NAME_OFFSET = 8
+
+
+class JailhouseCellCreate(ctypes.Structure):
+    _fields_ = [
+        ("config_address", ctypes.c_uint64),
+        ("config_size", ctypes.c_uint32),
+        ("padding", ctypes.c_uint32),
+    ]
+
+
+class JailhousePreloadImage(ctypes.Structure):
+    _fields_ = [
+        ("source_address", ctypes.c_uint64),
+        ("size", ctypes.c_uint64),
+        ("target_address", ctypes.c_uint64),
+        ("padding", ctypes.c_uint64),
+    ]
+
+
+class JailhouseCellId(ctypes.Structure):
+    _fields_ = [
+        ("id", ctypes.c_int32),
+        ("padding", ctypes.c_uint32),
+        ("name", ctypes.c_char * (JAILHOUSE_CELL_ID_NAMELEN + 1)),
+    ]
+
+    @classmethod
+    def from_name(cls, name: str):
+        cell_id = cls()
+        cell_id.id = JAILHOUSE_CELL_ID_UNUSED
+        cell_id.name = name.encode()
+        return cell_id
+
+
+class JailhouseCellLoad(ctypes.Structure):
+    _fields_ = [
+        ("cell_id", JailhouseCellId),
+        ("num_preload_images", ctypes.c_uint32),
+        ("padding", ctypes.c_uint32),
+    ]
+
+    @classmethod
+    def with_images(cls, count: int):
+        """ 带有count个image的jailhouse_cell_load """
+        class _CellLoad(ctypes.Structure):
+            _fields_ = cls._fields_ + [("image", JailhousePreloadImage * count)]
+        return _CellLoad()
+
+
+def _IO(nr):
+    return nr
+
+
+def _IOW(nr, size):
+    return (1 << 30) | (size << 16) | nr
+
+
+JAILHOUSE_ENABLE       = _IOW(0, ctypes.sizeof(ctypes.c_void_p))
+JAILHOUSE_DISABLE      = _IO(1)
+JAILHOUSE_CELL_CREATE  = _IOW(2, ctypes.sizeof(JailhouseCellCreate))
+JAILHOUSE_CELL_LOAD    = _IOW(3, ctypes.sizeof(JailhouseCellLoad))
+JAILHOUSE_CELL_START   = _IOW(4, ctypes.sizeof(JailhouseCellId))
+JAILHOUSE_CELL_DESTROY = _IOW(5, ctypes.sizeof(JailhouseCellId))
+
+
+def cell_config_name(config: bytes) -> Optional[str]:
+    """ cell配置中的名称, 配置不完整时返回None """
+    end = CELL_DESC_NAME_OFFSET + JAILHOUSE_CELL_ID_NAMELEN + 1
+    if len(config) < end:
+        return None
+    try:
+        return config[CELL_DESC_NAME_OFFSET:end].split(b'\0')[0].decode()
+    except UnicodeDecodeError:
+        return None
+
+
+def buffer_address(data: bytes) -> int:
+    """ bytes对象内部缓冲区地址, 调用期间调用方需持有data的引用 """
+    return ctypes.cast(ctypes.c_char_p(data), ctypes.c_void_p).value
+
+
+class JailhouseDevice(object):
+    """ /dev/jailhouse设备, 打开后保持文件描述符 """
+    def __init__(self, path: str = '/dev/jailhouse'):
+        self._path = path
+        self._fd: Optional[int] = None
+
+    def open(self) -> bool:
+        if self._fd is not None:
+            return True
+        try:
+            self._fd = os.open(self._path, os.O_RDWR)
+        except OSError:
+            return False
+        return True
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def ioctl(self, request: int, arg: ctypes.Structure):
+        if self._fd is None:
+            raise OSError(f"{self._path} not open")
+        fcntl.ioctl(self._fd, request, arg)
+
+    def list_cell(self) -> Optional[List[dict]]:
+        """ 真实设备的cell列表从sysfs获取 """
+        return None
+
+
+class FakeJailhouseDevice(object):
+    """ 模拟/dev/jailhouse, 在普通Linux主机上测试ioctl后端
+
+    记录cell表和加载的镜像, 按驱动的规则返回错误码.
+    """
+    def __init__(self):
+        self.cells: Dict[int, dict] = {
+            0: {'name': 'root', 'status': 'running', 'config': b'', 'images': list()}
+        }
+        self.calls: List[int] = list()
+        self._next_id = 1
+
+    def open(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+    def _find(self, cell_id: JailhouseCellId) -> int:
+        if cell_id.id != JAILHOUSE_CELL_ID_UNUSED:
+            if cell_id.id in self.cells:
+                return cell_id.id
+        else:
+            name = cell_id.name.decode()
+            for _id, cell in self.cells.items():
+                if cell['name'] == name:
+                    return _id
+        raise OSError(2, os.strerror(2))
+
+    def ioctl(self, request: int, arg: ctypes.Structure):
+        self.calls.append(request)
+        if request == JAILHOUSE_CELL_CREATE:
+            config = ctypes.string_at(arg.config_address, arg.config_size)
+            name = cell_config_name(config)
+            if name is None:
+                raise OSError(22, os.strerror(22))
+            if any(cell['name'] == name for cell in self.cells.values()):
+                raise OSError(17, os.strerror(17))
+            self.cells[self._next_id] = {'name': name, 'status': 'shut down', 'config': config, 'images': list()}
+            self._next_id += 1
+        elif request == JAILHOUSE_CELL_LOAD:
+            cell = self.cells[self._find(arg.cell_id)]
+            cell['status'] = 'shut down'
+            cell['images'] = list()
+            if arg.num_preload_images:
+                for image in arg.image:
+                    data = ctypes.string_at(image.source_address, image.size)
+                    cell['images'].append((image.target_address, data))
+        elif request == JAILHOUSE_CELL_START:
+            self.cells[self._find(arg)]['status'] = 'running'
+        elif request == JAILHOUSE_CELL_DESTROY:
+            _id = self._find(arg)
+            if _id == 0:
+                raise OSError(22, os.strerror(22))
+            del self.cells[_id]
+        else:
+            raise OSError(25, os.strerror(25))
+
+    def list_cell(self) -> Optional[List[dict]]:
+        return [{'id': _id, 'name': cell['name'], 'status': cell['status'], 'cpus': ''}
+                for _id, cell in sorted(self.cells.items())]
+
+
+class JailhouseDriver(object):
+    """ 通过ioctl直接操作jailhouse驱动, 不再为每个操作启动jailhouse进程 """
+    logger = logging.getLogger("JailhouseDriver")
+
+    def __init__(self, device=None):
+        if device is None:
+            device = JailhouseDevice()
+        self._device = device
+
+    def open(self) -> bool:
+        return self._device.open()
+
+    def close(self):
+        self._device.close()
+
+    def list_cell(self) -> Optional[List[dict]]:
+        return self._device.list_cell()
+
+    def _ioctl(self, what: str, request: int, arg: ctypes.Structure) -> RPCApi.Result:
+        try:
+            self._device.ioctl(request, arg)
+        except OSError as e:
+            msg = f"{what} failed: {e.strerror or e}"
+            self.logger.error(msg)
+            return RPCApi.Result(False, msg=msg)
+        return RPCApi.Result(True)
+
+    def _cell_id(self, name: str) -> Optional[JailhouseCellId]:
+        if len(name.encode()) > JAILHOUSE_CELL_ID_NAMELEN:
+            return None
+        return JailhouseCellId.from_name(name)
+
+    def create_cell(self, config: bytes) -> RPCApi.Result:
+        arg = JailhouseCellCreate()
+        arg.config_address = buffer_address(config)
+        arg.config_size = len(config)
+        return self._ioctl("create cell", JAILHOUSE_CELL_CREATE, arg)
+
+    def load_cell(self, name: str, images: List[Tuple[int, bytes]]) -> RPCApi.Result:
+        """ 加载镜像, 会使cell进入shutdown状态
+        Args:
+            images: [(加载地址, 数据) ...], 为空时只停止cell
+        """
+        cell_id = self._cell_id(name)
+        if cell_id is None:
+            return RPCApi.Result(False, msg=f"invalid cell name {name}")
+
+        arg = JailhouseCellLoad.with_images(len(images))
+        arg.cell_id = cell_id
+        arg.num_preload_images = len(images)
+        for i, (addr, data) in enumerate(images):
+            arg.image[i].source_address = buffer_address(data)
+            arg.image[i].size = len(data)
+            arg.image[i].target_address = addr
+        return self._ioctl(f"load cell {name}", JAILHOUSE_CELL_LOAD, arg)
+
+    def shutdown_cell(self, name: str) -> RPCApi.Result:
+        return self.load_cell(name, list())
+
+    def start_cell(self, name: str) -> RPCApi.Result:
+        cell_id = self._cell_id(name)
+        if cell_id is None:
+            return RPCApi.Result(False, msg=f"invalid cell name {name}")
+        return self._ioctl(f"start cell {name}", JAILHOUSE_CELL_START, cell_id)
+
+    def destroy_cell(self, name: str) -> RPCApi.Result:
+        cell_id = self._cell_id(name)
+        if cell_id is None:
+            return RPCApi.Result(False, msg=f"invalid cell name {name}")
+        return self._ioctl(f"destroy cell {name}", JAILHOUSE_CELL_DESTROY, cell_id)
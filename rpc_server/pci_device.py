@@ -1,10 +1,18 @@
 import os
+import io
+import json
+import time
+import uuid
+import socket
 import struct
+import tarfile
 import enum
 import glob
-from typing import List
+import threading
+from typing import List, Optional, Dict, Tuple
 from io import BytesIO, StringIO
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 
 class PCICapFlag(enum.Enum):
@@ -64,9 +72,7 @@ class PCICapID(enum.Enum):
 
     @classmethod
     def from_value(cls, value):
-        for n,e in cls.__members__.items():
-            if e.value == value:
-                return e
+        return cls._value2member_map_.get(value)
 
     def descript(self) -> str:
         describs = self._describes.value
@@ -176,9 +182,7 @@ class PCIExtCapID(enum.Enum):
 
     @classmethod
     def from_value(cls, value):
-        for n,e in cls.__members__.items():
-            if e.value == value:
-                return e
+        return cls._value2member_map_.get(value)
 
     def descript(self) -> str:
         describs = self._describes.value
@@ -187,8 +191,25 @@ class PCIExtCapID(enum.Enum):
         return ""
 
 
+_U8          = struct.Struct('B')
+_U16         = struct.Struct('<H')
+_U32         = struct.Struct('<I')
+_CAP_HEADER  = struct.Struct('BB')
+_EXT_HEADER  = struct.Struct('<HH')
+_ACS_HEADER  = struct.Struct('<HH')
+
+
+def config_view(config) -> memoryview:
+    """ 把config空间数据转换为memoryview, 支持bytes/bytearray/memoryview/BytesIO """
+    if isinstance(config, memoryview):
+        return config
+    if isinstance(config, BytesIO):
+        return config.getbuffer()
+    return memoryview(config)
+
+
 class PCICap(object):
-    def __init__(self, cap: PCICapID, start) -> None:
+    def __init__(self, cap: PCICapID, start, config: Optional[memoryview] = None) -> None:
         super().__init__()
         self.cap = cap
         self.start = start
@@ -196,8 +217,15 @@ class PCICap(object):
         self.len = 0
         self.flags = PCICapFlag.NONE
         self.extended =False
-        self.content = None
         self.msix_addr = 0
+        self._config = config
+
+    @property
+    def content(self) -> Optional[memoryview]:
+        """ cap内容, 为config空间的视图, 使用时才切片, 不复制数据 """
+        if self._config is None:
+            return None
+        return self._config[self.start:self.start+self.len]
 
     def to_dict(self):
         values = OrderedDict()
@@ -211,121 +239,137 @@ class PCICap(object):
         return values
 
     @classmethod
-    def parse(cls, config: BytesIO) -> list:
+    def parse(cls, config) -> list:
+        """ 解析capability列表
+        Args:
+            config: config空间数据, 长度不足4096时(如非root用户读取的sysfs)不解析扩展cap
+        """
+        view = config_view(config)
+        size = len(view)
         caps = list()
         has_extended_caps = False
 
-        config.seek(0x34)
-        (cap_pos,) = struct.unpack('B', config.read(1))
-        while cap_pos != 0:
-            config.seek(cap_pos)
-            cap_id, cap_next = struct.unpack('BB', config.read(2))
+        if size < 0x40:
+            return caps
+
+        visited = set()
+        (cap_pos,) = _U8.unpack_from(view, 0x34)
+        while cap_pos != 0 and cap_pos not in visited and cap_pos + 2 <= size:
+            visited.add(cap_pos)
+            cap_id, cap_next = _CAP_HEADER.unpack_from(view, cap_pos)
 
             _id = PCICapID.from_value(cap_id)
             if _id is None:
                 print(f"cap id {cap_id} not found.")
+                cap_pos = cap_next
                 continue
 
-            cap = PCICap(_id, cap_pos)
-
-            if _id is PCICapID.PM:
-                # this cap can be handed out completely
-                cap.len = 8
-                cap.flags = PCICapFlag.RW
-            elif _id is PCICapID.MSI:
-                cap.len = 10
-                (msgctl,) = struct.unpack('<H', config.read(2))
-                if (msgctl & (1 << 7)) != 0:  # 64-bit support
-                    cap.len = 14
-                if (msgctl & (1 << 8)) != 0:  # per-vector masking support
-                    cap.len = 20
-                cap.flags = PCICapFlag.RW
-            elif _id is PCICapID.PCIExpress:
-                (cap_reg,) = struct.unpack('<H', config.read(2))
-                if (cap_reg & 0xf) >= 2:  # v2 capability
-                    cap.len = 60
+            cap = PCICap(_id, cap_pos, view)
+
+            try:
+                if _id is PCICapID.PM:
+                    # this cap can be handed out completely
+                    cap.len = 8
+                    cap.flags = PCICapFlag.RW
+                elif _id is PCICapID.MSI:
+                    cap.len = 10
+                    (msgctl,) = _U16.unpack_from(view, cap_pos+2)
+                    if (msgctl & (1 << 7)) != 0:  # 64-bit support
+                        cap.len = 14
+                    if (msgctl & (1 << 8)) != 0:  # per-vector masking support
+                        cap.len = 20
+                    cap.flags = PCICapFlag.RW
+                elif _id is PCICapID.PCIExpress:
+                    (cap_reg,) = _U16.unpack_from(view, cap_pos+2)
+                    if (cap_reg & 0xf) >= 2:  # v2 capability
+                        cap.len = 60
+                    else:
+                        cap.len = 20
+                    # access side effects still need to be analyzed
+                    cap.flags = PCICapFlag.RD
+                    has_extended_caps = True
+                elif _id is PCICapID.MSIX:
+                    # access will be moderated by hypervisor
+                    cap.len = 12
+                    (table,) = _U32.unpack_from(view, cap_pos+4)
+                    bar_pos = 0x10 + (table & 7) * 4
+                    (bar,) = _U32.unpack_from(view, bar_pos)
+                    if (bar & 0x3) != 0:
+                        raise RuntimeError('Invalid MSI-X BAR found')
+                    if (bar & 0x4) != 0:
+                        bar |= _U32.unpack_from(view, bar_pos+4)[0] << 32
+                    cap.msix_addr = (bar & 0xfffffffffffffff0) + (table & 0xfffffff8)
+                    cap.flags = PCICapFlag.RW
                 else:
-                    cap.len = 20
-                # access side effects still need to be analyzed
-                cap.flags = PCICapFlag.RD
-                has_extended_caps = True
-            elif _id is PCICapID.MSIX:
-                # access will be moderated by hypervisor
-                cap.len = 12
-                (table,) = struct.unpack('<xxI', config.read(6))
-                config.seek(0x10 + (table & 7) * 4)
-                (bar,) = struct.unpack('<I', config.read(4))
-                if (bar & 0x3) != 0:
-                    raise RuntimeError('Invalid MSI-X BAR found')
-                if (bar & 0x4) != 0:
-                    bar |= struct.unpack('<I', config.read(4))[0] << 32
-                cap.msix_addr = (bar & 0xfffffffffffffff0) + (table & 0xfffffff8)
-                cap.flags = PCICapFlag.RW
-            else:
-                print(f"unknown cap {cap_id}")
-                cap.len = 2
-                cap.flags = PCICapFlag.RD
-
-            config.seek(cap_pos)
-            cap.content = config.read(cap.len)
+                    print(f"unknown cap {cap_id}")
+                    cap.len = 2
+                    cap.flags = PCICapFlag.RD
+            except struct.error:
+                print(f"cap {cap_id} at {cap_pos:#x} truncated")
+                break
+
             caps.append(cap)
             cap_pos = cap_next
 
-        if not has_extended_caps:
+        if not has_extended_caps or size < 0x104:
             return caps
 
+        visited.clear()
         cap_pos = 0x100
-        while cap_pos != 0:
-            config.seek(cap_pos)
-            cap_id, cap_next = struct.unpack('<HH', config.read(4))
+        while cap_pos != 0 and cap_pos not in visited and cap_pos + 4 <= size:
+            visited.add(cap_pos)
+            cap_id, cap_next = _EXT_HEADER.unpack_from(view, cap_pos)
             cap_next = cap_next >> 4
 
             _id = PCIExtCapID.from_value(cap_id)
             if _id is None:
                 print(f"extended cap {cap_id} not found")
+                cap_pos = cap_next
                 continue
 
-            cap = PCICap(_id, cap_pos)
+            cap = PCICap(_id, cap_pos, view)
             cap.extended = True
             cap.flags = PCICapFlag.RD
 
-            if _id is PCIExtCapID.VSEC:
-                (vsec_len,) = struct.unpack('<I', config.read(4))
-                cap.len = 4 + (vsec_len >> 20)
-            elif _id is PCIExtCapID.ACS:
-                length = 8
-                (acs_cap, acs_ctrl) = struct.unpack('<HH', config.read(4))
-                if acs_cap & (1 << 5) and acs_ctrl & (1 << 5):
-                    vector_bits = acs_cap >> 8
-                    if vector_bits == 0:
-                        vector_bits = 256
-
-                    vector_bytes = int((vector_bits + 31) / (8 * 4))
-                    length += vector_bytes
-                cap.len = length
-
-            elif _id in [PCIExtCapID.VCWithMFVC, PCIExtCapID.VCWithoutMFVC]:
-                # parsing is too complex, but we have at least 4 DWORDS
-                cap.len = 4 * 4
-            elif _id == PCIExtCapID.MFVC:
-                cap.len = 4
-            elif _id in [PCIExtCapID.LTR, PCIExtCapID.ARI, PCIExtCapID.PASID]:
-                cap.len = 8
-            elif _id in [PCIExtCapID.DevSerialNum, PCIExtCapID.PTM]:
-                cap.len = 12
-            elif _id in [PCIExtCapID.PowerBuget, PCIExtCapID.SecondaryPCIE]:
-                cap.len = 16
-            elif _id == PCIExtCapID.Multicast:
-                cap.len = 48
-            elif _id in [PCIExtCapID.SRIOV, PCIExtCapID.AER]:
-                cap.len = 64
-            else:
-                # unknown/unhandled cap, mark its existence
-                print(f"unknown ext cap {_id}")
-                cap.len = 4
-
-            config.seek(cap_pos)
-            cap.content = config.read(cap.len)
+            try:
+                if _id is PCIExtCapID.VSEC:
+                    (vsec_len,) = _U32.unpack_from(view, cap_pos+4)
+                    cap.len = 4 + (vsec_len >> 20)
+                elif _id is PCIExtCapID.ACS:
+                    length = 8
+                    (acs_cap, acs_ctrl) = _ACS_HEADER.unpack_from(view, cap_pos+4)
+                    if acs_cap & (1 << 5) and acs_ctrl & (1 << 5):
+                        vector_bits = acs_cap >> 8
+                        if vector_bits == 0:
+                            vector_bits = 256
+
+                        vector_bytes = int((vector_bits + 31) / (8 * 4))
+                        length += vector_bytes
+                    cap.len = length
+
+                elif _id in [PCIExtCapID.VCWithMFVC, PCIExtCapID.VCWithoutMFVC]:
+                    # parsing is too complex, but we have at least 4 DWORDS
+                    cap.len = 4 * 4
+                elif _id == PCIExtCapID.MFVC:
+                    cap.len = 4
+                elif _id in [PCIExtCapID.LTR, PCIExtCapID.ARI, PCIExtCapID.PASID]:
+                    cap.len = 8
+                elif _id in [PCIExtCapID.DevSerialNum, PCIExtCapID.PTM]:
+                    cap.len = 12
+                elif _id in [PCIExtCapID.PowerBuget, PCIExtCapID.SecondaryPCIE]:
+                    cap.len = 16
+                elif _id == PCIExtCapID.Multicast:
+                    cap.len = 48
+                elif _id in [PCIExtCapID.SRIOV, PCIExtCapID.AER]:
+                    cap.len = 64
+                else:
+                    # unknown/unhandled cap, mark its existence
+                    print(f"unknown ext cap {_id}")
+                    cap.len = 4
+            except struct.error:
+                print(f"extended cap {cap_id} at {cap_pos:#x} truncated")
+                break
+
             caps.append(cap)
             cap_pos = cap_next
 
@@ -397,6 +441,97 @@ class PCIBar:
         return bars
 
 
+class PCIIds(object):
+    """ pci.ids数据库, 用于把厂商/设备/类别代码转换为名称, 代替逐个设备调用lspci
+
+    第一次使用时加载一次, 只索引厂商, 设备和类别行.
+    """
+    search_paths = [
+        '/usr/share/hwdata/pci.ids',
+        '/usr/share/misc/pci.ids',
+        '/usr/share/pci.ids',
+        '/usr/local/share/pci.ids',
+    ]
+
+    _lock = threading.Lock()
+    _loaded = False
+    _vendors: Dict[int, str] = dict()
+    _devices: Dict[Tuple[int, int], str] = dict()
+    _classes: Dict[Tuple[int, Optional[int]], str] = dict()
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> bool:
+        with cls._lock:
+            if cls._loaded and path is None:
+                return len(cls._vendors) > 0
+            cls._loaded = True
+
+            paths = [path] if path is not None else cls.search_paths
+            for fn in paths:
+                if os.path.isfile(fn):
+                    cls._parse(fn)
+                    return True
+            return False
+
+    @classmethod
+    def _parse(cls, fn: str):
+        vendors = dict()
+        devices = dict()
+        classes = dict()
+        vendor = None
+        _class = None
+        with open(fn, 'rt', encoding='utf8', errors='replace') as f:
+            for line in f:
+                if not line.strip() or line[0] == '#':
+                    continue
+                if line.startswith('\t\t'):
+                    # 子系统和编程接口不需要
+                    continue
+                if line[0] == '\t':
+                    code, _, name = line.strip().partition(' ')
+                    if vendor is not None:
+                        devices[(vendor, int(code, 16))] = name.strip()
+                    elif _class is not None:
+                        classes[(_class, int(code, 16))] = name.strip()
+                    continue
+                if line.startswith('C '):
+                    code, _, name = line[2:].strip().partition(' ')
+                    vendor = None
+                    _class = int(code, 16)
+                    classes[(_class, None)] = name.strip()
+                    continue
+                code, _, name = line.strip().partition(' ')
+                _class = None
+                try:
+                    vendor = int(code, 16)
+                except ValueError:
+                    vendor = None
+                    continue
+                vendors[vendor] = name.strip()
+        cls._vendors = vendors
+        cls._devices = devices
+        cls._classes = classes
+
+    @classmethod
+    def name(cls, vendor: int, device: int, classcode: int, revision: int) -> Optional[str]:
+        """ 生成与lspci默认输出相同格式的设备名称
+        例如: Ethernet controller: Intel Corporation 82540EM Gigabit Ethernet Controller (rev 03)
+        Returns:
+            str: pci.ids不可用时返回None
+        """
+        if not cls.load():
+            return None
+
+        base, sub = classcode >> 8, classcode & 0xff
+        class_name = cls._classes.get((base, sub)) or cls._classes.get((base, None)) or f"Class {classcode:04x}"
+        vendor_name = cls._vendors.get(vendor, f"Vendor {vendor:04x}")
+        device_name = cls._devices.get((vendor, device), f"Device {device:04x}")
+        name = f"{class_name}: {vendor_name} {device_name}"
+        if revision != 0:
+            name += f" (rev {revision:02x})"
+        return name
+
+
 class PCIDevice():
     class Type(enum.Enum):
         DEVICE = 'device'
@@ -449,63 +584,62 @@ class PCIDevice():
         values['msix_address'] = self.msix_address
         return values
 
-    @classmethod
-    def from_sysfs(cls, path: str):
+    @staticmethod
+    def parse_slot(slot: str) -> Optional[Tuple[int, int, int, int]]:
+        """ 解析 domain:bus:dev.fun 格式的设备名 """
         try:
-            with open(os.path.join(path, 'config'), "rb") as f:
-                config_data = f.read()
-        except:
-            print("read config file failed.")
-            return None
-
-        try:
-            with open(os.path.join(path, 'resource'), "rt") as f:
-                resource_data = f.read()
-        except:
-            print("read config file failed.")
+            domain_str, bus_str, df_str = slot.split(':')
+            dev_str, fun_str = df_str.split('.')
+            return int(domain_str, 16), int(bus_str, 16), int(dev_str, 16), int(fun_str, 16)
+        except ValueError:
             return None
 
-        if len(config_data) != 4096:
-            print("invalid config length", len(config_data))
+    @classmethod
+    def from_config(cls, config_data, resource_data: Optional[str], path: str):
+        """ 从config空间和resource文件内容解析设备, 不访问sysfs
+        Args:
+            config_data: config空间数据, 只保留一份memoryview, 各cap的content为其视图
+            resource_data: resource文件内容, 为None时所有bar为空
+            path: 设备路径, 最后一级为 domain:bus:dev.fun
+        Returns:
+            PCIDevice, 设备无效时返回None. 不在pci.ids中的设备name为空
+        """
+        config = config_view(config_data)
+        if len(config) < 0x40:
+            print("invalid config length", len(config))
             return None
 
-        print('config length:', len(config_data))
-        config = BytesIO(config_data)
-        resource = StringIO(resource_data)
-
         dev = PCIDevice()
         dev.path = path
 
-        slot = os.path.basename(path)
-        name = os.popen("lspci -s {}".format(slot)).read().strip()
-        dev.name = name[name.find(' ')+1:]
-
-        config.seek(0)
-        vendor, = struct.unpack('<I', config.read(4))
+        (vendor,) = _U32.unpack_from(config, 0)
         if vendor == 0xffffffff:
             print(f'WARNING: Ignoring apparently disabled PCI device {path}')
             return None
 
-        config.seek(0x0A)
-        (classcode,) = struct.unpack('<H', config.read(2))
+        (revision,) = _U8.unpack_from(config, 0x08)
+        (classcode,) = _U16.unpack_from(config, 0x0A)
+
+        name = PCIIds.name(vendor & 0xffff, vendor >> 16, classcode, revision)
+        dev.name = name if name is not None else ''
         if classcode == 0x0604:
             dev.type = cls.Type.BRIDGE
         else:
             dev.type = cls.Type.DEVICE
 
-        #dev = PCIDevice().from_sysfs('/sys/bus/pci/devices/0000:09:00.0')
-        domain_str, bus_str, df_str = os.path.basename(path).split(':')
-        dev.domain = int(domain_str, 16)
-        dev.bus    = int(bus_str, 16)
-        dev.dev    = int(df_str.split('.')[0], 16)
-        dev.fun    = int(df_str.split('.')[1], 16)
+        bdf = cls.parse_slot(os.path.basename(path))
+        if bdf is not None:
+            dev.domain, dev.bus, dev.dev, dev.fun = bdf
 
         dev.caps = PCICap.parse(config)
-        dev.bars = PCIBar.parse(resource)
+        if resource_data:
+            dev.bars = PCIBar.parse(StringIO(resource_data))
+        else:
+            dev.bars = [PCIBar(0, 0, 0, PCIBar.Type.NONE) for _ in range(6)]
 
         for c in dev.caps:
             if c.cap in (PCICapID.MSI, PCICapID.MSIX):
-                msg_ctrl = struct.unpack('<H', c.content[2:4])[0]
+                (msg_ctrl,) = _U16.unpack_from(config, c.start+2)
                 if c.cap is PCICapID.MSI:
                     dev.msi_num = 1 << ((msg_ctrl >> 1) & 0x7)
                     dev.msi_64bits = (msg_ctrl >> 7) & 1
@@ -523,20 +657,406 @@ class PCIDevice():
         return dev
 
     @classmethod
-    def all_from_sysfs(cls):
-        devices = []
-        pci_list = sorted(glob.glob('/sys/bus/pci/devices/*'))
-
-        for pci in pci_list:
-            d = PCIDevice.from_sysfs(pci)
-            if d is not None:
-                devices.append(d)
+    def read_sysfs(cls, path: str) -> Optional[Tuple[bytes, str]]:
+        """ 读取设备的config和resource文件 """
+        try:
+            with open(os.path.join(path, 'config'), "rb") as f:
+                config_data = f.read()
+        except:
+            print("read config file failed.")
+            return None
+
+        try:
+            with open(os.path.join(path, 'resource'), "rt") as f:
+                resource_data = f.read()
+        except:
+            print("read config file failed.")
+            return None
+
+        if len(config_data) != 4096:
+            print("invalid config length", len(config_data))
+            return None
+        return config_data, resource_data
+
+    @classmethod
+    def from_sysfs_data(cls, path: str, config_data: bytes, resource_data: str):
+        dev = cls.from_config(config_data, resource_data, path)
+        if dev is not None and not dev.name:
+            slot = os.path.basename(path)
+            name = os.popen("lspci -s {}".format(slot)).read().strip()
+            dev.name = name[name.find(' ')+1:]
+        return dev
+
+    @classmethod
+    def from_sysfs(cls, path: str):
+        data = cls.read_sysfs(path)
+        if data is None:
+            return None
+        return cls.from_sysfs_data(path, *data)
+
+    @classmethod
+    def from_dump(cls, path: str):
+        """ 解析导出的config文件, 用于离线检查
+        Args:
+            path: 设备目录(包含config和resource), 或config文件.
+                  config文件同目录下存在resource文件时一并解析.
+        """
+        if os.path.isdir(path):
+            config_fn = os.path.join(path, 'config')
+            dev_path = path
+        else:
+            config_fn = path
+            dev_path = os.path.dirname(os.path.abspath(path)) \
+                if os.path.basename(path) == 'config' else path
+        resource_fn = os.path.join(os.path.dirname(config_fn), 'resource')
+
+        try:
+            with open(config_fn, "rb") as f:
+                config_data = f.read()
+        except OSError as e:
+            print(f"read {config_fn} failed: {e}")
+            return None
+
+        resource_data = None
+        if os.path.isfile(resource_fn):
+            with open(resource_fn, "rt") as f:
+                resource_data = f.read()
+
+        return cls.from_config(config_data, resource_data, dev_path)
+
+    sysfs_devices = '/sys/bus/pci/devices'
+    max_workers = 16
+
+    _cache_lock = threading.Lock()
+    # {设备路径: (config, resource, PCIDevice)}
+    _cache: Dict[str, Tuple[bytes, str, 'PCIDevice']] = dict()
+
+    @classmethod
+    def invalidate_cache(cls):
+        with cls._cache_lock:
+            cls._cache = dict()
+
+    @classmethod
+    def _cached_from_sysfs(cls, path: str, use_cache: bool):
+        """ 读取设备的config和resource, 内容与缓存相同时使用缓存的解析结果 """
+        data = cls.read_sysfs(path)
+        if data is None:
+            return None
+        if use_cache:
+            with cls._cache_lock:
+                cached = cls._cache.get(path)
+            if cached is not None and cached[0] == data[0] and cached[1] == data[1]:
+                return cached[2]
+
+        dev = cls.from_sysfs_data(path, *data)
+        if dev is not None:
+            with cls._cache_lock:
+                cls._cache[path] = (data[0], data[1], dev)
+        return dev
+
+    @classmethod
+    def all_from_sysfs(cls, use_cache: bool = True):
+        """ 枚举所有PCI设备
+        并发读取各设备的config和resource, 每次都重新读取, 内容不变的设备使用缓存的解析结果.
+        BAR重新分配、驱动绑定、MSI等配置变化后重新解析, 设备删除后从缓存中移除.
+        """
+        try:
+            names = sorted(os.listdir(cls.sysfs_devices))
+        except OSError:
+            return []
+
+        # pci.ids在线程池之外加载, 避免多个线程同时解析
+        PCIIds.load()
+        pci_list = [os.path.join(cls.sysfs_devices, name) for name in names]
+        workers = max(1, min(cls.max_workers, len(pci_list)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda path: cls._cached_from_sysfs(path, use_cache), pci_list))
+
+        with cls._cache_lock:
+            for path in set(cls._cache) - set(pci_list):
+                del cls._cache[path]
+        return [d for d in results if d is not None]
+
+
+class PCIInventory(object):
+    """ 带版本号的PCI设备清单
+
+    每次刷新与上一次的设备列表(按path)比较, 有变化时generation加一,
+    并记录每个设备的添加/修改/删除所在的generation.
+    客户端提供上次获取到的(inventory_id, generation), 只返回之后的变化.
+    inventory_id在服务端每次启动时重新生成, 不匹配时返回完整列表.
+    """
+    def __init__(self):
+        self._id = uuid.uuid4().hex
+        self._generation = 0
+        self._devices: Dict[str, dict] = OrderedDict()
+        self._created: Dict[str, int] = dict()
+        self._modified: Dict[str, int] = dict()
+        self._removed: Dict[str, int] = dict()
+        self._lock = threading.Lock()
+
+    def id(self) -> str:
+        return self._id
+
+    def generation(self) -> int:
+        return self._generation
+
+    def refresh(self, devices: List[PCIDevice]) -> int:
+        """ 更新设备列表, 返回当前generation """
+        new_devices: Dict[str, dict] = OrderedDict()
+        for dev in devices:
+            new_devices[dev.path] = dev.to_dict()
+
+        with self._lock:
+            generation = self._generation + 1
+            changed = False
+            for path, value in new_devices.items():
+                old = self._devices.get(path)
+                if old == value:
+                    continue
+                changed = True
+                if old is None:
+                    self._created[path] = generation
+                    self._removed.pop(path, None)
+                self._modified[path] = generation
+
+            for path in self._devices:
+                if path not in new_devices:
+                    changed = True
+                    self._removed[path] = generation
+                    self._created.pop(path, None)
+                    self._modified.pop(path, None)
+
+            self._devices = new_devices
+            if changed:
+                self._generation = generation
+            return self._generation
+
+    def since(self, inventory_id: Optional[str], generation: int) -> dict:
+        """ 获取generation之后的变化
+        Returns:
+            {id, generation, full, added: [dict], changed: [dict], removed: [path]}
+            full为True时added为完整的设备列表
+        """
+        with self._lock:
+            value = OrderedDict()
+            value['id'] = self._id
+            value['generation'] = self._generation
+
+            if inventory_id != self._id or generation <= 0 or generation > self._generation:
+                value['full'] = True
+                value['added'] = list(self._devices.values())
+                value['changed'] = list()
+                value['removed'] = list()
+                return value
+
+            added = list()
+            changed = list()
+            for path, dev in self._devices.items():
+                if self._created[path] > generation:
+                    added.append(dev)
+                elif self._modified[path] > generation:
+                    changed.append(dev)
+            value['full'] = False
+            value['added'] = added
+            value['changed'] = changed
+            value['removed'] = [path for path, gen in self._removed.items() if gen > generation]
+            return value
+
+
+class PCISnapshot(object):
+    """ PCI设备快照, 用于离线配置
+
+    tar.gz格式, 每个设备一个目录 <domain:bus:dev.fun>/{config,resource},
+    manifest.json记录导出的主机名, 时间和设备名称.
+    导入时与sysfs使用相同的解析流程, 设备路径与在线获取的一致.
+    """
+    manifest_name = 'manifest.json'
+    version = 1
+
+    @classmethod
+    def dumps(cls, devices: Optional[List[PCIDevice]] = None) -> bytes:
+        """ 导出快照
+        Args:
+            devices: 要导出的设备, 默认为本机所有设备
+        """
+        if devices is None:
+            devices = PCIDevice.all_from_sysfs()
+
+        manifest = OrderedDict()
+        manifest['version'] = cls.version
+        manifest['hostname'] = socket.gethostname()
+        manifest['time'] = time.time()
+        manifest['devices'] = OrderedDict()
+
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w:gz') as tar:
+            def add_file(name, data: bytes):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = int(manifest['time'])
+                tar.addfile(info, io.BytesIO(data))
+
+            for dev in devices:
+                slot = os.path.basename(dev.path)
+                try:
+                    with open(os.path.join(dev.path, 'config'), 'rb') as f:
+                        config_data = f.read()
+                    with open(os.path.join(dev.path, 'resource'), 'rb') as f:
+                        resource_data = f.read()
+                except OSError as e:
+                    print(f"read {dev.path} failed: {e}")
+                    continue
+                add_file(f'{slot}/config', config_data)
+                add_file(f'{slot}/resource', resource_data)
+                manifest['devices'][slot] = dev.name
+
+            add_file(cls.manifest_name, json.dumps(manifest, indent=2).encode())
+
+        return buf.getvalue()
+
+    @classmethod
+    def export(cls, fn: str, devices: Optional[List[PCIDevice]] = None) -> bool:
+        data = cls.dumps(devices)
+        try:
+            with open(fn, 'wb') as f:
+                f.write(data)
+        except OSError as e:
+            print(f"save snapshot {fn} failed: {e}")
+            return False
+        return True
+
+    @classmethod
+    def loads(cls, data: bytes) -> Optional[List[PCIDevice]]:
+        """ 导入快照, 数据格式错误时返回None """
+        try:
+            tar = tarfile.open(fileobj=io.BytesIO(data), mode='r:*')
+        except tarfile.TarError as e:
+            print(f"invalid snapshot: {e}")
+            return None
+
+        files: Dict[str, Dict[str, bytes]] = OrderedDict()
+        manifest = dict()
+        with tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                f = tar.extractfile(member)
+                if f is None:
+                    continue
+                if member.name == cls.manifest_name:
+                    try:
+                        manifest = json.loads(f.read().decode())
+                    except ValueError:
+                        print("invalid snapshot manifest")
+                    continue
+                slot, _, fn = member.name.partition('/')
+                if fn in ('config', 'resource'):
+                    files.setdefault(slot, dict())[fn] = f.read()
+
+        names = manifest.get('devices', dict())
+        devices = list()
+        for slot in sorted(files):
+            config_data = files[slot].get('config')
+            if config_data is None:
+                continue
+            resource_data = files[slot].get('resource', b'').decode()
+            dev = PCIDevice.from_config(config_data, resource_data, os.path.join(PCIDevice.sysfs_devices, slot))
+            if dev is None:
+                continue
+            if names.get(slot):
+                dev.name = names[slot]
+            devices.append(dev)
         return devices
 
+    @classmethod
+    def load(cls, fn: str) -> Optional[List[PCIDevice]]:
+        try:
+            with open(fn, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            print(f"read snapshot {fn} failed: {e}")
+            return None
+        return cls.loads(data)
+
+    @classmethod
+    def is_snapshot(cls, fn: str) -> bool:
+        return os.path.isfile(fn) and tarfile.is_tarfile(fn)
+
+
+# 测试用的config空间数据, 包含256字节的PCI设备和4KiB的PCIe设备
+BENCH_FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'data', 'pci')
+
+
+def bench_paths() -> List[str]:
+    """ benchmark默认使用的设备, 没有测试数据时使用本机设备 """
+    paths = sorted(glob.glob(os.path.join(BENCH_FIXTURES, '*')))
+    if not paths:
+        paths = sorted(glob.glob(os.path.join(PCIDevice.sysfs_devices, '*')))
+    return paths
+
+
+def benchmark(paths: List[str], count: int = 1000) -> Dict[str, float]:
+    """ 测试config空间解析速度
+    Args:
+        paths: 设备目录或导出的config文件, 默认见bench_paths
+        count: 每个设备的解析次数
+    Returns:
+        {path: 每次解析的平均耗时(us)}
+    """
+    import timeit
+    import contextlib
+    result = OrderedDict()
+    for path in paths:
+        config_fn = os.path.join(path, 'config') if os.path.isdir(path) else path
+        with open(config_fn, "rb") as f:
+            config_data = f.read()
+        # 忽略解析过程中的打印, 只统计解析耗时
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            elapsed = timeit.timeit(lambda: PCICap.parse(config_data), number=count)
+        result[path] = elapsed / count * 1e6
+    return result
 
-if __name__ == '__main__':
-    import pprint
-    devs = PCIDevice().all_from_sysfs()
-    for dev in devs:
-        pprint.pprint(dev.to_dict())
 
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PCI设备config空间解析")
+    parser.add_argument("paths", nargs='*',
+                        help="设备目录, 导出的config文件或快照, 默认为/sys/bus/pci/devices下的所有设备")
+    parser.add_argument("--bench", type=int, metavar="COUNT", default=0,
+                        help="只测试解析速度, 每个设备解析COUNT次, 默认使用tests/data/pci下的设备")
+    parser.add_argument("--export", metavar="FILE", help="导出本机PCI设备快照")
+    args = parser.parse_args()
+
+    if args.export:
+        if not PCISnapshot.export(args.export):
+            sys.exit(1)
+        print(f"save snapshot to {args.export}")
+        sys.exit(0)
+
+    paths = args.paths
+    if not paths:
+        if args.bench > 0:
+            paths = bench_paths()
+        else:
+            paths = sorted(glob.glob(os.path.join(PCIDevice.sysfs_devices, '*')))
+
+    if args.bench > 0:
+        total = 0.0
+        for path, us in benchmark(paths, args.bench).items():
+            total += us
+            print(f"{us:10.2f} us  {path}")
+        print(f"{total:10.2f} us  total {len(paths)} devices")
+    else:
+        devices = list()
+        for path in paths:
+            if PCISnapshot.is_snapshot(path):
+                for dev in PCISnapshot.load(path) or list():
+                    devices.append(dev.to_dict())
+                continue
+            dev = PCIDevice.from_dump(path)
+            if dev is not None:
+                devices.append(dev.to_dict())
+        print(json.dumps(devices, indent=2))
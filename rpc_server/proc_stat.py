@@ -0,0 +1,139 @@
+import os
+import logging
+from typing import Optional, List, Dict
+
+
+class ProcFile(object):
+    """ 保持打开的/proc文件, 每次使用pread从头读取 """
+    def __init__(self, path: str, bufsize: int = 64*1024):
+        self._path = path
+        self._bufsize = bufsize
+        self._fd: Optional[int] = None
+
+    def read(self) -> Optional[bytes]:
+        try:
+            if self._fd is None:
+                self._fd = os.open(self._path, os.O_RDONLY)
+            return os.pread(self._fd, self._bufsize, 0)
+        except OSError:
+            self.close()
+            return None
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class ProcStat(object):
+    """ 读取/proc/stat和/proc/meminfo, 代替psutil采样根单元状态
+
+    文件描述符在对象生命周期内保持打开, 每次采样只做一次pread,
+    CPU负载由服务端根据两次采样的差值计算.
+
+    采样结果:
+        {
+            cpucount: CPU个数,
+            cpuload: 总负载(百分比),
+            cpus: [每个CPU的负载(百分比)],
+            cputimes: {user, system, idle} 累计时间(秒),
+            meminfo: {total, available, free} 字节,
+        }
+    """
+    logger = logging.getLogger("ProcStat")
+
+    # /proc/stat cpu行各字段: user nice system idle iowait irq softirq steal
+    USER, NICE, SYSTEM, IDLE, IOWAIT, IRQ, SOFTIRQ, STEAL = range(8)
+
+    def __init__(self, proc: str = '/proc'):
+        self._stat = ProcFile(os.path.join(proc, 'stat'))
+        self._meminfo = ProcFile(os.path.join(proc, 'meminfo'))
+        self._last_cpus: Dict[str, List[int]] = dict()
+        try:
+            self._ticks = os.sysconf('SC_CLK_TCK')
+        except (ValueError, OSError):
+            self._ticks = 100
+
+    def close(self):
+        self._stat.close()
+        self._meminfo.close()
+
+    @staticmethod
+    def _load(last: Optional[List[int]], now: List[int]) -> float:
+        if last is None:
+            return 0.0
+        total = sum(now[:8]) - sum(last[:8])
+        idle = (now[ProcStat.IDLE] + now[ProcStat.IOWAIT]) - (last[ProcStat.IDLE] + last[ProcStat.IOWAIT])
+        if total <= 0:
+            return 0.0
+        return round(max(0.0, min(100.0, (total - idle) * 100.0 / total)), 1)
+
+    def _read_cpus(self) -> Optional[Dict[str, List[int]]]:
+        data = self._stat.read()
+        if data is None:
+            return None
+        cpus = dict()
+        for line in data.split(b'\n'):
+            if not line.startswith(b'cpu'):
+                # cpu行在文件开头
+                if cpus:
+                    break
+                continue
+            fields = line.split()
+            values = [int(x) for x in fields[1:9]]
+            values.extend([0] * (8 - len(values)))
+            cpus[fields[0].decode()] = values
+        return cpus
+
+    def _read_meminfo(self) -> Optional[Dict[str, int]]:
+        data = self._meminfo.read()
+        if data is None:
+            return None
+        meminfo = dict()
+        for line in data.split(b'\n'):
+            key, _, value = line.partition(b':')
+            if key in (b'MemTotal', b'MemFree', b'MemAvailable', b'Buffers', b'Cached'):
+                meminfo[key.decode()] = int(value.split()[0]) * 1024
+        return meminfo
+
+    def sample(self) -> Optional[dict]:
+        cpus = self._read_cpus()
+        meminfo = self._read_meminfo()
+        if cpus is None or meminfo is None or 'cpu' not in cpus:
+            self.logger.error("read /proc failed.")
+            return None
+
+        total = cpus.pop('cpu')
+        last = self._last_cpus
+        status = dict()
+        status['cpucount'] = len(cpus)
+        status['cpuload'] = self._load(last.get('cpu'), total)
+        status['cpus'] = [self._load(last.get(name), values) for name, values in cpus.items()]
+        status['cputimes'] = {
+            'user': (total[self.USER] + total[self.NICE]) / self._ticks,
+            'system': (total[self.SYSTEM] + total[self.IRQ] + total[self.SOFTIRQ]) / self._ticks,
+            'idle': (total[self.IDLE] + total[self.IOWAIT]) / self._ticks,
+        }
+
+        available = meminfo.get('MemAvailable')
+        if available is None:
+            # 旧内核没有MemAvailable
+            available = meminfo.get('MemFree', 0) + meminfo.get('Buffers', 0) + meminfo.get('Cached', 0)
+        status['meminfo'] = {
+            'total': meminfo.get('MemTotal', 0),
+            'available': available,
+            'free': meminfo.get('MemFree', 0),
+        }
+
+        cpus['cpu'] = total
+        self._last_cpus = cpus
+        return status
+
+
+if __name__ == '__main__':
+    import time
+    import pprint
+    stat = ProcStat()
+    stat.sample()
+    time.sleep(1)
+    pprint.pprint(stat.sample())
@@ -1,12 +1,14 @@
 import logging
 import threading
 import traceback
-from typing import Optional
+from typing import Optional, Dict, List, Iterable
 import zerorpc
+import gevent
+import gevent.pool
 if __name__ == '__main__':
-    from api import RPCApi
+    from api import RPCApi, dict_patch
 else:
-    from .api import RPCApi
+    from .api import RPCApi, dict_patch
 import click
 import blinker
 
@@ -51,6 +53,7 @@ class RPCClient(RPCApi):
     def __init__(self):
         super().__init__()
         self._client: Optional[zerorpc.Client] = None
+        self._addr: Optional[str] = None
         self._semaphore = threading.Semaphore(0)
         self._heartbeat = None
         self._lock = threading.Lock()
@@ -67,6 +70,7 @@ class RPCClient(RPCApi):
             self.logger.error("call hello failed.")
             return False
         self._client = c
+        self._addr = addr
 
         # 在线程中执行会出问题
         # self._heartbeat = threading.Thread(target=self._heartbeat_threadfun)
@@ -77,6 +81,9 @@ class RPCClient(RPCApi):
     def is_connected(self) -> bool:
         return self._client is not None
 
+    def addr(self) -> Optional[str]:
+        return self._addr
+
     def close(self):
         if self._client is not None:
             self._client.close()
@@ -127,6 +134,14 @@ class RPCClient(RPCApi):
     def pci_devices(self) -> Optional[RPCApi.Result]:
         return None
 
+    @rpc_call
+    def pci_devices_since(self, inventory_id: str, generation: int) -> Optional[RPCApi.Result]:
+        return None
+
+    @rpc_call
+    def pci_snapshot(self) -> Optional[RPCApi.Result]:
+        return None
+
     @rpc_call
     def list_cell(self) -> Optional[RPCApi.Result]:
         return None
@@ -151,18 +166,44 @@ class RPCClient(RPCApi):
     def stop_cell(self, name) -> Optional[RPCApi.Result]:
         return None
 
+    @rpc_call
+    def deploy_cell(self, plan: dict) -> Optional[RPCApi.Result]:
+        return None
+
     @rpc_call
     def get_status(self) -> Optional[RPCApi.Result]:
         return None
 
+    @rpc_call
+    def get_status_history(self, start: float, end: float, max_points: int) -> Optional[RPCApi.Result]:
+        return None
+
     @rpc_call
     def run_linux(self, cell: bytes, kernel: bytes, dtb: bytes, ramdisk: bytes, bootargs: str) -> Optional[RPCApi.Result]:
         return None
 
+    def stream_status(self):
+        """ 订阅服务端状态推送
+        不持有_lock, 推送在greenlet中接收, 与其他调用共用同一个连接.
+        Returns:
+            生成器, 每次产生 {seq, full, status}; 未连接或服务端不支持时返回None
+        """
+        if self._client is None:
+            return None
+        try:
+            return self._client.stream_status()
+        except Exception as e:
+            self.logger.error(f"stream status failed: {e}")
+            return None
+
     @rpc_call
     def get_guest_status(self, idx: int) -> Optional[RPCApi.Result]:
         return None
 
+    @rpc_call
+    def get_guests_status(self) -> Optional[RPCApi.Result]:
+        return None
+
     @rpc_call
     def start_uart_server(self, config: str) -> Optional[RPCApi.Result]:
         return None
@@ -172,6 +213,190 @@ class RPCClient(RPCApi):
         return None
 
 
+class StatusSubscription(object):
+    """ 在greenlet中接收stream_status推送, 合并差异得到完整状态
+
+    调用方周期性调用poll(), 取出自上次调用以来收到的所有完整状态.
+    """
+    logger = logging.getLogger("StatusSubscription")
+
+    def __init__(self, client: RPCClient):
+        self._client = client
+        self._greenlet: Optional[gevent.Greenlet] = None
+        self._status: Optional[dict] = None
+        self._pending: List[dict] = list()
+
+    def start(self) -> bool:
+        if self._greenlet is not None:
+            return True
+        stream = self._client.stream_status()
+        if stream is None:
+            return False
+        self._status = None
+        self._pending.clear()
+        self._greenlet = gevent.spawn(self._run, stream)
+        return True
+
+    def stop(self):
+        if self._greenlet is not None:
+            self._greenlet.kill(block=False)
+            self._greenlet = None
+
+    def is_alive(self) -> bool:
+        return self._greenlet is not None
+
+    def poll(self) -> List[dict]:
+        # 让出执行权, 使接收greenlet得以运行
+        gevent.sleep(0)
+        pending = self._pending
+        self._pending = list()
+        return pending
+
+    def _run(self, stream):
+        try:
+            for msg in stream:
+                if msg['full'] or self._status is None:
+                    self._status = msg['status']
+                else:
+                    self._status = dict_patch(self._status, msg['status'])
+                self._pending.append(self._status)
+        except Exception as e:
+            self.logger.error(f"status stream closed: {e}")
+        self._greenlet = None
+
+
+class RPCClientPool(object):
+    """ 按目标地址管理多个RPCClient连接
+
+    连接在第一次使用时建立, 断开后在下一次使用时自动重连.
+    fanout() 对多个目标并发执行同一个RPC操作, 返回每个目标的结果.
+    """
+    logger = logging.getLogger("RPCClientPool")
+
+    # 允许fanout的操作, 均为一次调用返回Result的方法.
+    # stream_status返回生成器, pci_devices_since的参数与目标相关, 不能并发执行
+    FANOUT_METHODS = frozenset([
+        'hello',
+        'pci_devices',
+        'pci_snapshot',
+        'compile_cell',
+        'jailhouse_enable',
+        'jailhouse_disable',
+        'list_cell',
+        'create_cell',
+        'destroy_cell',
+        'load_cell',
+        'start_cell',
+        'stop_cell',
+        'deploy_cell',
+        'get_status',
+        'get_status_history',
+        'get_guest_status',
+        'get_guests_status',
+        'run_linux',
+        'start_uart_server',
+        'stop_uart_server',
+    ])
+
+    def __init__(self, timeout=3, max_parallel=32):
+        self._timeout = timeout
+        self._max_parallel = max_parallel
+        self._clients: Dict[str, RPCClient] = dict()
+        self._lock = threading.Lock()
+
+    def targets(self) -> List[str]:
+        with self._lock:
+            return list(self._clients.keys())
+
+    def add(self, addr: str) -> RPCClient:
+        """ 添加目标, 不立即连接 """
+        with self._lock:
+            client = self._clients.get(addr)
+            if client is None:
+                client = RPCClient()
+                self._clients[addr] = client
+            return client
+
+    def remove(self, addr: str):
+        with self._lock:
+            client = self._clients.pop(addr, None)
+        if client is not None:
+            client.close()
+
+    def get(self, addr: str) -> Optional[RPCClient]:
+        """ 获取目标的连接, 未连接时自动重连
+        Returns:
+            RPCClient: 连接失败返回None
+        """
+        client = self.add(addr)
+        if not client.is_connected():
+            self.logger.info(f"connect {addr}")
+            if not client.connect(addr, timeout=self._timeout):
+                self.logger.error(f"connect {addr} failed.")
+                return None
+        return client
+
+    def check(self, addr: str) -> bool:
+        """ 健康检查, 失败时关闭连接, 下一次get时重连
+        """
+        client = self.get(addr)
+        if client is None:
+            return False
+        result = client.hello("hello")
+        if not result:
+            client.close()
+            return False
+        return True
+
+    def check_all(self) -> Dict[str, bool]:
+        targets = self.targets()
+        pool = gevent.pool.Pool(self._max_parallel)
+        jobs = [pool.spawn(self.check, addr) for addr in targets]
+        gevent.joinall(jobs)
+        return {addr: bool(job.value) for addr, job in zip(targets, jobs)}
+
+    def close(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+    def _call(self, addr: str, method: str, args) -> RPCApi.Result:
+        client = self.get(addr)
+        if client is None:
+            return RPCApi.Result.error("unconnected")
+        result = getattr(client, method)(*args)
+        if result is None:
+            return RPCApi.Result.error("no result")
+        return result
+
+    def fanout(self, targets: Iterable[str], method: str, *args) -> Dict[str, RPCApi.Result]:
+        """ 对多个目标并发执行同一个RPC操作
+        Args:
+            targets: 目标地址列表
+            method: FANOUT_METHODS中的方法名, 例如 jailhouse_enable, create_cell, get_status
+            args: 方法参数, 所有目标使用相同的参数
+        Returns:
+            dict: { <addr>: RPCApi.Result }
+        """
+        targets = list(dict.fromkeys(targets))
+        if method not in self.FANOUT_METHODS:
+            return {addr: RPCApi.Result.error(f"unknown method {method}") for addr in targets}
+
+        pool = gevent.pool.Pool(self._max_parallel)
+        jobs = [pool.spawn(self._call, addr, method, args) for addr in targets]
+        gevent.joinall(jobs)
+
+        results = dict()
+        for addr, job in zip(targets, jobs):
+            if job.successful():
+                results[addr] = job.value
+            else:
+                results[addr] = RPCApi.Result.error(f"call rpc except {job.exception}")
+        return results
+
+
 @click.group()
 @click.option("--addr", type=str, default='')
 @click.pass_context
@@ -251,6 +476,31 @@ def cmd_pci_devices(ctx):
     print(result.result)
     return True
 
+@cli.command("pci-snapshot")
+@click.argument("output")
+@click.pass_context
+def cmd_pci_snapshot(ctx, output):
+    client = ctx.obj['client']
+    if client is None:
+        print("not connect.")
+        return False
+
+    result = client.pci_snapshot()
+    if not result.status:
+        print("get pci snapshot failed.")
+        print(result.message)
+        return False
+
+    try:
+        with open(output, "wb") as f:
+            f.write(result.result)
+    except:
+        print("save output failed.")
+        return False
+
+    print(f"save snapshot to {output}")
+    return True
+
 @cli.command("enable")
 @click.argument("rootcell")
 @click.pass_context
@@ -412,16 +662,37 @@ def get_status(ctx):
     print(result.result)
     return True
 
+@cli.command("watch-status")
+@click.pass_context
+def watch_status(ctx):
+    client: RPCClient = ctx.obj['client']
+    if client is None:
+        print("not connect.")
+        return False
+
+    sub = StatusSubscription(client)
+    if not sub.start():
+        print("subscribe status failed.")
+        return False
+    while sub.is_alive():
+        for status in sub.poll():
+            print(status)
+        gevent.sleep(0.2)
+    return True
+
 @cli.command("guest-status")
 @click.pass_context
-@click.argument("index", type=int)
+@click.argument("index", type=int, required=False)
 def get_status(ctx, index):
     client: RPCClient = ctx.obj['client']
     if client is None:
         print("not connect.")
         return False
 
-    result = client.get_guest_status(index)
+    if index is None:
+        result = client.get_guests_status()
+    else:
+        result = client.get_guest_status(index)
     if not result.status:
         print(result.message)
         return False
@@ -462,5 +733,60 @@ def stop_uart(ctx):
         print(result.message)
 
 
+@cli.command("fleet")
+@click.option("-t", "--target", "targets", multiple=True, required=True, help="目标地址, 可多次指定")
+@click.argument("operation", type=click.Choice(['status', 'list-cell', 'enable', 'disable',
+                                                 'create-cell', 'destroy-cell', 'load-cell',
+                                                 'start-cell', 'stop-cell']))
+@click.argument("args", nargs=-1)
+def cmd_fleet(targets, operation, args):
+    """ 对多个目标并发执行同一个操作 """
+    def read_file(fn):
+        try:
+            with open(fn, 'rb') as f:
+                return f.read()
+        except:
+            print(f"read {fn} failed.")
+            return None
+
+    ops = {
+        'status':       ('get_status',        0),
+        'list-cell':    ('list_cell',         0),
+        'enable':       ('jailhouse_enable',  1),
+        'disable':      ('jailhouse_disable', 0),
+        'create-cell':  ('create_cell',       1),
+        'destroy-cell': ('destroy_cell',      1),
+        'load-cell':    ('load_cell',         3),
+        'start-cell':   ('start_cell',        1),
+        'stop-cell':    ('stop_cell',         1),
+    }
+    method, nargs = ops[operation]
+    if len(args) != nargs:
+        print(f"{operation} need {nargs} arguments.")
+        return False
+
+    call_args = list(args)
+    if operation in ('enable', 'create-cell'):
+        call_args[0] = read_file(args[0])
+    elif operation == 'load-cell':
+        call_args[1] = hexint(args[1])
+        call_args[2] = read_file(args[2])
+    if None in call_args:
+        return False
+
+    pool = RPCClientPool()
+    results = pool.fanout(targets, method, *call_args)
+    pool.close()
+
+    ok = True
+    for addr, result in results.items():
+        if result:
+            print(f"{addr}: ok {result.result if result.result is not None else ''}")
+        else:
+            print(f"{addr}: failed {result.message}")
+            ok = False
+    return ok
+
+
 if __name__ == "__main__":
     cli()
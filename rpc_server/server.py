@@ -1,7 +1,9 @@
 import zerorpc
 from typing import Optional
 from api import RPCApi
+from status_monitor import StatusMonitor
 import psutil
+import time
 
 
 class RPCServer(object):
@@ -26,6 +28,10 @@ class RPCServer(object):
 
 
 class TestAPI(RPCApi):
+    def __init__(self):
+        super().__init__()
+        self._status_monitor = StatusMonitor(self._sample_status)
+
     def hello(self, msg: str):
         return RPCApi.Result(True, result=msg).to_dict()
 
@@ -35,6 +41,12 @@ class TestAPI(RPCApi):
     def pci_devices(self) -> dict:
         return RPCApi.Result(False, msg="unimplement").to_dict()
 
+    def pci_devices_since(self, inventory_id: str, generation: int) -> dict:
+        return RPCApi.Result(False, msg="unimplement").to_dict()
+
+    def pci_snapshot(self) -> dict:
+        return RPCApi.Result(False, msg="unimplement").to_dict()
+
     def jailhouse_enable(self, rootcell: bytes) -> dict:
         return RPCApi.Result(False, msg="unimplement").to_dict()
 
@@ -59,15 +71,35 @@ class TestAPI(RPCApi):
     def stop_cell(self, name) -> dict:
         return RPCApi.Result(False, msg="unimplement").to_dict()
 
+    def deploy_cell(self, plan: dict) -> dict:
+        return RPCApi.Result(False, msg="unimplement").to_dict()
+
     def get_status(self) -> dict:
+        return RPCApi.Result(True, result=self._sample_status()).to_dict()
+
+    def get_status_history(self, start: float, end: float, max_points: int) -> dict:
+        return RPCApi.Result(False, msg="unimplement").to_dict()
+
+    def get_guest_status(self, idx) -> dict:
+        return RPCApi.Result(False, msg="unimplement").to_dict()
+
+    def get_guests_status(self) -> dict:
+        return RPCApi.Result(False, msg="unimplement").to_dict()
+
+    @zerorpc.stream
+    def stream_status(self):
+        return self._status_monitor.subscribe()
+
+    def _sample_status(self) -> dict:
         status = dict()
         rootcell = dict()
         rootcell['meminfo'] = psutil.virtual_memory()._asdict()
         rootcell['cputimes'] = psutil.cpu_times()._asdict()
         rootcell['cpuload'] = psutil.cpu_percent()
 
+        status['timestamp'] = time.time()
         status['rootcell'] = rootcell
-        return RPCApi.Result(True, result=status).to_dict()
+        return status
 
 
 if __name__ == "__main__":
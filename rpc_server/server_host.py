@@ -3,12 +3,18 @@
 from typing import Optional, Union
 from server import RPCServer
 from api import RPCApi
+from status_monitor import StatusMonitor
+from proc_stat import ProcStat
+from status_history import StatusHistory
 import os
 import logging
-from pci_device import PCIDevice
-import psutil
+import argparse
+import zerorpc
+from pci_device import PCIDevice, PCIInventory, PCISnapshot
 import time
 from jailhouse import Jailhouse, TempFile
+from jailhouse_driver import JailhouseDriver, FakeJailhouseDevice
+from ivsm_p2p import IvsmP2P, FakeIvsmP2PLibrary
 import subprocess
 
 mypath = os.path.split(os.path.realpath(__file__))[0]
@@ -28,16 +34,25 @@ cflags = "-Werror -Wall -Wextra -D__LINUX_COMPILER_TYPES_H"
 
 
 class HostApi(RPCApi):
-    def __init__(self):
+    def __init__(self, status_interval: float = 1.0, history: float = 3600):
         super().__init__()
         self._uart_server: Optional[subprocess.Popen] = None
+        self._status_monitor = StatusMonitor(self._sample_status, status_interval)
+        self._pci_inventory = PCIInventory()
+        self._proc_stat = ProcStat()
+        # 持续采样, 保存最近history秒的状态
+        self._status_history = StatusHistory(int(history / status_interval))
+        self._status_monitor.add_listener(self._status_history.append)
+        # ivshmem库只初始化一次
+        if not IvsmP2P.init():
+            logging.warning("ivsm p2p init failed, guest status not available.")
 
     def hello(self, msg: str):
         return RPCApi.Result(True, result=msg).to_dict()
 
     def compile_cell(self, src_txt: str) -> dict:
-        # 保存到临时目录
-        tf = TempFile()
+        # 保存到临时目录, gcc需要根据后缀识别文件类型, objcopy会重命名输出文件, 不能使用memfd
+        tf = TempFile(memory=False)
 
         if not isinstance(src_txt, str):
             return RPCApi.Result.error("source type error").to_dict()
@@ -80,6 +95,20 @@ class HostApi(RPCApi):
             devices.append(pci.to_dict())
         return RPCApi.Result(True, result=devices).to_dict()
 
+    def pci_devices_since(self, inventory_id: str, generation: int) -> dict:
+        if not isinstance(generation, int):
+            return RPCApi.Result.error("generation type error").to_dict()
+        # all_from_sysfs每次重新读取各设备的config和resource, 设备配置变化时记为changed
+        self._pci_inventory.refresh(PCIDevice.all_from_sysfs())
+        value = self._pci_inventory.since(inventory_id, generation)
+        logging.info(f"pci devices since {generation}: generation {value['generation']} full {value['full']} "
+                     f"added {len(value['added'])} changed {len(value['changed'])} removed {len(value['removed'])}")
+        return RPCApi.Result(True, result=value).to_dict()
+
+    def pci_snapshot(self) -> dict:
+        logging.info("pci snapshot")
+        return RPCApi.Result(True, result=PCISnapshot.dumps()).to_dict()
+
     def jailhouse_enable(self, rootcell: bytes) -> dict:
         logging.info(f"jailhouse enable")
         return Jailhouse.enable(rootcell).to_dict()
@@ -112,26 +141,68 @@ class HostApi(RPCApi):
         logging.info(f"stop cell {name}")
         return Jailhouse.stop_cell(name).to_dict()
 
+    def deploy_cell(self, plan: dict) -> dict:
+        if not isinstance(plan, dict):
+            return RPCApi.Result.error("plan type error").to_dict()
+        name = plan.get('name')
+        config = plan.get('config')
+        if not isinstance(name, str) or not name:
+            return RPCApi.Result.error("plan name error").to_dict()
+        if not isinstance(config, bytes):
+            return RPCApi.Result.error("plan config type error").to_dict()
+
+        images = list()
+        for image in plan.get('images', list()):
+            addr = image.get('addr')
+            data = image.get('data')
+            if not isinstance(addr, int) or not isinstance(data, bytes):
+                return RPCApi.Result.error(f"image {image.get('name')} type error").to_dict()
+            logging.info(f"image {image.get('name')} {len(data)} bytes @{hex(addr)}")
+            images.append((addr, data))
+
+        logging.info(f"deploy cell {name}")
+        return Jailhouse.deploy_cell(name, config, images,
+                                     plan.get('start', True), plan.get('replace', True)).to_dict()
+
     def get_status(self) -> dict:
+        # 有客户端订阅时直接使用最近一次采样结果
+        status = self._status_monitor.latest(self._status_monitor.interval()*2)
+        if status is None:
+            status = self._sample_status()
+        return RPCApi.Result(True, result=status).to_dict()
+
+    def get_status_history(self, start: float, end: float, max_points: int) -> dict:
+        if end <= 0:
+            end = None
+        value = self._status_history.query(start, end, max_points)
+        return RPCApi.Result(True, result=value).to_dict()
+
+    @zerorpc.stream
+    def stream_status(self):
+        logging.info("subscribe status")
+        return self._status_monitor.subscribe()
+
+    def _sample_status(self) -> dict:
         status = dict()
-        rootcell = dict()
         guestcells = dict()
-        rootcell['meminfo'] = psutil.virtual_memory()._asdict()
-        rootcell['cputimes'] = psutil.cpu_times()._asdict()
-        rootcell['cpuload'] = psutil.cpu_percent()
-        rootcell['cpucount'] = psutil.cpu_count()
-
-        for cell in Jailhouse.list_cell().result:
-            guestcells[cell['name']] = cell
+        rootcell = self._proc_stat.sample()
+        if rootcell is None:
+            rootcell = dict()
+
+        # 没有加载jailhouse驱动时没有客户单元格, 不启动jailhouse进程;
+        # 获取单元格列表失败时同样按没有客户单元格处理, 仍然记录根单元格的采样
+        if os.path.exists(Jailhouse.jh_dev) or os.path.isdir(Jailhouse.jh_sysfs):
+            cells = Jailhouse.list_cell()
+            if cells and isinstance(cells.result, list):
+                for cell in cells.result:
+                    guestcells[cell['name']] = cell
 
         status['timestamp'] = time.time()
         status['rootcell'] = rootcell
         status['guestcells'] = guestcells
-        return RPCApi.Result(True, result=status).to_dict()
+        return status
 
     def run_linux(self, cell: bytes, kernel: bytes, dtb: bytes, ramdisk: bytes, bootargs: str) -> dict():
-        tf = TempFile()
-
         if not isinstance(cell, bytes):
             return RPCApi.Result.error("cell type error").to_dict()
         if not isinstance(kernel, bytes):
@@ -141,48 +212,56 @@ class HostApi(RPCApi):
         if not isinstance(bootargs, str):
             return RPCApi.Result.error("bootargs type error").to_dict()
 
-        cell_fn    = None
-        kernel_fn  = None
-        dtb_fn     = None
-        ramdisk_fn = None
-
-        logging.info(f"save cell {len(cell)} bytes.")
-        cell_fn = tf.save("runlinux", ".cell", cell)
-        if cell_fn is None:
-            logging.error("save cell failed.")
-            return RPCApi.Result.error("save cell failed.").to_dict()
-
-        logging.info(f"save kernel {len(kernel)} bytes.")
-        kernel_fn = tf.save("runlinux", ".kernel", kernel)
-        if kernel_fn is None:
-            logging.error("save kernel failed.")
-            return RPCApi.Result.error("save kernel failed.").to_dict()
-
-        logging.info(f"save devicetree {len(dtb)} bytes")
-        dtb_fn = tf.save("runlinux", ".dtb", dtb)
-        if dtb_fn is None:
-            logging.error("save dtb failed.")
-            return RPCApi.Result.error("save dtb failed.").to_dict()
-
-        if ramdisk:
-            ramdisk_fn = tf.save("runlinux", ".ramdisk", ramdisk)
-            if ramdisk_fn is None:
-                logging.error("save ramdisk failed.")
-                return RPCApi.Result.error("save ramdisk failed.").to_dict()
-
-        result = Jailhouse.run_linux(cell_fn, kernel_fn, dtb_fn, ramdisk_fn, bootargs)
-        if not result:
-            logging.error(f"run linux failed: {result.message}.")
-        return result.to_dict()
+        with TempFile() as tf:
+            cell_fn    = None
+            kernel_fn  = None
+            dtb_fn     = None
+            ramdisk_fn = None
+
+            logging.info(f"save cell {len(cell)} bytes.")
+            cell_fn = tf.save("runlinux", ".cell", cell)
+            if cell_fn is None:
+                logging.error("save cell failed.")
+                return RPCApi.Result.error("save cell failed.").to_dict()
+
+            logging.info(f"save kernel {len(kernel)} bytes.")
+            kernel_fn = tf.save("runlinux", ".kernel", kernel)
+            if kernel_fn is None:
+                logging.error("save kernel failed.")
+                return RPCApi.Result.error("save kernel failed.").to_dict()
+
+            logging.info(f"save devicetree {len(dtb)} bytes")
+            dtb_fn = tf.save("runlinux", ".dtb", dtb)
+            if dtb_fn is None:
+                logging.error("save dtb failed.")
+                return RPCApi.Result.error("save dtb failed.").to_dict()
+
+            if ramdisk:
+                ramdisk_fn = tf.save("runlinux", ".ramdisk", ramdisk)
+                if ramdisk_fn is None:
+                    logging.error("save ramdisk failed.")
+                    return RPCApi.Result.error("save ramdisk failed.").to_dict()
+
+            result = Jailhouse.run_linux(cell_fn, kernel_fn, dtb_fn, ramdisk_fn, bootargs)
+            if not result:
+                logging.error(f"run linux failed: {result.message}.")
+            return result.to_dict()
 
     def get_guest_status(self, idx) -> dict:
-        status = {
-            "online": true,
-            "mem_total": 50,
-            "mem_used": 50,
-            "cpu_load": 50 
-        }
-        return RPCApi.Result.success(status).to_dict()
+        if not IvsmP2P.is_initialized():
+            return RPCApi.Result.error("ivsm p2p not available").to_dict()
+        status = IvsmP2P.guestos_status(idx)
+        if status is None:
+            return RPCApi.Result.error(f"get guest {idx} status failed").to_dict()
+        return RPCApi.Result.success(status.to_dict()).to_dict()
+
+    def get_guests_status(self) -> dict:
+        if not IvsmP2P.is_initialized():
+            return RPCApi.Result.error("ivsm p2p not available").to_dict()
+        status = IvsmP2P.all_guestos_status()
+        if status is None:
+            return RPCApi.Result.error("get guests status failed").to_dict()
+        return RPCApi.Result.success([x.to_dict() for x in status]).to_dict()
 
     def start_uart_server(self, config: str) -> dict:
         if self._uart_server is not None:
@@ -226,8 +305,23 @@ class HostApi(RPCApi):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--addr", default="tcp://0.0.0.0:4240")
+    parser.add_argument("--status-interval", type=float, default=1.0, help="状态采样周期(秒)")
+    parser.add_argument("--history", type=float, default=3600, help="保存状态历史的时长(秒)")
+    parser.add_argument("--no-ioctl", action="store_true", help="不使用ioctl, 所有操作调用jailhouse命令")
+    parser.add_argument("--fake-device", action="store_true", help="使用模拟的jailhouse设备, 用于测试")
+    parser.add_argument("--fake-ivsm", action="store_true", help="使用模拟的ivshmem共享内存, 用于测试")
+    args = parser.parse_args()
+
     logging.basicConfig(level=logging.INFO)
-    addr = "tcp://0.0.0.0:4240"
-    s = RPCServer(addr, HostApi())
+    if args.no_ioctl:
+        Jailhouse.use_driver = False
+    if args.fake_device:
+        Jailhouse.set_driver(JailhouseDriver(FakeJailhouseDevice()))
+    if args.fake_ivsm:
+        IvsmP2P.init(FakeIvsmP2PLibrary())
+    addr = args.addr
+    s = RPCServer(addr, HostApi(args.status_interval, args.history))
     logging.info(f"server running {addr}.")
     s.run()
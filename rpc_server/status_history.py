@@ -0,0 +1,163 @@
+import array
+import logging
+from typing import Optional, List, Dict
+
+
+class StatusHistory(object):
+    """ 状态历史, 固定大小的环形缓冲区
+
+    每个采样保存时间戳, 总CPU负载, 每个CPU的负载, 内存和各cell的状态,
+    数据保存在array中, 容量满后覆盖最早的采样.
+    客户端断开重连后可以获取之前一段时间的负载.
+    """
+    logger = logging.getLogger("StatusHistory")
+
+    # cell状态编码, 0表示cell不存在
+    cell_states = ('', 'running', 'running/locked', 'shut down', 'failed')
+
+    def __init__(self, capacity: int = 3600, max_cells: int = 16):
+        self._capacity = max(1, capacity)
+        self._max_cells = max_cells
+        self._count = 0
+        self._head = 0          # 下一个写入位置
+        self._cpucount = 0
+
+        self._timestamp = array.array('d', bytes(8 * self._capacity))
+        self._cpuload = array.array('f', bytes(4 * self._capacity))
+        self._mem_total = array.array('d', bytes(8 * self._capacity))
+        self._mem_available = array.array('d', bytes(8 * self._capacity))
+        self._cpus = array.array('f')
+        self._cells = array.array('b', bytes(self._capacity * self._max_cells))
+        self._cell_columns: Dict[str, int] = dict()
+
+    def capacity(self) -> int:
+        return self._capacity
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        self._count = 0
+        self._head = 0
+        self._cell_columns.clear()
+
+    def _state_code(self, state: str) -> int:
+        try:
+            return self.cell_states.index(state)
+        except ValueError:
+            return len(self.cell_states)
+
+    def _state_name(self, code: int) -> Optional[str]:
+        if code == 0:
+            return None
+        if code < len(self.cell_states):
+            return self.cell_states[code]
+        return 'unknown'
+
+    def _cell_column(self, name: str, present: set) -> Optional[int]:
+        column = self._cell_columns.get(name)
+        if column is not None:
+            return column
+
+        used = set(self._cell_columns.values())
+        for column in range(self._max_cells):
+            if column not in used:
+                break
+        else:
+            # 列已用完, 回收当前不存在的cell
+            stale = [n for n in self._cell_columns if n not in present]
+            if not stale:
+                return None
+            column = self._cell_columns.pop(stale[0])
+            for i in range(self._capacity):
+                self._cells[i * self._max_cells + column] = 0
+
+        self._cell_columns[name] = column
+        return column
+
+    def append(self, status: dict):
+        """ 添加一次采样, 格式为RPCApi.get_status的返回值 """
+        rootcell = status.get('rootcell') or dict()
+        guestcells = status.get('guestcells') or dict()
+        cpus = rootcell.get('cpus') or list()
+        meminfo = rootcell.get('meminfo') or dict()
+
+        if len(cpus) != self._cpucount:
+            # CPU个数变化(如CPU被分配给guest cell), 之前的每CPU数据作废
+            self._cpucount = len(cpus)
+            self._cpus = array.array('f', bytes(4 * self._capacity * self._cpucount))
+
+        idx = self._head
+        self._timestamp[idx] = status.get('timestamp', 0.0)
+        self._cpuload[idx] = rootcell.get('cpuload', 0.0)
+        self._mem_total[idx] = meminfo.get('total', 0)
+        self._mem_available[idx] = meminfo.get('available', 0)
+        base = idx * self._cpucount
+        for i, load in enumerate(cpus):
+            self._cpus[base + i] = load
+
+        base = idx * self._max_cells
+        for i in range(self._max_cells):
+            self._cells[base + i] = 0
+        present = set(guestcells.keys())
+        for name, cell in guestcells.items():
+            column = self._cell_column(name, present)
+            if column is None:
+                continue
+            self._cells[base + column] = self._state_code(cell.get('status', ''))
+
+        self._head = (self._head + 1) % self._capacity
+        self._count = min(self._count + 1, self._capacity)
+
+    def _indexes(self, start: float, end: float) -> List[int]:
+        first = (self._head - self._count) % self._capacity
+        indexes = list()
+        for n in range(self._count):
+            idx = (first + n) % self._capacity
+            ts = self._timestamp[idx]
+            if start <= ts <= end:
+                indexes.append(idx)
+        return indexes
+
+    def query(self, start: float = 0.0, end: Optional[float] = None, max_points: int = 0) -> dict:
+        """ 获取时间范围内的采样
+        Args:
+            start: 开始时间
+            end: 结束时间, None表示最新
+            max_points: 最多返回的点数, 采样多于该值时按时间分组平均, 0表示不降采样
+        Returns:
+            {
+                timestamp: [...],
+                cpuload: [...],
+                cpus: [[cpu0 ...], [cpu1 ...] ...],
+                mem_total: [...],
+                mem_available: [...],
+                cells: {name: [status|None ...]},
+            }
+            cpuload/cpus为百分比, 内存单位为字节, cell状态取每组最后一个采样.
+        """
+        if end is None:
+            end = float('inf')
+        indexes = self._indexes(start, end)
+
+        if max_points > 0 and len(indexes) > max_points:
+            step = len(indexes) / max_points
+            groups = [indexes[int(i*step):int((i+1)*step)] for i in range(max_points)]
+        else:
+            groups = [[idx] for idx in indexes]
+
+        def mean(values: array.array, group: List[int], stride: int = 1, offset: int = 0) -> float:
+            return sum(values[i*stride + offset] for i in group) / len(group)
+
+        value = dict()
+        value['timestamp'] = [self._timestamp[g[-1]] for g in groups]
+        value['cpuload'] = [round(mean(self._cpuload, g), 1) for g in groups]
+        value['cpus'] = [[round(mean(self._cpus, g, self._cpucount, cpu), 1) for g in groups]
+                         for cpu in range(self._cpucount)]
+        value['mem_total'] = [int(self._mem_total[g[-1]]) for g in groups]
+        value['mem_available'] = [int(mean(self._mem_available, g)) for g in groups]
+        cells = dict()
+        for name, column in self._cell_columns.items():
+            cells[name] = [self._state_name(self._cells[g[-1]*self._max_cells + column]) for g in groups]
+        value['cells'] = cells
+        return value
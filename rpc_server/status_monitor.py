@@ -0,0 +1,134 @@
+import logging
+import time
+from typing import Callable, Optional, List
+import gevent
+import gevent.queue
+from api import dict_diff
+
+
+class StatusMonitor(object):
+    """ 状态采样与推送
+
+    按固定周期调用sampler采样一次, 与上一次采样比较后, 只把变化部分推送给所有订阅者.
+    不论有多少个客户端订阅, 每个周期只采样一次. 没有订阅者和监听者时采样停止.
+    监听者(如状态历史)收到每一次完整的采样结果.
+    """
+    logger = logging.getLogger("StatusMonitor")
+
+    def __init__(self, sampler: Callable[[], dict], interval: float = 1.0, queue_size: int = 16):
+        self._sampler = sampler
+        self._interval = interval
+        self._queue_size = queue_size
+        self._subscribers: List[gevent.queue.Queue] = list()
+        self._listeners: List[Callable[[dict], None]] = list()
+        self._greenlet: Optional[gevent.Greenlet] = None
+        self._last: Optional[dict] = None
+        self._last_time = 0.0
+        self._seq = 0
+
+    def interval(self) -> float:
+        return self._interval
+
+    def set_interval(self, interval: float):
+        if interval > 0:
+            self._interval = interval
+
+    def is_running(self) -> bool:
+        return self._greenlet is not None
+
+    def latest(self, max_age: Optional[float] = None) -> Optional[dict]:
+        """ 最近一次采样结果
+        Args:
+            max_age: 允许的最大间隔(秒), 超过返回None
+        """
+        if self._last is None:
+            return None
+        if max_age is not None and time.monotonic() - self._last_time > max_age:
+            return None
+        return self._last
+
+    def add_listener(self, listener: Callable[[dict], None]):
+        """ 添加监听者, 有监听者时持续采样 """
+        self._listeners.append(listener)
+        self._start()
+
+    def remove_listener(self, listener: Callable[[dict], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def subscribe(self):
+        """ 订阅状态变化, 返回生成器
+        第一条为完整状态, 之后为dict_diff差异.
+        """
+        queue = gevent.queue.Queue(self._queue_size)
+        self._subscribers.append(queue)
+        self._start()
+        try:
+            if self._last is not None:
+                yield {'seq': self._seq, 'full': True, 'status': self._last}
+            while True:
+                msg = queue.get()
+                if msg is None:
+                    break
+                yield msg
+        finally:
+            if queue in self._subscribers:
+                self._subscribers.remove(queue)
+
+    def stop(self):
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+        self._subscribers.clear()
+        if self._greenlet is not None:
+            self._greenlet.kill(block=False)
+            self._greenlet = None
+
+    def _start(self):
+        if self._greenlet is None:
+            self._greenlet = gevent.spawn(self._run)
+
+    def _run(self):
+        self.logger.info("status monitor start")
+        while self._subscribers or self._listeners:
+            begin = time.monotonic()
+            try:
+                status = self._sampler()
+            except Exception as e:
+                self.logger.error(f"sample status failed: {e}")
+                status = None
+
+            if status is not None:
+                for listener in list(self._listeners):
+                    try:
+                        listener(status)
+                    except Exception as e:
+                        self.logger.error(f"status listener failed: {e}")
+                self._publish(status)
+
+            elapsed = time.monotonic() - begin
+            gevent.sleep(max(self._interval - elapsed, 0))
+
+        self._greenlet = None
+        self.logger.info("status monitor stop")
+
+    def _publish(self, status: dict):
+        if self._last is None:
+            msg = {'full': True, 'status': status}
+        else:
+            diff = dict_diff(self._last, status)
+            msg = {'full': False, 'status': diff} if diff else None
+        self._last = status
+        self._last_time = time.monotonic()
+        if msg is None:
+            return
+
+        self._seq += 1
+        msg['seq'] = self._seq
+        for queue in list(self._subscribers):
+            if queue.full():
+                # 客户端消费过慢, 发送完整状态让其重新同步
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({'seq': self._seq, 'full': True, 'status': status})
+            else:
+                queue.put_nowait(msg)
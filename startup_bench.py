@@ -0,0 +1,368 @@
+"""
+启动时间测试工具。
+
+无界面(offscreen)使用 python -X importtime 运行各入口脚本，
+统计启动就绪时间、主界面首次绘制时间和各模块的导入耗时。
+
+子命令:
+- bench: 测量各入口的启动时间和分组模块的导入耗时，超出预算时返回非0
+- profile: 列出一个入口脚本导入耗时最多的模块，用于检查启动时是否导入了不需要的模块
+
+bench的入口:
+- mainui: mainui.py --startup-only, 就绪时间为主窗口首次绘制的时间
+- checklist: checklist.py --help
+- generator: generator.py --help
+
+预算(毫秒)通过 --budget 设置:
+    <入口>=<ms>          入口的就绪时间
+    <入口>/<分组>=<ms>    入口中分组模块的导入耗时, 例如 mainui/forms.*=300
+
+用法:
+    python3 startup_bench.py bench
+    python3 startup_bench.py bench mainui --repeat 5 --budget mainui=2500 --json startup.json
+    python3 startup_bench.py profile                      # 分析mainui.py
+    python3 startup_bench.py profile --top 40 generator.py --help
+"""
+
+import os
+import sys
+import json
+import time
+import fnmatch
+import tempfile
+import threading
+import subprocess
+import statistics
+from typing import List, Dict, Optional, Tuple, NamedTuple
+
+import click
+
+
+# 与mainui.FirstPaintFilter.MARKER一致, 导入mainui会触发build, 这里不导入
+MARKER = "startup: first paint"
+
+ENTRY_POINTS = {
+    'mainui': ['mainui.py', '--startup-only'],
+    'checklist': ['checklist.py', '--help'],
+    'generator': ['generator.py', '--help'],
+}
+
+# 默认预算(毫秒)
+DEFAULT_BUDGETS = {
+    'mainui': 4000,
+    'checklist': 2000,
+    'generator': 2000,
+}
+
+# 分组统计的模块, 支持通配符
+MODULE_GROUPS = [
+    'jh_resource',
+    'generator',
+    'forms.*',
+    'assets.qr_resource',
+    'PySide2*',
+    'mako*',
+    'fdt*',
+    'toml*',
+    'zerorpc*',
+]
+
+
+class ImportTime(NamedTuple):
+    """
+    单个模块的导入耗时。
+
+    Attributes:
+        module: 模块名
+        self_us: 模块自身的导入耗时(微秒)
+        cumulative_us: 包括子模块的导入耗时(微秒)
+        depth: 导入的嵌套层数，0为顶层导入
+    """
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(text: str) -> List[ImportTime]:
+    """
+    解析 -X importtime 的输出。
+
+    输出格式:
+        import time: self [us] | cumulative | imported package
+        import time:       123 |        456 |   module.name
+
+    Args:
+        text: 标准错误输出
+
+    Returns:
+        list: 各模块的导入耗时，按导入完成的顺序
+    """
+    records = list()
+    for line in text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split('|')
+        if len(fields) != 3:
+            continue
+        try:
+            self_us = int(fields[0])
+            cumulative_us = int(fields[1])
+        except ValueError:
+            # 表头
+            continue
+        name = fields[2].rstrip()
+        stripped = name.lstrip()
+        depth = (len(name) - len(stripped) - 1) // 2
+        records.append(ImportTime(stripped, self_us, cumulative_us, depth))
+    return records
+
+
+class RunResult(object):
+    """
+    一次运行的结果。
+
+    Attributes:
+        ready_ms: 从启动进程到就绪的时间，mainui为首次绘制，其他为进程退出
+        first_paint_ms: 首次绘制时间，没有绘制时为None
+        returncode: 进程返回值
+        imports: 模块导入耗时
+        output: 出错时的标准错误输出(去掉importtime部分)
+    """
+    def __init__(self):
+        self.ready_ms = 0.0
+        self.first_paint_ms: Optional[float] = None
+        self.returncode = 0
+        self.imports: List[ImportTime] = list()
+        self.output = ""
+
+
+def run_once(args: List[str], timeout: float = 120) -> RunResult:
+    """
+    运行一次入口脚本。
+
+    importtime的输出很多，写入临时文件，避免读取标准输出等待首次绘制时管道阻塞。
+    """
+    env = dict(os.environ)
+    env["QT_QPA_PLATFORM"] = "offscreen"
+    env["PYTHONUNBUFFERED"] = "1"
+    cmd = [sys.executable, "-X", "importtime"] + args
+    result = RunResult()
+
+    with tempfile.TemporaryFile(mode="w+t") as stderr:
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=stderr,
+                                stdin=subprocess.DEVNULL, universal_newlines=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        # 进程卡住时读取标准输出不会返回, 超时后由定时器结束进程
+        killer = threading.Timer(timeout, proc.kill)
+        killer.start()
+        try:
+            for line in proc.stdout:
+                if result.first_paint_ms is None and line.strip() == MARKER:
+                    result.first_paint_ms = (time.perf_counter() - start) * 1000
+            result.returncode = proc.wait()
+        finally:
+            killer.cancel()
+        exit_ms = (time.perf_counter() - start) * 1000
+        result.ready_ms = result.first_paint_ms if result.first_paint_ms is not None else exit_ms
+
+        stderr.seek(0)
+        text = stderr.read()
+    result.imports = parse_importtime(text)
+    result.output = "\n".join(line for line in text.splitlines() if not line.startswith("import time:"))
+    return result
+
+
+def group_cost(imports: List[ImportTime], pattern: str) -> Tuple[int, int]:
+    """
+    统计分组模块的导入耗时。
+
+    分组内模块导入的子模块计入分组，嵌套在分组内另一个模块中的只计算一次。
+
+    Returns:
+        (cumulative_us, count): 导入耗时(微秒)和模块个数
+    """
+    total = 0
+    count = 0
+    # 逆序遍历时, 栈中为当前模块的所有上层模块
+    stack: List[Tuple[int, bool]] = list()
+    for record in reversed(imports):
+        while stack and stack[-1][0] >= record.depth:
+            stack.pop()
+        matched = fnmatch.fnmatchcase(record.module, pattern)
+        if matched:
+            count += 1
+            if not any(m for _, m in stack):
+                total += record.cumulative_us
+        stack.append((record.depth, matched))
+    return total, count
+
+
+def parse_budgets(items: List[str]) -> Dict[str, float]:
+    budgets = dict(DEFAULT_BUDGETS)
+    for item in items:
+        key, sep, value = item.partition('=')
+        if not sep:
+            raise click.BadParameter(f"invalid budget {item}, expect NAME=MS")
+        try:
+            budgets[key.strip()] = float(value)
+        except ValueError:
+            raise click.BadParameter(f"invalid budget {item}, expect NAME=MS")
+    return budgets
+
+
+def bench(name: str, repeat: int, warmup: int, timeout: float, patterns: List[str] = MODULE_GROUPS) -> dict:
+    """
+    测试一个入口，预热后运行repeat次，时间取中位数，导入耗时取就绪时间为中位数的一次。
+
+    Returns:
+        dict: {name, ready_ms, first_paint_ms, runs, import_ms, modules, groups, returncode}
+    """
+    args = ENTRY_POINTS[name]
+    for _ in range(warmup):
+        run_once(args, timeout)
+    runs = sorted((run_once(args, timeout) for _ in range(max(1, repeat))), key=lambda r: r.ready_ms)
+    median = runs[len(runs)//2]
+
+    groups = dict()
+    for pattern in patterns:
+        cost, count = group_cost(median.imports, pattern)
+        if count:
+            groups[pattern] = {'ms': round(cost/1000, 1), 'modules': count}
+
+    paints = [r.first_paint_ms for r in runs if r.first_paint_ms is not None]
+    return {
+        'name': name,
+        'ready_ms': round(statistics.median(r.ready_ms for r in runs), 1),
+        'first_paint_ms': round(statistics.median(paints), 1) if paints else None,
+        'runs': [round(r.ready_ms, 1) for r in runs],
+        'import_ms': round(sum(r.cumulative_us for r in median.imports if r.depth == 0)/1000, 1),
+        'modules': len(median.imports),
+        'groups': groups,
+        'returncode': median.returncode,
+        'output': median.output if median.returncode != 0 else "",
+    }
+
+
+def check_budgets(result: dict, budgets: Dict[str, float]) -> List[str]:
+    """
+    检查结果是否超出预算。
+
+    Returns:
+        list: 超出预算的说明
+    """
+    name = result['name']
+    failures = list()
+    if result['returncode'] != 0:
+        failures.append(f"{name} exit with {result['returncode']}")
+    if name == 'mainui' and result['first_paint_ms'] is None:
+        failures.append(f"{name} no first paint")
+
+    budget = budgets.get(name)
+    if budget is not None and result['ready_ms'] > budget:
+        failures.append(f"{name} ready {result['ready_ms']:.1f}ms > {budget:.0f}ms")
+    for key, budget in budgets.items():
+        entry, sep, pattern = key.partition('/')
+        if not sep or entry != name:
+            continue
+        cost = result['groups'].get(pattern, {'ms': 0.0})['ms']
+        if cost > budget:
+            failures.append(f"{name} import {pattern} {cost:.1f}ms > {budget:.0f}ms")
+    return failures
+
+
+def print_result(result: dict):
+    first_paint = result['first_paint_ms']
+    print(f"{result['name']}: ready {result['ready_ms']:.1f} ms"
+          + (f", first paint {first_paint:.1f} ms" if first_paint is not None else "")
+          + f", import {result['import_ms']:.1f} ms ({result['modules']} modules)"
+          + f", runs {result['runs']}")
+    for pattern, group in sorted(result['groups'].items(), key=lambda x: x[1]['ms'], reverse=True):
+        print(f"    {group['ms']:10.1f} ms  {group['modules']:4d}  {pattern}")
+    if result['output']:
+        print(result['output'])
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command("bench")
+@click.argument("names", nargs=-1)
+@click.option("--repeat", type=int, default=3, help="每个入口的运行次数")
+@click.option("--warmup", type=int, default=1, help="预热运行次数, 生成pyc缓存")
+@click.option("--timeout", type=float, default=120, help="单次运行的超时时间(秒)")
+@click.option("--budget", "budget_items", multiple=True, help="预算, 例如 mainui=3000 或 mainui/forms.*=300")
+@click.option("--json", "json_file", type=str, default=None, help="结果保存为json文件")
+def cmd_bench(names, repeat, warmup, timeout, budget_items, json_file):
+    """
+    测试入口脚本的启动时间，超出预算时返回1。
+    """
+    names = list(names) or list(ENTRY_POINTS.keys())
+    for name in names:
+        if name not in ENTRY_POINTS:
+            raise click.BadParameter(f"unknown entry {name}, available: {', '.join(ENTRY_POINTS)}")
+    budgets = parse_budgets(budget_items)
+    patterns = list(MODULE_GROUPS)
+    for key in budgets:
+        _, sep, pattern = key.partition('/')
+        if sep and pattern not in patterns:
+            patterns.append(pattern)
+
+    results = list()
+    failures = list()
+    for name in names:
+        result = bench(name, repeat, warmup, timeout, patterns)
+        print_result(result)
+        failures.extend(check_budgets(result, budgets))
+        results.append(result)
+
+    if json_file:
+        with open(json_file, "wt", encoding="utf-8") as f:
+            json.dump({'budgets': budgets, 'results': results}, f, indent=2, ensure_ascii=False)
+
+    if failures:
+        print()
+        for failure in failures:
+            print(f"FAILED: {failure}")
+        raise SystemExit(1)
+
+
+@cli.command("profile", context_settings={"ignore_unknown_options": True, "allow_interspersed_args": False})
+@click.option("--top", type=int, default=30, help="显示耗时最多的模块数")
+@click.option("--timeout", type=float, default=120, help="运行的超时时间(秒)")
+@click.argument("script", default="mainui.py")
+@click.argument("args", nargs=-1, type=click.UNPROCESSED)
+def cmd_profile(top, timeout, script, args):
+    """
+    分析入口脚本的导入耗时。
+
+    分析mainui.py时默认添加--startup-only参数，主窗口第一次绘制后立即退出。
+    """
+    args = list(args)
+    if script == "mainui.py" and not args:
+        args = ["--startup-only"]
+
+    result = run_once([script] + args, timeout)
+    records = result.imports
+    if not records:
+        print(result.output)
+        raise SystemExit(1)
+
+    total = sum(r.cumulative_us for r in records if r.depth == 0)
+    print(f"{script}: {len(records)} modules, {total/1000:.1f} ms")
+    print()
+    print(f"{'cumulative(ms)':>14} {'self(ms)':>9}  module")
+    for r in sorted(records, key=lambda r: r.cumulative_us, reverse=True)[:top]:
+        print(f"{r.cumulative_us/1000:14.1f} {r.self_us/1000:9.1f}  {'  '*r.depth}{r.module}")
+
+    if result.returncode != 0:
+        print()
+        print(f"{script} exit with {result.returncode}")
+        raise SystemExit(result.returncode)
+
+
+if __name__ == "__main__":
+    cli()
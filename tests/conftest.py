@@ -0,0 +1,8 @@
+import os
+import sys
+
+# 界面程序和rpc_server都按目录直接导入模块
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "rpc_server")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,53 @@
+import os
+import json
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("PySide2")
+pytest.importorskip("toml")
+
+from autosave import AutosaveService, JOURNAL_MAGIC, JOURNAL_VERSION, JOURNAL_SUFFIX
+
+
+def dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def write_journal(path, name, pid):
+    journal = {
+        'magic': JOURNAL_MAGIC,
+        'version': JOURNAL_VERSION,
+        'filename': None,
+        'name': name,
+        'time': 1.0,
+        'pid': pid,
+        'value': {},
+    }
+    fn = os.path.join(path, name + JOURNAL_SUFFIX)
+    with open(fn, "wt") as f:
+        json.dump(journal, f)
+    return fn
+
+
+def test_journals_skip_running_instances(tmp_path):
+    live = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        write_journal(str(tmp_path), "live", live.pid)
+        write_journal(str(tmp_path), "crashed", dead_pid())
+        service = AutosaveService(str(tmp_path))
+        assert [j.name for j in service.journals()] == ["crashed"]
+    finally:
+        live.kill()
+        live.wait()
+    assert sorted(j.name for j in service.journals()) == ["crashed", "live"]
+
+
+def test_journal_with_own_pid_is_orphaned(tmp_path):
+    # 上次崩溃的程序的进程ID可能被本进程重用
+    write_journal(str(tmp_path), "reused", os.getpid())
+    service = AutosaveService(str(tmp_path))
+    assert [j.name for j in service.journals()] == ["reused"]
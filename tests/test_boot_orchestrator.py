@@ -0,0 +1,130 @@
+import os
+
+import pytest
+
+pytest.importorskip("gevent")
+pytest.importorskip("zerorpc")
+
+from rpc_server.api import RPCApi
+from jh_resource import ResourceMgr, PlatformMgr
+from boot_orchestrator import BootOrchestrator, CellBootPlan, order_levels, parse_depends
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_order_levels():
+    depends = {'app': ['comm', 'log'], 'comm': [], 'log': ['comm'], 'idle': []}
+    assert order_levels(depends) == [['comm', 'idle'], ['log'], ['app']]
+    assert order_levels({}) == []
+
+
+@pytest.mark.parametrize("depends", [
+    {'a': ['b'], 'b': ['a']},
+    {'a': ['b'], 'b': ['c'], 'c': ['a'], 'd': []},
+    {'a': ['a']},
+    {'a': ['missing']},
+])
+def test_order_levels_rejects_invalid(depends):
+    assert order_levels(depends) is None
+
+
+def test_parse_depends():
+    assert parse_depends("") == {}
+    assert parse_depends("app: comm, log ;log:comm; comm:;") == {
+        'app': ['comm', 'log'],
+        'log': ['comm'],
+        'comm': [],
+    }
+    assert parse_depends("app") == {'app': []}
+
+
+class FakeRunInfo(object):
+    def __init__(self, depends):
+        self._depends = depends
+
+    def depends(self):
+        return list(self._depends)
+
+
+class FakeCell(object):
+    def __init__(self, name, depends):
+        self._name = name
+        self._runinfo = FakeRunInfo(depends)
+
+    def name(self):
+        return self._name
+
+    def runinfo(self):
+        return self._runinfo
+
+
+def orchestrator_with(cells, depends=None) -> BootOrchestrator:
+    orchestrator = BootOrchestrator(None, None, depends)
+    orchestrator.cells = lambda: cells
+    return orchestrator
+
+
+def test_order_uses_runinfo_and_override():
+    cells = [FakeCell('app', ['comm']), FakeCell('comm', []), FakeCell('ui', ['app'])]
+    assert orchestrator_with(cells).order() == [['comm'], ['app'], ['ui']]
+    # 调用时指定的依赖覆盖运行信息
+    assert orchestrator_with(cells, {'comm': ['ui']}).order() is None
+    assert orchestrator_with(cells, {'ui': []}).order() == [['comm', 'ui'], ['app']]
+    assert orchestrator_with(cells, {'app': ['nope']}).order() is None
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.calls = list()
+
+    def is_connected(self):
+        return True
+
+    def addr(self):
+        return "tcp://127.0.0.1:0"
+
+    def start_cell(self, name):
+        self.calls.append(('start', name))
+        return RPCApi.Result(True)
+
+    def destroy_cell(self, name):
+        self.calls.append(('destroy', name))
+        return RPCApi.Result(True)
+
+
+@pytest.fixture
+def qemu(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(ResourceMgr, "use_cache", False)
+    monkeypatch.setattr(PlatformMgr, "use_cache", False)
+    PlatformMgr.get_instance().load("platform")
+    rsc = ResourceMgr.get_instance().open(os.path.join("demos", "qemu.jhr"))
+    assert rsc is not None
+    yield rsc
+    ResourceMgr.get_instance().remove(rsc)
+
+
+def test_boot_after_prepare_does_not_touch_resource(qemu, monkeypatch):
+    uploaded = list()
+
+    def upload(self, plan: CellBootPlan):
+        uploaded.append(plan.deploy_plan(False))
+        return RPCApi.Result(True)
+    monkeypatch.setattr(BootOrchestrator, "_upload", upload)
+
+    client = FakeClient()
+    orchestrator = BootOrchestrator(qemu, client)
+    assert orchestrator.prepare()
+    plan = orchestrator.plans()['freertos']
+    assert plan.error is None and isinstance(plan.config, bytes)
+
+    # prepare()之后boot()只使用部署源
+    orchestrator._rsc = None
+    orchestrator.cells = None
+    assert orchestrator.boot()
+    assert orchestrator.states() == {'freertos': BootOrchestrator.RUNNING}
+    assert [p['name'] for p in uploaded] == ['freertos']
+    assert uploaded[0]['config'] == plan.config and uploaded[0]['start'] is False
+    assert client.calls == [('start', 'freertos')]
+    assert orchestrator.plans() == {}
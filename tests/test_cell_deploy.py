@@ -0,0 +1,122 @@
+import pytest
+
+from rpc_server.api import RPCApi
+from utils import CpioUtil
+import cell_deploy
+from cell_deploy import DeployError
+
+
+@pytest.fixture
+def images(tmp_path):
+    a = tmp_path / "a.bin"
+    a.write_bytes(b"A" * 0x100)
+    b = tmp_path / "b.bin"
+    b.write_bytes(b"B" * 0x10)
+    return [
+        {'name': "A", 'addr': 0x1000, 'file': str(a)},
+        {'name': "B", 'addr': 0x2000, 'file': str(b)},
+    ]
+
+
+def test_check_images(images):
+    cell_deploy.check_images(images)
+
+    with pytest.raises(DeployError, match="overlap"):
+        cell_deploy.check_images(images + [dict(images[1], name="C", addr=0x10f0)])
+    with pytest.raises(DeployError, match="invalid"):
+        cell_deploy.check_images([dict(images[0], addr=None)])
+    with pytest.raises(DeployError, match="not found"):
+        cell_deploy.check_images([dict(images[0], file=images[0]['file'] + ".missing")])
+
+
+def test_deploy_plan_loads_resource_table_last(images):
+    source = {
+        'name': "rtos",
+        'config': b"config",
+        'images': images,
+        'rsc_table': {'name': "resource table", 'addr': 0x3000, 'data': b"table"},
+    }
+    plan = cell_deploy.deploy_plan(source, [cell_deploy.read_image(image) for image in images], start=False)
+    assert plan['name'] == "rtos" and plan['config'] == b"config"
+    assert plan['start'] is False and plan['replace'] is True
+    assert [(i['name'], i['addr'], len(i['data'])) for i in plan['images']] == [
+        ("A", 0x1000, 0x100), ("B", 0x2000, 0x10), ("resource table", 0x3000, 5)]
+    assert len(source['images']) == 2
+
+    with pytest.raises(DeployError):
+        cell_deploy.read_image(dict(images[0], file=images[0]['file'] + ".missing"))
+
+
+def test_read_linux(tmp_path):
+    kernel = tmp_path / "Image"
+    kernel.write_bytes(b"kernel")
+    ramdisk = tmp_path / "rootfs.cpio"
+    ramdisk.write_bytes(CpioUtil.header(CpioUtil.TRAILER, 0, 0, 0, 0))
+    overlay = tmp_path / "app"
+    overlay.write_bytes(b"app")
+    source = {
+        'name': "linux",
+        'config': b"config",
+        'kernel': str(kernel),
+        'devicetree': None,
+        'dtb': b"generated",
+        'ramdisk': str(ramdisk),
+        'overlay': [str(overlay)],
+        'bootargs': "console=ttyAMA0",
+    }
+    linux = cell_deploy.read_linux(source)
+    assert linux['kernel'] == b"kernel" and linux['dtb'] == b"generated"
+    assert linux['bootargs'] == "console=ttyAMA0"
+    assert b"app\0" in linux['ramdisk']
+
+    source['overlay'] = [str(tmp_path / "missing")]
+    with pytest.raises(DeployError, match="append"):
+        cell_deploy.read_linux(source)
+
+
+class FakeClient(object):
+    def __init__(self, cells):
+        self.cells = cells
+        self.calls = list()
+
+    def list_cell(self):
+        return RPCApi.Result(True, result=self.cells)
+
+    def destroy_cell(self, name):
+        self.calls.append(('destroy', name))
+
+    def jailhouse_disable(self):
+        self.calls.append(('disable',))
+        return RPCApi.Result(True)
+
+    def jailhouse_enable(self, config):
+        self.calls.append(('enable', config))
+        return RPCApi.Result(True)
+
+    def start_uart_server(self, jhr):
+        self.calls.append(('uart', jhr))
+        return RPCApi.Result(True)
+
+    def run_linux(self, *args):
+        self.calls.append(('run_linux',) + args)
+        return RPCApi.Result(True)
+
+
+def test_run_linux_replaces_existing_cell():
+    client = FakeClient([{'id': 0, 'name': "root"}, {'id': 1, 'name': "linux"}])
+    linux = {'kernel': b"k", 'dtb': b"d", 'ramdisk': None, 'bootargs': ""}
+    assert cell_deploy.run_linux(client, "linux", b"config", linux)
+    assert client.calls == [('destroy', "linux"), ('run_linux', b"config", b"k", b"d", None, "")]
+
+
+def test_enable_hypervisor():
+    client = FakeClient([{'id': 0, 'name': "root"}])
+    steps = list()
+    root = {'config': b"root", 'jhr': "{}"}
+    assert cell_deploy.enable_hypervisor(client, root, step=lambda *args: steps.append(args))
+    assert client.calls == [('disable',), ('enable', b"root"), ('uart', "{}")]
+    assert [s[2] for s in steps] == ["disable", "enable", "start uart server"]
+
+    client = FakeClient([])
+    assert cell_deploy.enable_hypervisor(client, root, start_uart=False)
+    assert client.calls == [('enable', b"root")]
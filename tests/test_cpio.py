@@ -0,0 +1,176 @@
+import os
+import stat
+
+import pytest
+
+from utils import CpioUtil
+
+
+def parse_newc(data: bytes) -> dict:
+    """ {文件名: (mode, 内容)}, 不含TRAILER!!! """
+    entries = dict()
+    offset = 0
+    while True:
+        header = data[offset:offset+CpioUtil.HEADER_SIZE]
+        assert header[:6] == b'070701'
+        mode = int(header[14:22], 16)
+        filesize = int(header[54:62], 16)
+        namesize = int(header[94:102], 16)
+        offset += CpioUtil.HEADER_SIZE
+        name = data[offset:offset+namesize].rstrip(b'\0').decode()
+        offset = CpioUtil._align(offset + namesize)
+        if name == CpioUtil.TRAILER:
+            return entries
+        entries[name] = (mode, data[offset:offset+filesize])
+        offset = CpioUtil._align(offset + filesize)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / "ramdisk.cpio"
+    path.write_bytes(CpioUtil.header(CpioUtil.TRAILER, 0, 0, 0, 0))
+    return str(path)
+
+
+@pytest.mark.skipif(os.name != 'posix', reason="需要POSIX文件权限")
+def test_append_file_keeps_permission_bits(tmp_path, archive):
+    script = tmp_path / "start.sh"
+    script.write_bytes(b"#!/bin/sh\n")
+    os.chmod(str(script), 0o755)
+    private = tmp_path / "key"
+    private.write_bytes(b"secret")
+    os.chmod(str(private), 0o600)
+
+    cpio = CpioUtil(archive)
+    assert cpio.append_file("start.sh", str(script))
+    assert cpio.append_file("/etc/key", str(private))
+    entries = parse_newc(cpio.get_bytes())
+    assert entries["start.sh"] == (stat.S_IFREG | 0o755, b"#!/bin/sh\n")
+    assert entries["etc/key"] == (stat.S_IFREG | 0o600, b"secret")
+
+
+def test_append_data_uses_default_mode(archive):
+    cpio = CpioUtil(archive)
+    assert cpio.append("config.txt", b"abc")
+    data = cpio.get_bytes()
+    assert len(data) % CpioUtil.BLOCK_SIZE == 0
+    assert parse_newc(data) == {"config.txt": (stat.S_IFREG | 0o644, b"abc")}
+
+
+def parse_all(data: bytes) -> list:
+    """ [(文件名, inode, mode, 内容) ...], 包含TRAILER!!!, 解析到数据末尾 """
+    entries = list()
+    offset = 0
+    while offset + CpioUtil.HEADER_SIZE <= len(data) and data[offset:offset+6] == b'070701':
+        header = data[offset:offset+CpioUtil.HEADER_SIZE]
+        ino = int(header[6:14], 16)
+        mode = int(header[14:22], 16)
+        filesize = int(header[54:62], 16)
+        namesize = int(header[94:102], 16)
+        offset += CpioUtil.HEADER_SIZE
+        name = data[offset:offset+namesize].rstrip(b'\0').decode()
+        offset = CpioUtil._align(offset + namesize)
+        entries.append((name, ino, mode, data[offset:offset+filesize]))
+        offset = CpioUtil._align(offset + filesize)
+    # TRAILER!!!之后只有补齐的0
+    assert not data[offset:].strip(b'\0')
+    return entries
+
+
+# 原归档的条目, inode号不连续, 包含目录和符号链接
+BASE_ENTRIES = [
+    (".", 300, stat.S_IFDIR | 0o755, b""),
+    ("bin", 301, stat.S_IFDIR | 0o755, b""),
+    ("bin/busybox", 1207, stat.S_IFREG | 0o755, b"\x7fELF" + bytes(range(256)) * 3),
+    ("bin/sh", 302, stat.S_IFLNK | 0o777, b"busybox"),
+    ("init", 15, stat.S_IFREG | 0o755, b"#!/bin/sh\nexec /bin/sh\n"),
+    ("etc/hostname", 9, stat.S_IFREG | 0o644, b"jailhouse\n"),
+]
+
+
+def make_newc(entries) -> bytes:
+    data = b''
+    for name, ino, mode, content in entries:
+        data += CpioUtil.header(name, len(content), ino, 1700000000, mode)
+        data += content + bytes(CpioUtil._align(len(content)) - len(content))
+    data += CpioUtil.header(CpioUtil.TRAILER, 0, 0, 0, 0)
+    return data + bytes(-len(data) % CpioUtil.BLOCK_SIZE)
+
+
+@pytest.fixture
+def base_archive(tmp_path):
+    path = tmp_path / "rootfs.cpio"
+    path.write_bytes(make_newc(BASE_ENTRIES))
+    return str(path)
+
+
+def append_files(tmp_path, cpio: CpioUtil):
+    app = tmp_path / "app"
+    app.write_bytes(b"app" * 1000)
+    assert cpio.append_file("/usr/bin/app", str(app))
+    assert cpio.append("etc/app.conf", b"x=1\n")
+    assert cpio.append("empty", b"")
+
+
+def test_append_to_archive_with_entries(tmp_path, base_archive):
+    cpio = CpioUtil(base_archive)
+    append_files(tmp_path, cpio)
+    data = cpio.get_bytes()
+    assert len(data) % CpioUtil.BLOCK_SIZE == 0
+
+    entries = parse_all(data)
+    names = [e[0] for e in entries]
+    # 原条目保持不变, 新条目在原TRAILER!!!的位置
+    assert entries[:len(BASE_ENTRIES)] == BASE_ENTRIES
+    assert names[len(BASE_ENTRIES):] == ["usr/bin/app", "etc/app.conf", "empty", CpioUtil.TRAILER]
+    assert names.count(CpioUtil.TRAILER) == 1
+
+    inodes = [e[1] for e in entries[:-1]]
+    assert len(set(inodes)) == len(inodes)
+    max_ino = max(e[1] for e in BASE_ENTRIES)
+    assert [e[1] for e in entries[len(BASE_ENTRIES):-1]] == [max_ino + 1, max_ino + 2, max_ino + 3]
+
+    assert entries[len(BASE_ENTRIES)][3] == b"app" * 1000
+    assert entries[len(BASE_ENTRIES)+1][3] == b"x=1\n"
+    assert entries[len(BASE_ENTRIES)+2][3] == b""
+
+    # 保存的文件与get_bytes相同, 可以继续追加
+    out = tmp_path / "out.cpio"
+    assert cpio.save_as(str(out))
+    assert out.read_bytes() == data
+    again = CpioUtil(str(out))
+    assert again.append("more", b"1")
+    entries = parse_all(again.get_bytes())
+    assert [e[0] for e in entries].count(CpioUtil.TRAILER) == 1
+    assert entries[-2][:2] == ("more", max_ino + 4)
+
+
+def test_append_to_compressed_archive(tmp_path):
+    import gzip
+
+    gz = gzip.compress(make_newc(BASE_ENTRIES))
+    # 长度不是4的倍数, 新归档前需要补齐
+    compressed = gz + b"\0" * ((4 - len(gz) % 4) % 4 + 1)
+    path = tmp_path / "rootfs.cpio.gz"
+    path.write_bytes(compressed)
+
+    cpio = CpioUtil(str(path))
+    append_files(tmp_path, cpio)
+    data = cpio.get_bytes()
+    assert len(data) % CpioUtil.BLOCK_SIZE == 0
+
+    # 原文件内容不变, 新归档从4字节对齐的位置开始
+    assert data[:len(compressed)] == compressed
+    start = CpioUtil._align(len(compressed))
+    assert not data[len(compressed):start].strip(b'\0')
+    assert gzip.decompress(gz) == make_newc(BASE_ENTRIES)
+
+    entries = parse_all(data[start:])
+    assert [e[0] for e in entries] == ["usr/bin/app", "etc/app.conf", "empty", CpioUtil.TRAILER]
+    inodes = [e[1] for e in entries[:-1]]
+    assert len(set(inodes)) == len(inodes)
+
+
+def test_no_entries_copies_archive(base_archive):
+    with open(base_archive, "rb") as f:
+        assert CpioUtil(base_archive).get_bytes() == f.read()
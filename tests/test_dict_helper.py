@@ -0,0 +1,268 @@
+import os
+import enum
+import copy
+import logging
+import traceback
+from inspect import isclass
+
+import pytest
+
+from jh_resource import DictHelper, Resource, ResourceMgr, PlatformMgr
+import jhr_cache
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def interpret(items, obj, value) -> bool:
+    """ 逐项解释items的参考实现, 与编译前的DictHelper.from_dict相同 """
+    logger = DictHelper.logger
+    for item in items:
+        keys = item.keys
+        if isinstance(keys, str):
+            keys = keys.split('.')
+
+        if not isinstance(keys, (list, tuple)):
+            logger.error("items error {keys}")
+            return False
+
+        v = value
+        for key in keys:
+            if not isinstance(v, dict):
+                logger.error(f"[{key}] not a dict")
+                traceback.print_stack()
+                return False
+            v = v.get(key)
+
+        if v is None and not item.require:
+            logger.debug(f"{keys} not found, ignore")
+            continue
+
+        if isclass(item.types) and issubclass(item.types, enum.Enum):
+            enum_type = item.types
+            enum_value = None
+            for name in enum_type.__members__:
+                if v.upper() == name.upper():
+                    enum_value = enum_type.__members__[name]
+                    break
+            if enum_value is None:
+                logger.error(f'unknown enum value {v} for type {enum_type}')
+                return False
+            v = enum_value
+
+        if not isinstance(v, item.types):
+            logger.error(f'[{item.keys}]({v}) type error expect {item.types} but {type(v)}: {value}')
+            return False
+
+        ret = item.set(obj, v)
+        if not ret:
+            return ret
+
+    return True
+
+
+class Color(enum.Enum):
+    RED = 'red'
+    Green = 'green'
+    green = 'light green'
+
+
+class Sample(object):
+    items = [
+        DictHelper.Item("name", str, *DictHelper.common_getset("name")),
+        DictHelper.Item("color", Color, *DictHelper.common_getset("color")),
+        DictHelper.Item("size", (str, int), *DictHelper.size_getset("size")),
+        DictHelper.Item("a.b.c", int, *DictHelper.common_getset("abc")),
+        DictHelper.Item(["a", "flag"], bool, *DictHelper.common_getset("flag"), False),
+        DictHelper.Item("comment", str, *DictHelper.common_getset("comment"), False),
+        DictHelper.Item("mode", Color, *DictHelper.common_getset("mode"), False),
+    ]
+
+    def __init__(self):
+        self.name = ''
+        self.color = Color.RED
+        self.size = 0
+        self.abc = 0
+        self.flag = False
+        self.comment = None
+        self.mode = None
+
+
+class SlotSample(object):
+    """ 没有__dict__的对象, 编译的加载函数不能直接赋值 """
+    __slots__ = ('name', 'size')
+    items = [
+        DictHelper.Item("name", str, *DictHelper.common_getset("name")),
+        DictHelper.Item("size", (str, int), *DictHelper.size_getset("size")),
+    ]
+
+    def __init__(self):
+        self.name = ''
+        self.size = 0
+
+
+class Missing(object):
+    """ 属性不存在或为函数时由设置函数报告错误 """
+    items = [
+        DictHelper.Item("name", str, *DictHelper.common_getset("name")),
+        DictHelper.Item("run", str, *DictHelper.common_getset("run")),
+    ]
+
+    def __init__(self):
+        self.name = ''
+        self.run = lambda: None
+
+
+def state(obj):
+    if hasattr(obj, '__dict__'):
+        return {k: v for k, v in vars(obj).items() if not callable(v)}
+    return {k: getattr(obj, k) for k in obj.__slots__}
+
+
+def check(cls, value):
+    expect = cls()
+    try:
+        expect_ret = interpret(cls.items, expect, copy.deepcopy(value))
+    except Exception as e:
+        # 解释执行抛出的异常(如缺少必需的枚举值), 编译后保持一致
+        with pytest.raises(type(e)):
+            DictHelper.compile(cls.items)(cls(), copy.deepcopy(value))
+        return e, None
+    obj = cls()
+    ret = DictHelper.compile(cls.items)(obj, copy.deepcopy(value))
+    assert ret == expect_ret
+    assert state(obj) == state(expect)
+    # from_dict使用缓存的加载函数
+    obj = cls()
+    assert DictHelper.from_dict(cls.items, obj, copy.deepcopy(value)) == expect_ret
+    assert state(obj) == state(expect)
+    return ret, obj
+
+
+FULL = {'name': "x", 'color': "green", 'size': "4KB", 'a': {'b': {'c': 3}, 'flag': True},
+        'comment': "c", 'mode': "Red"}
+
+
+def with_value(**kwargs):
+    value = copy.deepcopy(FULL)
+    for key, v in kwargs.items():
+        value[key] = v
+    return value
+
+
+def test_full():
+    ret, obj = check(Sample, FULL)
+    assert ret
+    assert obj.color is Color.Green
+    assert obj.mode is Color.RED
+    assert (obj.size, obj.abc, obj.flag) == (4096, 3, True)
+
+
+@pytest.mark.parametrize("v, expect", [
+    ("red", Color.RED), ("RED", Color.RED), ("gReEn", Color.Green), ("GREEN", Color.Green),
+])
+def test_enum_case_insensitive(v, expect):
+    ret, obj = check(Sample, with_value(color=v))
+    assert ret and obj.color is expect
+
+
+def test_unknown_enum():
+    ret, _ = check(Sample, with_value(color="blue"))
+    assert not ret
+
+
+@pytest.mark.parametrize("v, expect", [
+    ("4KB", 4096), ("2MB", 2*1024*1024), ("1GB", 1024**3), (0x1000, 0x1000), ("0KB", 0),
+    ("4kb", None), ("2M", None), ("xMB", None), (1.5, None),
+])
+def test_size(v, expect):
+    ret, obj = check(Sample, with_value(size=v))
+    assert ret == (expect is not None)
+    if ret:
+        assert obj.size == expect
+
+
+@pytest.mark.parametrize("a", [
+    {'b': {'c': 7}},
+    {'b': {'c': 7}, 'flag': False},
+    {'b': {}},
+    {'b': 5},
+    {},
+    7,
+    None,
+])
+def test_nested_keys(a):
+    value = with_value(a=a)
+    if a is None:
+        del value['a']
+    check(Sample, value)
+
+
+@pytest.mark.parametrize("missing", ["name", "color", "size", "comment", "mode"])
+def test_missing_key(missing):
+    value = copy.deepcopy(FULL)
+    del value[missing]
+    ret, _ = check(Sample, value)
+    if missing == "color":
+        assert isinstance(ret, AttributeError)
+    else:
+        assert ret == (missing in ("comment", "mode"))
+
+
+@pytest.mark.parametrize("key, v", [
+    ("name", 1), ("name", None), ("size", [1]), ("comment", 1), ("flag", "yes"), ("abc", "3"),
+])
+def test_wrong_type(key, v):
+    value = copy.deepcopy(FULL)
+    if key == "flag":
+        value['a']['flag'] = v
+    elif key == "abc":
+        value['a']['b']['c'] = v
+    else:
+        value[key] = v
+    ret, _ = check(Sample, value)
+    assert not ret
+
+
+@pytest.mark.parametrize("value", [None, [], "name", 1])
+def test_not_a_dict(value):
+    ret, _ = check(Sample, value)
+    assert not ret
+
+
+def test_empty_items_accept_anything():
+    assert DictHelper.compile([])(object(), None) == interpret([], object(), None)
+
+
+@pytest.mark.parametrize("value", [{'name': "x", 'size': "2MB"}, {'name': "x", 'size': "2"}, {'size': 1}])
+def test_object_without_dict(value):
+    check(SlotSample, value)
+
+
+@pytest.mark.parametrize("value", [{'name': "x", 'run': "y"}, {'name': "x"}])
+def test_function_attr(value):
+    ret, _ = check(Missing, value)
+    assert not ret
+
+
+@pytest.mark.parametrize("sample", [
+    os.path.join("demos", "qemu.jhr"),
+    os.path.join("examples", "D2000_rtt.jhr"),
+])
+def test_sample_resource(sample, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(PlatformMgr, "use_cache", False)
+    PlatformMgr.get_instance().load("platform")
+    value = jhr_cache.read_jhr(sample, use_cache=False)
+
+    compiled = Resource("compiled", ResourceMgr.get_instance())
+    assert compiled.from_dict(copy.deepcopy(value))
+
+    with monkeypatch.context() as m:
+        m.setattr(DictHelper, "from_dict", classmethod(lambda cls, items, obj, v: interpret(items, obj, v)))
+        interpreted = Resource("interpreted", ResourceMgr.get_instance())
+        assert interpreted.from_dict(copy.deepcopy(value))
+        expect = interpreted.to_dict()
+
+    assert expect is not None
+    assert compiled.to_dict() == expect
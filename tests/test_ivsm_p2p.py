@@ -0,0 +1,104 @@
+import ctypes
+
+import pytest
+
+import ivsm_p2p
+from ivsm_p2p import IvsmP2P, IvsmP2PLibrary, FakeIvsmP2PLibrary, GuestStatus
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ivsm_p2p.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def fake(monkeypatch, clock):
+    lib = FakeIvsmP2PLibrary()
+    monkeypatch.setattr(IvsmP2P, "lib", None)
+    monkeypatch.setattr(IvsmP2P, "_status", (GuestStatus * IvsmP2P.max_guests)())
+    monkeypatch.setattr(IvsmP2P, "_status_count", 0)
+    monkeypatch.setattr(IvsmP2P, "_status_time", 0.0)
+    assert IvsmP2P.init(lib)
+    return lib
+
+
+def test_all_guestos_status_uses_one_batch_call(fake):
+    fake.set_guest(0, True, 1024, 512, 30)
+    fake.set_guest(3, True, 2048, 1024, 70)
+
+    status = IvsmP2P.all_guestos_status()
+    assert fake.calls == 1
+    assert len(status) == fake.count
+    assert status[0].to_dict() == {"online": 1, "mem_total": 1024, "mem_used": 512, "cpu_load": 30}
+    assert status[3].cpu_load == 70
+    assert not status[1].online
+
+    assert IvsmP2P.guestos_status(3).mem_used == 1024
+    assert IvsmP2P.guestos_status(fake.count) is None
+    assert fake.calls == 1
+
+
+def test_all_guestos_status_cached_for_cache_time(fake, clock):
+    fake.set_guest(0, True, cpu_load=10)
+    assert IvsmP2P.guestos_status(0).cpu_load == 10
+
+    fake.set_guest(0, True, cpu_load=90)
+    clock.now += IvsmP2P.cache_time / 2
+    assert IvsmP2P.guestos_status(0).cpu_load == 10
+    assert fake.calls == 1
+
+    clock.now += IvsmP2P.cache_time
+    assert IvsmP2P.guestos_status(0).cpu_load == 90
+    assert fake.calls == 2
+
+
+def test_all_guestos_status_returns_copies(fake):
+    fake.set_guest(0, True, cpu_load=10)
+    status = IvsmP2P.all_guestos_status()
+    status[0].cpu_load = 99
+    assert IvsmP2P.guestos_status(0).cpu_load == 10
+
+
+class FakeSo(object):
+    """ 没有ivsm_p2p_guestos_status_all的旧版本库 """
+    def __init__(self, guests):
+        self.guests = guests
+
+    def ivsm_p2p_guestos_status(self, target, status):
+        if target not in self.guests:
+            return -1
+        ctypes.pointer(status)[0] = self.guests[target]
+        return 0
+
+
+def test_library_fallback_zeroes_failed_guests():
+    lib = IvsmP2PLibrary("libjhtool.so")
+    lib._so = FakeSo({
+        0: GuestStatus(1, 1024, 512, 30),
+        2: GuestStatus(1, 2048, 1024, 70),
+    })
+    status = (GuestStatus * 8)()
+    for i in range(8):
+        status[i] = GuestStatus(1, 4096, 4096, 100)
+
+    assert lib.guestos_status_all(status, 8) == 3
+    assert status[0].to_dict() == {"online": 1, "mem_total": 1024, "mem_used": 512, "cpu_load": 30}
+    assert status[1].to_dict() == {"online": 0, "mem_total": 0, "mem_used": 0, "cpu_load": 0}
+    assert status[2].cpu_load == 70
+
+
+def test_library_fallback_no_guest_answered():
+    lib = IvsmP2PLibrary("libjhtool.so")
+    lib._so = FakeSo({})
+    status = (GuestStatus * 8)()
+    assert lib.guestos_status_all(status, 8) == 0
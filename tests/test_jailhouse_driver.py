@@ -0,0 +1,168 @@
+import os
+import struct
+
+import pytest
+
+from api import RPCApi
+from jailhouse import Jailhouse
+from jailhouse_driver import JailhouseDriver, FakeJailhouseDevice, JAILHOUSE_CELL_CREATE
+
+
+def make_config(name: str) -> bytes:
+    """ jailhouse_cell_desc头部: signature[6], revision, name[32] """
+    return b'JHCELL' + struct.pack("<H", 13) + name.encode().ljust(32, b'\0') + bytes(64)
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    device = FakeJailhouseDevice()
+    monkeypatch.setattr(Jailhouse, "use_driver", True)
+    monkeypatch.setattr(Jailhouse, "_driver", JailhouseDriver(device))
+    monkeypatch.setattr(Jailhouse, "_cell_ids", dict())
+    return device
+
+
+@pytest.fixture
+def commands(monkeypatch):
+    """ 记录jailhouse命令, 不实际执行 """
+    cmds = list()
+
+    def run_command(cmd):
+        cmds.append(cmd)
+        return RPCApi.Result(True, result="")
+    monkeypatch.setattr(Jailhouse, "run_command", run_command)
+    return cmds
+
+
+@pytest.fixture
+def sysfs(tmp_path, monkeypatch, commands):
+    """ 驱动不可用, 从sysfs读取cell列表 """
+    root = tmp_path / "jailhouse"
+    (root / "cells").mkdir(parents=True)
+    monkeypatch.setattr(Jailhouse, "use_driver", False)
+    monkeypatch.setattr(Jailhouse, "_cell_ids", dict())
+    monkeypatch.setattr(Jailhouse, "jh_sysfs", str(root))
+    monkeypatch.setattr(Jailhouse, "jh_sysfs_cells", str(root / "cells"))
+    return root / "cells"
+
+
+def write_cell(cells, cell_id: int, name: str, state: str = "running", cpus: str = "1"):
+    path = cells / str(cell_id)
+    path.mkdir(exist_ok=True)
+    (path / "name").write_text(name + "\n")
+    (path / "state").write_text(state + "\n")
+    (path / "cpus_assigned_list").write_text(cpus + "\n")
+
+
+def test_driver_cell_lifecycle(fake):
+    driver = JailhouseDriver(fake)
+    assert driver.open()
+
+    assert driver.create_cell(make_config("linux"))
+    assert fake.calls == [JAILHOUSE_CELL_CREATE]
+    assert [c['name'] for c in driver.list_cell()] == ["root", "linux"]
+    r = driver.create_cell(make_config("linux"))
+    assert not r and "create cell failed" in r.message
+
+    assert driver.load_cell("linux", [(0x80000000, b'kernel'), (0x90000000, b'dtb')])
+    assert fake.cells[1]['images'] == [(0x80000000, b'kernel'), (0x90000000, b'dtb')]
+    assert driver.start_cell("linux")
+    assert fake.cells[1]['status'] == "running"
+    assert driver.shutdown_cell("linux")
+    assert fake.cells[1]['status'] == "shut down"
+    assert fake.cells[1]['images'] == []
+
+    assert driver.destroy_cell("linux")
+    assert 1 not in fake.cells
+    assert not driver.start_cell("linux")
+    assert not driver.destroy_cell("root")
+    assert not driver.load_cell("x" * 32, [])
+
+
+def test_jailhouse_uses_driver(fake, commands):
+    assert Jailhouse.create_cell(make_config("linux"))
+    assert Jailhouse.load_cell("linux", 0x80000000, b'kernel')
+    assert Jailhouse.start_cell("linux")
+    assert Jailhouse.list_cell().result[1] == {'id': 1, 'name': "linux", 'status': "running", 'cpus': ''}
+    assert Jailhouse.stop_cell("linux")
+    assert Jailhouse.destroy_cell("linux")
+    assert [c['name'] for c in Jailhouse.list_cell().result] == ["root"]
+    assert commands == []
+
+
+def test_deploy_cell_through_driver(fake, commands):
+    r = Jailhouse.deploy_cell("linux", make_config("linux"), [(0x80000000, b'kernel')])
+    assert r and r.result == ["create", "load", "start"]
+    assert fake.cells[1]['status'] == "running"
+
+    r = Jailhouse.deploy_cell("linux", make_config("linux"), [(0x80000000, b'kernel2')], start=False)
+    assert r and r.result == ["destroy", "create", "load"]
+    assert [c['name'] for c in fake.cells.values()] == ["root", "linux"]
+    assert not Jailhouse.deploy_cell("linux", make_config("linux"), [], replace=False)
+    assert commands == []
+
+@pytest.mark.parametrize("config", [make_config("acore"), b'JHCELL'], ids=["mismatch", "truncated"])
+def test_deploy_cell_rejects_config_name_mismatch(fake, config):
+    r = Jailhouse.deploy_cell("linux", config, [(0x80000000, b'kernel')])
+    assert not r and "failed at check" in r.message
+    assert r.result == []
+    assert fake.calls == []
+    assert [c['name'] for c in fake.cells.values()] == ["root"]
+
+
+def test_list_cell_sysfs_fallback(sysfs, commands):
+    write_cell(sysfs, 0, "root", cpus="0-1")
+    write_cell(sysfs, 2, "acore", state="shut down", cpus="3")
+    write_cell(sysfs, 1, "linux", cpus="2")
+    (sysfs / "3").mkdir()               # 读取过程中被销毁的cell
+    (sysfs / "2" / "cpus_assigned_list").unlink()
+    (sysfs / "2" / "cpus_assigned").write_text("8\n")
+
+    r = Jailhouse.list_cell()
+    assert r.result == [
+        {'id': 0, 'name': "root", 'status': "running", 'cpus': "0-1"},
+        {'id': 1, 'name': "linux", 'status': "running", 'cpus': "2"},
+        {'id': 2, 'name': "acore", 'status': "shut down", 'cpus': "8"},
+    ]
+    assert commands == []
+
+
+def test_find_cell_id_revalidates_cache(sysfs):
+    write_cell(sysfs, 0, "root")
+    write_cell(sysfs, 1, "linux")
+    assert Jailhouse.find_cell_id("linux") == 1
+    assert Jailhouse._cell_ids == {"linux": 1}
+
+    # 其他程序销毁了cell, 同一个id被新的cell使用
+    write_cell(sysfs, 1, "acore")
+    assert Jailhouse.find_cell_id("linux") is None
+    assert Jailhouse.find_cell_id("acore") == 1
+
+
+@pytest.mark.parametrize("op", [
+    lambda: Jailhouse.create_cell(make_config("acore")),
+    lambda: Jailhouse.destroy_cell("linux"),
+    lambda: Jailhouse.enable(make_config("root")),
+    lambda: Jailhouse.disable(),
+])
+def test_commands_invalidate_cell_ids(sysfs, tmp_path, monkeypatch, commands, op):
+    dev = tmp_path / "jailhouse_dev"
+    dev.write_bytes(b'')
+    monkeypatch.setattr(Jailhouse, "jh_dev", str(dev))
+    write_cell(sysfs, 0, "root")
+    write_cell(sysfs, 1, "linux")
+    assert Jailhouse.find_cell_id("linux") == 1
+
+    assert op()
+    assert Jailhouse._cell_ids == {}
+    assert commands
+
+
+def test_driver_invalidates_cell_ids(fake):
+    Jailhouse._cell_ids["linux"] = 1
+    assert Jailhouse.create_cell(make_config("linux"))
+    assert Jailhouse._cell_ids == {}
+
+    Jailhouse._cell_ids["linux"] = 1
+    assert Jailhouse.destroy_cell("linux")
+    assert Jailhouse._cell_ids == {}
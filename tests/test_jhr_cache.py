@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+
+import pytest
+
+msgpack = pytest.importorskip("msgpack")
+
+import jhr_cache
+
+
+JSON_VALUE = {'name': "json", 'cells': [1, 2, 3]}
+CACHE_VALUE = {'name': "cache", 'cells': [1, 2, 3]}
+
+
+@pytest.fixture
+def jhr(tmp_path):
+    path = tmp_path / "test.jhr"
+    path.write_bytes(json.dumps(JSON_VALUE).encode('utf-8'))
+    return str(path)
+
+
+def digest_of(filename) -> str:
+    with open(filename, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def write_sidecar(filename, data: bytes, age_ns: int = 0):
+    """ 写入缓存文件, age_ns>0时缓存比JSON旧 """
+    path = jhr_cache.cache_path(filename)
+    with open(path, "wb") as f:
+        f.write(data)
+    mtime = os.stat(filename).st_mtime_ns - age_ns
+    os.utime(path, ns=(mtime, mtime))
+    return path
+
+
+def test_valid_sidecar_is_used(jhr):
+    write_sidecar(jhr, jhr_cache.pack(CACHE_VALUE, digest_of(jhr)))
+    assert jhr_cache.read_jhr(jhr) == CACHE_VALUE
+    assert jhr_cache.read_jhr(jhr, use_cache=False) == JSON_VALUE
+
+
+def test_sidecar_older_than_json_is_ignored(jhr):
+    write_sidecar(jhr, jhr_cache.pack(CACHE_VALUE, digest_of(jhr)), age_ns=10**9)
+    assert jhr_cache.read_jhr(jhr) == JSON_VALUE
+
+
+def test_sidecar_hash_mismatch_is_ignored(jhr):
+    path = write_sidecar(jhr, jhr_cache.pack(CACHE_VALUE, hashlib.sha256(b"other").hexdigest()))
+    assert jhr_cache.read_jhr(jhr) == JSON_VALUE
+    # 缓存按JSON重新生成
+    with open(path, "rb") as f:
+        assert jhr_cache.unpack(f.read()) == (digest_of(jhr), JSON_VALUE)
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda data: data[:len(data)//2],
+    lambda data: b"\xc1" + data[1:],
+    lambda data: b"",
+    lambda data: msgpack.packb([1, 2, 3]),
+])
+def test_corrupt_sidecar_falls_back_to_json(jhr, corrupt):
+    path = write_sidecar(jhr, corrupt(jhr_cache.pack(CACHE_VALUE, digest_of(jhr))))
+    assert jhr_cache.read_jhr(jhr) == JSON_VALUE
+    with open(path, "rb") as f:
+        assert jhr_cache.unpack(f.read()) == (digest_of(jhr), JSON_VALUE)
+
+
+def test_write_cache_after_save(jhr):
+    assert jhr_cache.write_cache(jhr, CACHE_VALUE)
+    assert jhr_cache.read_jhr(jhr) == CACHE_VALUE
+
+    # 外部修改JSON后缓存失效
+    with open(jhr, "wb") as f:
+        f.write(json.dumps({'name': "edited"}).encode('utf-8'))
+    assert jhr_cache.read_jhr(jhr) == {'name': "edited"}
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("sample", [
+    os.path.join("demos", "qemu.jhr"),
+    os.path.join("examples", "D2000_rtt.jhr"),
+])
+def test_sample_round_trip(sample, monkeypatch):
+    """ 与jh_resource.py cache-check相同: JSON -> msgpack -> dict -> Resource -> dict """
+    from jh_resource import Resource, ResourceMgr, PlatformMgr
+
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(PlatformMgr, "use_cache", False)
+    PlatformMgr.get_instance().load("platform")
+
+    value = jhr_cache.read_jhr(sample, use_cache=False)
+    digest, cached = jhr_cache.unpack(jhr_cache.pack(value, "check"))
+    assert digest == "check"
+    assert cached == value
+    assert not os.path.exists(jhr_cache.cache_path(sample))
+
+    from_json = Resource("json", ResourceMgr.get_instance())
+    assert from_json.from_dict(value)
+    from_cache = Resource("cache", ResourceMgr.get_instance())
+    assert from_cache.from_dict(cached)
+    rsc_value = from_cache.to_dict()
+    assert rsc_value is not None
+    assert rsc_value == from_json.to_dict()
+
+    again = jhr_cache.unpack(jhr_cache.pack(rsc_value, "check"))[1]
+    assert again == rsc_value
+    assert json.loads(json.dumps(rsc_value)) == again
@@ -0,0 +1,237 @@
+import os
+import struct
+
+import pytest
+
+from pci_device import PCIDevice, PCIIds
+
+
+def make_config(vendor=0x8086, device=0x1234, classcode=0x0200, command=0x0006) -> bytes:
+    config = bytearray(4096)
+    struct.pack_into("<HHH", config, 0, vendor, device, command)
+    struct.pack_into("<H", config, 0x0A, classcode)
+    return bytes(config)
+
+
+def make_resource(bar0=0xfe000000) -> str:
+    lines = [f"0x{bar0:016x} 0x{bar0+0xfff:016x} 0x{0x40200:016x}"]
+    lines += ["0x0000000000000000 0x0000000000000000 0x0000000000000000"] * 6
+    return '\n'.join(lines) + '\n'
+
+
+def write_device(root, slot, config: bytes, resource: str):
+    path = os.path.join(root, slot)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'config'), 'wb') as f:
+        f.write(config)
+    with open(os.path.join(path, 'resource'), 'wt') as f:
+        f.write(resource)
+    return path
+
+
+@pytest.fixture
+def sysfs(tmp_path, monkeypatch):
+    ids = tmp_path / "pci.ids"
+    ids.write_text("8086  Intel Corporation\n\t1234  Test NIC\nC 02  Network controller\n\t00  Ethernet controller\n")
+    PCIIds.load(str(ids))
+
+    root = tmp_path / "devices"
+    root.mkdir()
+    monkeypatch.setattr(PCIDevice, "sysfs_devices", str(root))
+    PCIDevice.invalidate_cache()
+    yield str(root)
+    PCIDevice.invalidate_cache()
+
+
+def test_all_from_sysfs_reuses_unchanged_devices(sysfs):
+    write_device(sysfs, "0000:00:01.0", make_config(), make_resource())
+    first = PCIDevice.all_from_sysfs()
+    second = PCIDevice.all_from_sysfs()
+    assert len(first) == 1
+    assert first[0] is second[0]
+    assert first[0].name == "Ethernet controller: Intel Corporation Test NIC"
+
+
+def test_all_from_sysfs_reparses_changed_bar(sysfs):
+    write_device(sysfs, "0000:00:01.0", make_config(), make_resource(0xfe000000))
+    old = PCIDevice.all_from_sysfs()[0]
+
+    write_device(sysfs, "0000:00:01.0", make_config(), make_resource(0xfd000000))
+    new = PCIDevice.all_from_sysfs()[0]
+    assert new is not old
+    assert new.bars[0].start == 0xfd000000
+
+
+def test_all_from_sysfs_reparses_changed_config(sysfs):
+    write_device(sysfs, "0000:00:01.0", make_config(command=0x0006), make_resource())
+    old = PCIDevice.all_from_sysfs()[0]
+
+    write_device(sysfs, "0000:00:01.0", make_config(command=0x0406), make_resource())
+    assert PCIDevice.all_from_sysfs()[0] is not old
+    assert PCIDevice.all_from_sysfs(use_cache=False)[0] is not old
+
+
+def test_all_from_sysfs_drops_removed_devices(sysfs):
+    write_device(sysfs, "0000:00:01.0", make_config(), make_resource())
+    path = write_device(sysfs, "0000:00:02.0", make_config(device=0x5678), make_resource())
+    assert len(PCIDevice.all_from_sysfs()) == 2
+
+    os.remove(os.path.join(path, 'config'))
+    os.remove(os.path.join(path, 'resource'))
+    os.rmdir(path)
+    devices = PCIDevice.all_from_sysfs()
+    assert [os.path.basename(d.path) for d in devices] == ["0000:00:01.0"]
+    assert path not in PCIDevice._cache
+
+
+def test_inventory_reports_modified_device_as_changed(sysfs):
+    from pci_device import PCIInventory
+
+    write_device(sysfs, "0000:00:01.0", make_config(), make_resource(0xfe000000))
+    write_device(sysfs, "0000:00:02.0", make_config(device=0x5678), make_resource(0xfc000000))
+    inventory = PCIInventory()
+    generation = inventory.refresh(PCIDevice.all_from_sysfs())
+    value = inventory.since(inventory.id(), generation)
+    assert value['full'] is False and not value['changed']
+
+    write_device(sysfs, "0000:00:01.0", make_config(), make_resource(0xfd000000))
+    new_generation = inventory.refresh(PCIDevice.all_from_sysfs())
+    assert new_generation == generation + 1
+
+    value = inventory.since(inventory.id(), generation)
+    assert value['full'] is False
+    assert value['added'] == [] and value['removed'] == []
+    assert [os.path.basename(d['path']) for d in value['changed']] == ["0000:00:01.0"]
+    assert value['changed'][0]['bars'][0]['start'] == 0xfd000000
+
+
+# virtio-net: KVM虚拟机sysfs中读取的256字节config, 5个厂商cap和MSI-X
+# i210: 4KiB PCIe设备, 按Intel I210的lspci -xxxx布局, 包含PM/MSI/MSI-X/PCIe和扩展cap
+PCI_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "pci")
+VIRTIO_NET = os.path.join(PCI_DATA, "virtio-net")
+I210 = os.path.join(PCI_DATA, "i210")
+
+VIRTIO_NET_CAPS = [
+    ("VendorSpecific", 0x40, 2, False),
+    ("VendorSpecific", 0x50, 2, False),
+    ("VendorSpecific", 0x60, 2, False),
+    ("VendorSpecific", 0x70, 2, False),
+    ("VendorSpecific", 0x84, 2, False),
+    ("MSIX", 0x98, 12, False),
+]
+
+I210_CAPS = [
+    ("PM", 0x40, 8, False),
+    ("MSI", 0x50, 20, False),
+    ("MSIX", 0x70, 12, False),
+    ("PCIExpress", 0xa0, 60, False),
+    ("AER", 0x100, 64, True),
+    ("DevSerialNum", 0x140, 12, True),
+    ("TPHRequester", 0x1a0, 4, True),
+    ("LTR", 0x1c0, 8, True),
+    ("PTM", 0x1d0, 12, True),
+]
+
+
+def read_fixture(path, name='config'):
+    with open(os.path.join(path, name), 'rb') as f:
+        return f.read()
+
+
+def caps_of(dev):
+    return [(c.cap.name, c.start, c.len, c.extended) for c in dev.caps]
+
+
+def bars_of(dev):
+    return [(b.type.value, b.start, b.size) for b in dev.bars]
+
+
+def test_conventional_device_from_dump():
+    dev = PCIDevice.from_dump(VIRTIO_NET)
+    assert len(read_fixture(VIRTIO_NET)) == 256
+    assert dev.type is PCIDevice.Type.DEVICE
+    assert caps_of(dev) == VIRTIO_NET_CAPS
+    assert bars_of(dev)[0] == ("mem64", 0x4000000000, 0x80000)
+    assert all(t == "none" for t, _, _ in bars_of(dev)[1:])
+    assert (dev.msi_num, dev.msix_num) == (0, 5)
+    assert dev.msix_address == 0x4000008000
+    assert dev.msix_region_size == 0x1000
+
+
+def test_pcie_device_from_dump():
+    dev = PCIDevice.from_dump(os.path.join(I210, 'config'))
+    assert dev.path == I210
+    assert caps_of(dev) == I210_CAPS
+    assert bars_of(dev) == [
+        ("mem", 0xf7c00000, 0x20000),
+        ("none", 0, 0),
+        ("io", 0xe000, 0x20),
+        ("mem", 0xf7c20000, 0x4000),
+        ("none", 0, 0),
+        ("none", 0, 0),
+    ]
+    assert (dev.msi_num, dev.msi_64bits, dev.msi_maskable) == (1, 1, 1)
+    assert dev.msix_num == 5
+    assert dev.msix_address == 0xf7c20000
+    assert dev.msix_region_size == 0x1000
+
+
+def test_from_config_matches_from_dump():
+    config = read_fixture(I210)
+    resource = read_fixture(I210, 'resource').decode()
+    dev = PCIDevice.from_config(bytearray(config), resource, "/sys/bus/pci/devices/0000:03:00.0")
+    assert (dev.domain, dev.bus, dev.dev, dev.fun) == (0, 3, 0, 0)
+    assert caps_of(dev) == I210_CAPS
+    assert bars_of(dev) == bars_of(PCIDevice.from_dump(I210))
+    # cap内容为config的视图
+    assert bytes(dev.caps[0].content) == config[0x40:0x48]
+
+    # 没有resource时bar为空
+    dev = PCIDevice.from_config(config, None, "i210")
+    assert caps_of(dev) == I210_CAPS
+    assert bars_of(dev) == [("none", 0, 0)] * 6
+
+
+@pytest.mark.parametrize("size, count", [
+    (0x100, 4),   # 非root用户读取sysfs只有256字节, 不解析扩展cap
+    (0x104, 5),   # AER不读取内容
+    (0x103, 4),   # 扩展cap头不完整
+    (0x76, 2),    # MSI-X表偏移被截断
+    (0x51, 1),    # MSI头被截断
+])
+def test_truncated_caps(size, count):
+    dev = PCIDevice.from_config(read_fixture(I210)[:size], None, "i210")
+    assert caps_of(dev) == I210_CAPS[:count]
+
+
+def test_too_short_config_is_rejected():
+    assert PCIDevice.from_config(read_fixture(I210)[:0x3f], None, "i210") is None
+
+
+def test_cap_loop_guard():
+    config = bytearray(read_fixture(I210))
+    # PCIe cap的next指回PM, 最后一个扩展cap的next指回AER
+    config[0xa1] = 0x40
+    struct.pack_into("<I", config, 0x1d0, 0x001f | (1 << 16) | (0x100 << 20))
+    dev = PCIDevice.from_config(config, None, "i210")
+    assert caps_of(dev) == I210_CAPS
+
+
+def test_unknown_cap_loop_guard():
+    config = bytearray(read_fixture(I210))
+    # 未知cap的next指向自身
+    struct.pack_into("BB", config, 0xf0, 0x3f, 0xf0)
+    config[0xa1] = 0xf0
+    struct.pack_into("<I", config, 0x1d0, 0x001f | (1 << 16) | (0x200 << 20))
+    struct.pack_into("<I", config, 0x200, 0x07ff | (1 << 16) | (0x200 << 20))
+    dev = PCIDevice.from_config(config, None, "i210")
+    assert caps_of(dev) == I210_CAPS
+
+
+def test_benchmark_fixtures():
+    from pci_device import benchmark, BENCH_FIXTURES
+
+    assert os.path.samefile(BENCH_FIXTURES, PCI_DATA)
+    result = benchmark([VIRTIO_NET, os.path.join(I210, 'config')], count=10)
+    assert list(result) == [VIRTIO_NET, os.path.join(I210, 'config')]
+    assert all(us > 0 for us in result.values())
@@ -0,0 +1,184 @@
+import os
+import json
+import shutil
+
+import pytest
+
+from jh_resource import PlatformMgr
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CPU = "qemu_aarch64.toml"
+BOARD = "qemu_aarch64_virt.toml"
+DTS = "guestos.dts"
+
+
+@pytest.fixture
+def platform(tmp_path):
+    """ 复制平台目录, 并为cpu添加guest os设备树 """
+    path = tmp_path / "platform"
+    shutil.copytree(os.path.join(ROOT, "platform"), str(path),
+                    ignore=shutil.ignore_patterns(PlatformMgr.CATALOGUE_CACHE))
+    (path / DTS).write_text("/dts-v1/;\n/ {\n};\n")
+    index = (path / "index.toml").read_text()
+    index = index.replace('file   = "qemu_aarch64.toml"', f'file   = "{CPU}"\n    guestos-dts = "{DTS}"')
+    (path / "index.toml").write_text(index)
+    return str(path)
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """ 记录加载的cpu和开发板文件 """
+    loaded = list()
+    load_value = PlatformMgr.load_value.__func__
+
+    def _load_value(cls, filename, rsc_type):
+        loaded.append(os.path.basename(filename))
+        return load_value(cls, filename, rsc_type)
+    monkeypatch.setattr(PlatformMgr, "load_value", classmethod(_load_value))
+    monkeypatch.setattr(PlatformMgr, "use_cache", True)
+    return loaded
+
+
+def cache_of(platform):
+    return os.path.join(platform, PlatformMgr.CATALOGUE_CACHE)
+
+
+def load(platform) -> PlatformMgr:
+    mgr = PlatformMgr()
+    assert mgr.load(platform)
+    return mgr
+
+
+def touch(path, text="\n# changed\n"):
+    with open(path, "a") as f:
+        f.write(text)
+
+
+def test_first_load_writes_cache(platform, loads):
+    mgr = load(platform)
+    assert sorted(loads) == [CPU, BOARD]
+    assert os.path.isfile(cache_of(platform))
+
+    with open(cache_of(platform), "rb") as f:
+        catalogue = json.loads(f.read().decode('utf-8'))
+    assert catalogue['version'] == PlatformMgr.CATALOGUE_VERSION
+    assert sorted(catalogue['stamps']) == sorted(["index.toml", CPU, BOARD, DTS])
+    assert mgr.board_names() == [b['name'] for b in catalogue['boards']]
+    assert mgr.cpu_names() == [c['name'] for c in catalogue['cpus']]
+
+
+def test_cache_hit_defers_materialize(platform, loads):
+    eager = load(platform)
+    loads.clear()
+
+    mgr = load(platform)
+    assert loads == []
+    assert mgr.board_names() == eager.board_names()
+    assert mgr.cpu_names() == eager.cpu_names()
+
+    cpu = mgr.find_cpu(eager.cpu_names()[0])
+    assert loads == [CPU]
+    assert cpu.value == eager.find_cpu(eager.cpu_names()[0]).value
+    assert cpu.dts_path == os.path.join(platform, DTS)
+    assert cpu.guestos_dts is not None
+
+    loads.clear()
+    board = mgr.find_board(eager.board_names()[0])
+    assert loads == [BOARD]
+    assert board.cpu is cpu
+    assert board.value == eager.find_board(eager.board_names()[0]).value
+
+
+def test_find_board_loads_its_cpu(platform, loads):
+    load(platform)
+    loads.clear()
+    mgr = load(platform)
+    assert mgr.find_board(mgr.board_names()[0]) is not None
+    assert loads == [BOARD, CPU]
+
+
+@pytest.mark.parametrize("changed", ["index.toml", CPU, BOARD, DTS])
+def test_changed_file_rebuilds_cache(platform, loads, changed):
+    load(platform)
+    with open(cache_of(platform), "rb") as f:
+        old = json.loads(f.read().decode('utf-8'))
+
+    touch(os.path.join(platform, changed))
+    loads.clear()
+    load(platform)
+    assert sorted(loads) == [CPU, BOARD]
+
+    with open(cache_of(platform), "rb") as f:
+        new = json.loads(f.read().decode('utf-8'))
+    assert new['stamps'][changed] != old['stamps'][changed]
+
+    loads.clear()
+    load(platform)
+    assert loads == []
+
+
+def test_changed_name_is_picked_up(platform, loads):
+    mgr = load(platform)
+    name = mgr.board_names()[0]
+    path = os.path.join(platform, BOARD)
+    with open(path) as f:
+        text = f.read()
+    assert name in text
+    with open(path, "w") as f:
+        f.write(text.replace(name, name + " rev2"))
+
+    assert load(platform).board_names() == [name + " rev2"]
+    assert load(platform).board_names() == [name + " rev2"]
+
+
+def test_removed_dts_rebuilds_cache(platform, loads):
+    load(platform)
+    os.remove(os.path.join(platform, DTS))
+    loads.clear()
+    mgr = load(platform)
+    assert sorted(loads) == [CPU, BOARD]
+    assert mgr.find_cpu(mgr.cpu_names()[0]).dts_path is None
+
+
+def corrupt_catalogue(catalogue: dict):
+    catalogue['version'] = PlatformMgr.CATALOGUE_VERSION + 1
+    return catalogue
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda data: b"",
+    lambda data: data[:len(data)//2],
+    lambda data: b"\xff\xfe" + data,
+    lambda data: b"[]",
+    lambda data: b"null",
+    lambda data: json.dumps(corrupt_catalogue(json.loads(data))).encode(),
+    lambda data: json.dumps(dict(json.loads(data), version=None)).encode(),
+    lambda data: json.dumps(dict(json.loads(data), cpus=[{'id': "x"}])).encode(),
+    lambda data: json.dumps(dict(json.loads(data), boards=[dict(json.loads(data)['boards'][0], cpu="none")])).encode(),
+    lambda data: json.dumps(dict(json.loads(data), stamps={"index.toml": "x"})).encode(),
+])
+def test_corrupt_cache_falls_back(platform, loads, corrupt):
+    eager = load(platform)
+    with open(cache_of(platform), "rb") as f:
+        data = f.read()
+    with open(cache_of(platform), "wb") as f:
+        f.write(corrupt(data))
+
+    loads.clear()
+    mgr = load(platform)
+    assert sorted(loads) == [CPU, BOARD]
+    assert mgr.board_names() == eager.board_names()
+    assert mgr.cpu_names() == eager.cpu_names()
+
+    # 重新生成有效的缓存
+    with open(cache_of(platform), "rb") as f:
+        assert json.loads(f.read().decode('utf-8')) == json.loads(data)
+
+
+def test_no_cache(platform, loads, monkeypatch):
+    monkeypatch.setattr(PlatformMgr, "use_cache", False)
+    load(platform)
+    assert sorted(loads) == [CPU, BOARD]
+    assert not os.path.exists(cache_of(platform))
@@ -0,0 +1,149 @@
+import pytest
+
+pytest.importorskip("gevent")
+pytest.importorskip("zerorpc")
+
+from rpc_server import rpc_client
+from rpc_server.rpc_client import RPCClientPool
+from rpc_server.api import RPCApi
+
+
+class StubServer(object):
+    """ 模拟的RPC服务端, up为False时调用失败 """
+    def __init__(self):
+        self.up = True
+        self.calls = list()
+        self.connects = 0
+        self.status = {'cpus': [1]}
+        self.fail = set()
+
+    def call(self, name, *args):
+        if not self.up:
+            raise RuntimeError("lost remote")
+        self.calls.append((name,) + args)
+        if name in self.fail:
+            return RPCApi.Result.error(f"{name} failed").to_dict()
+        if name == 'hello':
+            return RPCApi.Result.success(args[0]).to_dict()
+        if name == 'get_status':
+            return RPCApi.Result.success(self.status).to_dict()
+        if name == 'crash':
+            return "not a dict"
+        return RPCApi.Result.success(None).to_dict()
+
+
+class StubZeroClient(object):
+    """ 代替zerorpc.Client, 按地址转发到StubServer """
+    servers = dict()
+
+    def __init__(self, timeout=None):
+        self.server = None
+
+    def connect(self, addr):
+        self.server = self.servers.setdefault(addr, StubServer())
+        self.server.connects += 1
+
+    def __call__(self, name, *args):
+        if self.server is None:
+            raise RuntimeError("not connected")
+        return self.server.call(name, *args)
+
+    def __getattr__(self, name):
+        return lambda *args: self(name, *args)
+
+    def close(self):
+        self.server = None
+
+
+A = "tcp://10.0.0.1:4240"
+B = "tcp://10.0.0.2:4240"
+C = "tcp://10.0.0.3:4240"
+
+
+@pytest.fixture
+def servers(monkeypatch):
+    servers = {A: StubServer(), B: StubServer(), C: StubServer()}
+    monkeypatch.setattr(StubZeroClient, "servers", servers)
+    monkeypatch.setattr(rpc_client.zerorpc, "Client", StubZeroClient)
+    return servers
+
+
+@pytest.fixture
+def pool(servers):
+    pool = RPCClientPool()
+    yield pool
+    pool.close()
+
+
+def test_connect_lazily(servers, pool):
+    pool.add(A)
+    assert pool.targets() == [A]
+    assert servers[A].connects == 0
+    assert not pool.add(A).is_connected()
+
+    results = pool.fanout([A, B, A], "get_status")
+    assert list(results) == [A, B]
+    assert all(r.status and r.result == {'cpus': [1]} for r in results.values())
+    assert servers[A].connects == 1 and servers[B].connects == 1
+    assert servers[C].connects == 0
+
+    pool.fanout([A, B], "get_status")
+    assert servers[A].connects == 1
+
+
+def test_reconnect_after_failure(servers, pool):
+    assert pool.fanout([A], "get_status")[A]
+
+    servers[A].up = False
+    result = pool.fanout([A], "get_status")[A]
+    assert not result and "lost remote" in result.message
+    # 调用失败后连接关闭, 下一次使用时重连
+    assert not pool.add(A).is_connected()
+    result = pool.fanout([A], "get_status")[A]
+    assert not result and result.message == "unconnected"
+
+    servers[A].up = True
+    assert pool.fanout([A], "get_status")[A]
+    assert pool.add(A).is_connected()
+    assert servers[A].connects == 3
+
+
+def test_health_check_closes_dead_connections(servers, pool):
+    pool.fanout([A, B, C], "hello", "hi")
+    assert all(pool.add(addr).is_connected() for addr in (A, B, C))
+
+    servers[B].up = False
+    servers[C].fail.add('hello')
+    assert pool.check_all() == {A: True, B: False, C: False}
+    assert pool.add(A).is_connected()
+    assert not pool.add(B).is_connected()
+    assert not pool.add(C).is_connected()
+    assert pool.targets() == [A, B, C]
+
+    servers[B].up = True
+    servers[C].fail.clear()
+    assert pool.check_all() == {A: True, B: True, C: True}
+    assert servers[B].connects == 2 and servers[C].connects == 2
+
+
+def test_per_target_errors(servers, pool):
+    servers[B].up = False
+    servers[C].fail.add('start_cell')
+    results = pool.fanout([A, B, C], "start_cell", "rtos")
+    assert results[A].status
+    assert not results[B].status and results[B].message == "unconnected"
+    assert not results[C].status and results[C].message == "start_cell failed"
+    assert servers[A].calls[-1] == ('start_cell', "rtos")
+    assert servers[C].calls[-1] == ('start_cell', "rtos")
+
+
+@pytest.mark.parametrize("method", ["stream_status", "pci_devices_since", "connect", "close", "crash"])
+def test_only_fanout_methods(servers, pool, method):
+    results = pool.fanout([A, B], method)
+    assert all(not r.status and r.message == f"unknown method {method}" for r in results.values())
+    assert servers[A].connects == 0 and not servers[A].calls
+
+
+def test_fanout_methods_are_rpc_api():
+    assert RPCClientPool.FANOUT_METHODS < RPCApi.__abstractmethods__
+    assert 'stream_status' not in RPCClientPool.FANOUT_METHODS
@@ -0,0 +1,31 @@
+from startup_bench import ImportTime, parse_importtime, group_cost
+
+
+IMPORTTIME = """import time: self [us] | cumulative | imported package
+import time:       100 |        100 |     forms.ui_a
+import time:        50 |         50 |       PySide2.QtCore
+import time:        30 |        180 |   forms
+import time:        20 |        200 | mainui_deps
+import time:        10 |         10 | forms.ui_b
+Traceback (most recent call last):
+import time: invalid | line
+"""
+
+
+def test_parse_importtime():
+    assert parse_importtime(IMPORTTIME) == [
+        ImportTime("forms.ui_a", 100, 100, 2),
+        ImportTime("PySide2.QtCore", 50, 50, 3),
+        ImportTime("forms", 30, 180, 1),
+        ImportTime("mainui_deps", 20, 200, 0),
+        ImportTime("forms.ui_b", 10, 10, 0),
+    ]
+
+
+def test_group_cost_counts_nested_modules_once():
+    imports = parse_importtime(IMPORTTIME)
+    # forms.ui_a嵌套在forms中, 只计算forms的累计耗时
+    assert group_cost(imports, "forms*") == (180 + 10, 3)
+    assert group_cost(imports, "forms.*") == (100 + 10, 2)
+    assert group_cost(imports, "PySide2*") == (50, 1)
+    assert group_cost(imports, "toml*") == (0, 0)
@@ -0,0 +1,95 @@
+import copy
+
+import pytest
+
+from api import dict_diff, dict_patch, DIFF_DELETED
+
+
+STATES = [
+    {},
+    {'cpus': [[1, 2], [3, 4]], 'cells': {'root': ["running"], 'rtos': [None]}, 'uptime': None},
+    {'cpus': [[1, 2], [3, 5]], 'cells': {'root': ["running"], 'rtos': ["running"]}, 'uptime': 10},
+    {'cpus': [[1, 2], [3, 5]], 'cells': {'root': ["running"]}, 'uptime': None},
+    {'cpus': None, 'cells': {'root': {'state': "running", 'cpus': {0: None}}}, 'extra': {}},
+    {'cpus': [], 'cells': {'root': {'state': None, 'cpus': {}}}, 'extra': {'a': {'b': None}}},
+    {'cells': None},
+    {'cells': {'linux': {'state': "failed"}}, DIFF_DELETED + "x": 1},
+]
+
+
+@pytest.mark.parametrize("old", STATES)
+@pytest.mark.parametrize("new", STATES)
+def test_round_trip(old, new):
+    base = copy.deepcopy(old)
+    diff = dict_diff(old, new)
+    assert dict_patch(old, diff) == new
+    # 不修改输入
+    assert old == base
+    if old == new:
+        assert diff == {}
+
+
+def test_none_value_is_kept():
+    old = {'a': 1, 'b': {'c': 2, 'd': 3}}
+    new = {'a': None, 'b': {'c': None}}
+    diff = dict_diff(old, new)
+    assert diff == {'a': None, 'b': {'c': None, DIFF_DELETED: ['d']}}
+    assert dict_patch(old, diff) == new
+
+
+def test_deleted_keys():
+    old = {'a': 1, 'b': None, 'c': {'d': None}}
+    diff = dict_diff(old, {'c': {}})
+    assert diff == {DIFF_DELETED: ['a', 'b'], 'c': {DIFF_DELETED: ['d']}}
+    assert dict_patch(old, diff) == {'c': {}}
+
+
+def test_patch_sequence():
+    status = None
+    for i, state in enumerate(STATES):
+        status = copy.deepcopy(state) if i == 0 else dict_patch(status, dict_diff(STATES[i-1], state))
+        assert status == state
+
+
+def test_status_monitor_sends_diffs():
+    gevent = pytest.importorskip("gevent")
+    from status_monitor import StatusMonitor
+
+    samples = [
+        {'cpus': [1], 'cells': {'root': "running", 'rtos': None}},
+        {'cpus': [1], 'cells': {'root': "running", 'rtos': None}},
+        {'cpus': [2], 'cells': {'root': "running", 'rtos': "running"}},
+        {'cpus': [2], 'cells': {'root': None}},
+    ]
+    index = [0]
+
+    def sampler():
+        value = samples[min(index[0], len(samples)-1)]
+        index[0] += 1
+        return copy.deepcopy(value)
+
+    monitor = StatusMonitor(sampler, interval=0.001)
+    received = list()
+
+    def consume():
+        for msg in monitor.subscribe():
+            received.append(msg)
+            if len(received) == 3:
+                break
+
+    greenlet = gevent.spawn(consume)
+    greenlet.join(timeout=5)
+    monitor.stop()
+    assert greenlet.dead
+
+    assert [msg['seq'] for msg in received] == [1, 2, 3]
+    assert [msg['full'] for msg in received] == [True, False, False]
+    assert received[0]['status'] == samples[0]
+    # 相同的采样不推送
+    assert received[1]['status'] == {'cpus': [2], 'cells': {'rtos': "running"}}
+    assert received[2]['status'] == {'cells': {'root': None, DIFF_DELETED: ['rtos']}}
+
+    status = received[0]['status']
+    for msg in received[1:]:
+        status = dict_patch(status, msg['status'])
+    assert status == samples[3]
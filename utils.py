@@ -1,11 +1,10 @@
 import os
 import sys
-from typing import Optional, Any, List
+from typing import Optional, Any, List, Tuple, Iterator
 import pathlib
 import json
-import platform
-import tempfile
-import shutil
+import time
+import stat
 
 _KB = 1024
 _MB = 1024*1024
@@ -48,84 +47,174 @@ def get_template_path(name: str) -> str:
         return os.path.join(meipass, "template", name)
     return os.path.join("assets", "template", name)
 
-def get_cpio() -> str:
-    if platform.system() == "Windows":
-        if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
-            meipass = getattr(sys, '_MEIPASS')
-            return os.path.join(meipass, "tools", "win32", "cpio.exe")
-        current = os.path.abspath(os.path.dirname(__file__))
-        return os.path.join(current, "tools", "win32", "cpio.exe")
-
-    return "cpio"
-
-
 class CpioUtil():
+    """ 向newc格式的cpio归档追加文件
+
+    不复制原归档, 也不调用外部cpio程序. stream()逐块生成追加后的归档:
+    原归档TRAILER!!!之前的内容, 新文件的条目, 新的TRAILER!!!.
+    原文件不是newc格式(例如压缩的ramdisk)时, 在其后连接一个新的newc归档,
+    内核解压initramfs时支持多个归档连接.
+    """
+    MAGIC = (b'070701', b'070702')
+    HEADER_SIZE = 110
+    TRAILER = 'TRAILER!!!'
+    BLOCK_SIZE = 512
+    CHUNK_SIZE = 1024*1024
+    # append()追加的数据没有文件权限, 使用普通文件的0644
+    DEFAULT_MODE = stat.S_IFREG | 0o644
+
     def __init__(self, filename) -> None:
         self._filename = filename
-        self._temp_dir = tempfile.mkdtemp(prefix='jh_')
-        self._temp_cpio = None
+        self._entries: List[tuple] = list()
+        self._mtime = int(time.time())
 
-    def __del__(self):
-        shutil.rmtree(self._temp_dir)
-        self._temp_dir = None
+    @staticmethod
+    def _align(n: int) -> int:
+        return (n + 3) & ~3
 
-    def append(self, name: str, data: bytes) -> bool:
-        if self._temp_cpio is None:
-            temp = os.path.join(self._temp_dir, "temp.cpio")
+    @classmethod
+    def header(cls, name: str, size: int, ino: int, mtime: int, mode: int = DEFAULT_MODE) -> bytes:
+        name_bytes = name.encode() + b'\0'
+        fields = (ino, mode, 0, 0, 1, mtime, size, 0, 0, 0, 0, len(name_bytes), 0)
+        header = b'070701' + b''.join(b'%08X' % x for x in fields) + name_bytes
+        return header + bytes(cls._align(len(header)) - len(header))
+
+    def _scan(self, f) -> Tuple[Optional[int], int]:
+        """ 查找原归档中TRAILER!!!的位置和最大的inode号
+
+        Returns:
+            (trailer_offset, max_ino): 不是newc归档时trailer_offset为None
+        """
+        offset = 0
+        max_ino = 0
+        while True:
+            f.seek(offset)
+            header = f.read(self.HEADER_SIZE)
+            if len(header) < self.HEADER_SIZE or header[:6] not in self.MAGIC:
+                return None, 0
             try:
-                shutil.copy(self._filename, temp)
-            except:
-                return False
-            self._temp_cpio = temp
-
-        cwd = os.getcwd()
-        cpio_exe = get_cpio()
-        path = os.path.join(self._temp_dir, name)
-        print("path: ", path)
+                ino = int(header[6:14], 16)
+                filesize = int(header[54:62], 16)
+                namesize = int(header[94:102], 16)
+            except ValueError:
+                return None, 0
+            name = f.read(namesize).rstrip(b'\0')
+            if name == self.TRAILER.encode():
+                return offset, max_ino
+            max_ino = max(max_ino, ino)
+            offset = self._align(self._align(offset + self.HEADER_SIZE + namesize) + filesize)
 
-        if not os.path.exists(os.path.dirname(path)):
-            os.makedirs(os.path.dirname(path))
+    def append(self, name: str, data: bytes) -> bool:
+        if not isinstance(data, (bytes, bytearray)):
+            return False
+        self._entries.append((name.lstrip('/'), len(data), data, None, self.DEFAULT_MODE))
+        return True
 
+    def append_file(self, name: str, filename: str) -> bool:
+        """ 追加文件, 保留文件的权限位(例如可执行), 文件内容在生成归档时才读取 """
         try:
-            with open(path, "wb") as f:
-                f.write(data)
-        except:
-            return False
-    
-        os.chdir(self._temp_dir)
-        cmd = f"echo {name} | {cpio_exe} -oA -H newc -F temp.cpio"
-        print(cmd)
-        status = os.system(cmd)
-        os.chdir(cwd)
-        if status != 0:
+            st = os.stat(filename)
+        except OSError:
             return False
+        mode = stat.S_IFREG | stat.S_IMODE(st.st_mode)
+        self._entries.append((name.lstrip('/'), st.st_size, None, filename, mode))
         return True
 
+    def _read_chunks(self, f, size: Optional[int]) -> Iterator[bytes]:
+        while size is None or size > 0:
+            n = self.CHUNK_SIZE if size is None else min(self.CHUNK_SIZE, size)
+            chunk = f.read(n)
+            if not chunk:
+                if size is not None:
+                    raise IOError(f"unexpected end of {f.name}")
+                return
+            if size is not None:
+                size -= len(chunk)
+            yield chunk
+
+    def stream(self) -> Iterator[bytes]:
+        """ 生成追加后的归档, 读取失败时抛出OSError """
+        with open(self._filename, "rb") as f:
+            if not self._entries:
+                yield from self._read_chunks(f, None)
+                return
+
+            trailer, max_ino = self._scan(f)
+            f.seek(0)
+            if trailer is not None:
+                offset = trailer
+                yield from self._read_chunks(f, trailer)
+            else:
+                # 不是newc归档, 在其后连接新的归档
+                offset = 0
+                for chunk in self._read_chunks(f, None):
+                    offset += len(chunk)
+                    yield chunk
+                pad = self._align(offset) - offset
+                offset += pad
+                yield bytes(pad)
+
+        ino = max_ino
+        for name, size, data, filename, mode in self._entries:
+            ino += 1
+            header = self.header(name, size, ino, self._mtime, mode)
+            offset += len(header)
+            yield header
+            if data is not None:
+                yield bytes(data)
+            else:
+                with open(filename, "rb") as f:
+                    yield from self._read_chunks(f, size)
+            pad = self._align(size) - size
+            offset += size + pad
+            yield bytes(pad)
+
+        header = self.header(self.TRAILER, 0, 0, 0, 0)
+        offset += len(header)
+        yield header
+        yield bytes(-offset % self.BLOCK_SIZE)
+
     def get_bytes(self) -> Optional[bytes]:
-        fn = self._filename
-        if self._temp_cpio:
-            fn = self._temp_cpio
-        
         try:
-            with open(fn, "rb") as f:
-                return f.read()
-        except:
+            return b''.join(self.stream())
+        except OSError:
             return None
 
-        return None
-
     def save_as(self, dst: str) -> bool:
-        fn = self._filename
-        if self._temp_cpio:
-            fn = self._temp_cpio
-
         try:
-            shutil.copy(fn, dst)
-        except:
+            with open(dst, "wb") as f:
+                for chunk in self.stream():
+                    f.write(chunk)
+        except OSError:
             return False
         return True
 
 
+def write_file_atomic(filename: str, data: bytes):
+    """
+    原子写入文件。
+
+    先写入同目录下的临时文件并刷新到磁盘，再用os.replace替换目标文件，
+    写入过程中崩溃时原文件保持不变。
+
+    Raises:
+        OSError: 写入失败, 临时文件已删除
+    """
+    tmp = f"{filename}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, filename)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
 def profile_load() -> dict:
     fn = os.path.join(pathlib.Path.home(), ".resource_tool")
     try:
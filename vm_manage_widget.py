@@ -1,7 +1,6 @@
 import logging
-from typing import Optional
+from typing import Optional, List, Tuple
 import time
-import json
 import math
 
 from PySide2 import QtWidgets, QtCore, QtGui
@@ -11,8 +10,8 @@ from forms.ui_vm_state_item import Ui_VMStateItemWidget
 from forms.ui_meminfo import Ui_MemInfoWidget
 from forms.ui_cpuload import Ui_CPULoadWidget
 
-from rpc_server.rpc_client import RPCClient
-from generator import RootCellGenerator
+from rpc_server.rpc_client import RPCClient, StatusSubscription
+from rpc_server.api import RPCApi
 from jh_resource import Resource, ResourceGuestCellList, ResourceGuestCell, ResourceCPU
 from jh_resource import LinuxRunInfo, ACoreRunInfo, CommonOSRunInfo
 from utils import Profile
@@ -20,6 +19,26 @@ from utils import Profile
 from commonos_runinfo import OSRunInfoWidget, CommonOSRunInfoWidget
 from linux_runinfo import LinuxRunInfoWidget
 from acore_runinfo import ACoreRunInfoWidget
+from boot_orchestrator import BootOrchestrator
+from cell_deploy import DeployError, root_source, enable_hypervisor
+from rpc_job import JobManager, RPCJob
+from common_widget import JobProgressWidget
+
+
+def fetch_status_history(job: RPCJob, client: RPCClient, start: float, max_points: int) -> Optional[RPCApi.Result]:
+    """
+    获取服务端保存的负载历史，在后台任务中执行。
+
+    Args:
+        job: 后台任务。
+        client: 工作线程的RPC连接。
+        start: 开始时间戳(秒)。
+        max_points: 最多返回的采样点数。
+
+    Returns:
+        RPCApi.Result: get_status_history的结果。
+    """
+    return client.get_status_history(start, 0, max_points)
 
 
 class CellStateItemWidget(QtWidgets.QWidget):
@@ -125,6 +144,10 @@ class CPULoadWidget(QtWidgets.QWidget):
         self.setMinimumHeight(400)
         self._chart.setTheme(QtCharts.QChart.ChartTheme.ChartThemeBlueCerulean)
 
+        # 显示的时间范围(秒)和保留的点数, 加载历史后扩大
+        self._span = 30
+        self._max_points = 200
+
     def add_data(self, now_sec, load):
         """
         添加负载数据点。
@@ -138,10 +161,31 @@ class CPULoadWidget(QtWidgets.QWidget):
         now = QtCore.QDateTime.fromMSecsSinceEpoch(int(now_sec*1000))
         self._ui.label_load.setText(f"{load*100:.1f} %")
         self._series.append(now_sec*1000, load)
-        if self._series.count() > 200:
-            print(self._series.count())
-            self._series.removePoints(0, self._series.count()-40)
-        self._axis_time.setRange(now.addSecs(-30), now)
+        if self._series.count() > self._max_points:
+            self._series.removePoints(0, self._series.count()-self._max_points//5)
+        self._axis_time.setRange(now.addSecs(-self._span), now)
+        self._chartview.update()
+
+    def set_history(self, samples: List[Tuple[float, float]]):
+        """
+        设置历史负载数据。
+        
+        用服务端保存的历史替换当前曲线，时间轴扩大到历史的范围，
+        保留历史之后已经收到的数据点。
+        
+        Args:
+            samples: [(时间戳(秒), 负载(0-1)) ...]，按时间排序。
+        """
+        if not samples:
+            return
+        newer = [p for p in self._series.pointsVector() if p.x() > samples[-1][0]*1000]
+        self._series.replace([QtCore.QPointF(ts*1000, load) for ts, load in samples] + newer)
+        self._span = max(30, int(samples[-1][0] - samples[0][0]))
+        self._max_points = len(samples) + 200
+        self._axis_time.setFormat("hh:mm:ss" if self._span > 3600 else "mm:ss")
+        now = QtCore.QDateTime.fromMSecsSinceEpoch(int(samples[-1][0]*1000))
+        self._axis_time.setRange(now.addSecs(-self._span), now)
+        self._ui.label_load.setText(f"{samples[-1][1]*100:.1f} %")
         self._chartview.update()
 
     def set_cpucount(self, count):
@@ -162,6 +206,9 @@ class CPULoadWidget(QtWidgets.QWidget):
         清空所有数据点。
         """
         self._series.clear()
+        self._span = 30
+        self._max_points = 200
+        self._axis_time.setFormat("mm:ss")
 
 
 class MemInfoWidget(QtWidgets.QWidget):
@@ -223,6 +270,9 @@ class MemInfoWidget(QtWidgets.QWidget):
         self.setMinimumHeight(400)
         self._chart.setTheme(QtCharts.QChart.ChartTheme.ChartThemeBlueCerulean)
 
+        self._span = 30
+        self._max_points = 200
+
     def add_data(self, now_sec, total, free):
         """
         添加内存数据点。
@@ -247,12 +297,41 @@ class MemInfoWidget(QtWidgets.QWidget):
 
         now = QtCore.QDateTime.fromMSecsSinceEpoch(int(now_sec*1000))
         self._series.append(now_sec*1000, (total-free)/total)
-        if self._series.count() > 200:
-            print(self._series.count())
-            self._series.removePoints(0, self._series.count()-40)
-        self._axis_time.setRange(now.addSecs(-30), now)
+        if self._series.count() > self._max_points:
+            self._series.removePoints(0, self._series.count()-self._max_points//5)
+        self._axis_time.setRange(now.addSecs(-self._span), now)
+        self._chartview.update()
+
+    def set_history(self, samples: List[Tuple[float, int, int]]):
+        """
+        设置历史内存数据。
+        
+        Args:
+            samples: [(时间戳(秒), 总内存, 可用内存) ...]，按时间排序。
+        """
+        samples = [x for x in samples if x[1] > 0]
+        if not samples:
+            return
+        newer = [p for p in self._series.pointsVector() if p.x() > samples[-1][0]*1000]
+        self._series.replace([QtCore.QPointF(ts*1000, (total-free)/total) for ts, total, free in samples] + newer)
+        self._span = max(30, int(samples[-1][0] - samples[0][0]))
+        self._max_points = len(samples) + 200
+        self._axis_time.setFormat("hh:mm:ss" if self._span > 3600 else "mm:ss")
+        now = QtCore.QDateTime.fromMSecsSinceEpoch(int(samples[-1][0]*1000))
+        self._axis_time.setRange(now.addSecs(-self._span), now)
         self._chartview.update()
 
+    def reset(self):
+        """
+        重置图表。
+        
+        清空所有数据点。
+        """
+        self._series.clear()
+        self._span = 30
+        self._max_points = 200
+        self._axis_time.setFormat("mm:ss")
+
 
 class VMManageWidget(QtWidgets.QWidget):
     """
@@ -269,6 +348,7 @@ class VMManageWidget(QtWidgets.QWidget):
         _current_cell: 当前选中的客户单元格。
         _client: RPC客户端实例。
         _last_status: 上次获取的状态信息。
+        _status_sub: 服务端状态推送订阅。
         _os_runinfo_desc: 操作系统运行信息描述列表。
         logger: 日志记录器。
         profile_addr: 远程地址配置项。
@@ -277,6 +357,12 @@ class VMManageWidget(QtWidgets.QWidget):
 
     profile_addr = Profile.Item('remote_addr', 'tcp://127.0.0.1:4240')
 
+    POLL_INTERVAL = 1000
+    STREAM_INTERVAL = 100
+    # 连接后加载的历史时长(秒)和最多的点数
+    HISTORY_SPAN = 3600
+    HISTORY_POINTS = 360
+
     def __init__(self, parent=None):
         """
         初始化虚拟机管理界面部件。
@@ -300,8 +386,14 @@ class VMManageWidget(QtWidgets.QWidget):
         self._root_layout.addWidget(self._root_meminfo)
         self._ui.frame_runcell.hide()
 
+        # 后台任务的进度显示在对应按钮的左侧
+        self._hyp_progress = JobProgressWidget(self)
+        self._ui.btn_hyp_start.parentWidget().layout().insertWidget(0, self._hyp_progress)
+        self._cell_progress = JobProgressWidget(self)
+        self._ui.frame_runcell_btns.layout().insertWidget(0, self._cell_progress)
+
         self._timer = QtCore.QTimer()
-        self._timer.setInterval(1000)
+        self._timer.setInterval(self.POLL_INTERVAL)
         self._timer.setSingleShot(False)
 
         self._ui.lineedit_addr.setText(self.profile_addr.get())
@@ -341,6 +433,7 @@ class VMManageWidget(QtWidgets.QWidget):
         self._current_cell: Optional[ResourceGuestCell] = None
         self._client: RPCClient = RPCClient.get_instance()
         self._last_status = None
+        self._status_sub = StatusSubscription(self._client)
 
         self._client.state_changed.connect(self._on_state_changed)
         self._ui.lineedit_addr.editingFinished.connect(self._on_addr_edit_finished)
@@ -351,6 +444,7 @@ class VMManageWidget(QtWidgets.QWidget):
         self._ui.btn_cell_stop.clicked.connect(self._on_cell_stop)
         self._ui.btn_hyp_start.clicked.connect(self._on_hyp_start)
         self._ui.btn_hyp_stop.clicked.connect(self._on_hyp_stop)
+        self._ui.btn_boot_all.clicked.connect(self._on_boot_all)
         self._ui.btn_cell_flush.clicked.connect(self._on_cell_flush)
 
         self._timer.timeout.connect(self._on_timeout)
@@ -407,52 +501,87 @@ class VMManageWidget(QtWidgets.QWidget):
         """
         处理启动虚拟机监控器事件。
         
-        生成根单元格配置，启用Jailhouse，并启动UART服务器。
+        在界面线程中生成根单元格配置，在后台任务中启用Jailhouse，并启动UART服务器。
         """
         if self._resource is None:
             return
 
-        # 生成源码
-        root_cell_bin = RootCellGenerator.gen_config_bin(self._resource)
-        if root_cell_bin is None:
-            self.logger.error("root_cell_bin is None")
+        try:
+            root = root_source(self._resource)
+        except DeployError as e:
+            self.logger.error(f"{e}")
             return
+        self._run_job(self._ui.btn_hyp_start, self._hyp_progress, "enable hypervisor",
+                      enable_hypervisor, root)
 
-        # 每次创建, 前先destroy
-        result = self._client.list_cell()
-        if result is None or not result.status:
-            self.logger.error("get root cell list failed")
+    def _run_job(self, button: Optional[QtWidgets.QAbstractButton], progress: JobProgressWidget,
+                 name: str, fn, *args) -> Optional[RPCJob]:
+        """
+        在后台任务中执行RPC操作，任务结束前禁用按钮。
+
+        Args:
+            button: 任务执行期间禁用的按钮
+            progress: 显示任务进度的组件
+            name: 任务名称
+            fn: 任务函数 fn(client, *args)
+            args: 任务函数的参数
+
+        Returns:
+            RPCJob: 未连接时返回None
+        """
+        job = JobManager.get_instance().submit(name, lambda job, client, *args: fn(client, *args), *args)
+        self._wait_job(button, progress, job)
+        return job
+
+    def _wait_job(self, button: Optional[QtWidgets.QAbstractButton], progress: JobProgressWidget,
+                  job: Optional[RPCJob]):
+        """ 显示任务进度, 任务结束后恢复按钮 """
+        progress.track(job)
+        if button is None:
             return
-        for cell in result.result:
-            if cell['id'] == 0:
-                self.logger.info(f"jailhouse disable")
-                result = self._client.jailhouse_disable()
-                if not result.status:
-                    self.logger.error("disable failed")
-                    return
-                break
+        if job is None:
+            button.setEnabled(self._client.is_connected())
+            return
+        button.setEnabled(False)
+        job.signals.finished.connect(lambda: button.setEnabled(self._client.is_connected()))
 
-        # 开始创建root cell
-        self.logger.info(f"jailhouse enable")
-        result = self._client.jailhouse_enable(root_cell_bin)
-        if not result.status:
-            self.logger.error("jailhouse_enable failed")
-            self.logger.error(f"{result.message}")
+    def _on_boot_all(self):
+        """
+        处理全部启动事件。
+        
+        启动根单元格，再按依赖顺序启动所有客户单元格。
+        """
+        if self._resource is None:
             return
-        self.logger.info("jailhouse root cell enable success")
-
-        jhr_obj = self._resource.to_dict()
-        jhr_json = None
-        if jhr_obj is not None:
-            jhr_json = json.dumps(jhr_obj)
-        if jhr_json is not None:
-            result = self._client.start_uart_server(jhr_json)
-            if not result:
-                self.logger.warning(f"start uart server failed, {result.message}")
-            else:
-                self.logger.info("start uart server succes.")
-        else:
-            self.logger.warning(f"generate jhr json failed.")
+
+        # 资源对象不是线程安全的, 在界面线程中设置入口地址, 生成各单元格的配置和资源表,
+        # 后台任务只读取镜像文件并调用RPC
+        orchestrator = BootOrchestrator(self._resource, self._client, upload_timeout=JobManager.RPC_TIMEOUT)
+        if not orchestrator.prepare(enable=True):
+            self.logger.error("prepare boot all failed.")
+            return
+        job = JobManager.get_instance().submit("boot all", self._boot_all, orchestrator)
+        self._wait_job(self._ui.btn_boot_all, self._hyp_progress, job)
+
+    def _boot_all(self, job: RPCJob, client: RPCClient, orchestrator: BootOrchestrator) -> bool:
+        # 进度为已结束(运行、失败或跳过)的单元格数
+        total = len(orchestrator.plans())
+        done = set()
+        def on_state(name: str, state: str):
+            if state in (BootOrchestrator.RUNNING, BootOrchestrator.FAILED, BootOrchestrator.SKIPPED):
+                done.add(name)
+            job.progress(len(done), total, f"{name} {state}")
+        orchestrator.set_listener(on_state)
+        orchestrator.set_cancel_check(job.is_canceled)
+
+        job.progress(0, total, "read images")
+        if orchestrator.boot(enable=True, client=client):
+            self.logger.info("boot all cells success.")
+            return True
+        for name, state in orchestrator.states().items():
+            if state != BootOrchestrator.RUNNING:
+                self.logger.error(f"cell {name} {state}: {orchestrator.message(name)}")
+        return False
 
     def _on_cell_flush(self):
         """
@@ -473,35 +602,60 @@ class VMManageWidget(QtWidgets.QWidget):
         if self._resource is None:
             return
 
-        result = self._client.list_cell()
+        self._run_job(self._ui.btn_hyp_stop, self._hyp_progress, "disable hypervisor", self._disable_hypervisor)
+
+    def _disable_hypervisor(self, client: RPCClient) -> bool:
+        result = client.list_cell()
         if not result.status or result is None:
             self.logger.error("get root cell list failed")
-            return
-        result = self._client.jailhouse_disable()
+            return False
+        result = client.jailhouse_disable()
         if not result.status:
             self.logger.error("get root cell list failed")
-            return
+            return False
         self.logger.info("root cell disable success")
 
-        result = self._client.stop_uart_server()
+        result = client.stop_uart_server()
         if not result:
             self.logger.warning("stop uart server failed.")
+        return True
 
     def _on_timeout(self):
         """
         处理定时器超时事件。
         
-        定期从服务器获取状态信息，更新单元格状态和性能指标图表。
+        订阅了服务端推送时处理收到的状态，否则从服务器轮询状态信息。
         """
-        if self._resource is None:
-            return
         if not self._client.is_connected():
             return
 
+        if self._status_sub.is_alive():
+            for status in self._status_sub.poll():
+                self._update_status(status)
+            return
+
+        if self._timer.interval() != self.POLL_INTERVAL:
+            self.logger.warning("status stream closed, fallback to polling")
+            self._timer.setInterval(self.POLL_INTERVAL)
+
+        if self._resource is None:
+            return
         result = self._client.get_status()
         if not result:
             return
-        status = result.result
+        self._update_status(result.result)
+
+    def _update_status(self, status: dict):
+        """
+        更新状态显示。
+        
+        根据状态信息更新单元格状态和性能指标图表。
+        
+        Args:
+            status: 状态信息，格式见RPCApi.get_status。
+        """
+        if self._resource is None:
+            return
         rootcell: dict = status.get('rootcell')
         guestcells = status.get('guestcells')
         timestamp = status.get('timestamp', time.time())
@@ -526,7 +680,10 @@ class VMManageWidget(QtWidgets.QWidget):
 
             self._root_cpuload.set_cpucount(rootcell.get('cpucount', "?"))
 
-            if self._last_status is not None:
+            if 'cpus' in rootcell:
+                # 服务端已根据两次采样计算负载
+                self._root_cpuload.add_data(timestamp, rootcell.get('cpuload', 0)/100)
+            elif self._last_status is not None:
                 last_cputimes = self._last_status['rootcell']['cputimes']
                 _user = last_cputimes['user'] - cputimes['user']
                 _sys = last_cputimes['system'] - cputimes['system']
@@ -538,6 +695,39 @@ class VMManageWidget(QtWidgets.QWidget):
 
         self._last_status = status
 
+    def _load_history(self):
+        """
+        加载服务端保存的负载历史。
+        
+        重新连接后显示之前一段时间的CPU和内存负载。
+        在后台任务中获取历史，在界面线程中更新曲线。
+        """
+        job = JobManager.get_instance().submit("load status history", fetch_status_history,
+                                               time.time()-self.HISTORY_SPAN, self.HISTORY_POINTS)
+        if job is None:
+            return
+        job.signals.result.connect(self._on_history_loaded)
+
+    def _on_history_loaded(self, result: Optional[RPCApi.Result]):
+        """
+        处理后台任务获取的负载历史。
+
+        Args:
+            result: get_status_history的结果
+        """
+        if not self._client.is_connected():
+            return
+        if result is None or not result.status:
+            self.logger.info("get status history failed.")
+            return
+        history: dict = result.result
+        timestamps = history.get('timestamp', list())
+        cpuloads = history.get('cpuload', list())
+        mem_total = history.get('mem_total', list())
+        mem_available = history.get('mem_available', list())
+        self._root_cpuload.set_history([(ts, load/100) for ts, load in zip(timestamps, cpuloads)])
+        self._root_meminfo.set_history(list(zip(timestamps, mem_total, mem_available)))
+
     def _on_cell_run(self):
         """
         处理运行单元格事件。
@@ -546,17 +736,17 @@ class VMManageWidget(QtWidgets.QWidget):
         """
         if self._current_cell is None:
             return
-        self._ui.btn_cell_run.setEnabled(False)
+        job = None
         os_runinfo = self._current_cell.runinfo().os_runinfo()
         if isinstance(os_runinfo, ACoreRunInfo):
-            self._acore_runinfo.run(self._current_cell)
+            job = self._acore_runinfo.run(self._current_cell)
         elif isinstance(os_runinfo, LinuxRunInfo):
-            self._linux_runinfo.run(self._current_cell)
+            job = self._linux_runinfo.run(self._current_cell)
         elif isinstance(os_runinfo, CommonOSRunInfo):
-            self._commonos_runinfo.run(self._current_cell)
+            job = self._commonos_runinfo.run(self._current_cell)
         else:
             self.logger.error(f'Unknown OS runinfo {type(os_runinfo)}')
-        self._ui.btn_cell_run.setEnabled(True)
+        self._wait_job(self._ui.btn_cell_run, self._cell_progress, job)
 
     def _on_cell_stop(self):
         """
@@ -568,8 +758,9 @@ class VMManageWidget(QtWidgets.QWidget):
             return
 
         name = self._current_cell.name()
-        self.logger.info("destroy cell {name}")
-        self._client.destroy_cell(name)
+        self.logger.info(f"destroy cell {name}")
+        self._run_job(self._ui.btn_cell_stop, self._cell_progress, f"destroy cell {name}",
+                      lambda client: client.destroy_cell(name))
 
     def _update_vm_list(self, rsc: Resource):
         """
@@ -712,16 +903,26 @@ class VMManageWidget(QtWidgets.QWidget):
         is_connected = self._client.is_connected()
         if is_connected:
             self._ui.btn_connect.setText("断开")
+            self._load_history()
+            if self._status_sub.start():
+                self._timer.setInterval(self.STREAM_INTERVAL)
+            else:
+                self.logger.info("server not support status stream, use polling")
+                self._timer.setInterval(self.POLL_INTERVAL)
             self._timer.start()
         else:
             self._ui.btn_connect.setText("连接")
             self._ui.listwidget_cells.clearSelection()
             self._timer.stop()
+            self._status_sub.stop()
+            self._last_status = None
             self._root_cpuload.reset()
+            self._root_meminfo.reset()
 
         self._ui.btn_connect.setChecked(is_connected)
         self._ui.btn_hyp_start.setEnabled(is_connected)
         self._ui.btn_hyp_stop.setEnabled(is_connected)
+        self._ui.btn_boot_all.setEnabled(is_connected)
         self._ui.frame_runcell.setVisible(is_connected)
 
     def _on_connect(self):